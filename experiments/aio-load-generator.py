@@ -0,0 +1,222 @@
+"""
+Open-loop load generator for `flatnav.aio.AsyncIndex`. Single queries arrive
+at a fixed average rate (exponential inter-arrival times), each awaited by its
+own coroutine, and the latency of every query is recorded. Sweeping the rate
+for a few batching policies gives tail-latency-vs-throughput curves, next to a
+baseline that runs every query through `search_single` on its own thread.
+
+Example:
+    poetry run python aio-load-generator.py \
+        --dataset /root/data/sift/train.npy --queries /root/data/sift/queries.npy \
+        --rates 1000 5000 10000 20000 --max-batch-sizes 16 64 --max-wait-ms 0.5 2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import flatnav
+import numpy as np
+from flatnav.aio import AsyncIndex
+from plotting.plot import create_plot, create_linestyles
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def run_load(
+    search_one: Callable[[np.ndarray], Awaitable],
+    queries: np.ndarray,
+    rate: float,
+    duration: float,
+) -> Tuple[float, np.ndarray]:
+    """
+    Submits queries at `rate` queries per second for `duration` seconds without
+    waiting for earlier queries to finish.
+    :return: The achieved throughput and the latency of every query, in ms.
+    """
+    latencies = []
+    rng = np.random.default_rng(seed=0)
+
+    async def timed_search(query: np.ndarray) -> None:
+        start = time.perf_counter()
+        await search_one(query)
+        latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival - start < duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        query = queries[len(tasks) % len(queries)]
+        tasks.append(asyncio.create_task(timed_search(query)))
+        next_arrival += rng.exponential(1 / rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    return len(tasks) / elapsed, np.array(latencies) * 1000
+
+
+def summarize(offered_rate: float, qps: float, latencies: np.ndarray) -> Dict:
+    return {
+        "offered_qps": offered_rate,
+        "qps": qps,
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p90": float(np.percentile(latencies, 90)),
+        "latency_p99": float(np.percentile(latencies, 99)),
+        "latency_p999": float(np.percentile(latencies, 99.9)),
+    }
+
+
+def sweep_rates(
+    name: str,
+    search_one: Callable[[np.ndarray], Awaitable],
+    queries: np.ndarray,
+    rates: List[float],
+    duration: float,
+) -> List[Dict]:
+    runs = []
+    for rate in rates:
+        qps, latencies = asyncio.run(run_load(search_one, queries, rate, duration))
+        run = summarize(offered_rate=rate, qps=qps, latencies=latencies)
+        logger.info(f"{name}: {json.dumps(run)}")
+        runs.append(run)
+    return runs
+
+
+def main(args: argparse.Namespace) -> None:
+    if args.dataset:
+        train_data = np.load(args.dataset).astype(np.float32)
+        queries = np.load(args.queries).astype(np.float32)
+    else:
+        rng = np.random.default_rng(seed=0)
+        train_data = rng.random((args.num_vectors, args.dim), dtype=np.float32)
+        queries = rng.random((10_000, args.dim), dtype=np.float32)
+
+    index = flatnav.index.create(
+        distance_type=args.metric,
+        dim=train_data.shape[1],
+        dataset_size=train_data.shape[0],
+        max_edges_per_node=args.num_node_links,
+    )
+    index.set_num_threads(args.num_threads)
+    logger.info(f"Building the index over {train_data.shape[0]} vectors")
+    index.add(data=train_data, ef_construction=args.ef_construction)
+
+    all_runs = {}
+
+    async def search_unbatched(query: np.ndarray):
+        return await asyncio.to_thread(
+            index.search_single, query=query, K=args.K, ef_search=args.ef_search
+        )
+
+    all_runs["unbatched"] = sweep_rates(
+        "unbatched", search_unbatched, queries, args.rates, args.duration
+    )
+
+    for max_batch_size in args.max_batch_sizes:
+        for max_wait_ms in args.max_wait_ms:
+            name = f"batch={max_batch_size}, wait={max_wait_ms}ms"
+            with AsyncIndex(
+                index, max_batch_size=max_batch_size, max_wait=max_wait_ms / 1000
+            ) as async_index:
+
+                def search_batched(query: np.ndarray):
+                    return async_index.search_one(
+                        query, K=args.K, ef_search=args.ef_search
+                    )
+
+                all_runs[name] = sweep_rates(
+                    name, search_batched, queries, args.rates, args.duration
+                )
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    metrics_file_path = os.path.join(args.output_dir, "aio_load_metrics.json")
+    with open(metrics_file_path, "w") as file:
+        json.dump(all_runs, file, indent=4)
+    logger.info(f"Saved metrics to {metrics_file_path}")
+
+    linestyles = create_linestyles(unique_algorithms=all_runs.keys())
+    for y_metric in ["latency_p50", "latency_p99"]:
+        experiment_runs = {
+            name: [(name, run["qps"], run[y_metric]) for run in runs]
+            for name, runs in all_runs.items()
+        }
+        create_plot(
+            experiment_runs=experiment_runs,
+            raw=False,
+            x_scale="linear",
+            y_scale="log",
+            x_axis_metric="qps",
+            y_axis_metric=y_metric,
+            linestyles=linestyles,
+            plot_name=os.path.join(args.output_dir, f"aio_{y_metric}_v_qps.png"),
+        )
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measure tail latency against throughput for flatnav.aio."
+    )
+    parser.add_argument(
+        "--dataset",
+        default=None,
+        help="Path to the vectors to index (.npy). Random vectors are used if unset.",
+    )
+    parser.add_argument("--queries", default=None, help="Path to the queries (.npy).")
+    parser.add_argument(
+        "--num-vectors",
+        type=int,
+        default=100_000,
+        help="Number of random vectors to index if no dataset is given.",
+    )
+    parser.add_argument(
+        "--dim", type=int, default=128, help="Dimension of the random vectors."
+    )
+    parser.add_argument("--metric", default="l2", help="Either `l2` or `angular`.")
+    parser.add_argument("--num-node-links", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--ef-search", type=int, default=100)
+    parser.add_argument("--K", type=int, default=10)
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=os.cpu_count(),
+        help="Size of the thread pool that searches each batch.",
+    )
+    parser.add_argument(
+        "--rates",
+        nargs="+",
+        type=float,
+        default=[1_000, 2_000, 5_000, 10_000, 20_000],
+        help="Offered loads, in queries per second.",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=10.0,
+        help="Number of seconds each offered load is sustained.",
+    )
+    parser.add_argument(
+        "--max-batch-sizes", nargs="+", type=int, default=[16, 64, 256]
+    )
+    parser.add_argument(
+        "--max-wait-ms", nargs="+", type=float, default=[0.5, 2.0]
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="metrics",
+        help="Directory to write the metrics and plots to.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_arguments())
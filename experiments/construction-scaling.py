@@ -0,0 +1,131 @@
+"""
+Measures how index construction scales with the number of build threads. The
+same vectors are indexed from scratch with each thread count, and the build
+time, insertion throughput and parallel efficiency (speedup divided by the
+number of threads) are recorded.
+
+Example:
+    poetry run python construction-scaling.py \
+        --dataset /root/data/sift/train.npy --num-threads 1 2 4 8 16 32 64
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict
+
+import flatnav
+import numpy as np
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def time_construction(train_data: np.ndarray, num_threads: int, args) -> float:
+    """
+    Builds an index over `train_data` with `num_threads` threads.
+    :return: The build time in seconds.
+    """
+    index = flatnav.index.create(
+        distance_type=args.metric,
+        dim=train_data.shape[1],
+        dataset_size=train_data.shape[0],
+        max_edges_per_node=args.num_node_links,
+    )
+    index.set_num_threads(num_threads)
+    start = time.perf_counter()
+    index.add(
+        data=train_data,
+        ef_construction=args.ef_construction,
+        num_initializations=args.num_initializations,
+    )
+    return time.perf_counter() - start
+
+
+def summarize(num_threads: int, build_time: float, baseline: float, n: int) -> Dict:
+    speedup = baseline / build_time
+    return {
+        "num_threads": num_threads,
+        "build_time": build_time,
+        "vectors_per_second": n / build_time,
+        "speedup": speedup,
+        "efficiency": speedup / num_threads,
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    if args.dataset:
+        train_data = np.load(args.dataset).astype(np.float32)
+    else:
+        rng = np.random.default_rng(seed=0)
+        train_data = rng.random((args.num_vectors, args.dim), dtype=np.float32)
+
+    runs = []
+    baseline = None
+    for num_threads in sorted(args.num_threads):
+        build_time = min(
+            time_construction(train_data, num_threads, args)
+            for _ in range(args.num_trials)
+        )
+        # Speedups are relative to the smallest thread count, taking it to
+        # scale perfectly (so it is usually 1).
+        baseline = baseline or build_time * num_threads
+        run = summarize(num_threads, build_time, baseline, len(train_data))
+        logger.info(json.dumps(run))
+        runs.append(run)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    metrics_file_path = os.path.join(args.output_dir, "construction_scaling.json")
+    with open(metrics_file_path, "w") as file:
+        json.dump(runs, file, indent=4)
+    logger.info(f"Saved metrics to {metrics_file_path}")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measure index construction time against the number of threads."
+    )
+    parser.add_argument(
+        "--dataset",
+        default=None,
+        help="Path to the vectors to index (.npy). Random vectors are used if unset.",
+    )
+    parser.add_argument(
+        "--num-vectors",
+        type=int,
+        default=1_000_000,
+        help="Number of random vectors to index if no dataset is given.",
+    )
+    parser.add_argument(
+        "--dim", type=int, default=128, help="Dimension of the random vectors."
+    )
+    parser.add_argument("--metric", default="l2", help="Either `l2` or `angular`.")
+    parser.add_argument("--num-node-links", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=100)
+    parser.add_argument("--num-initializations", type=int, default=100)
+    parser.add_argument(
+        "--num-threads",
+        nargs="+",
+        type=int,
+        default=[1, 2, 4, 8, 16, 32, 64],
+        help="Thread counts to build the index with.",
+    )
+    parser.add_argument(
+        "--num-trials",
+        type=int,
+        default=1,
+        help="Builds per thread count. The fastest one is reported.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="metrics",
+        help="Directory to write the metrics to.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_arguments())
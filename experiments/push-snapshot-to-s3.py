@@ -1,3 +1,4 @@
+import asyncio
 import boto3
 import os
 import sys
@@ -72,6 +73,31 @@ def find_most_recent_file(directory: str, file_extension: str) -> str:
     return latest_file
 
 
+async def save_and_upload_snapshot(
+    index, s3_client: boto3.client, bucket_name: str, bucket_prefix: str
+) -> str:
+    """
+    Saves a snapshot of a live index and uploads it once it is written. The index
+    keeps serving (and accepting insertions) while the snapshot is written.
+    :param index: The FlatNav index to snapshot.
+    :param s3_client: The S3 client to use.
+    :param bucket_name: The name of the bucket to upload to.
+    :param bucket_prefix: The prefix to add to the file in the bucket.
+    :return: The path of the snapshot.
+    """
+    time_format = "%a%b%d%H:%M:%S%Y"
+    file_extension = os.environ.get("FILE_EXTENSION", ".hnsw")
+    file_name = os.path.join(
+        os.getcwd(), f"index_{datetime.now().strftime(time_format)}{file_extension}"
+    )
+
+    await asyncio.wrap_future(index.save_async(file_name))
+    await asyncio.get_running_loop().run_in_executor(
+        None, upload_file_to_s3, s3_client, file_name, bucket_name, bucket_prefix
+    )
+    return file_name
+
+
 def run():
     """
     Uploads the most recent HNSW index snapshot to an S3 bucket specified by the
@@ -169,6 +169,9 @@ def train_index(
     use_hnsw_base_layer: bool = False,
     hnsw_base_layer_filename: Optional[str] = None,
     num_build_threads: int = 1,
+    collect_stats: bool = False,
+    pruning_alpha: float = 1.0,
+    refine_graph: bool = False,
 ) -> Union[flatnav.index.IndexL2Float, flatnav.index.IndexIPFloat, hnswlib.Index]:
     """
     Creates and trains an index on the given dataset.
@@ -182,6 +185,10 @@ def train_index(
     :param use_hnsw_base_layer: If set, use HNSW's base layer's connectivity for the Flatnav index.
     :param hnsw_base_layer_filename: Filename to save the HNSW base layer graph to.
     :param num_build_threads: The number of threads to use during index construction.
+    :param collect_stats: If set, the FlatNav index counts distance computations.
+    :param pruning_alpha: The alpha of FlatNav's neighbor pruning rule (1 is the HNSW heuristic).
+    :param refine_graph: If set, the FlatNav graph is built in two passes, as in Vamana: the
+        vectors are inserted with an alpha of 1, then every node is re-linked with `pruning_alpha`.
     :return: The trained index.
     """
     if index_type == "hnsw":
@@ -246,15 +253,20 @@ def train_index(
             dataset_size=dataset_size,
             max_edges_per_node=max_edges_per_node,
             verbose=True,
-            collect_stats=False,
+            collect_stats=collect_stats,
         )
         index.set_num_threads(num_build_threads)
+        if not refine_graph:
+            index.pruning_alpha = pruning_alpha
 
         # Train the index.
         start = time.time()
         index.add(
             data=train_dataset, ef_construction=ef_construction, num_initializations=100
         )
+        if refine_graph:
+            index.pruning_alpha = pruning_alpha
+            index.refine_graph(ef_construction=ef_construction)
         end = time.time()
 
         logging.info(f"Indexing time = {end - start} seconds")
@@ -278,9 +290,12 @@ def main(
     use_hnsw_base_layer: bool = False,
     hnsw_base_layer_filename: Optional[str] = None,
     reordering_strategies: List[str] | None = None,
+    entry_point_strategies: List[str] | None = None,
     num_initializations: Optional[List[int]] = None,
     num_build_threads: int = 1,
     num_search_threads: int = 1,
+    pruning_alpha: float = 1.0,
+    refine_graph: bool = False,
 ):
     
     def build_and_run_knn_search(ef_cons: int, node_links: int):
@@ -302,6 +317,9 @@ def main(
             use_hnsw_base_layer=use_hnsw_base_layer,
             hnsw_base_layer_filename=hnsw_base_layer_filename,
             num_build_threads=num_build_threads,
+            collect_stats="distance_computations" in requested_metrics,
+            pruning_alpha=pruning_alpha,
+            refine_graph=refine_graph,
         )
         
         if reordering_strategies is not None:
@@ -310,37 +328,46 @@ def main(
             index.reorder(strategies=reordering_strategies)
         
         index.set_num_threads(num_search_threads)
-        for ef_search in ef_search_params:
-            # Extend metrics with computed metrics
-            metrics.update(
-                compute_metrics(
-                    requested_metrics=requested_metrics,
-                    index=index,
-                    queries=queries,
-                    ground_truth=gtruth,
-                    ef_search=ef_search,
+        for entry_point_strategy in entry_point_strategies or [None]:
+            if entry_point_strategy is not None:
+                if index_type != "flatnav":
+                    raise ValueError(
+                        "Entry point strategies only apply to the FlatNav index."
+                    )
+                index.set_entry_point_strategy(strategy=entry_point_strategy)
+                metrics["entry_point_strategy"] = entry_point_strategy
+
+            for ef_search in ef_search_params:
+                # Extend metrics with computed metrics
+                metrics.update(
+                    compute_metrics(
+                        requested_metrics=requested_metrics,
+                        index=index,
+                        queries=queries,
+                        ground_truth=gtruth,
+                        ef_search=ef_search,
+                    )
                 )
-            )
-            logging.info(f"Metrics: {metrics}")
-
-            # Add parameters to the metrics dictionary.
-            metrics["distance_type"] = distance_type
-            metrics["ef_search"] = ef_search
-            all_metrics = {experiment_key: []}
-
-            if os.path.exists(metrics_file) and os.path.getsize(metrics_file) > 0:
-                with open(metrics_file, "r") as file:
-                    try:
-                        all_metrics = json.load(file)
-                    except json.JSONDecodeError:
-                        logging.error(f"Error reading {metrics_file=}")
-
-            if experiment_key not in all_metrics:
-                all_metrics[experiment_key] = []
-
-            all_metrics[experiment_key].append(metrics)
-            with open(metrics_file, "w") as file:
-                json.dump(all_metrics, file, indent=4)
+                logging.info(f"Metrics: {metrics}")
+
+                # Add parameters to the metrics dictionary.
+                metrics["distance_type"] = distance_type
+                metrics["ef_search"] = ef_search
+                all_metrics = {experiment_key: []}
+
+                if os.path.exists(metrics_file) and os.path.getsize(metrics_file) > 0:
+                    with open(metrics_file, "r") as file:
+                        try:
+                            all_metrics = json.load(file)
+                        except json.JSONDecodeError:
+                            logging.error(f"Error reading {metrics_file=}")
+
+                if experiment_key not in all_metrics:
+                    all_metrics[experiment_key] = []
+
+                all_metrics[experiment_key].append(metrics)
+                with open(metrics_file, "w") as file:
+                    json.dump(all_metrics, file, indent=4)
     
     
     dataset_size = train_dataset.shape[0]
@@ -348,9 +375,15 @@ def main(
 
     experiment_key = f"{dataset_name}_{index_type}"
 
+    if index_type != "flatnav" and (pruning_alpha != 1.0 or refine_graph):
+        raise ValueError("Pruning alpha and graph refinement only apply to the FlatNav index.")
+
     for node_links in num_node_links:
         metrics = {}
         metrics["node_links"] = node_links
+        if index_type == "flatnav":
+            metrics["pruning_alpha"] = pruning_alpha
+            metrics["refine_graph"] = refine_graph
 
         for ef_cons in ef_cons_params:
             metrics["ef_construction"] = ef_cons
@@ -448,6 +481,32 @@ def parse_arguments() -> argparse.Namespace:
         "Options include `gorder` and `rcm`.",
     )
 
+    parser.add_argument(
+        "--entry-point-strategies",
+        required=False,
+        nargs="+",
+        type=str,
+        default=None,
+        help="Entry point strategies to benchmark, one after the other, on the same index "
+        "(only applies to FlatNav index). Options include `stride` and `sample_graph`.",
+    )
+
+    parser.add_argument(
+        "--pruning-alpha",
+        required=False,
+        default=1.0,
+        type=float,
+        help="Alpha of the neighbor pruning rule (only applies to FlatNav index). "
+        "1 is the HNSW heuristic; Vamana uses 1.2.",
+    )
+
+    parser.add_argument(
+        "--refine-graph",
+        action="store_true",
+        help="Build the FlatNav graph in two passes, as Vamana does: insert every vector, "
+        "then re-link every node with --pruning-alpha.",
+    )
+
     parser.add_argument(
         "--num-build-threads",
         required=False,
@@ -586,8 +645,11 @@ def run_experiment():
         use_hnsw_base_layer=args.use_hnsw_base_layer,
         hnsw_base_layer_filename=args.hnsw_base_layer_filename,
         reordering_strategies=args.reordering_strategies,
+        entry_point_strategies=args.entry_point_strategies,
         num_build_threads=args.num_build_threads,
         num_search_threads=args.num_search_threads,
+        pruning_alpha=args.pruning_alpha,
+        refine_graph=args.refine_graph,
         metrics_file=metrics_file_path,
         num_initializations=num_initializations,
         requested_metrics=args.requested_metrics,
@@ -44,10 +44,44 @@ public:
     static_cast<T *>(this)->transformDataImpl(destination, src);
   }
 
+  // Size, in bytes, of the query representation produced by
+  // `transformQuery`. Asymmetric distances expect a transformed query as their
+  // first argument, which lets distances such as product quantization compute
+  // per-query state (e.g. lookup tables) once instead of on every call. A size
+  // of 0 means queries are used as they are.
+  size_t querySize() { return static_cast<T *>(this)->querySizeImpl(); }
+
+  void transformQuery(void *destination, const void *src) {
+    static_cast<T *>(this)->transformQueryImpl(destination, src);
+  }
+
+  // Exact distance between two vectors in their original (untransformed)
+  // representation. This is used to re-rank results computed on compressed
+  // codes.
+  float fullPrecisionDistance(const void *x, const void *y) {
+    return static_cast<T *>(this)->fullPrecisionDistanceImpl(x, y);
+  }
+
+  // Whether `transformData` stores vectors as they are given, in which case a
+  // stored vector can itself be used as a query.
+  bool storesVectors() { return static_cast<T *>(this)->storesVectorsImpl(); }
+
   // Serializes the distance function to disk.
   template <typename Archive> void serialize(Archive &archive) {
     static_cast<T *>(this)->template serialize<Archive>(archive);
   }
+
+protected:
+  // Defaults for distances that store vectors as they are given.
+  size_t querySizeImpl() { return 0; }
+
+  bool storesVectorsImpl() { return true; }
+
+  void transformQueryImpl(void *destination, const void *src) {}
+
+  float fullPrecisionDistanceImpl(const void *x, const void *y) {
+    return static_cast<T *>(this)->distanceImpl(x, y, /* asymmetric = */ false);
+  }
 };
 
 } // namespace flatnav::distances
\ No newline at end of file
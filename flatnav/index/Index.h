@@ -3,47 +3,165 @@
 #include <algorithm>
 #include <atomic>
 #include <cassert>
+#include <cctype>
 #include <cereal/access.hpp>
 #include <cereal/archives/binary.hpp>
 #include <cereal/cereal.hpp>
 #include <cereal/types/memory.hpp>
+#include <cereal/types/unordered_map.hpp>
+#include <cereal/types/vector.hpp>
+#include <charconv>
+#include <cmath>
+#include <cstdio>
 #include <cstring>
+#include <fcntl.h>
 #include <flatnav/distances/DistanceInterface.h>
 #include <flatnav/util/Macros.h>
 #include <flatnav/util/Multithreading.h>
 #include <flatnav/util/Reordering.h>
+#include <flatnav/util/SectionedFile.h>
+#include <flatnav/util/SegmentedArray.h>
+#include <flatnav/util/VectorStore.h>
 #include <flatnav/util/VisitedSetPool.h>
 #include <fstream>
+#include <functional>
+#include <future>
 #include <limits>
 #include <memory>
 #include <mutex>
+#include <numeric>
 #include <queue>
+#include <sys/mman.h>
+#include <sys/stat.h>
 #include <thread>
+#include <unistd.h>
+#include <unordered_map>
 #include <utility>
 #include <vector>
 
+using flatnav::ThreadPool;
+using flatnav::WriterGate;
 using flatnav::distances::DistanceInterface;
+using flatnav::util::SegmentedArray;
+using flatnav::util::VectorStore;
 using flatnav::util::VisitedSet;
 using flatnav::util::VisitedSetPool;
 
 namespace flatnav {
 
+// Internal node numbering scheme. Node ids are 32 bits wide unless the library
+// is built with FLATNAV_64BIT_NODE_IDS, which lifts the limit of ~4.29B nodes
+// per index at the cost of 4 more bytes per link.
+#ifdef FLATNAV_64BIT_NODE_IDS
+typedef uint64_t node_id_t;
+#else
+typedef uint32_t node_id_t;
+#endif
+
+// Strategies used by `Index::initializeSearch` to pick the node a beam search
+// starts from.
+enum class EntryPointStrategy : uint8_t {
+  // Compare the query against `num_initializations` nodes taken at a fixed
+  // stride over the node ids.
+  STRIDE = 0,
+  // Greedily descend a small k-NN graph built over ~sqrt(N) sampled nodes,
+  // starting at the sample medoid. The graph is rebuilt at the end of every
+  // `addBatch`.
+  SAMPLE_GRAPH = 1,
+};
+
 // dist_t: A distance function implementing DistanceInterface.
 // label_t: A fixed-width data type for the label (meta-data) of each point.
 template <typename dist_t, typename label_t> class Index {
   typedef std::pair<float, label_t> dist_label_t;
-  // internal node numbering scheme. We might need to change this to uint64_t
-  typedef uint32_t node_id_t;
   typedef std::pair<float, node_id_t> dist_node_t;
 
   // NOTE: by default this is a max-heap. We could make this a min-heap
   // by using std::greater, but we want to use the queue as both a max-heap and
   // min-heap depending on the context.
-  typedef std::priority_queue<dist_node_t, std::vector<dist_node_t>>
-      PriorityQueue;
+  // Unlike std::priority_queue, the underlying storage can be reserved and
+  // cleared, which lets batched searches reuse the same heaps across queries.
+  class PriorityQueue
+      : public std::priority_queue<dist_node_t, std::vector<dist_node_t>> {
+  public:
+    void reserve(size_t capacity) { this->c.reserve(capacity); }
+    void clear() { this->c.clear(); }
+  };
+
+  // State of one in-flight beam search. `searchBatch` keeps a few of these
+  // per worker thread and advances them in turns.
+  struct BeamSearchState {
+    const void *query;
+    // Holds the transformed query for distances that have one (see
+    // `transformQuery`).
+    std::vector<char> query_buffer;
+    PriorityQueue neighbors;
+    PriorityQueue candidates;
+    VisitedSet *visited_set;
+    // Snapshot of the links of the node being expanded.
+    std::vector<node_id_t> links_buffer;
+    float max_dist;
+    int buffer_size;
+    // Whether links are read in place rather than through the node versions
+    // (see `LinksReader`).
+    bool read_links_in_place;
+  };
+
+  // Number of queries a `searchBatch` worker interleaves. While one query
+  // computes distances, the node blocks prefetched for the others arrive.
+  static constexpr uint32_t SEARCH_BATCH_INTERLEAVE = 4;
 
-  // Large (several GB), pre-allocated block of memory.
-  char *_index_memory;
+public:
+  // Predicate over labels used to restrict search results. An empty filter
+  // admits every label.
+  typedef std::function<bool(const label_t &)> LabelFilter;
+
+private:
+
+  // The node block is written to disk starting at an offset that is a multiple
+  // of this value. 64KB covers the page sizes of all the platforms we build on
+  // (4KB on x86, 16KB on Apple Silicon, 64KB on some ARM servers), which lets
+  // us mmap the node block directly from the index file.
+  static constexpr size_t INDEX_MEMORY_ALIGNMENT = 1 << 16;
+
+  // Version of the file format written by `saveIndex`. Files are made of
+  // checksummed sections (see util::SectionedFileWriter), each starting at a
+  // multiple of INDEX_MEMORY_ALIGNMENT.
+  static constexpr uint32_t INDEX_FILE_VERSION = 1;
+  enum IndexFileSection : uint32_t {
+    // Sizes, node counts and deletion state.
+    PARAMETERS_SECTION = 1,
+    // Distance parameters, including quantizer codebooks.
+    DISTANCE_SECTION = 2,
+    // The label to node map and the re-ordering permutation.
+    LABELS_SECTION = 3,
+    // The entry point strategy and the sample graph.
+    ENTRY_POINTS_SECTION = 4,
+    // Re-rank vectors. Only present if re-ranking is enabled.
+    RERANK_VECTORS_SECTION = 5,
+    // The blocks of the first `_cur_num_nodes` nodes, back to back.
+    NODES_SECTION = 6,
+  };
+
+  // Out-degree of the sample graph and the minimum number of nodes sampled
+  // into it (for small indices sqrt(N) is too coarse to be useful).
+  static constexpr size_t SAMPLE_GRAPH_DEGREE = 16;
+  static constexpr size_t MIN_SAMPLE_GRAPH_SIZE = 64;
+
+  // With several threads, Gorder runs on partitions of at least this many
+  // nodes in parallel (see `util::partitionedGOrder`). Smaller graphs are
+  // reordered exactly.
+  static constexpr size_t MIN_GORDER_PARTITION_SIZE = 1 << 18;
+
+  // Large (several GB), pre-allocated node blocks. They are stored in
+  // segments of a power of two number of nodes that never move, so that the
+  // index can grow (see `resize`) while it is being searched.
+  SegmentedArray<char> _index_memory;
+  // Read-only mapping of the node block when the index was loaded with
+  // `mmap = true`. The segments of `_index_memory` then point into it. The
+  // size is 0 if the node blocks were allocated on the heap.
+  char *_mapped_memory = nullptr;
+  size_t _mapped_memory_size = 0;
 
   size_t _M;
   // size of one data point (does not support variable-size data, strings)
@@ -51,16 +169,85 @@ template <typename dist_t, typename label_t> class Index {
   // Node consists of: ([data] [M links] [data label]). This layout was chosen
   // after benchmarking - it's slightly more cache-efficient than others.
   size_t _node_size_bytes;
-  size_t _max_node_count; // Determines size of internal pre-allocated memory
-  size_t _cur_num_nodes;
+  // Number of nodes the index can hold before it has to grow. Only raised
+  // with `_index_data_guard` held, but read without it.
+  std::atomic<size_t> _max_node_count = 0;
+  // Nodes below this id are initialized and can be scanned. Nodes are
+  // inserted concurrently but published in id order (see `publishNode`).
+  std::atomic<size_t> _cur_num_nodes = 0;
+  // Next node id that was never handed out. Ids in [`_cur_num_nodes`,
+  // `_next_node_id`) are being initialized by inserting threads.
+  std::atomic<size_t> _next_node_id = 0;
+  // If set, inserting into a full index grows it instead of throwing.
+  bool _auto_grow = false;
+  // Relaxation of the pruning rule in `selectNeighbors`. 1 is the HNSW
+  // heuristic. Not saved with the index, since it only affects construction.
+  float _pruning_alpha = 1.0f;
   std::unique_ptr<DistanceInterface<dist_t>> _distance;
   std::mutex _index_data_guard;
 
-  uint32_t _num_threads;
+  // Long-lived workers used for construction, repair and batched search.
+  // Its size is the number of threads the index uses.
+  std::unique_ptr<ThreadPool> _thread_pool;
+  // Number of consecutive items a worker claims at a time in `addBatch` and
+  // other parallel loops. 0 lets the thread pool pick.
+  uint32_t _parallel_chunk_size = 0;
 
   // Remembers which nodes we've visited, to avoid re-computing distances.
   VisitedSetPool *_visited_set_pool;
-  std::vector<std::mutex> _node_links_mutexes;
+
+  // Per-node seqlock versions guarding the links of each node. Writers make a
+  // node's version odd while they modify its links and even again when done;
+  // readers copy the links and retry if the version changed underneath them,
+  // so searches never write to shared memory. This is empty while the index
+  // is frozen and no longer being modified.
+  SegmentedArray<std::atomic<uint32_t>> _node_versions;
+  // While frozen, searches read links directly without consulting
+  // `_node_versions`. The first write thaws the index.
+  std::atomic<bool> _frozen = false;
+  std::mutex _freeze_guard;
+  // Searches in flight, by how they read links (see `LinksReader`).
+  mutable std::atomic<size_t> _in_place_readers = 0;
+  mutable std::atomic<size_t> _seqlock_readers = 0;
+
+  // Every modification of the index passes through this gate. Saving pauses
+  // it, so that the file holds the index as it was between two writes.
+  WriterGate _writer_gate;
+
+  // Tombstones for soft-deleted nodes. Deleted nodes are still traversed by
+  // beam search (so the graph stays connected) but never returned as results
+  // or chosen as neighbors of new nodes. Writes are guarded by
+  // `_index_data_guard`.
+  SegmentedArray<uint8_t> _tombstones;
+  // Deleted nodes whose in-edges have not yet been re-linked by
+  // `repairDeletedNodes`.
+  std::vector<node_id_t> _deleted_node_ids;
+  // Repaired slots that no node links to anymore. `allocateNode` reuses these
+  // before growing `_cur_num_nodes`.
+  std::vector<node_id_t> _free_node_ids;
+
+  // Node id of every live label, so that a label is found without scanning
+  // the node block. Guarded by `_index_data_guard`. Labels are expected to be
+  // unique: if one is added twice, it keeps pointing to the first node.
+  std::unordered_map<label_t, node_id_t> _label_to_node;
+  // Every re-ordering applied so far, composed: the node that had id `i`
+  // before the first re-ordering now has id `_node_permutation[i]`. Empty if
+  // the index was never re-ordered. Nodes beyond its end kept their ids.
+  std::vector<node_id_t> _node_permutation;
+
+  EntryPointStrategy _entry_point_strategy = EntryPointStrategy::STRIDE;
+  // Nodes of the sample graph, medoid first. `_sample_links` holds the
+  // adjacency lists as positions into `_sample_nodes`, with the same number
+  // of links for every sample.
+  std::vector<node_id_t> _sample_nodes;
+  std::vector<uint32_t> _sample_links;
+
+  // Full-precision (float) copies of the vectors, indexed by node id, used to
+  // re-rank the candidates found with a compressed representation such as
+  // product quantization. Empty unless `enableReranking` was called. They can
+  // live in a memory-mapped file so that only the compressed codes take up
+  // RAM.
+  VectorStore _rerank_vectors;
 
   bool _collect_stats = false;
 
@@ -79,52 +266,76 @@ template <typename dist_t, typename label_t> class Index {
   // resources are safely transferred and the source object is left in a valid
   // state.
   Index(Index &&other) noexcept
-      : _index_memory(other._index_memory), _M(other._M),
+      : _index_memory(std::move(other._index_memory)),
+        _mapped_memory(other._mapped_memory),
+        _mapped_memory_size(other._mapped_memory_size), _M(other._M),
         _data_size_bytes(other._data_size_bytes),
         _node_size_bytes(other._node_size_bytes),
-        _max_node_count(other._max_node_count),
-        _cur_num_nodes(other._cur_num_nodes),
+        _max_node_count(other._max_node_count.load()),
+        _cur_num_nodes(other._cur_num_nodes.load()),
+        _next_node_id(other._next_node_id.load()), _auto_grow(other._auto_grow),
+        _pruning_alpha(other._pruning_alpha),
         _distance(std::move(other._distance)),
         _index_data_guard(std::move(other._index_data_guard)),
-        _num_threads(other._num_threads),
+        _thread_pool(std::move(other._thread_pool)),
+        _parallel_chunk_size(other._parallel_chunk_size),
         _visited_set_pool(std::move(other._visited_set_pool)),
-        _node_links_mutexes(std::move(other._node_links_mutexes)) {
-    other._index_memory = nullptr;
+        _node_versions(std::move(other._node_versions)),
+        _frozen(other._frozen.load()),
+        _tombstones(std::move(other._tombstones)),
+        _deleted_node_ids(std::move(other._deleted_node_ids)),
+        _free_node_ids(std::move(other._free_node_ids)),
+        _label_to_node(std::move(other._label_to_node)),
+        _node_permutation(std::move(other._node_permutation)),
+        _entry_point_strategy(other._entry_point_strategy),
+        _sample_nodes(std::move(other._sample_nodes)),
+        _sample_links(std::move(other._sample_links)),
+        _rerank_vectors(std::move(other._rerank_vectors)) {
+    other._mapped_memory = nullptr;
+    other._mapped_memory_size = 0;
     other._visited_set_pool = nullptr;
   }
 
   Index &operator=(Index &&other) noexcept {
     if (this != &other) {
-      delete[] _index_memory;
+      releaseIndexMemory();
       delete _visited_set_pool;
 
-      _index_memory = other._index_memory;
+      _index_memory = std::move(other._index_memory);
+      _mapped_memory = other._mapped_memory;
+      _mapped_memory_size = other._mapped_memory_size;
       _M = other._M;
       _data_size_bytes = other._data_size_bytes;
       _node_size_bytes = other._node_size_bytes;
-      _max_node_count = other._max_node_count;
-      _cur_num_nodes = other._cur_num_nodes;
+      _max_node_count = other._max_node_count.load();
+      _cur_num_nodes = other._cur_num_nodes.load();
+      _next_node_id = other._next_node_id.load();
+      _auto_grow = other._auto_grow;
+      _pruning_alpha = other._pruning_alpha;
       _distance = std::move(other._distance);
       _index_data_guard = std::move(other._index_data_guard);
-      _num_threads = other._num_threads;
+      _thread_pool = std::move(other._thread_pool);
+      _parallel_chunk_size = other._parallel_chunk_size;
       _visited_set_pool = std::move(other._visited_set_pool);
-      _node_links_mutexes = std::move(other._node_links_mutexes);
-
-      other._index_memory = nullptr;
+      _node_versions = std::move(other._node_versions);
+      _frozen = other._frozen.load();
+      _tombstones = std::move(other._tombstones);
+      _deleted_node_ids = std::move(other._deleted_node_ids);
+      _free_node_ids = std::move(other._free_node_ids);
+      _label_to_node = std::move(other._label_to_node);
+      _node_permutation = std::move(other._node_permutation);
+      _entry_point_strategy = other._entry_point_strategy;
+      _sample_nodes = std::move(other._sample_nodes);
+      _sample_links = std::move(other._sample_links);
+      _rerank_vectors = std::move(other._rerank_vectors);
+
+      other._mapped_memory = nullptr;
+      other._mapped_memory_size = 0;
       other._visited_set_pool = nullptr;
     }
     return *this;
   }
 
-  template <typename Archive> void serialize(Archive &archive) {
-    archive(_M, _data_size_bytes, _node_size_bytes, _max_node_count,
-            _cur_num_nodes, *_distance);
-
-    // Serialize the allocated memory for the index & query.
-    archive(
-        cereal::binary_data(_index_memory, _node_size_bytes * _max_node_count));
-  }
-
 public:
   /**
    * @brief Construct a new Index object for approximate near neighbor search.
@@ -144,82 +355,137 @@ public:
   Index(std::unique_ptr<DistanceInterface<dist_t>> dist, int dataset_size,
         int max_edges_per_node, bool collect_stats = false)
       : _M(max_edges_per_node), _max_node_count(dataset_size),
-        _cur_num_nodes(0), _distance(std::move(dist)), _num_threads(1),
+        _distance(std::move(dist)),
+        _thread_pool(std::make_unique<ThreadPool>(/* num_threads = */ 1)),
         _visited_set_pool(new VisitedSetPool(
             /* initial_pool_size = */ 1,
             /* num_elements = */ dataset_size)),
-        _node_links_mutexes(dataset_size), _collect_stats(collect_stats) {
-
-    // Get the size in bytes of the _node_links_mutexes vector.
-    size_t mutexes_size_bytes = _node_links_mutexes.size() * sizeof(std::mutex);
+        _collect_stats(collect_stats) {
 
     _data_size_bytes = _distance->dataSize();
     _node_size_bytes =
         _data_size_bytes + (sizeof(node_id_t) * _M) + sizeof(label_t);
-    size_t index_memory_size = _node_size_bytes * _max_node_count;
 
-    _index_memory = new char[index_memory_size];
+    initializeNodeStorage();
+    _index_memory.grow(_max_node_count);
+    _node_versions.grow(_max_node_count);
+    _tombstones.grow(_max_node_count);
   }
 
   ~Index() {
-    delete[] _index_memory;
+    releaseIndexMemory();
     delete _visited_set_pool;
   }
 
+  /**
+   * @brief Sets the links of every node from a graph in Matrix Market format,
+   * such as the base layer written by hnswlib's `save_base_layer_graph`. The
+   * header holds the number of nodes (twice) and the number of links per
+   * node, and every other line a 1-based edge `u v`. Prefer the compressed
+   * sparse row overload, which skips the text and fills the links in
+   * parallel.
+   *
+   * @exception std::runtime_error Thrown if the file cannot be read, does not
+   * match the index, or gives a node more than M links.
+   */
   void buildGraphLinks(const std::string &mtx_filename) {
-    std::ifstream input_file(mtx_filename);
-    if (!input_file.is_open()) {
+    auto writer = beginWrite(/* operation = */ "build graph links");
+    int fd = ::open(mtx_filename.c_str(), O_RDONLY);
+    struct stat file_stat;
+    if (fd == -1 || ::fstat(fd, &file_stat) == -1 || file_stat.st_size == 0) {
+      if (fd != -1) {
+        ::close(fd);
+      }
       throw std::runtime_error("Unable to open file for reading: " +
                                mtx_filename);
     }
-
-    std::string line;
-    // Skip the header
-    while (std::getline(input_file, line)) {
-      if (line[0] != '%')
-        break;
+    size_t size = file_stat.st_size;
+    void *region = ::mmap(/* addr = */ nullptr, /* length = */ size,
+                          /* prot = */ PROT_READ, /* flags = */ MAP_PRIVATE,
+                          /* fd = */ fd, /* offset = */ 0);
+    ::close(fd);
+    if (region == MAP_FAILED) {
+      throw std::runtime_error("Unable to memory-map file: " + mtx_filename);
     }
-
-    std::istringstream iss(line);
-    int num_vertices, num_edges;
-    iss >> num_vertices >> num_vertices >> num_edges;
-
-    // check that the number of vertices in the mtx file matches the number of
-    // nodes in the index and that the number of edges is equal to the number of
-    // links per node.
-    if (num_vertices != _max_node_count) {
-      throw std::runtime_error("Number of vertices in the mtx file does not "
-                               "match the size allocated for the index.");
+    ::madvise(region, size, MADV_SEQUENTIAL);
+    try {
+      const char *text = static_cast<const char *>(region);
+      readMatrixMarketLinks(/* begin = */ text, /* end = */ text + size,
+                            /* mtx_filename = */ mtx_filename);
+    } catch (...) {
+      ::munmap(region, size);
+      throw;
     }
+    ::munmap(region, size);
+  }
 
-    if (num_edges != _M) {
-      throw std::runtime_error("Number of edges in the mtx file does not match "
-                               "the number of links per node.");
+  /**
+   * @brief Sets the links of every node from a graph in compressed sparse
+   * row form: the out-edges of `node` are `edges[offsets[node]]` up to
+   * `edges[offsets[node + 1]]`. The graph must have one node per allocated
+   * node (see `allocateNode`), in node id order. The whole graph is
+   * validated before any links change, then the links are filled in parallel
+   * on the index's thread pool. Slots beyond a node's degree, and edges of a
+   * node to itself, are left empty. This must not run concurrently with
+   * searches.
+   *
+   * @param offsets The `num_nodes + 1` offsets of each node's edges.
+   * @param edges The `num_edges` edge targets.
+   *
+   * @exception std::invalid_argument Thrown if the graph does not have one
+   * node per allocated node, its offsets are not a valid partition of the
+   * edges, a node has more than M out-edges, or an edge leaves the graph.
+   */
+  void buildGraphLinks(const uint64_t *offsets, const node_id_t *edges,
+                       size_t num_nodes, uint64_t num_edges) {
+    auto writer = beginWrite(/* operation = */ "build graph links");
+    checkGraphNumNodes(/* num_nodes = */ num_nodes);
+    if (offsets[0] != 0 || offsets[num_nodes] != num_edges) {
+      throw std::invalid_argument(
+          "The offsets of the graph must start at 0 and end at the number of "
+          "edges (" + std::to_string(num_edges) + ").");
     }
-
-    int u, v;
-    while (input_file >> u >> v) {
-      // Adjust for 1-based indexing in Matrix Market format
-      u--;
-      v--;
-      node_id_t *links = getNodeLinks(u);
-      // Now add a directed edge from u to v. We need to check for the first
-      // available slot in the links array since there might be other edges
-      // added before this one. By definition, a slot is available if and only
-      // if it points to the node itself.
-      for (size_t i = 0; i < _M; i++) {
-        if (links[i] == u) {
-          links[i] = v;
-          break;
+    _thread_pool->parallelFor(0, num_nodes, [&](uint64_t node) {
+      if (offsets[node + 1] < offsets[node]) {
+        throw std::invalid_argument(
+            "The offsets of the graph must be non-decreasing, but node " +
+            std::to_string(node) + " ends before it starts.");
+      }
+      uint64_t degree = offsets[node + 1] - offsets[node];
+      if (degree > _M) {
+        throw std::invalid_argument(
+            "Node " + std::to_string(node) + " has " + std::to_string(degree) +
+            " out-edges, but the index holds at most " + std::to_string(_M) +
+            " links per node.");
+      }
+      for (uint64_t edge = offsets[node]; edge < offsets[node + 1]; edge++) {
+        if (edges[edge] >= num_nodes) {
+          throw std::invalid_argument(
+              "Node " + std::to_string(node) + " links to node " +
+              std::to_string(edges[edge]) + ", which is not in the graph.");
         }
       }
-    }
+    });
+
+    _thread_pool->parallelFor(0, num_nodes, [&](uint64_t node) {
+      node_id_t *links = getNodeLinks(node);
+      node_id_t *last =
+          std::copy_if(edges + offsets[node], edges + offsets[node + 1], links,
+                       [node](node_id_t edge) { return edge != node; });
+      std::fill(last, links + _M, static_cast<node_id_t>(node));
+    });
+  }
 
-    input_file.close();
+  // The links of every node, in compressed sparse row form.
+  util::CSRGraph<node_id_t> getGraph() {
+    return util::CSRGraph<node_id_t>::fromLinks(
+        /* num_nodes = */ _cur_num_nodes, /* max_degree = */ _M,
+        /* links = */ [this](node_id_t node) { return getNodeLinks(node); },
+        /* thread_pool = */ _thread_pool.get());
   }
 
-  std::vector<std::vector<uint32_t>> getGraphOutdegreeTable() {
-    std::vector<std::vector<uint32_t>> outdegree_table(_cur_num_nodes);
+  std::vector<std::vector<node_id_t>> getGraphOutdegreeTable() {
+    std::vector<std::vector<node_id_t>> outdegree_table(_cur_num_nodes);
     for (node_id_t node = 0; node < _cur_num_nodes; node++) {
       node_id_t *links = getNodeLinks(node);
       for (int i = 0; i < _M; i++) {
@@ -232,26 +498,71 @@ public:
   }
 
   /**
-   * @brief Store the new node in the global data structure. In a
-   * multi-threaded setting, the index data guard should be held by the caller
-   * with an exclusive lock.
+   * @brief Store the new node in the global data structure. Slots freed by
+   * `repairDeletedNodes` are reused before new ones are handed out. Safe to
+   * call from several threads: new node ids come from an atomic counter and
+   * the index data guard is only held to update the free slots and the label
+   * map.
    *
    * @param data The vector to add.
    * @param label The label (meta-data) of the vector.
    * @param new_node_id The id of the new node.
+   *
+   * @exception std::runtime_error Thrown if the index is full and auto-grow
+   * is disabled.
    */
   void allocateNode(void *data, label_t &label, node_id_t &new_node_id) {
+    auto writer = beginWrite(/* operation = */ "allocate nodes");
+
+    // Reused slots stay tombstoned, and new ones unpublished, until they are
+    // initialized, so that scans over the node ids skip them meanwhile.
+    bool reused = false;
+    {
+      std::unique_lock<std::mutex> lock(_index_data_guard);
+      if (!_free_node_ids.empty()) {
+        new_node_id = _free_node_ids.back();
+        _free_node_ids.pop_back();
+        reused = true;
+      }
+    }
+    if (!reused) {
+      new_node_id = reserveNodeId();
+    }
 
-    new_node_id = _cur_num_nodes;
-    _distance->transformData(
-        /* destination = */ getNodeData(new_node_id),
-        /* src = */ data);
+    try {
+      _distance->transformData(
+          /* destination = */ getNodeData(new_node_id),
+          /* src = */ data);
+      storeRerankVector(/* node = */ new_node_id, /* data = */ data);
+    } catch (...) {
+      // Give the slot back. A new one is still published, as a free slot, so
+      // that the nodes after it can be published too.
+      std::fill_n(getNodeLinks(new_node_id), _M, new_node_id);
+      _tombstones[new_node_id] = true;
+      {
+        std::unique_lock<std::mutex> lock(_index_data_guard);
+        _free_node_ids.push_back(new_node_id);
+      }
+      if (!reused) {
+        publishNode(new_node_id);
+      }
+      throw;
+    }
     *(getNodeLabel(new_node_id)) = label;
 
     node_id_t *links = getNodeLinks(new_node_id);
     // Initialize all edges to self
     std::fill_n(links, _M, new_node_id);
-    _cur_num_nodes++;
+
+    {
+      std::unique_lock<std::mutex> lock(_index_data_guard);
+      _label_to_node.emplace(label, new_node_id);
+    }
+    if (reused) {
+      _tombstones[new_node_id] = false;
+    } else {
+      publishNode(new_node_id);
+    }
   }
 
   /**
@@ -260,13 +571,14 @@ public:
    * This method is responsible for adding vectors in batches, represented by
    * `data`, to the underlying graph. Each vector is associated with a label
    * provided in the `labels` vector. The method efficiently handles concurrent
-   * additions by dividing the workload among multiple threads, defined by
-   * `_num_threads`.
+   * additions by dividing the workload among the workers of the index's
+   * thread pool.
    *
-   * The method ensures thread safety by employing locking mechanisms at the
-   * node level in the underlying `connectNeighbors` and `beamSearch` methods.
-   * This allows multiple threads to safely add vectors to the index without
-   * causing data races or inconsistencies in the graph structure.
+   * The method ensures thread safety by employing per-node seqlocks in the
+   * underlying `connectNeighbors` and `beamSearch` methods. This allows
+   * multiple threads to safely add vectors to the index without causing data
+   * races or inconsistencies in the graph structure. The index is frozen (see
+   * `freeze`) when the batch has been added.
    *
    * @param data Pointer to the array of vectors to be added.
    * @param labels A vector of labels corresponding to each vector in `data`.
@@ -278,7 +590,7 @@ public:
    * @exception std::invalid_argument Thrown if `num_initializations` is less
    * than or equal to 0.
    * @exception std::runtime_error Thrown if the maximum number of nodes in the
-   * index is reached.
+   * index is reached and auto-grow is disabled.
    */
   template <typename data_type>
   void addBatch(void *data, std::vector<label_t> &labels, int ef_construction,
@@ -287,40 +599,56 @@ public:
       throw std::invalid_argument(
           "num_initializations must be greater than 0.");
     }
-    uint32_t total_num_nodes = labels.size();
-    uint32_t data_dimension = _distance->dimension();
-
-    // Don't spawn any threads if we are only using one.
-    if (_num_threads == 1) {
-      for (uint32_t row_id = 0; row_id < total_num_nodes; row_id++) {
-        void *vector = (data_type *)data + (row_id * data_dimension);
-        label_t label = labels[row_id];
-        this->add(vector, label, ef_construction, num_initializations);
+    size_t total_num_nodes = labels.size();
+    size_t data_dimension = _distance->dimension();
+
+    // The batch is not one write: each vector enters the writer gate on its
+    // own, so that the index can be saved while a large batch is added.
+    {
+      auto writer = beginWrite(/* operation = */ "add vectors");
+      // Grow once for the whole batch rather than in steps while it is added.
+      if (_auto_grow) {
+        std::unique_lock<std::mutex> lock(_index_data_guard);
+        size_t required_capacity =
+            _next_node_id + total_num_nodes -
+            std::min<size_t>(total_num_nodes, _free_node_ids.size());
+        if (required_capacity > _max_node_count) {
+          growCapacity(/* new_capacity = */ required_capacity);
+        }
       }
-      return;
     }
 
-    flatnav::executeInParallel(
+    _thread_pool->parallelFor(
         /* start_index = */ 0, /* end_index = */ total_num_nodes,
-        /* num_threads = */ _num_threads, /* function = */
-        [&](uint32_t row_index) {
+        /* function = */
+        [&](size_t row_index) {
           void *vector = (data_type *)data + (row_index * data_dimension);
           label_t label = labels[row_index];
           this->add(vector, label, ef_construction, num_initializations);
-        });
+        },
+        /* chunk_size = */ _parallel_chunk_size);
+
+    auto writer = _writer_gate.write();
+    if (_entry_point_strategy == EntryPointStrategy::SAMPLE_GRAPH) {
+      buildSampleGraph();
+    }
+
+    // Construction is done, so searches can skip the per-node versions until
+    // the next write. They stay allocated since more writes are likely. If
+    // other threads are still writing (e.g. adding batches of their own), the
+    // last of them freezes the index instead.
+    _writer_gate.runIfSoleWriter([this] { _frozen = true; });
   }
 
   /**
    * @brief Adds a single vector to the index.
    *
    * This method is called internally by `addBatch` for each vector in the
-   * batch. The method ensures thread safety by using locking primitives,
-   * allowing it to be safely used in a multi-threaded environment.
-   *
-   * The method first checks if the current number of nodes has reached the
-   * maximum capacity. If so, it throws a runtime error. It then locks the index
-   * structure to prevent concurrent modifications while allocating a new node.
-   * After unlocking, it connects the new node to its neighbors in the graph.
+   * batch and can run on many threads at once. No global lock is held while
+   * the entry point is chosen, and the new node gets its id from an atomic
+   * counter (see `allocateNode`), growing the index first if it is full and
+   * auto-grow is enabled. The new node is then connected to its neighbors in
+   * the graph.
    *
    * @param data Pointer to the vector data being added.
    * @param label Label associated with the vector.
@@ -330,245 +658,1853 @@ public:
    * algorithm.
    *
    * @exception std::runtime_error Thrown if the maximum number of nodes is
-   * reached.
+   * reached and auto-grow is disabled.
    */
   void add(void *data, label_t &label, int ef_construction,
            int num_initializations) {
+    auto writer = beginWrite(/* operation = */ "add vectors");
 
-    if (_cur_num_nodes >= _max_node_count) {
-      throw std::runtime_error("Maximum number of nodes reached. Consider "
-                               "increasing the `max_node_count` parameter to "
-                               "create a larger index.");
-    }
-    _index_data_guard.lock();
-    auto entry_node = initializeSearch(data, num_initializations);
+    std::vector<char> query_buffer;
+    const void *query =
+        transformQuery(/* query = */ data, /* buffer = */ query_buffer);
+
+    // The entry point is chosen among the nodes published so far. If there
+    // are none, node 0 is used: it is published before any other node, so it
+    // is ready once this node has been allocated.
+    bool index_was_empty = _cur_num_nodes.load() == 0;
+    auto entry_node = initializeSearch(query, num_initializations);
     node_id_t new_node_id;
     allocateNode(data, label, new_node_id);
-    _index_data_guard.unlock();
 
-    if (new_node_id == 0) {
+    if (index_was_empty && new_node_id == 0) {
       return;
     }
 
     auto neighbors = beamSearch(
-        /* query = */ data, /* entry_node = */ entry_node,
+        /* query = */ query, /* entry_node = */ entry_node,
         /* buffer_size = */ ef_construction);
 
     selectNeighbors(/* neighbors = */ neighbors);
     connectNeighbors(neighbors, new_node_id);
   }
 
+  /**
+   * @brief Soft-deletes the node with the given label. The node stays in the
+   * graph as a routing point but is excluded from search results and from the
+   * neighbor lists of nodes inserted afterwards. Its slot becomes reusable
+   * once `repairDeletedNodes` has re-linked its neighbors.
+   *
+   * @param label Label of the vector to remove.
+   *
+   * @exception std::invalid_argument Thrown if no live node has this label.
+   */
+  void remove(const label_t &label) {
+    auto writer = beginWrite(/* operation = */ "remove vectors");
+
+    std::unique_lock<std::mutex> lock(_index_data_guard);
+    node_id_t node = findNode(label);
+    _tombstones[node] = true;
+    _deleted_node_ids.push_back(node);
+    _label_to_node.erase(label);
+  }
+
+  /**
+   * @brief Replaces the vector stored under `label` and re-links the node with
+   * fresh neighbors, without changing its node id.
+   *
+   * @param data Pointer to the new vector data.
+   * @param label Label of the vector to update.
+   * @param ef_construction Parameter controlling the size of the dynamic
+   * candidate list while searching for the new neighbors.
+   * @param num_initializations Number of initializations for the search
+   * algorithm.
+   *
+   * @exception std::invalid_argument Thrown if no live node has this label.
+   */
+  void update(void *data, const label_t &label, int ef_construction,
+              int num_initializations = 100) {
+    auto writer = beginWrite(/* operation = */ "update vectors");
+
+    node_id_t node;
+    {
+      std::unique_lock<std::mutex> lock(_index_data_guard);
+      node = findNode(label);
+    }
+    {
+      NodeLinksGuard node_lock(this, node);
+      _distance->transformData(/* destination = */ getNodeData(node),
+                               /* src = */ data);
+      storeRerankVector(/* node = */ node, /* data = */ data);
+      std::fill_n(getNodeLinks(node), _M, node);
+    }
+
+    std::vector<char> query_buffer;
+    const void *query =
+        transformQuery(/* query = */ data, /* buffer = */ query_buffer);
+    auto entry_node = initializeSearch(query, num_initializations);
+    auto candidates = beamSearch(
+        /* query = */ query, /* entry_node = */ entry_node,
+        /* buffer_size = */ ef_construction);
+
+    // The node can find itself through its old in-edges, and linking a node to
+    // itself is how we mark an unused slot.
+    PriorityQueue neighbors;
+    while (!candidates.empty()) {
+      if (candidates.top().second != node) {
+        neighbors.push(candidates.top());
+      }
+      candidates.pop();
+    }
+    selectNeighbors(/* neighbors = */ neighbors);
+    connectNeighbors(neighbors, node);
+  }
+
+  // Whether a live (not removed) vector has this label.
+  bool contains(const label_t &label) {
+    std::unique_lock<std::mutex> lock(_index_data_guard);
+    return _label_to_node.count(label) > 0;
+  }
+
+  // One more than the largest label of a live vector, or 0 if there is none.
+  label_t nextUnusedLabel() {
+    std::unique_lock<std::mutex> lock(_index_data_guard);
+    label_t next_label = 0;
+    for (const auto &[label, node] : _label_to_node) {
+      next_label = std::max<label_t>(next_label, label + 1);
+    }
+    return next_label;
+  }
+
+  /**
+   * @brief Copies the vector stored under `label` into `destination`. With
+   * re-ranking enabled, this is the full-precision (float) vector. Otherwise
+   * it is the `dataSizeBytes()` bytes stored in the node, which for quantized
+   * indices is the code of the vector.
+   *
+   * @exception std::invalid_argument Thrown if no live node has this label.
+   */
+  void getVector(const label_t &label, void *destination) {
+    node_id_t node;
+    {
+      std::unique_lock<std::mutex> lock(_index_data_guard);
+      node = findNode(label);
+    }
+    if (rerankingEnabled()) {
+      std::memcpy(destination, _rerank_vectors.get(node),
+                  _rerank_vectors.dimension() * sizeof(float));
+      return;
+    }
+    std::memcpy(destination, getNodeData(node), _data_size_bytes);
+  }
+
+  /**
+   * @brief Returns P such that the node that had id `i` before the index was
+   * first re-ordered now has id `P[i]`, for every node. It is the identity if
+   * the index was never re-ordered.
+   */
+  std::vector<node_id_t> nodePermutation() {
+    std::unique_lock<std::mutex> lock(_index_data_guard);
+    std::vector<node_id_t> permutation(_node_permutation);
+    permutation.resize(_cur_num_nodes);
+    std::iota(permutation.begin() + _node_permutation.size(),
+              permutation.end(), _node_permutation.size());
+    return permutation;
+  }
+
+  /**
+   * @brief Re-links every node, as the second pass of Vamana's two-pass
+   * construction does. Each node searches the graph for its vector, starting
+   * from itself, and the nodes found together with its current neighbors are
+   * pruned with the current pruning alpha (see `setPruningAlpha`). The new
+   * neighbors then link back to the node. This gives nodes that were added
+   * to a small graph early on neighborhoods as good as later ones. With an
+   * alpha above 1, the extra long edges let searches reach the same recall
+   * with a smaller `ef_search`. Nodes are split across the thread pool's
+   * workers, and the index is frozen when they are done (see `addBatch`).
+   *
+   * @param ef_construction The beam width of the search for new neighbors.
+   *
+   * @exception std::runtime_error Thrown if the index only stores compressed
+   * codes and re-ranking is disabled, since there is no vector to search
+   * with.
+   */
+  void refineGraph(int ef_construction) {
+    if (_rerank_vectors.empty() && !_distance->storesVectors()) {
+      throw std::runtime_error(
+          "A quantized index only stores the codes of its vectors. Enable "
+          "re-ranking to keep full-precision copies to refine the graph with.");
+    }
+    auto writer = beginWrite(/* operation = */ "refine the graph");
+    size_t num_nodes = _cur_num_nodes;
+
+    auto refine_node = [&](node_id_t node) {
+      if (_tombstones[node]) {
+        return;
+      }
+      const void *vector = _rerank_vectors.empty()
+                               ? static_cast<const void *>(getNodeData(node))
+                               : _rerank_vectors.get(node);
+      std::vector<char> query_buffer;
+      const void *query =
+          transformQuery(/* query = */ vector, /* buffer = */ query_buffer);
+      PriorityQueue found =
+          beamSearch(/* query = */ query, /* entry_node = */ node,
+                     /* buffer_size = */ ef_construction);
+
+      std::vector<node_id_t> links_buffer(_M);
+      const node_id_t *links = readNodeLinks(
+          /* node = */ node, /* buffer = */ links_buffer.data(),
+          /* in_place = */ false);
+      std::vector<node_id_t> candidate_ids(links, links + _M);
+      for (; !found.empty(); found.pop()) {
+        candidate_ids.push_back(found.top().second);
+      }
+      std::sort(candidate_ids.begin(), candidate_ids.end());
+      candidate_ids.erase(
+          std::unique(candidate_ids.begin(), candidate_ids.end()),
+          candidate_ids.end());
+
+      PriorityQueue neighbors;
+      for (node_id_t candidate : candidate_ids) {
+        if (candidate != node && !_tombstones[candidate]) {
+          neighbors.emplace(
+              _distance->distance(/* x = */ getNodeData(node),
+                                  /* y = */ getNodeData(candidate)),
+              candidate);
+        }
+      }
+      selectNeighbors(neighbors);
+
+      std::vector<node_id_t> new_neighbors;
+      {
+        NodeLinksGuard lock(this, node);
+        node_id_t *node_links = getNodeLinks(node);
+        for (; !neighbors.empty(); neighbors.pop()) {
+          node_links[new_neighbors.size()] = neighbors.top().second;
+          new_neighbors.push_back(neighbors.top().second);
+        }
+        std::fill(node_links + new_neighbors.size(), node_links + _M, node);
+      }
+      // Only one node is locked at a time, so that two nodes that are being
+      // refined and link to each other cannot wait on one another.
+      for (node_id_t neighbor : new_neighbors) {
+        addLink(/* node = */ neighbor, /* new_neighbor = */ node);
+      }
+    };
+    _thread_pool->parallelFor(/* start_index = */ 0,
+                              /* end_index = */ num_nodes,
+                              /* function = */ refine_node,
+                              /* chunk_size = */ _parallel_chunk_size);
+
+    _writer_gate.runIfSoleWriter([this] { _frozen = true; });
+  }
+
+  /**
+   * @brief Re-links the neighbors of every node removed since the last call,
+   * then frees the removed slots for reuse. A node that points to a deleted
+   * node gets a new neighbor list, pruned with `selectNeighbors`, drawn from
+   * its remaining links and the deleted node's links. This keeps recall from
+   * decaying under churn. Re-linking can run on a background thread while
+   * searches and insertions continue. Writes are then paused while the slots
+   * are freed: an insertion that was in flight may have linked to a deleted
+   * node after its in-edges were re-linked, so only the slots that no node
+   * links to anymore are freed. The others are left for the next call.
+   */
+  void repairDeletedNodes() {
+    std::vector<node_id_t> deleted_nodes;
+    {
+      auto writer = beginWrite(/* operation = */ "repair deleted nodes");
+      size_t num_nodes;
+      {
+        std::unique_lock<std::mutex> lock(_index_data_guard);
+        deleted_nodes.swap(_deleted_node_ids);
+        num_nodes = _cur_num_nodes;
+      }
+      if (deleted_nodes.empty()) {
+        return;
+      }
+      _thread_pool->parallelFor(
+          /* start_index = */ 0, /* end_index = */ num_nodes,
+          /* function = */ [this](node_id_t node) { repairNode(node); },
+          /* chunk_size = */ _parallel_chunk_size);
+    }
+
+    auto pause = _writer_gate.pause();
+    if (_frozen.load()) {
+      unfreeze();
+    }
+    size_t num_nodes = _cur_num_nodes;
+    std::vector<uint8_t> freeing(num_nodes, false);
+    for (node_id_t node : deleted_nodes) {
+      freeing[node] = true;
+    }
+    // Deleted nodes that a remaining node still links to are kept, and so are
+    // the deleted nodes that those link to.
+    std::vector<std::atomic<bool>> linked(num_nodes);
+    _thread_pool->parallelFor(
+        /* start_index = */ 0, /* end_index = */ num_nodes,
+        /* function = */
+        [&](node_id_t node) {
+          if (freeing[node]) {
+            return;
+          }
+          node_id_t *links = getNodeLinks(node);
+          for (size_t i = 0; i < _M; i++) {
+            if (links[i] != node && freeing[links[i]]) {
+              linked[links[i]].store(true, std::memory_order_relaxed);
+            }
+          }
+        },
+        /* chunk_size = */ _parallel_chunk_size);
+    std::vector<node_id_t> kept_nodes;
+    for (node_id_t node : deleted_nodes) {
+      if (linked[node]) {
+        kept_nodes.push_back(node);
+      }
+    }
+    for (size_t i = 0; i < kept_nodes.size(); i++) {
+      node_id_t *links = getNodeLinks(kept_nodes[i]);
+      for (size_t j = 0; j < _M; j++) {
+        if (freeing[links[j]] && !linked[links[j]]) {
+          linked[links[j]] = true;
+          kept_nodes.push_back(links[j]);
+        }
+      }
+    }
+
+    // Nothing points to the other deleted nodes anymore, so their slots can
+    // be handed out again. They stay tombstoned until then.
+    deleted_nodes.erase(std::remove_if(deleted_nodes.begin(),
+                                       deleted_nodes.end(),
+                                       [&](node_id_t node) {
+                                         return linked[node].load();
+                                       }),
+                        deleted_nodes.end());
+    for (node_id_t node : deleted_nodes) {
+      NodeLinksGuard node_lock(this, node);
+      std::fill_n(getNodeLinks(node), _M, node);
+    }
+    std::unique_lock<std::mutex> lock(_index_data_guard);
+    _free_node_ids.insert(_free_node_ids.end(), deleted_nodes.begin(),
+                          deleted_nodes.end());
+    _deleted_node_ids.insert(_deleted_node_ids.end(), kept_nodes.begin(),
+                             kept_nodes.end());
+  }
+
   /***
    * @brief Search the index for the k nearest neighbors of the query.
    * @param query The query vector.
    * @param K The number of nearest neighbors to return.
    * @param ef_search The search beam width.
    * @param num_initializations The number of random initializations to use.
+   * @param filter If set, only nodes whose label satisfies the filter are
+   * returned. The search still expands through filtered-out nodes. With a
+   * very selective filter, `searchBruteForce` is usually cheaper.
    */
   std::vector<dist_label_t> search(const void *query, const int K,
                                    int ef_search,
-                                   int num_initializations = 100) {
-    node_id_t entry_node = initializeSearch(query, num_initializations);
+                                   int num_initializations = 100,
+                                   const LabelFilter &filter = nullptr) {
+    std::vector<char> query_buffer;
+    const void *transformed_query =
+        transformQuery(/* query = */ query, /* buffer = */ query_buffer);
+    node_id_t entry_node =
+        initializeSearch(transformed_query, num_initializations);
     PriorityQueue neighbors =
-        beamSearch(/* query = */ query,
+        beamSearch(/* query = */ transformed_query,
                    /* entry_node = */ entry_node,
-                   /* buffer_size = */ std::max(ef_search, K));
-    auto size = neighbors.size();
-    std::vector<dist_label_t> results;
-    results.reserve(size);
-    while (!neighbors.empty()) {
-      results.emplace_back(neighbors.top().first,
-                           *getNodeLabel(neighbors.top().second));
-      neighbors.pop();
-    }
-    std::sort(results.begin(), results.end(),
-              [](const dist_label_t &left, const dist_label_t &right) {
-                return left.first < right.first;
-              });
-    if (results.size() > static_cast<size_t>(K)) {
-      results.resize(K);
+                   /* buffer_size = */ std::max(ef_search, K),
+                   /* filter = */ filter);
+    rerank(/* neighbors = */ neighbors, /* query = */ query);
+    return sortedResults(neighbors, K);
+  }
+
+  /***
+   * @brief Exhaustively scans the index for the k nearest neighbors of the
+   * query among the nodes whose label satisfies the filter. Distances are only
+   * computed for admitted nodes, which makes this the fastest option for
+   * filters that admit a small fraction of the index.
+   * @param query The query vector.
+   * @param K The number of nearest neighbors to return.
+   * @param filter If set, only nodes whose label satisfies the filter are
+   * considered.
+   */
+  std::vector<dist_label_t>
+  searchBruteForce(const void *query, const int K,
+                   const LabelFilter &filter = nullptr) {
+    std::vector<char> query_buffer;
+    const void *transformed_query =
+        transformQuery(/* query = */ query, /* buffer = */ query_buffer);
+    PriorityQueue neighbors;
+    for (node_id_t node = 0; node < _cur_num_nodes; node++) {
+      if (!isSearchResult(node, filter)) {
+        continue;
+      }
+      float dist = _distance->distance(/* x = */ transformed_query,
+                                       /* y = */ getNodeData(node),
+                                       /* asymmetric = */ true);
+      if (_collect_stats) {
+        _distance_computations.fetch_add(1);
+      }
+      if (neighbors.size() < K || dist < neighbors.top().first) {
+        neighbors.emplace(dist, node);
+        if (neighbors.size() > K) {
+          neighbors.pop();
+        }
+      }
     }
+    rerank(/* neighbors = */ neighbors, /* query = */ query);
+    return sortedResults(neighbors, K);
+  }
 
+  /***
+   * @brief Finds the nodes within `radius` of the query, closest first. Beam
+   * search starts with a beam of `ef_search` nodes. Whenever the beam is about
+   * to fill up while all of it is within the radius, it grows, so that no
+   * node found within the radius is dropped. Once it has grown, the search
+   * keeps expanding the closest candidates for as long as they are within the
+   * radius.
+   *
+   * With re-ranking, beam distances are approximate. A node whose
+   * approximate distance is beyond the radius is checked again with its
+   * full-precision distance before the search stops on it, so the search
+   * errs on the side of expanding further. Results are filtered on
+   * full-precision distances.
+   * @param query The query vector.
+   * @param radius The largest distance (as returned by `search`) of a result.
+   * @param ef_search The initial search beam width.
+   * @param max_results If non-zero, at most this many results are returned,
+   * and the beam does not grow beyond it.
+   * @param num_initializations The number of random initializations to use.
+   * @param filter If set, only nodes whose label satisfies the filter are
+   * returned.
+   */
+  std::vector<dist_label_t> rangeSearch(const void *query, float radius,
+                                        int ef_search, size_t max_results = 0,
+                                        int num_initializations = 100,
+                                        const LabelFilter &filter = nullptr) {
+    std::vector<char> query_buffer;
+    const void *transformed_query =
+        transformQuery(/* query = */ query, /* buffer = */ query_buffer);
+    node_id_t entry_node =
+        initializeSearch(transformed_query, num_initializations);
+
+    ef_search = std::max(ef_search, 1);
+    size_t max_buffer_size =
+        max_results > 0 ? std::max<size_t>(max_results, ef_search)
+                        : std::max<size_t>(_cur_num_nodes, ef_search);
+    // The node last checked with its full-precision distance, which is often
+    // the same across steps (e.g. the furthest node of the beam).
+    node_id_t checked_node = std::numeric_limits<node_id_t>::max();
+    bool checked_node_within_radius = false;
+    auto within_radius = [&](float dist, node_id_t node) {
+      if (dist <= radius || _rerank_vectors.empty()) {
+        return dist <= radius;
+      }
+      if (node != checked_node) {
+        checked_node = node;
+        checked_node_within_radius =
+            _distance->fullPrecisionDistance(
+                /* x = */ query, /* y = */ _rerank_vectors.get(node)) <=
+            radius;
+        if (_collect_stats) {
+          _distance_computations.fetch_add(1);
+        }
+      }
+      return checked_node_within_radius;
+    };
+
+    LinksReader reader(this);
+    BeamSearchState state;
+    state.visited_set = _visited_set_pool->pollAvailableSet();
+    startBeamSearch(/* state = */ state, /* query = */ transformed_query,
+                    /* entry_node = */ entry_node,
+                    /* buffer_size = */ ef_search, /* filter = */ filter,
+                    /* reader = */ reader);
+    while (!state.candidates.empty()) {
+      // Expanding a node admits up to M nodes into the beam. If the beam
+      // could overflow while all of it is within the radius, it grows first.
+      size_t buffer_size = state.buffer_size;
+      if (state.neighbors.size() + _M > buffer_size &&
+          buffer_size < max_buffer_size && !state.neighbors.empty() &&
+          within_radius(state.neighbors.top().first,
+                        state.neighbors.top().second)) {
+        state.buffer_size = std::min<size_t>(
+            std::max<size_t>(2 * buffer_size, state.neighbors.size() + _M),
+            max_buffer_size);
+      }
+      // Once the beam has grown and holds at least `ef_search` nodes, only
+      // candidates within the radius are worth expanding.
+      auto [distance, node] = state.candidates.top();
+      if (state.buffer_size > ef_search &&
+          state.neighbors.size() >= static_cast<size_t>(ef_search) &&
+          !within_radius(-distance, node)) {
+        break;
+      }
+      if (!stepBeamSearch(/* state = */ state, /* filter = */ filter)) {
+        break;
+      }
+    }
+    _visited_set_pool->pushVisitedSet(
+        /* visited_set = */ state.visited_set);
+
+    PriorityQueue neighbors = std::move(state.neighbors);
+    rerank(/* neighbors = */ neighbors, /* query = */ query);
+
+    std::vector<dist_label_t> results =
+        sortedResults(neighbors, /* K = */ neighbors.size());
+    results.erase(std::find_if(results.begin(), results.end(),
+                               [radius](const dist_label_t &result) {
+                                 return result.first > radius;
+                               }),
+                  results.end());
+    if (max_results > 0 && results.size() > max_results) {
+      results.resize(max_results);
+    }
     return results;
   }
 
-  void doGraphReordering(const std::vector<std::string> &reordering_methods) {
+  /**
+   * @brief Computes the approximate K nearest neighbors of every live node,
+   * i.e. the k-NN graph of the indexed dataset. The query of each node is its
+   * stored vector (its re-rank vector, if re-ranking is enabled) and its
+   * search starts from the node itself, so no entry point is searched for.
+   * Nodes are split across the thread pool's workers.
+   *
+   * Rows are ordered by label. The node itself is not among its neighbors,
+   * but other nodes holding the same vector are.
+   *
+   * @param K The number of neighbors per node.
+   * @param ef_search The search beam width.
+   * @param distances Output array of `numLiveNodes() * K` distances, sorted in
+   * increasing order for each row.
+   * @param labels Output array of `numLiveNodes() * K` neighbor labels. Rows
+   * with fewer than K neighbors are padded with a label of -1 and an infinite
+   * distance.
+   * @param row_labels Output array of the `numLiveNodes()` labels of the rows.
+   *
+   * @exception std::runtime_error Thrown if the index only stores compressed
+   * codes and re-ranking is disabled, since there is no vector to query with.
+   */
+  void knnGraph(const int K, int ef_search, float *distances, label_t *labels,
+                label_t *row_labels) {
+    if (_rerank_vectors.empty() && !_distance->storesVectors()) {
+      throw std::runtime_error(
+          "A quantized index only stores the codes of its vectors. Enable "
+          "re-ranking to keep full-precision copies to compute the k-NN graph "
+          "with.");
+    }
+    std::vector<std::pair<label_t, node_id_t>> rows;
+    rows.reserve(numLiveNodes());
+    for (node_id_t node = 0; node < _cur_num_nodes; node++) {
+      if (!_tombstones[node]) {
+        rows.emplace_back(*getNodeLabel(node), node);
+      }
+    }
+    std::sort(rows.begin(), rows.end());
+
+    auto search_row = [&](size_t row) {
+      auto [label, node] = rows[row];
+      row_labels[row] = label;
+      const void *vector = _rerank_vectors.empty()
+                               ? static_cast<const void *>(getNodeData(node))
+                               : _rerank_vectors.get(node);
+      std::vector<char> query_buffer;
+      const void *query =
+          transformQuery(/* query = */ vector, /* buffer = */ query_buffer);
+      PriorityQueue candidates =
+          beamSearch(/* query = */ query, /* entry_node = */ node,
+                     /* buffer_size = */ std::max(ef_search, K + 1));
+      rerank(/* neighbors = */ candidates, /* query = */ vector);
+
+      PriorityQueue neighbors;
+      while (!candidates.empty()) {
+        if (candidates.top().second != node) {
+          neighbors.push(candidates.top());
+        }
+        candidates.pop();
+      }
+      writeResults(/* neighbors = */ neighbors, /* K = */ K,
+                   /* distances = */ distances + (row * K),
+                   /* labels = */ labels + (row * K));
+    };
+    _thread_pool->parallelFor(/* start_index = */ 0,
+                              /* end_index = */ rows.size(),
+                              /* function = */ search_row,
+                              /* chunk_size = */ _parallel_chunk_size);
+  }
+
+  /**
+   * @brief Search the index for the k nearest neighbors of a batch of queries.
+   * Queries are split across the thread pool's workers. Each worker reuses one
+   * set of heaps and visited sets for its whole share of the batch and
+   * advances SEARCH_BATCH_INTERLEAVE queries in turns, so that the memory
+   * accesses prefetched for one query overlap with the distance computations
+   * of the others.
+   *
+   * @param queries Row-major array of `num_queries` query vectors.
+   * @param num_queries The number of queries.
+   * @param K The number of nearest neighbors to return per query.
+   * @param ef_search The search beam width.
+   * @param num_initializations The number of random initializations to use.
+   * @param distances Output array of `num_queries * K` distances, sorted in
+   * increasing order for each query.
+   * @param labels Output array of `num_queries * K` labels. Queries with fewer
+   * than K results are padded with a label of -1 and an infinite distance.
+   * @param filter If set, only nodes whose label satisfies the filter are
+   * returned.
+   */
+  template <typename data_type>
+  void searchBatch(const void *queries, size_t num_queries, const int K,
+                   int ef_search, int num_initializations, float *distances,
+                   label_t *labels, const LabelFilter &filter = nullptr) {
+    size_t data_dimension = _distance->dimension();
+    int buffer_size = std::max(ef_search, K);
+    std::atomic<size_t> next_query(0);
+
+    auto search_queries = [&](uint32_t /* worker_id */) {
+      std::vector<BeamSearchState> states(SEARCH_BATCH_INTERLEAVE);
+      for (auto &state : states) {
+        state.visited_set = nullptr;
+        state.neighbors.reserve(buffer_size + 1);
+        state.candidates.reserve(buffer_size * 2);
+      }
 
+      while (true) {
+        size_t first_query = next_query.fetch_add(SEARCH_BATCH_INTERLEAVE);
+        if (first_query >= num_queries) {
+          break;
+        }
+        uint32_t num_active = std::min<size_t>(SEARCH_BATCH_INTERLEAVE,
+                                               num_queries - first_query);
+        // Registered per group of queries rather than for the whole batch, so
+        // that a write waiting to thaw the index is not held up for long.
+        LinksReader reader(this);
+
+        for (uint32_t i = 0; i < num_active; i++) {
+          // Visited sets are polled lazily so that idle workers do not pull
+          // (or allocate) any.
+          if (!states[i].visited_set) {
+            states[i].visited_set = _visited_set_pool->pollAvailableSet();
+          }
+          const void *query = transformQuery(
+              /* query = */ (const data_type *)queries +
+                  ((first_query + i) * data_dimension),
+              /* buffer = */ states[i].query_buffer);
+          startBeamSearch(
+              /* state = */ states[i], /* query = */ query,
+              /* entry_node = */ initializeSearch(query, num_initializations),
+              /* buffer_size = */ buffer_size, /* filter = */ filter,
+              /* reader = */ reader);
+        }
+
+        // Round-robin over the unfinished searches, one expansion at a time.
+        std::vector<bool> active(num_active, true);
+        uint32_t num_remaining = num_active;
+        while (num_remaining > 0) {
+          for (uint32_t i = 0; i < num_active; i++) {
+            if (active[i] && !stepBeamSearch(states[i], filter)) {
+              active[i] = false;
+              num_remaining--;
+            }
+          }
+        }
+
+        for (uint32_t i = 0; i < num_active; i++) {
+          rerank(/* neighbors = */ states[i].neighbors,
+                 /* query = */ (const data_type *)queries +
+                     ((first_query + i) * data_dimension));
+          size_t offset = (first_query + i) * K;
+          writeResults(/* neighbors = */ states[i].neighbors, /* K = */ K,
+                       /* distances = */ distances + offset,
+                       /* labels = */ labels + offset);
+        }
+      }
+
+      for (auto &state : states) {
+        if (state.visited_set) {
+          _visited_set_pool->pushVisitedSet(
+              /* visited_set = */ state.visited_set);
+        }
+      }
+    };
+
+    if (num_queries <= SEARCH_BATCH_INTERLEAVE) {
+      search_queries(0);
+      return;
+    }
+    _thread_pool->broadcast(search_queries);
+  }
+
+  void doGraphReordering(const std::vector<std::string> &reordering_methods) {
     for (const auto &method : reordering_methods) {
-      auto outdegree_table = getGraphOutdegreeTable();
-      std::vector<node_id_t> P;
       if (method == "gorder") {
-        P = std::move(util::gOrder<node_id_t>(outdegree_table, 5));
+        reorderGOrder();
       } else if (method == "rcm") {
-        P = std::move(util::rcmOrder<node_id_t>(outdegree_table));
+        reorderRCM();
       } else {
         throw std::invalid_argument("Invalid reordering method: " + method);
       }
-
-      relabel(P);
     }
   }
 
+  /**
+   * @brief Re-orders the nodes with Gorder. With several threads, graphs of
+   * more than MIN_GORDER_PARTITION_SIZE nodes are split into partitions that
+   * are reordered in parallel.
+   */
   void reorderGOrder(const int window_size = 5) {
-    auto outdegree_table = getGraphOutdegreeTable();
+    auto writer = beginWrite(/* operation = */ "re-order the graph");
+    util::CSRGraph<node_id_t> graph = getGraph();
+    uint32_t num_partitions = std::min<size_t>(
+        _thread_pool->numThreads(),
+        _cur_num_nodes / MIN_GORDER_PARTITION_SIZE);
     std::vector<node_id_t> P =
-        util::gOrder<node_id_t>(outdegree_table, window_size);
+        num_partitions > 1
+            ? util::partitionedGOrder<node_id_t>(
+                  /* graph = */ graph, /* w = */ window_size,
+                  /* num_partitions = */ num_partitions,
+                  /* thread_pool = */ *_thread_pool)
+            : util::gOrder<node_id_t>(/* graph = */ graph,
+                                      /* w = */ window_size);
+    graph = {};
+
+    relabel(P);
+  }
+
+  void reorderRCM() {
+    auto writer = beginWrite(/* operation = */ "re-order the graph");
+    std::vector<node_id_t> P = util::rcmOrder<node_id_t>(
+        /* graph = */ getGraph(), /* thread_pool = */ _thread_pool.get());
+    relabel(P);
+  }
+
+  /**
+   * @brief Load an index previously written with `saveIndex`. The checksum of
+   * every section read is verified.
+   *
+   * @param filename The file location to load the index from.
+   * @param mmap If true, the node block is memory-mapped read-only from the
+   * index file instead of being copied into heap memory. Loading then only
+   * reads the metadata, pages are faulted in as searches touch them, and
+   * several processes mapping the same file share one copy in the page cache.
+   * The checksum of the node block is not verified in this case, since that
+   * would read all of it. A memory-mapped index cannot be modified: `add`,
+   * `allocateNode`, `buildGraphLinks` and re-ordering will throw.
+   *
+   * Index files saved before the sectioned format are read too. They have no
+   * checksums, and are always copied into heap memory. Saving such an index
+   * again writes it in the current format.
+   *
+   * @exception std::runtime_error Thrown if the file cannot be opened or
+   * mapped, was written by an incompatible version or is corrupt.
+   */
+  static std::unique_ptr<Index<dist_t, label_t>>
+  loadIndex(const std::string &filename, bool mmap = false) {
+    if (!util::isSectionedFile(filename)) {
+      return loadLegacyIndex(filename);
+    }
+    util::SectionedFileReader file(filename);
+    checkFileVersion(file, filename);
+    std::unique_ptr<Index<dist_t, label_t>> index(new Index<dist_t, label_t>());
+
+    std::unique_ptr<DistanceInterface<dist_t>> dist =
+        std::make_unique<dist_t>();
+
+    // 1. Deserialize metadata
+    std::vector<uint8_t> tombstones;
+    file.beginSection(PARAMETERS_SECTION);
+    {
+      cereal::BinaryInputArchive archive(file.stream());
+      size_t max_node_count, cur_num_nodes;
+      archive(index->_M, index->_data_size_bytes, index->_node_size_bytes,
+              max_node_count, cur_num_nodes);
+      index->_max_node_count = max_node_count;
+      index->_cur_num_nodes = cur_num_nodes;
+      index->_next_node_id = cur_num_nodes;
+      checkNodeLayout(/* M = */ index->_M,
+                      /* data_size_bytes = */ index->_data_size_bytes,
+                      /* node_size_bytes = */ index->_node_size_bytes,
+                      /* filename = */ filename);
+      archive(tombstones, index->_deleted_node_ids, index->_free_node_ids);
+    }
+    file.endSection();
+    readArchiveSection(file, DISTANCE_SECTION, *dist);
+    readArchiveSection(file, LABELS_SECTION, index->_label_to_node,
+                       index->_node_permutation);
+    readArchiveSection(file, ENTRY_POINTS_SECTION,
+                       index->_entry_point_strategy, index->_sample_nodes,
+                       index->_sample_links);
+    if (file.hasSection(RERANK_VECTORS_SECTION)) {
+      file.beginSection(RERANK_VECTORS_SECTION);
+      {
+        cereal::BinaryInputArchive archive(file.stream());
+        index->_rerank_vectors.load(archive);
+      }
+      file.endSection();
+    }
+    index->initializeNodeStorage();
+    index->_tombstones.grow(index->_max_node_count);
+    for (node_id_t node = 0; node < index->_cur_num_nodes; node++) {
+      index->_tombstones[node] = tombstones[node];
+    }
+    index->initializeLoadedIndex(/* dist = */ std::move(dist));
+    index->_rerank_vectors.open(/* writable = */ !mmap);
+
+    const util::SectionEntry &nodes = file.section(NODES_SECTION);
+    size_t index_memory_size =
+        index->_node_size_bytes * index->_cur_num_nodes;
+    if (nodes.size != index_memory_size) {
+      throw std::runtime_error("Corrupt node block in index file: " +
+                               filename);
+    }
+
+    if (mmap && index_memory_size > 0) {
+      index->mapIndexMemory(/* filename = */ filename,
+                            /* offset = */ nodes.offset,
+                            /* size = */ index_memory_size);
+      return index;
+    }
+
+    // 2. Allocate memory using deserialized metadata
+    index->_index_memory.grow(index->_max_node_count);
+
+    // 3. Read the node block into the allocated memory, one segment at a time
+    file.beginSection(NODES_SECTION);
+    size_t nodes_per_segment = index->_index_memory.segmentSize();
+    for (size_t node = 0; node < index->_cur_num_nodes;
+         node += nodes_per_segment) {
+      file.read(index->getNodeData(node),
+                std::min(nodes_per_segment, index->_cur_num_nodes - node) *
+                    index->_node_size_bytes);
+    }
+    file.endSection();
+
+    return index;
+  }
+
+  /**
+   * @brief Saves the index. Only the `currentNumNodes()` nodes in use are
+   * written, whatever the capacity. The capacity is restored on load. Writes
+   * to the index wait until it is saved; searches do not.
+   *
+   * @exception std::runtime_error Thrown if the file cannot be written.
+   */
+  void saveIndex(const std::string &filename) {
+    auto pause = _writer_gate.pause();
+    util::SectionedFileWriter file(/* filename = */ filename,
+                                   /* version = */ INDEX_FILE_VERSION,
+                                   /* alignment = */ INDEX_MEMORY_ALIGNMENT);
+    writeMetadataSections(file);
+    writeRerankVectors(/* file = */ file, /* vectors = */ _rerank_vectors,
+                       /* count = */ _cur_num_nodes);
+
+    // The segments are written back to back, as one contiguous node block.
+    file.beginSection(NODES_SECTION);
+    size_t nodes_per_segment = _index_memory.segmentSize();
+    for (size_t node = 0; node < _cur_num_nodes; node += nodes_per_segment) {
+      file.write(getNodeData(node),
+                 std::min(nodes_per_segment, _cur_num_nodes - node) *
+                     _node_size_bytes);
+    }
+    file.endSection();
+    file.close();
+  }
+
+  /**
+   * @brief Saves a snapshot of the index on a background thread and returns
+   * as soon as the snapshot is taken. Writes to the index are paused only
+   * while it is copied into memory (the node blocks in use, plus the re-rank
+   * vectors), then the index can be searched and modified again while the
+   * copy is written out. Until then the copy is held in RAM next to the
+   * index, which can briefly double its memory use.
+   *
+   * Re-rank vectors kept in a file are copied too, and written into the
+   * saved index instead of referring to the file, which keeps changing after
+   * the snapshot. The loaded index holds them in RAM.
+   *
+   * The file is written under `filename + ".tmp"` and renamed to `filename`
+   * once complete, so that a reader never sees a partial index.
+   *
+   * @return A future that becomes ready when the file is in place. It holds
+   * the exception if the snapshot could not be written.
+   */
+  std::future<void> saveIndexAsync(const std::string &filename) {
+    std::string temporary_filename = filename + ".tmp";
+    auto file = std::make_unique<util::SectionedFileWriter>(
+        /* filename = */ temporary_filename,
+        /* version = */ INDEX_FILE_VERSION,
+        /* alignment = */ INDEX_MEMORY_ALIGNMENT);
+    std::vector<char> nodes;
+    VectorStore rerank_vectors;
+    size_t num_nodes;
+    {
+      auto pause = _writer_gate.pause();
+      // The metadata is small, so it goes straight into the file.
+      writeMetadataSections(*file);
+      num_nodes = _cur_num_nodes;
+      nodes.resize(num_nodes * _node_size_bytes);
+      size_t nodes_per_segment = _index_memory.segmentSize();
+      for (size_t node = 0; node < num_nodes; node += nodes_per_segment) {
+        std::memcpy(nodes.data() + (node * _node_size_bytes),
+                    getNodeData(node),
+                    std::min(nodes_per_segment, num_nodes - node) *
+                        _node_size_bytes);
+      }
+      rerank_vectors = _rerank_vectors.snapshot(/* count = */ num_nodes);
+    }
+
+    return std::async(
+        std::launch::async,
+        [file = std::move(file), nodes = std::move(nodes),
+         rerank_vectors = std::move(rerank_vectors), num_nodes, filename,
+         temporary_filename]() mutable {
+          writeRerankVectors(/* file = */ *file,
+                             /* vectors = */ rerank_vectors,
+                             /* count = */ num_nodes);
+          file->beginSection(NODES_SECTION);
+          file->write(nodes.data(), nodes.size());
+          file->endSection();
+          file->close();
+          if (std::rename(temporary_filename.c_str(), filename.c_str()) != 0) {
+            throw std::runtime_error("Unable to rename " + temporary_filename +
+                                     " to " + filename);
+          }
+        });
+  }
+
+  /**
+   * @brief Reads only the graph of a saved index: the links of every node,
+   * skipping empty slots, in compressed sparse row form. Nothing else is
+   * kept in memory, which makes it cheap to analyze the graph of an index
+   * too large to load.
+   */
+  static util::CSRGraph<node_id_t> loadGraph(const std::string &filename) {
+    util::CSRGraph<node_id_t> graph;
+    readNodeBlocks(filename, [&](node_id_t node, const char *block,
+                                 size_t data_size_bytes, size_t M, bool) {
+      auto *links = reinterpret_cast<const node_id_t *>(block + data_size_bytes);
+      std::copy_if(links, links + M, std::back_inserter(graph.edges),
+                   [node](node_id_t link) { return link != node; });
+      graph.offsets.push_back(graph.edges.size());
+    });
+    return graph;
+  }
+
+  /**
+   * @brief Reads only the vectors of a saved index, as they are stored in
+   * its nodes, and their labels. Removed vectors are skipped.
+   *
+   * @param filename The index file.
+   * @param labels Set to the label of every vector returned.
+   * @return The vectors, `dataSizeBytes()` bytes each, back to back.
+   */
+  static std::vector<char> loadVectors(const std::string &filename,
+                                       std::vector<label_t> &labels) {
+    std::vector<char> vectors;
+    labels.clear();
+    readNodeBlocks(filename, [&](node_id_t node, const char *block,
+                                 size_t data_size_bytes, size_t M,
+                                 bool is_deleted) {
+      if (is_deleted) {
+        return;
+      }
+      vectors.insert(vectors.end(), block, block + data_size_bytes);
+      labels.push_back(*reinterpret_cast<const label_t *>(
+          block + data_size_bytes + (M * sizeof(node_id_t))));
+    });
+    return vectors;
+  }
+
+  /**
+   * @brief Select how searches and insertions pick their entry node. Choosing
+   * EntryPointStrategy::SAMPLE_GRAPH builds the sample graph right away; it
+   * is rebuilt at the end of every `addBatch` and saved with the index.
+   * With the sample graph, `num_initializations` is ignored.
+   *
+   * @param strategy The entry point strategy.
+   */
+  void setEntryPointStrategy(EntryPointStrategy strategy) {
+    auto writer = _writer_gate.write();
+    _entry_point_strategy = strategy;
+    if (strategy == EntryPointStrategy::SAMPLE_GRAPH) {
+      buildSampleGraph();
+    } else {
+      _sample_nodes.clear();
+      _sample_links.clear();
+    }
+  }
+
+  inline EntryPointStrategy entryPointStrategy() const {
+    return _entry_point_strategy;
+  }
+
+  /**
+   * @brief Keeps a full-precision (float) copy of every vector added from now
+   * on and uses it to re-compute the distances of the `ef_search` candidates
+   * of each search before the top K are picked. This restores the recall lost
+   * to compressed representations such as product quantization, at the cost
+   * of `dimension * 4` bytes per node.
+   *
+   * @param vectors_filename If set, the copies are stored in this file, which
+   * is memory-mapped instead of being held in RAM. Searches then read at most
+   * `ef_search` vectors from it per query. The file is not copied into the
+   * index saved by `saveIndex`; `loadIndex` maps it again from the same path.
+   *
+   * @exception std::runtime_error Thrown if vectors were already added or the
+   * file cannot be created.
+   */
+  void enableReranking(const std::string &vectors_filename = "") {
+    auto writer = _writer_gate.write();
+    if (_cur_num_nodes > 0) {
+      throw std::runtime_error(
+          "Re-ranking must be enabled before vectors are added to the index.");
+    }
+    _rerank_vectors.allocate(/* num_vectors = */ _max_node_count,
+                             /* dim = */ _distance->dimension(),
+                             /* filename = */ vectors_filename);
+  }
+
+  inline bool rerankingEnabled() const { return !_rerank_vectors.empty(); }
+
+  /**
+   * @brief Grows the index so that it can hold `new_capacity` nodes. Node
+   * storage is extended with new segments, so existing nodes never move and
+   * searches can keep running while the index grows. The per-node versions,
+   * tombstones, re-ranking vectors and visited sets grow along with it.
+   *
+   * @param new_capacity The new maximum number of nodes. Must be at least the
+   * current one.
+   *
+   * @exception std::invalid_argument Thrown if `new_capacity` is smaller than
+   * the current capacity or does not fit in a node id.
+   */
+  void resize(size_t new_capacity) {
+    auto writer = beginWrite(/* operation = */ "resize the index");
+    if (new_capacity < _max_node_count) {
+      throw std::invalid_argument(
+          "The capacity of an index can only grow. The index holds up to " +
+          std::to_string(_max_node_count) + " nodes.");
+    }
+    std::unique_lock<std::mutex> lock(_index_data_guard);
+    growCapacity(/* new_capacity = */ new_capacity);
+  }
+
+  /**
+   * @brief Lets insertions into a full index grow it instead of throwing. The
+   * capacity grows by half (and at least one segment) at a time, and
+   * `addBatch` grows the index once to fit the whole batch.
+   */
+  inline void setAutoGrow(bool auto_grow) { _auto_grow = auto_grow; }
+
+  /**
+   * @brief Sets the alpha of the pruning rule that picks the neighbors of
+   * every node (see `selectNeighbors`). With alpha = 1, the default, it is
+   * the HNSW heuristic. Larger values, such as Vamana's 1.2, keep more long
+   * edges, so fewer hops are needed to cross the graph. It applies to every
+   * write that follows, and should not change while vectors are added.
+   *
+   * @exception std::invalid_argument Thrown if `alpha` is smaller than 1.
+   */
+  void setPruningAlpha(float alpha) {
+    if (!(alpha >= 1.0f)) {
+      throw std::invalid_argument("The pruning alpha must be at least 1.");
+    }
+    _pruning_alpha = alpha;
+  }
+  inline float pruningAlpha() const { return _pruning_alpha; }
+  inline bool autoGrow() const { return _auto_grow; }
+
+  // The distance the index was created with. Distances that need training
+  // (e.g. product quantization) are trained through it before vectors are
+  // added.
+  inline dist_t &distance() { return static_cast<dist_t &>(*_distance); }
+
+  /**
+   * @brief Resizes the thread pool used for construction and batched search.
+   * The workers persist across calls.
+   *
+   * @param num_threads The number of threads, including the calling thread.
+   * @param pin_threads If true, workers are pinned to distinct cores (Linux
+   * only). The calling thread is never pinned.
+   * @param chunk_size Number of consecutive vectors a worker claims at a time
+   * in `addBatch`. 0 picks a chunk size from the batch size.
+   */
+  inline void setNumThreads(uint32_t num_threads, bool pin_threads = false,
+                            uint32_t chunk_size = 0) {
+    if (num_threads == 0 || num_threads > std::thread::hardware_concurrency()) {
+      throw std::invalid_argument(
+          "Number of threads must be greater than 0 and less than or equal to "
+          "the number of hardware threads.");
+    }
+    _thread_pool->resize(num_threads, pin_threads);
+    _parallel_chunk_size = chunk_size;
+    if (num_threads == 1) {
+      _visited_set_pool->setPoolSize(1);
+    }
+  }
+
+  inline uint64_t getTotalIndexMemory() const {
+    return static_cast<uint64_t>(_node_size_bytes * _index_memory.capacity());
+  }
+  inline uint64_t nodeVersionsAllocatedMemory() const {
+    return static_cast<uint64_t>(_node_versions.allocatedBytes());
+  }
+
+  // Full-precision vectors held in RAM for re-ranking. File-backed vectors
+  // are paged in by the OS and not counted.
+  inline uint64_t rerankVectorsAllocatedMemory() const {
+    return _rerank_vectors.isFileBacked() ? 0 : _rerank_vectors.sizeInBytes();
+  }
+
+  inline uint64_t visitedSetPoolAllocatedMemory() const {
+    size_t pool_size = _visited_set_pool->poolSize();
+    return static_cast<uint64_t>(pool_size * sizeof(VisitedSet));
+  }
+
+  inline uint32_t getNumThreads() const { return _thread_pool->numThreads(); }
+  inline ThreadPool &threadPool() { return *_thread_pool; }
+
+  inline size_t maxEdgesPerNode() const { return _M; }
+  inline size_t dataSizeBytes() const { return _data_size_bytes; }
+
+  inline size_t nodeSizeBytes() const { return _node_size_bytes; }
+
+  inline size_t maxNodeCount() const { return _max_node_count; }
+
+  inline size_t currentNumNodes() const { return _cur_num_nodes; }
+  inline bool isMemoryMapped() const { return _mapped_memory_size > 0; }
+  inline bool isFrozen() const { return _frozen.load(); }
+
+  /**
+   * @brief Puts the index in read-only mode. Searches then read node links
+   * without any synchronization and the per-node versions (4 bytes per node)
+   * are released. Loaded indices start out frozen, and `addBatch` freezes the
+   * index when it returns (keeping the versions allocated). Writes in
+   * progress are waited for, and so are searches that started before the
+   * index was frozen. The next write thaws the index automatically (see
+   * `unfreeze`).
+   */
+  void freeze() {
+    auto pause = _writer_gate.pause();
+    std::unique_lock<std::mutex> lock(_freeze_guard);
+    _frozen = true;
+    while (_seqlock_readers.load() != 0) {
+      std::this_thread::yield();
+    }
+    _node_versions.clear();
+  }
+
+  /**
+   * @brief Leaves read-only mode, so that searches can safely run
+   * concurrently with insertions, updates and deletions again. Searches that
+   * started while the index was frozen read links without synchronization,
+   * so this waits for them to finish.
+   */
+  void unfreeze() {
+    std::unique_lock<std::mutex> lock(_freeze_guard);
+    if (_frozen.load()) {
+      _node_versions.grow(_max_node_count);
+      _frozen = false;
+    }
+    while (_in_place_readers.load() != 0) {
+      std::this_thread::yield();
+    }
+  }
+  // Number of nodes holding a vector that was not removed.
+  inline size_t numLiveNodes() const {
+    return _cur_num_nodes - numDeletedNodes();
+  }
+  inline size_t numDeletedNodes() const {
+    return _deleted_node_ids.size() + _free_node_ids.size();
+  }
+  inline size_t dataDimension() const { return _distance->dimension(); }
+
+  inline uint64_t distanceComputations() const {
+    return _distance_computations.load();
+  }
+
+  void resetStats() {
+    _distance_computations = 0;
+    _metric_hops = 0;
+  }
+
+  void getIndexSummary() const {
+    std::cout << "\nIndex Parameters\n" << std::flush;
+    std::cout << "-----------------------------\n" << std::flush;
+    std::cout << "max_edges_per_node (M): " << _M << "\n" << std::flush;
+    std::cout << "data_size_bytes: " << _data_size_bytes << "\n" << std::flush;
+    std::cout << "node_size_bytes: " << _node_size_bytes << "\n" << std::flush;
+    std::cout << "max_node_count: " << _max_node_count << "\n" << std::flush;
+    std::cout << "cur_num_nodes: " << _cur_num_nodes << "\n" << std::flush;
+
+    _distance->getSummary();
+  }
+
+private:
+  // Default constructor used by `loadIndex`.
+  Index() = default;
+
+  // Sets up what a loaded index needs besides its nodes and metadata.
+  void initializeLoadedIndex(std::unique_ptr<DistanceInterface<dist_t>> dist) {
+    _visited_set_pool = new VisitedSetPool(
+        /* initial_pool_size = */ 1,
+        /* num_elements = */ _max_node_count);
+    _distance = std::move(dist);
+    _thread_pool = std::make_unique<ThreadPool>(
+        /* num_threads = */ std::max(
+            (uint32_t)1, (uint32_t)std::thread::hardware_concurrency() / 2));
+    // Loaded indices are usually only searched. The first write thaws them.
+    _frozen = true;
+  }
+
+  // Sets up empty node storage for the node size and capacity. Segments are
+  // sized for the initial capacity, up to a maximum.
+  void initializeNodeStorage() {
+    size_t segment_shift =
+        SegmentedArray<char>::segmentShiftFor(_max_node_count);
+    // Node blocks are left uninitialized so that their pages are only
+    // committed once nodes are written to them.
+    _index_memory = SegmentedArray<char>(
+        /* segment_shift = */ segment_shift, /* stride = */ _node_size_bytes,
+        /* zero_initialize = */ false);
+    _node_versions =
+        SegmentedArray<std::atomic<uint32_t>>(/* segment_shift = */
+                                              segment_shift);
+    _tombstones = SegmentedArray<uint8_t>(/* segment_shift = */ segment_shift);
+  }
+
+  // Grows every per-node structure to `new_capacity` nodes. The index data
+  // guard must be held by the caller. New segments are published before
+  // `_max_node_count` is raised, so no node id can refer to memory that does
+  // not exist yet.
+  void growCapacity(size_t new_capacity) {
+    if (new_capacity > std::numeric_limits<node_id_t>::max()) {
+      throw std::invalid_argument("The capacity of an index cannot exceed " +
+                                  std::to_string(std::numeric_limits<
+                                                 node_id_t>::max()) +
+                                  " nodes.");
+    }
+    if (new_capacity <= _max_node_count) {
+      return;
+    }
+    _index_memory.grow(new_capacity);
+    if (!_node_versions.empty()) {
+      _node_versions.grow(new_capacity);
+    }
+    _tombstones.grow(new_capacity);
+    if (!_rerank_vectors.empty()) {
+      _rerank_vectors.resize(new_capacity);
+    }
+    _visited_set_pool->setNumElements(new_capacity);
+    _max_node_count = new_capacity;
+  }
+
+  // Imported graphs must cover exactly the nodes allocated so far.
+  void checkGraphNumNodes(size_t num_nodes) const {
+    if (num_nodes != _cur_num_nodes) {
+      throw std::invalid_argument(
+          "The graph has " + std::to_string(num_nodes) +
+          " nodes, but the index has " + std::to_string(_cur_num_nodes) +
+          " allocated nodes.");
+    }
+  }
+
+  // Parses the Matrix Market text in [begin, end) into the node links,
+  // appending the edges of each node in the order they appear.
+  void readMatrixMarketLinks(const char *begin, const char *end,
+                             const std::string &mtx_filename) {
+    const char *cursor = begin;
+    auto read_number = [&](uint64_t &value) {
+      while (cursor < end && std::isspace(static_cast<unsigned char>(*cursor))) {
+        cursor++;
+      }
+      auto [next, error] = std::from_chars(cursor, end, value);
+      if (error != std::errc()) {
+        return false;
+      }
+      cursor = next;
+      return true;
+    };
+    // Skip the comments and the banner
+    while (cursor < end && *cursor == '%') {
+      cursor = std::find(cursor, end, '\n');
+      cursor += cursor < end;
+    }
+
+    uint64_t num_vertices, num_edges;
+    if (!read_number(num_vertices) || !read_number(num_vertices) ||
+        !read_number(num_edges)) {
+      throw std::runtime_error("Missing header in mtx file: " + mtx_filename);
+    }
+    if (num_vertices != _cur_num_nodes) {
+      throw std::runtime_error("Number of vertices in the mtx file does not "
+                               "match the number of nodes allocated in the "
+                               "index.");
+    }
+    // check that the number of edges is equal to the number of links per node.
+    if (num_edges != _M) {
+      throw std::runtime_error("Number of edges in the mtx file does not match "
+                               "the number of links per node.");
+    }
+
+    // A slot is available if and only if it points to the node itself.
+    std::vector<uint32_t> degrees(num_vertices, 0);
+    _thread_pool->parallelFor(0, num_vertices, [&](uint64_t node) {
+      std::fill_n(getNodeLinks(node), _M, static_cast<node_id_t>(node));
+    });
+    uint64_t u, v;
+    while (read_number(u) && read_number(v)) {
+      // Adjust for 1-based indexing in Matrix Market format
+      if (u == 0 || v == 0 || u > num_vertices || v > num_vertices) {
+        throw std::runtime_error("Edge (" + std::to_string(u) + ", " +
+                                 std::to_string(v) + ") in mtx file " +
+                                 mtx_filename + " is out of range.");
+      }
+      u--;
+      v--;
+      if (u == v) {
+        continue;
+      }
+      if (degrees[u] == _M) {
+        throw std::runtime_error("Node " + std::to_string(u + 1) +
+                                 " in mtx file " + mtx_filename +
+                                 " has more than " + std::to_string(_M) +
+                                 " edges.");
+      }
+      getNodeLinks(u)[degrees[u]++] = v;
+    }
+    while (cursor < end && std::isspace(static_cast<unsigned char>(*cursor))) {
+      cursor++;
+    }
+    if (cursor != end) {
+      throw std::runtime_error("Unexpected text in mtx file: " + mtx_filename);
+    }
+  }
+
+  // Hands out the next node id that was never used, growing the index first
+  // if it is full and auto-grow is enabled. The id must be passed to
+  // `publishNode` once the node is initialized.
+  node_id_t reserveNodeId() {
+    size_t node = _next_node_id.load();
+    while (true) {
+      if (node >= _max_node_count.load()) {
+        std::unique_lock<std::mutex> lock(_index_data_guard);
+        if (_next_node_id.load() >= _max_node_count) {
+          if (!_auto_grow) {
+            throw std::runtime_error(
+                "Maximum number of nodes reached. Consider increasing the "
+                "`max_node_count` parameter to create a larger index, or "
+                "enabling auto-grow.");
+          }
+          growCapacity(/* new_capacity = */ _max_node_count +
+                       std::max<size_t>(_max_node_count / 2,
+                                        _index_memory.segmentSize()));
+        }
+        node = _next_node_id.load();
+        continue;
+      }
+      if (_next_node_id.compare_exchange_weak(node, node + 1)) {
+        return node;
+      }
+    }
+  }
+
+  // Makes a node returned by `reserveNodeId` visible to scans over the node
+  // ids. Nodes are published in id order, so this waits for the threads
+  // still initializing nodes with smaller ids.
+  void publishNode(node_id_t node) {
+    size_t expected = node;
+    while (!_cur_num_nodes.compare_exchange_weak(expected, expected + 1)) {
+      expected = node;
+      std::this_thread::yield();
+    }
+  }
+
+  static void checkFileVersion(const util::SectionedFileReader &file,
+                               const std::string &filename) {
+    if (file.version() > INDEX_FILE_VERSION) {
+      throw std::runtime_error(
+          "Index file " + filename + " uses format version " +
+          std::to_string(file.version()) + ", but this version of FlatNav "
+          "only reads up to version " + std::to_string(INDEX_FILE_VERSION) +
+          ".");
+    }
+  }
+
+  // Writes every section but the node blocks and the re-rank vectors. The
+  // writer gate must be paused.
+  void writeMetadataSections(util::SectionedFileWriter &file) {
+    std::vector<uint8_t> tombstones(_cur_num_nodes);
+    for (node_id_t node = 0; node < _cur_num_nodes; node++) {
+      tombstones[node] = _tombstones[node];
+    }
+    writeArchiveSection(file, PARAMETERS_SECTION, _M, _data_size_bytes,
+                        _node_size_bytes, _max_node_count.load(),
+                        _cur_num_nodes.load(), tombstones, _deleted_node_ids, _free_node_ids);
+    writeArchiveSection(file, DISTANCE_SECTION, *_distance);
+    writeArchiveSection(file, LABELS_SECTION, _label_to_node,
+                        _node_permutation);
+    writeArchiveSection(file, ENTRY_POINTS_SECTION, _entry_point_strategy,
+                        _sample_nodes, _sample_links);
+  }
+
+  static void writeRerankVectors(util::SectionedFileWriter &file,
+                                 VectorStore &vectors, size_t count) {
+    if (vectors.empty()) {
+      return;
+    }
+    file.beginSection(RERANK_VECTORS_SECTION);
+    {
+      cereal::BinaryOutputArchive archive(file.stream());
+      vectors.save(archive, /* count = */ count);
+    }
+    file.endSection();
+    vectors.flush();
+  }
+
+  template <typename... Types>
+  static void writeArchiveSection(util::SectionedFileWriter &file,
+                                  IndexFileSection section,
+                                  Types &&...values) {
+    file.beginSection(section);
+    {
+      cereal::BinaryOutputArchive archive(file.stream());
+      archive(std::forward<Types>(values)...);
+    }
+    file.endSection();
+  }
+
+  template <typename... Types>
+  static void readArchiveSection(util::SectionedFileReader &file,
+                                 IndexFileSection section,
+                                 Types &&...values) {
+    file.beginSection(section);
+    {
+      cereal::BinaryInputArchive archive(file.stream());
+      archive(std::forward<Types>(values)...);
+    }
+    file.endSection();
+  }
 
-    relabel(P);
+  // The links and the label are stored inline in every node, so an index can
+  // only be read with the node id width and label type it was saved with.
+  static void checkNodeLayout(size_t M, size_t data_size_bytes,
+                              size_t node_size_bytes,
+                              const std::string &filename) {
+    if (node_size_bytes !=
+        data_size_bytes + (M * sizeof(node_id_t)) + sizeof(label_t)) {
+      throw std::runtime_error(
+          "Index file " + filename +
+          " was saved with a different label type or node id width. Its "
+          "nodes are " +
+          std::to_string(node_size_bytes) + " bytes, expected " +
+          std::to_string(data_size_bytes + (M * sizeof(node_id_t)) +
+                         sizeof(label_t)) +
+          " bytes with " + std::to_string(sizeof(label_t)) +
+          "-byte labels and " + std::to_string(sizeof(node_id_t)) +
+          "-byte node ids.");
+    }
   }
 
-  void reorderRCM() {
-    auto outdegree_table = getGraphOutdegreeTable();
-    std::vector<node_id_t> P = util::rcmOrder<node_id_t>(outdegree_table);
-    relabel(P);
+  // Streams the node blocks of an index file through
+  // `function(node, block, data_size_bytes, M, is_deleted)` a few megabytes
+  // at a time.
+  template <typename Function>
+  static void readNodeBlocks(const std::string &filename, Function function) {
+    if (!util::isSectionedFile(filename)) {
+      dist_t distance;
+      size_t M, data_size_bytes, max_node_count, cur_num_nodes;
+      std::ifstream stream = openLegacyIndex(
+          /* filename = */ filename, /* distance = */ distance, /* M = */ M,
+          /* data_size_bytes = */ data_size_bytes,
+          /* max_node_count = */ max_node_count,
+          /* cur_num_nodes = */ cur_num_nodes);
+      readLegacyNodes(stream, filename, M, data_size_bytes, cur_num_nodes,
+                      [&](node_id_t node, const char *block) {
+                        function(node, block, data_size_bytes, M,
+                                 /* is_deleted = */ false);
+                      });
+      return;
+    }
+    util::SectionedFileReader file(filename);
+    checkFileVersion(file, filename);
+    size_t M, data_size_bytes, node_size_bytes, max_node_count, cur_num_nodes;
+    std::vector<uint8_t> tombstones;
+    readArchiveSection(file, PARAMETERS_SECTION, M, data_size_bytes,
+                       node_size_bytes, max_node_count, cur_num_nodes,
+                       tombstones);
+    checkNodeLayout(/* M = */ M, /* data_size_bytes = */ data_size_bytes,
+                    /* node_size_bytes = */ node_size_bytes,
+                    /* filename = */ filename);
+
+    size_t nodes_per_chunk = std::max<size_t>(1, (8 << 20) / node_size_bytes);
+    std::vector<char> chunk(nodes_per_chunk * node_size_bytes);
+    file.beginSection(NODES_SECTION);
+    for (size_t first = 0; first < cur_num_nodes; first += nodes_per_chunk) {
+      size_t num_nodes = std::min(nodes_per_chunk, cur_num_nodes - first);
+      file.read(chunk.data(), num_nodes * node_size_bytes);
+      for (size_t i = 0; i < num_nodes; i++) {
+        function(static_cast<node_id_t>(first + i),
+                 chunk.data() + (i * node_size_bytes), data_size_bytes, M,
+                 tombstones[first + i] != 0);
+      }
+    }
+    file.endSection();
   }
 
-  static std::unique_ptr<Index<dist_t, label_t>>
-  loadIndex(const std::string &filename) {
+  // Index files saved before the sectioned format hold one cereal archive:
+  // the parameters, the distance and then the node block of the whole
+  // capacity, with 32-bit node ids. Reads up to the node block.
+  static std::ifstream openLegacyIndex(const std::string &filename,
+                                       dist_t &distance, size_t &M,
+                                       size_t &data_size_bytes,
+                                       size_t &max_node_count,
+                                       size_t &cur_num_nodes) {
     std::ifstream stream(filename, std::ios::binary);
-
     if (!stream.is_open()) {
       throw std::runtime_error("Unable to open file for reading: " + filename);
     }
-
-    cereal::BinaryInputArchive archive(stream);
-    std::unique_ptr<Index<dist_t, label_t>> index(new Index<dist_t, label_t>());
-
-    std::unique_ptr<DistanceInterface<dist_t>> dist =
-        std::make_unique<dist_t>();
-
-    // 1. Deserialize metadata
-    archive(index->_M, index->_data_size_bytes, index->_node_size_bytes,
-            index->_max_node_count, index->_cur_num_nodes, *dist);
-    index->_visited_set_pool = new VisitedSetPool(
-        /* initial_pool_size = */ 1,
-        /* num_elements = */ index->_max_node_count);
-    index->_distance = std::move(dist);
-    index->_num_threads = std::max(
-        (uint32_t)1, (uint32_t)std::thread::hardware_concurrency() / 2);
-    index->_node_links_mutexes =
-        std::vector<std::mutex>(index->_max_node_count);
-
-    // 2. Allocate memory using deserialized metadata
-    index->_index_memory =
-        new char[index->_node_size_bytes * index->_max_node_count];
-
-    // 3. Deserialize content into allocated memory
-    archive(
-        cereal::binary_data(index->_index_memory,
-                            index->_node_size_bytes * index->_max_node_count));
-
-    return index;
+    size_t node_size_bytes;
+    try {
+      cereal::BinaryInputArchive archive(stream);
+      archive(M, data_size_bytes, node_size_bytes, max_node_count,
+              cur_num_nodes, distance);
+    } catch (const std::runtime_error &) {
+      throw std::runtime_error("Not a FlatNav index file: " + filename);
+    }
+    if (node_size_bytes != data_size_bytes + (M * sizeof(uint32_t)) +
+                               sizeof(label_t) ||
+        cur_num_nodes > max_node_count) {
+      throw std::runtime_error(
+          "Not a FlatNav index file, or one saved with a different label "
+          "type: " +
+          filename);
+    }
+    return stream;
   }
 
-  void saveIndex(const std::string &filename) {
-    std::ofstream stream(filename, std::ios::binary);
-
-    if (!stream.is_open()) {
-      throw std::runtime_error("Unable to open file for writing: " + filename);
+  // Streams the first `num_nodes` nodes of a file opened with
+  // `openLegacyIndex` through `function(node, block)`, with each block laid
+  // out like the nodes of this index.
+  template <typename Function>
+  static void readLegacyNodes(std::ifstream &stream,
+                              const std::string &filename, size_t M,
+                              size_t data_size_bytes, size_t num_nodes,
+                              Function function) {
+    size_t legacy_node_size_bytes =
+        data_size_bytes + (M * sizeof(uint32_t)) + sizeof(label_t);
+    std::vector<char> legacy_block(legacy_node_size_bytes);
+    std::vector<char> block(data_size_bytes + (M * sizeof(node_id_t)) +
+                            sizeof(label_t));
+    std::vector<uint32_t> links(M);
+    for (size_t node = 0; node < num_nodes; node++) {
+      if (!stream.read(legacy_block.data(), legacy_node_size_bytes)) {
+        throw std::runtime_error("Truncated index file: " + filename);
+      }
+      std::memcpy(block.data(), legacy_block.data(), data_size_bytes);
+      std::memcpy(links.data(), legacy_block.data() + data_size_bytes,
+                  M * sizeof(uint32_t));
+      std::copy(links.begin(), links.end(),
+                reinterpret_cast<node_id_t *>(block.data() + data_size_bytes));
+      std::memcpy(block.data() + data_size_bytes + (M * sizeof(node_id_t)),
+                  legacy_block.data() + data_size_bytes +
+                      (M * sizeof(uint32_t)),
+                  sizeof(label_t));
+      function(static_cast<node_id_t>(node), block.data());
     }
+  }
 
-    cereal::BinaryOutputArchive archive(stream);
-    archive(*this);
+  // Loads an index saved before the sectioned format (see `openLegacyIndex`).
+  // Nothing could be removed from such an index, and its labels are the ones
+  // stored in its nodes.
+  static std::unique_ptr<Index<dist_t, label_t>>
+  loadLegacyIndex(const std::string &filename) {
+    std::unique_ptr<Index<dist_t, label_t>> index(new Index<dist_t, label_t>());
+    std::unique_ptr<dist_t> dist = std::make_unique<dist_t>();
+    size_t max_node_count, cur_num_nodes;
+    std::ifstream stream = openLegacyIndex(
+        /* filename = */ filename, /* distance = */ *dist,
+        /* M = */ index->_M, /* data_size_bytes = */ index->_data_size_bytes,
+        /* max_node_count = */ max_node_count,
+        /* cur_num_nodes = */ cur_num_nodes);
+    index->_node_size_bytes = index->_data_size_bytes +
+                              (index->_M * sizeof(node_id_t)) +
+                              sizeof(label_t);
+    index->_max_node_count = max_node_count;
+    index->_cur_num_nodes = cur_num_nodes;
+    index->_next_node_id = cur_num_nodes;
+    index->initializeNodeStorage();
+    index->_index_memory.grow(max_node_count);
+    index->_tombstones.grow(max_node_count);
+
+    readLegacyNodes(stream, filename, index->_M, index->_data_size_bytes,
+                    cur_num_nodes, [&](node_id_t node, const char *block) {
+                      std::memcpy(index->getNodeData(node), block,
+                                  index->_node_size_bytes);
+                      index->_label_to_node.emplace(
+                          *index->getNodeLabel(node), node);
+                    });
+    index->initializeLoadedIndex(/* dist = */ std::move(dist));
+    return index;
   }
 
-  inline void setNumThreads(uint32_t num_threads) {
-    if (num_threads == 0 || num_threads > std::thread::hardware_concurrency()) {
-      throw std::invalid_argument(
-          "Number of threads must be greater than 0 and less than or equal to "
-          "the number of hardware threads.");
+  void mapIndexMemory(const std::string &filename, size_t offset,
+                      size_t size) {
+    int fd = ::open(filename.c_str(), O_RDONLY);
+    if (fd == -1) {
+      throw std::runtime_error("Unable to open file for mapping: " + filename);
     }
-    _num_threads = num_threads;
-    if (_num_threads == 1) {
-      _visited_set_pool->setPoolSize(1);
+    void *region = ::mmap(/* addr = */ nullptr, /* length = */ size,
+                          /* prot = */ PROT_READ, /* flags = */ MAP_SHARED,
+                          /* fd = */ fd, /* offset = */ offset);
+    // The mapping keeps its own reference to the file.
+    ::close(fd);
+
+    if (region == MAP_FAILED) {
+      throw std::runtime_error("Unable to memory-map index file: " + filename);
+    }
+    // Graph traversal jumps around the node block, so read-ahead mostly pulls
+    // in pages that queries never touch.
+    ::madvise(region, size, MADV_RANDOM);
+
+    _mapped_memory = static_cast<char *>(region);
+    _mapped_memory_size = size;
+    // The last segment may extend past the end of the mapping, but only the
+    // nodes within it are ever accessed.
+    size_t segment_bytes = _index_memory.segmentSize() * _node_size_bytes;
+    for (size_t offset = 0; offset < size; offset += segment_bytes) {
+      _index_memory.attach(_mapped_memory + offset);
     }
   }
 
-  inline uint64_t getTotalIndexMemory() const {
-    return static_cast<uint64_t>(_node_size_bytes * _max_node_count);
-  }
-  inline uint64_t mutexesAllocatedMemory() const {
-    return static_cast<uint64_t>(_node_links_mutexes.size() *
-                                 sizeof(std::mutex));
+  void releaseIndexMemory() {
+    if (_mapped_memory_size > 0) {
+      ::munmap(_mapped_memory, _mapped_memory_size);
+    }
+    _index_memory.clear();
+    _mapped_memory = nullptr;
+    _mapped_memory_size = 0;
   }
 
-  inline uint64_t visitedSetPoolAllocatedMemory() const {
-    size_t pool_size = _visited_set_pool->poolSize();
-    return static_cast<uint64_t>(pool_size * sizeof(VisitedSet));
+  // Returns true if the node may be returned to the caller (or linked to a new
+  // node during construction): it must not be deleted and its label has to
+  // pass the filter, if any.
+  inline bool isSearchResult(node_id_t node, const LabelFilter &filter) const {
+    return !_tombstones[node] && (!filter || filter(*getNodeLabel(node)));
   }
 
-  inline uint32_t getNumThreads() const { return _num_threads; }
+  // Applies the query transform of the distance (e.g. the lookup table of a
+  // product quantizer) once, so that it is not recomputed on every distance
+  // computation. Returns `query` itself for distances without one.
+  const void *transformQuery(const void *query, std::vector<char> &buffer) {
+    size_t query_size = _distance->querySize();
+    if (query_size == 0) {
+      return query;
+    }
+    buffer.resize(query_size);
+    _distance->transformQuery(/* destination = */ buffer.data(),
+                              /* src = */ query);
+    return buffer.data();
+  }
 
-  inline size_t maxEdgesPerNode() const { return _M; }
-  inline size_t dataSizeBytes() const { return _data_size_bytes; }
+  void storeRerankVector(node_id_t node, const void *data) {
+    if (_rerank_vectors.empty()) {
+      return;
+    }
+    _rerank_vectors.set(/* index = */ node, /* vector = */ data);
+  }
 
-  inline size_t nodeSizeBytes() const { return _node_size_bytes; }
+  // Replaces the distances of `neighbors` with full-precision distances to
+  // the (untransformed) query. Does nothing unless re-ranking is enabled.
+  void rerank(PriorityQueue &neighbors, const void *query) {
+    if (_rerank_vectors.empty()) {
+      return;
+    }
+    PriorityQueue reranked;
+    reranked.reserve(neighbors.size());
+    while (!neighbors.empty()) {
+      node_id_t node = neighbors.top().second;
+      neighbors.pop();
+      reranked.emplace(
+          _distance->fullPrecisionDistance(
+              /* x = */ query, /* y = */ _rerank_vectors.get(node)),
+          node);
+    }
+    if (_collect_stats) {
+      _distance_computations.fetch_add(reranked.size());
+    }
+    std::swap(neighbors, reranked);
+  }
 
-  inline size_t maxNodeCount() const { return _max_node_count; }
+  std::vector<dist_label_t> sortedResults(PriorityQueue &neighbors,
+                                          const int K) const {
+    std::vector<dist_label_t> results;
+    results.reserve(neighbors.size());
+    while (!neighbors.empty()) {
+      results.emplace_back(neighbors.top().first,
+                           *getNodeLabel(neighbors.top().second));
+      neighbors.pop();
+    }
+    std::sort(results.begin(), results.end(),
+              [](const dist_label_t &left, const dist_label_t &right) {
+                return left.first < right.first;
+              });
+    if (results.size() > static_cast<size_t>(K)) {
+      results.resize(K);
+    }
+    return results;
+  }
 
-  inline size_t currentNumNodes() const { return _cur_num_nodes; }
-  inline size_t dataDimension() const { return _distance->dimension(); }
+  // Writes the K closest of `neighbors` in increasing order of distance,
+  // padding with a label of -1 and an infinite distance. Empties `neighbors`.
+  void writeResults(PriorityQueue &neighbors, const int K, float *distances,
+                    label_t *labels) const {
+    while (neighbors.size() > static_cast<size_t>(K)) {
+      neighbors.pop();
+    }
+    for (int i = K - 1; i >= 0; i--) {
+      if (static_cast<size_t>(i) >= neighbors.size()) {
+        distances[i] = std::numeric_limits<float>::infinity();
+        labels[i] = static_cast<label_t>(-1);
+        continue;
+      }
+      distances[i] = neighbors.top().first;
+      labels[i] = *getNodeLabel(neighbors.top().second);
+      neighbors.pop();
+    }
+  }
 
-  inline uint64_t distanceComputations() const {
-    return _distance_computations.load();
+  // Node id of a live label. The caller must hold `_index_data_guard`.
+  node_id_t findNode(const label_t &label) const {
+    auto entry = _label_to_node.find(label);
+    if (entry == _label_to_node.end()) {
+      throw std::invalid_argument("No vector with label `" +
+                                  std::to_string(label) + "` in the index.");
+    }
+    return entry->second;
   }
 
-  void resetStats() {
-    _distance_computations = 0;
-    _metric_hops = 0;
+  // Checks that the index can be modified, thaws it and enters the writer
+  // gate for as long as the returned writer lives.
+  [[nodiscard]] WriterGate::Writer beginWrite(const std::string &operation) {
+    if (isMemoryMapped()) {
+      throw std::runtime_error("Cannot " + operation +
+                               " on an index loaded with mmap=true since the "
+                               "node block is mapped read-only.");
+    }
+    // The index is only frozen by a sole writer, so checking after entering
+    // the gate guarantees that it stays thawed until this write is done.
+    // Another writer may have just thawed it and still be waiting for the
+    // searches that read links in place.
+    auto writer = _writer_gate.write();
+    if (_frozen.load() || _in_place_readers.load() != 0) {
+      unfreeze();
+    }
+    return writer;
   }
 
-  void getIndexSummary() const {
-    std::cout << "\nIndex Parameters\n" << std::flush;
-    std::cout << "-----------------------------\n" << std::flush;
-    std::cout << "max_edges_per_node (M): " << _M << "\n" << std::flush;
-    std::cout << "data_size_bytes: " << _data_size_bytes << "\n" << std::flush;
-    std::cout << "node_size_bytes: " << _node_size_bytes << "\n" << std::flush;
-    std::cout << "max_node_count: " << _max_node_count << "\n" << std::flush;
-    std::cout << "cur_num_nodes: " << _cur_num_nodes << "\n" << std::flush;
+  // Registers a search for as long as it lives and tells it how to read
+  // links. A search that starts while the index is frozen reads them in
+  // place, and the next write waits for it before changing any link (see
+  // `unfreeze`). Other searches go through the per-node versions, which
+  // `freeze` waits for before releasing them.
+  class LinksReader {
+    std::atomic<size_t> *_readers;
+    bool _in_place;
+
+  public:
+    explicit LinksReader(const Index *index) {
+      while (true) {
+        _in_place = index->_frozen.load();
+        _readers = _in_place ? &index->_in_place_readers
+                             : &index->_seqlock_readers;
+        _readers->fetch_add(1);
+        // If the index was frozen or thawed in between, the freezing or
+        // thawing thread may not have seen this search. Try again.
+        if (index->_frozen.load() == _in_place) {
+          return;
+        }
+        _readers->fetch_sub(1);
+      }
+    }
+    ~LinksReader() { _readers->fetch_sub(1); }
+
+    bool inPlace() const { return _in_place; }
+
+    LinksReader(const LinksReader &) = delete;
+    LinksReader &operator=(const LinksReader &) = delete;
+  };
+
+  // Exclusive access to the links of one node. Makes the node's version odd
+  // for as long as the guard lives, so that concurrent readers retry.
+  class NodeLinksGuard {
+    std::atomic<uint32_t> &_version;
+    bool _owns_lock = true;
+
+  public:
+    NodeLinksGuard(Index *index, node_id_t node)
+        : _version(index->_node_versions[node]) {
+      uint32_t version = _version.load(std::memory_order_relaxed);
+      while ((version & 1) ||
+             !_version.compare_exchange_weak(version, version + 1,
+                                             std::memory_order_acquire)) {
+        std::this_thread::yield();
+        version = _version.load(std::memory_order_relaxed);
+      }
+    }
+    ~NodeLinksGuard() { unlock(); }
 
-    _distance->getSummary();
-  }
+    void unlock() {
+      if (_owns_lock) {
+        _version.fetch_add(1, std::memory_order_release);
+        _owns_lock = false;
+      }
+    }
 
-private:
-  friend class cereal::access;
-  // Default constructor for cereal
-  Index() = default;
+    NodeLinksGuard(const NodeLinksGuard &) = delete;
+    NodeLinksGuard &operator=(const NodeLinksGuard &) = delete;
+  };
 
-  char *getNodeData(const node_id_t &n) const {
-    return _index_memory + (n * _node_size_bytes);
+  /**
+   * @brief Returns the links of `node` for a search. With `in_place` (i.e.
+   * for a search that started while the index was frozen, see `LinksReader`)
+   * these are read in place. Otherwise a consistent snapshot is copied into
+   * `buffer` (of size _M), retrying while a writer holds the node.
+   */
+  const node_id_t *readNodeLinks(node_id_t node, node_id_t *buffer,
+                                 bool in_place) const {
+    if (in_place) {
+      return getNodeLinks(node);
+    }
+    const std::atomic<uint32_t> &version = _node_versions[node];
+    while (true) {
+      uint32_t before = version.load(std::memory_order_acquire);
+      if (before & 1) {
+        std::this_thread::yield();
+        continue;
+      }
+      std::memcpy(buffer, getNodeLinks(node), _M * sizeof(node_id_t));
+      std::atomic_thread_fence(std::memory_order_acquire);
+      if (version.load(std::memory_order_relaxed) == before) {
+        return buffer;
+      }
+    }
   }
 
+  char *getNodeData(const node_id_t &n) const { return _index_memory.at(n); }
+
   node_id_t *getNodeLinks(const node_id_t &n) const {
-    char *location = _index_memory + (n * _node_size_bytes) + _data_size_bytes;
+    char *location = _index_memory.at(n) + _data_size_bytes;
     return reinterpret_cast<node_id_t *>(location);
   }
 
   label_t *getNodeLabel(const node_id_t &n) const {
-    char *location = _index_memory + (n * _node_size_bytes) + _data_size_bytes +
-                     (_M * sizeof(node_id_t));
+    char *location =
+        _index_memory.at(n) + _data_size_bytes + (_M * sizeof(node_id_t));
     return reinterpret_cast<label_t *>(location);
   }
 
-  inline void swapNodes(node_id_t a, node_id_t b, void *temp_data,
-                        node_id_t *temp_links, label_t *temp_label) {
-
-    // stash b in temp
-    std::memcpy(temp_data, getNodeData(b), _data_size_bytes);
-    std::memcpy(temp_links, getNodeLinks(b), _M * sizeof(node_id_t));
-    std::memcpy(temp_label, getNodeLabel(b), sizeof(label_t));
-
-    // place node at a in b
-    std::memcpy(getNodeData(b), getNodeData(a), _data_size_bytes);
-    std::memcpy(getNodeLinks(b), getNodeLinks(a), _M * sizeof(node_id_t));
-    std::memcpy(getNodeLabel(b), getNodeLabel(a), sizeof(label_t));
-
-    // put node b in a
-    std::memcpy(getNodeData(a), temp_data, _data_size_bytes);
-    std::memcpy(getNodeLinks(a), temp_links, _M * sizeof(node_id_t));
-    std::memcpy(getNodeLabel(a), temp_label, sizeof(label_t));
-  }
-
   /**
    * @brief Performs beam search for the nearest neighbors of the query.
    * @TODO: Add `entry_node_dist` argument to this function since we expect to
@@ -577,16 +2513,48 @@ private:
    * @param query               The query vector.
    * @param entry_node          The node to start the search from.
    * @param buffer_size         This is equivalent to `ef_search` in the HNSW
+   * @param filter              Nodes whose label fails the filter are expanded
+   *                            but never admitted into the result heap.
    *
    * @return PriorityQueue
    */
   PriorityQueue beamSearch(const void *query, const node_id_t entry_node,
-                           const int buffer_size) {
-    PriorityQueue neighbors;
-    PriorityQueue candidates;
+                           const int buffer_size,
+                           const LabelFilter &filter = nullptr) {
+    LinksReader reader(this);
+    BeamSearchState state;
+    state.visited_set = _visited_set_pool->pollAvailableSet();
+
+    startBeamSearch(/* state = */ state, /* query = */ query,
+                    /* entry_node = */ entry_node,
+                    /* buffer_size = */ buffer_size, /* filter = */ filter,
+                    /* reader = */ reader);
+    while (stepBeamSearch(/* state = */ state, /* filter = */ filter)) {
+    }
 
-    auto *visited_set = _visited_set_pool->pollAvailableSet();
-    visited_set->clear();
+    _visited_set_pool->pushVisitedSet(
+        /* visited_set = */ state.visited_set);
+
+    return std::move(state.neighbors);
+  }
+
+  // Resets `state` (whose visited set must already be set) and seeds it with
+  // the entry node. `reader` must outlive the search.
+  void startBeamSearch(BeamSearchState &state, const void *query,
+                       const node_id_t entry_node, const int buffer_size,
+                       const LabelFilter &filter, const LinksReader &reader) {
+    state.query = query;
+    state.buffer_size = buffer_size;
+    state.read_links_in_place = reader.inPlace();
+    state.links_buffer.resize(_M);
+    state.neighbors.clear();
+    state.candidates.clear();
+    // The index may have grown since the visited set was polled.
+    if (state.visited_set->size() < _visited_set_pool->numElements()) {
+      state.visited_set->resize(
+          /* size = */ _visited_set_pool->numElements());
+    }
+    state.visited_set->clear();
 
     // Prefetch the data for entry node before computing its distance.
 #ifdef USE_SSE
@@ -597,54 +2565,76 @@ private:
         _distance->distance(/* x = */ query, /* y = */ getNodeData(entry_node),
                             /* asymmetric = */ true);
 
-    float max_dist = dist;
-    candidates.emplace(-dist, entry_node);
-    neighbors.emplace(dist, entry_node);
-    visited_set->insert(entry_node);
-
-    while (!candidates.empty()) {
-      auto [distance, node] = candidates.top();
+    state.max_dist = dist;
+    state.candidates.emplace(-dist, entry_node);
+    if (isSearchResult(entry_node, filter)) {
+      state.neighbors.emplace(dist, entry_node);
+    }
+    state.visited_set->insert(entry_node);
+  }
 
-      if (-distance > max_dist && neighbors.size() >= buffer_size) {
-        break;
-      }
-      candidates.pop();
+  // Expands the closest unexpanded candidate. Returns false once the search
+  // has converged.
+  bool stepBeamSearch(BeamSearchState &state, const LabelFilter &filter) {
+    if (state.candidates.empty()) {
+      return false;
+    }
+    auto [distance, node] = state.candidates.top();
 
-      // Prefetching the next candidate node data and visited set marker
-      // before processing it. Note that this might not be useful if the current
-      // iteration finds a neighbor that is closer than the current max
-      // distance. In that case we would have prefetched data that is not used
-      // immediately, but I think the cost of prefetching is low enough that
-      // it's probably worth it.
+    if (-distance > state.max_dist &&
+        state.neighbors.size() >= state.buffer_size) {
+      return false;
+    }
+    state.candidates.pop();
+
+    // Prefetching the next candidate node data and visited set marker
+    // before processing it. Note that this might not be useful if the current
+    // iteration finds a neighbor that is closer than the current max
+    // distance. In that case we would have prefetched data that is not used
+    // immediately, but I think the cost of prefetching is low enough that
+    // it's probably worth it.
 #ifdef USE_SSE
-      if (!candidates.empty()) {
-        _mm_prefetch(getNodeData(candidates.top().second), _MM_HINT_T0);
-        visited_set->prefetch(candidates.top().second);
-      }
+    if (!state.candidates.empty()) {
+      _mm_prefetch(getNodeData(state.candidates.top().second), _MM_HINT_T0);
+      state.visited_set->prefetch(state.candidates.top().second);
+    }
 #endif
 
-      processCandidateNode(
-          /* query = */ query, /* node = */ node,
-          /* max_dist = */ max_dist, /* buffer_size = */ buffer_size,
-          /* visited_set = */ visited_set,
-          /* neighbors = */ neighbors, /* candidates = */ candidates);
+    processCandidateNode(
+        /* query = */ state.query, /* node = */ node,
+        /* max_dist = */ state.max_dist,
+        /* buffer_size = */ state.buffer_size,
+        /* visited_set = */ state.visited_set,
+        /* neighbors = */ state.neighbors,
+        /* candidates = */ state.candidates,
+        /* filter = */ filter,
+        /* links_buffer = */ state.links_buffer.data(),
+        /* read_links_in_place = */ state.read_links_in_place);
+
+    // The links of the node expanded next. When searches are interleaved,
+    // they arrive while the other queries are being advanced.
+#ifdef USE_SSE
+    if (!state.candidates.empty()) {
+      _mm_prefetch(reinterpret_cast<const char *>(
+                       getNodeLinks(state.candidates.top().second)),
+                   _MM_HINT_T0);
     }
-
-    _visited_set_pool->pushVisitedSet(
-        /* visited_set = */ visited_set);
-
-    return neighbors;
+#endif
+    return true;
   }
 
   void processCandidateNode(const void *query, node_id_t &node, float &max_dist,
                             const int buffer_size, VisitedSet *visited_set,
                             PriorityQueue &neighbors,
-                            PriorityQueue &candidates) {
-    // Lock all operations on this specific node
-    std::unique_lock<std::mutex> lock(_node_links_mutexes[node]);
+                            PriorityQueue &candidates,
+                            const LabelFilter &filter,
+                            node_id_t *links_buffer,
+                            bool read_links_in_place) {
     float dist = 0.f;
 
-    node_id_t *neighbor_node_links = getNodeLinks(node);
+    const node_id_t *neighbor_node_links =
+        readNodeLinks(/* node = */ node, /* buffer = */ links_buffer,
+                      /* in_place = */ read_links_in_place);
     for (uint32_t i = 0; i < _M; i++) {
       node_id_t neighbor_node_id = neighbor_node_links[i];
 
@@ -657,7 +2647,10 @@ private:
       }
 #endif
 
+      // Nodes added after the visited set was sized (i.e. the index grew
+      // during this search) are skipped.
       bool neighbor_is_visited =
+          neighbor_node_id >= visited_set->size() ||
           visited_set->isVisited(/* num = */ neighbor_node_id);
 
       if (neighbor_is_visited) {
@@ -674,6 +2667,10 @@ private:
 
       if (neighbors.size() < buffer_size || dist < max_dist) {
         candidates.emplace(-dist, neighbor_node_id);
+        // Deleted and filtered-out nodes are only used for routing.
+        if (!isSearchResult(neighbor_node_id, filter)) {
+          continue;
+        }
         neighbors.emplace(dist, neighbor_node_id);
 #ifdef USE_SSE
         _mm_prefetch(getNodeData(candidates.top().second), _MM_HINT_T0);
@@ -690,8 +2687,11 @@ private:
 
   /**
    * @brief Selects neighbors from the PriorityQueue, according to the HNSW
-   * heuristic. The neighbors priority queue contains elements sorted by
-   * distance where the top element is the furthest neighbor from the query.
+   * heuristic relaxed by `_pruning_alpha` as in Vamana's RobustPrune: a
+   * candidate is dropped if an already selected neighbor is more than alpha
+   * times closer to it than the query is. The neighbors priority queue
+   * contains elements sorted by distance where the top element is the
+   * furthest neighbor from the query.
    */
   void selectNeighbors(PriorityQueue &neighbors) {
     if (neighbors.size() < _M) {
@@ -723,7 +2723,7 @@ private:
             _distance->distance(/* x = */ getNodeData(second_pair.second),
                                 /* y = */ getNodeData(current_pair.second));
 
-        if (cur_dist < (-current_pair.first)) {
+        if (_pruning_alpha * cur_dist < (-current_pair.first)) {
           should_keep_candidate = false;
           break;
         }
@@ -742,11 +2742,79 @@ private:
     }
   }
 
+  // Replaces the links of a live node to deleted nodes (see
+  // `repairDeletedNodes`). An insertion holds the new node while it links its
+  // neighbors back to it, and the new node may have been removed meanwhile,
+  // so this never locks a node while holding another. The new links are
+  // chosen from snapshots, and written only if the node's links did not
+  // change in the meantime. Otherwise the node is repaired again.
+  void repairNode(node_id_t node) {
+    if (_tombstones[node]) {
+      return;
+    }
+    std::vector<node_id_t> links(_M), neighbor_links(_M);
+    while (true) {
+      readNodeLinks(/* node = */ node, /* buffer = */ links.data(),
+                    /* in_place = */ false);
+      if (std::none_of(links.begin(), links.end(), [&](node_id_t neighbor) {
+            return neighbor != node && _tombstones[neighbor];
+          })) {
+        return;
+      }
+
+      std::vector<node_id_t> candidate_ids;
+      for (node_id_t neighbor : links) {
+        if (neighbor == node) {
+          continue;
+        }
+        if (!_tombstones[neighbor]) {
+          candidate_ids.push_back(neighbor);
+          continue;
+        }
+        readNodeLinks(/* node = */ neighbor,
+                      /* buffer = */ neighbor_links.data(),
+                      /* in_place = */ false);
+        for (node_id_t second_hop : neighbor_links) {
+          if (second_hop != node && second_hop != neighbor &&
+              !_tombstones[second_hop]) {
+            candidate_ids.push_back(second_hop);
+          }
+        }
+      }
+      std::sort(candidate_ids.begin(), candidate_ids.end());
+      candidate_ids.erase(
+          std::unique(candidate_ids.begin(), candidate_ids.end()),
+          candidate_ids.end());
+
+      PriorityQueue candidates;
+      for (node_id_t candidate : candidate_ids) {
+        candidates.emplace(
+            _distance->distance(/* x = */ getNodeData(node),
+                                /* y = */ getNodeData(candidate)),
+            candidate);
+      }
+      selectNeighbors(candidates);
+
+      NodeLinksGuard lock(this, node);
+      node_id_t *node_links = getNodeLinks(node);
+      if (!std::equal(links.begin(), links.end(), node_links)) {
+        continue;
+      }
+      size_t j = 0;
+      while (!candidates.empty()) {
+        node_links[j++] = candidates.top().second;
+        candidates.pop();
+      }
+      std::fill(node_links + j, node_links + _M, node);
+      return;
+    }
+  }
+
   void connectNeighbors(PriorityQueue &neighbors, node_id_t new_node_id) {
     // connects neighbors according to the HSNW heuristic
 
     // Lock all operations on this node
-    std::unique_lock<std::mutex> lock(_node_links_mutexes[new_node_id]);
+    NodeLinksGuard lock(this, new_node_id);
 
     node_id_t *new_node_links = getNodeLinks(new_node_id);
     int i = 0; // iterates through links for "new_node_id"
@@ -756,58 +2824,7 @@ private:
       // add link to the current new node
       new_node_links[i] = neighbor_node_id;
       // now do the back-connections (a little tricky)
-
-      std::unique_lock<std::mutex> neighbor_lock(
-          _node_links_mutexes[neighbor_node_id]);
-      node_id_t *neighbor_node_links = getNodeLinks(neighbor_node_id);
-      bool is_inserted = false;
-      for (size_t j = 0; j < _M; j++) {
-        if (neighbor_node_links[j] == neighbor_node_id) {
-          // If there is a self-loop, replace the self-loop with
-          // the desired link.
-          neighbor_node_links[j] = new_node_id;
-          is_inserted = true;
-          break;
-        }
-      }
-      if (!is_inserted) {
-        // now, we may to replace one of the links. This will disconnect
-        // the old neighbor and create a directed edge, so we have to be
-        // very careful. To ensure we respect the pruning heuristic, we
-        // construct a candidate set including the old links AND our new
-        // one, then prune this candidate set to get the new neighbors.
-
-        float max_dist =
-            _distance->distance(/* x = */ getNodeData(neighbor_node_id),
-                                /* y = */ getNodeData(new_node_id));
-
-        PriorityQueue candidates;
-        candidates.emplace(max_dist, new_node_id);
-        for (size_t j = 0; j < _M; j++) {
-          if (neighbor_node_links[j] != neighbor_node_id) {
-            auto label = neighbor_node_links[j];
-            auto distance =
-                _distance->distance(/* x = */ getNodeData(neighbor_node_id),
-                                    /* y = */ getNodeData(label));
-            candidates.emplace(distance, label);
-          }
-        }
-        selectNeighbors(candidates);
-        // connect the pruned set of candidates, including self-loops:
-        size_t j = 0;
-        while (candidates.size() > 0) { // candidates
-          neighbor_node_links[j] = candidates.top().second;
-          candidates.pop();
-          j++;
-        }
-        while (j < _M) { // self-loops (unused links)
-          neighbor_node_links[j] = neighbor_node_id;
-          j++;
-        }
-      }
-
-      // Unlock the current node we are iterating over
-      neighbor_lock.unlock();
+      addLink(/* node = */ neighbor_node_id, /* new_neighbor = */ new_node_id);
 
       // loop increments:
       i++;
@@ -818,6 +2835,53 @@ private:
     }
   }
 
+  // Adds a link from `node` to `new_neighbor`, unless there already is one.
+  void addLink(node_id_t node, node_id_t new_neighbor) {
+    NodeLinksGuard lock(this, node);
+    node_id_t *links = getNodeLinks(node);
+    if (std::find(links, links + _M, new_neighbor) != links + _M) {
+      return;
+    }
+    for (size_t j = 0; j < _M; j++) {
+      if (links[j] == node) {
+        // If there is a self-loop, replace the self-loop with
+        // the desired link.
+        links[j] = new_neighbor;
+        return;
+      }
+    }
+    // now, we may to replace one of the links. This will disconnect
+    // the old neighbor and create a directed edge, so we have to be
+    // very careful. To ensure we respect the pruning heuristic, we
+    // construct a candidate set including the old links AND our new
+    // one, then prune this candidate set to get the new neighbors.
+    float max_dist = _distance->distance(/* x = */ getNodeData(node),
+                                         /* y = */ getNodeData(new_neighbor));
+
+    PriorityQueue candidates;
+    candidates.emplace(max_dist, new_neighbor);
+    for (size_t j = 0; j < _M; j++) {
+      if (links[j] != node) {
+        auto label = links[j];
+        auto distance = _distance->distance(/* x = */ getNodeData(node),
+                                            /* y = */ getNodeData(label));
+        candidates.emplace(distance, label);
+      }
+    }
+    selectNeighbors(candidates);
+    // connect the pruned set of candidates, including self-loops:
+    size_t j = 0;
+    while (candidates.size() > 0) { // candidates
+      links[j] = candidates.top().second;
+      candidates.pop();
+      j++;
+    }
+    while (j < _M) { // self-loops (unused links)
+      links[j] = node;
+      j++;
+    }
+  }
+
   /**
    * @brief Selects a node to use as the entry point for a new node.
    * This proceeds in a greedy fashion, by selecting the node with
@@ -835,17 +2899,28 @@ private:
           "num_initializations must be greater than 0.");
     }
 
-    int step_size = _cur_num_nodes / num_initializations;
+    node_id_t entry_node;
+    if (_entry_point_strategy == EntryPointStrategy::SAMPLE_GRAPH &&
+        descendSampleGraph(query, entry_node)) {
+      return entry_node;
+    }
+
+    size_t num_nodes = _cur_num_nodes.load();
+    int step_size = num_nodes / num_initializations;
     step_size = step_size ? step_size : 1;
 
     float min_dist = std::numeric_limits<float>::max();
-    node_id_t entry_node = 0;
+    entry_node = 0;
 
     if (_collect_stats) {
       _distance_computations.fetch_add(num_initializations);
     }
 
-    for (node_id_t node = 0; node < _cur_num_nodes; node += step_size) {
+    for (node_id_t node = 0; node < num_nodes; node += step_size) {
+      // Repaired deleted nodes have no out-edges left to route through.
+      if (_tombstones[node]) {
+        continue;
+      }
       float dist =
           _distance->distance(/* x = */ query, /* y = */ getNodeData(node),
                               /* asymmetric = */ true);
@@ -857,19 +2932,159 @@ private:
     return entry_node;
   }
 
+  /**
+   * @brief Greedily walks the sample graph from the sample medoid towards the
+   * query, moving to the closest neighbor until no neighbor is closer.
+   *
+   * @param query The query vector.
+   * @param entry_node Set to the closest non-deleted sample seen on the way.
+   * @return false if the sample graph is empty or every sample seen is
+   * deleted, in which case the caller should fall back to a strided scan.
+   */
+  bool descendSampleGraph(const void *query, node_id_t &entry_node) {
+    if (_sample_nodes.empty()) {
+      return false;
+    }
+    size_t degree = _sample_links.size() / _sample_nodes.size();
+
+    uint32_t current = 0;
+    float current_dist = _distance->distance(
+        /* x = */ query, /* y = */ getNodeData(_sample_nodes[current]),
+        /* asymmetric = */ true);
+    uint64_t num_distance_computations = 1;
+
+    // Deleted samples still route the descent, but are never returned.
+    bool found = !_tombstones[_sample_nodes[current]];
+    float entry_dist =
+        found ? current_dist : std::numeric_limits<float>::max();
+    entry_node = _sample_nodes[current];
+
+    while (true) {
+      uint32_t next = current;
+      const uint32_t *links = _sample_links.data() + (current * degree);
+      for (size_t i = 0; i < degree; i++) {
+        node_id_t node = _sample_nodes[links[i]];
+        float dist =
+            _distance->distance(/* x = */ query, /* y = */ getNodeData(node),
+                                /* asymmetric = */ true);
+        num_distance_computations++;
+        if (dist < current_dist) {
+          current_dist = dist;
+          next = links[i];
+        }
+        if (dist < entry_dist && !_tombstones[node]) {
+          entry_dist = dist;
+          entry_node = node;
+          found = true;
+        }
+      }
+      if (next == current) {
+        break;
+      }
+      current = next;
+    }
+
+    if (_collect_stats) {
+      _distance_computations.fetch_add(num_distance_computations);
+    }
+    return found;
+  }
+
+  /**
+   * @brief Builds the sample graph used by EntryPointStrategy::SAMPLE_GRAPH.
+   * About sqrt(N) live nodes are sampled at a fixed stride and linked to
+   * their SAMPLE_GRAPH_DEGREE nearest samples. This costs as many distance
+   * computations as one brute-force query over the index. The sample with the
+   * smallest total distance to all the others is stored first and used as
+   * the starting point of every descent.
+   */
+  void buildSampleGraph() {
+    std::vector<node_id_t> live_nodes;
+    live_nodes.reserve(_cur_num_nodes);
+    for (node_id_t node = 0; node < _cur_num_nodes; node++) {
+      if (!_tombstones[node]) {
+        live_nodes.push_back(node);
+      }
+    }
+
+    _sample_nodes.clear();
+    _sample_links.clear();
+    if (live_nodes.empty()) {
+      return;
+    }
+
+    size_t num_samples = std::min(
+        live_nodes.size(),
+        std::max(MIN_SAMPLE_GRAPH_SIZE,
+                 static_cast<size_t>(std::sqrt(live_nodes.size()))));
+    size_t degree = std::min(SAMPLE_GRAPH_DEGREE, num_samples - 1);
+
+    std::vector<node_id_t> samples(num_samples);
+    for (size_t i = 0; i < num_samples; i++) {
+      samples[i] = live_nodes[i * live_nodes.size() / num_samples];
+    }
+
+    std::vector<uint32_t> links(num_samples * degree);
+    std::vector<double> total_distances(num_samples, 0.0);
+    auto link_sample = [&](uint32_t sample) {
+      std::vector<std::pair<float, uint32_t>> distances;
+      distances.reserve(num_samples - 1);
+      for (uint32_t other = 0; other < num_samples; other++) {
+        if (other == sample) {
+          continue;
+        }
+        float dist = _distance->distance(
+            /* x = */ getNodeData(samples[sample]),
+            /* y = */ getNodeData(samples[other]));
+        distances.emplace_back(dist, other);
+        total_distances[sample] += dist;
+      }
+      std::partial_sort(distances.begin(), distances.begin() + degree,
+                        distances.end());
+      for (size_t i = 0; i < degree; i++) {
+        links[(sample * degree) + i] = distances[i].second;
+      }
+    };
+
+    _thread_pool->parallelFor(/* start_index = */ 0,
+                              /* end_index = */ num_samples,
+                              /* function = */ link_sample);
+
+    // Move the medoid to position 0.
+    uint32_t medoid = std::min_element(total_distances.begin(),
+                                       total_distances.end()) -
+                      total_distances.begin();
+    if (medoid != 0) {
+      std::swap(samples[0], samples[medoid]);
+      std::swap_ranges(links.begin(), links.begin() + degree,
+                       links.begin() + (medoid * degree));
+      for (uint32_t &link : links) {
+        if (link == 0) {
+          link = medoid;
+        } else if (link == medoid) {
+          link = 0;
+        }
+      }
+    }
+
+    _sample_nodes.swap(samples);
+    _sample_links.swap(links);
+  }
+
   void relabel(const std::vector<node_id_t> &P) {
     // 1. Rewire all of the node connections
-    for (node_id_t n = 0; n < _cur_num_nodes; n++) {
+    _thread_pool->parallelFor(0, _cur_num_nodes, [&](node_id_t n) {
       node_id_t *links = getNodeLinks(n);
       for (int m = 0; m < _M; m++) {
         links[m] = P[links[m]];
       }
-    }
+    });
 
-    // 2. Physically re-layout the nodes (in place)
-    char *temp_data = new char[_data_size_bytes];
-    node_id_t *temp_links = new node_id_t[_M];
-    label_t *temp_label = new label_t;
+    // 2. Physically re-layout the nodes (in place). Every cycle of P is
+    // followed once, carrying the displaced node along, so that each node
+    // block is copied twice and only two node-sized buffers are needed.
+    std::vector<char> carried(_node_size_bytes);
+    std::vector<char> displaced(_node_size_bytes);
 
     auto *visited_set = _visited_set_pool->pollAvailableSet();
 
@@ -878,39 +3093,56 @@ private:
     visited_set->clear();
 
     for (node_id_t n = 0; n < _cur_num_nodes; n++) {
-      if (visited_set->isVisited(/* num = */ n)) {
+      if (visited_set->isVisited(/* num = */ n) || P[n] == n) {
         continue;
       }
 
-      node_id_t src = n;
-      node_id_t dest = P[src];
-
-      // swap node at src with node at dest
-      swapNodes(src, dest, temp_data, temp_links, temp_label);
-
-      // mark src as having been relocated
-      visited_set->insert(src);
-
-      // recursively relocate the node from "dest"
+      std::memcpy(carried.data(), getNodeData(n), _node_size_bytes);
+      node_id_t dest = P[n];
       while (!visited_set->isVisited(/* num = */ dest)) {
         // mark node as having been relocated
         visited_set->insert(dest);
-        // the value of src remains the same. However, dest needs
-        // to change because the node located at src was previously
-        // located at dest, and must be relocated to P[dest].
+        // the node at dest moves on to P[dest] next
+        std::memcpy(displaced.data(), getNodeData(dest), _node_size_bytes);
+        std::memcpy(getNodeData(dest), carried.data(), _node_size_bytes);
+        std::swap(carried, displaced);
         dest = P[dest];
-
-        // swap node at src with node at dest
-        swapNodes(src, dest, temp_data, temp_links, temp_label);
       }
     }
 
     _visited_set_pool->pushVisitedSet(
         /* visited_set = */ visited_set);
 
-    delete[] temp_data;
-    delete[] temp_links;
-    delete temp_label;
+    // 3. Carry the deletion state over to the new node ids
+    std::vector<uint8_t> tombstones(_cur_num_nodes);
+    for (node_id_t n = 0; n < _cur_num_nodes; n++) {
+      tombstones[P[n]] = _tombstones[n];
+    }
+    for (node_id_t n = 0; n < _cur_num_nodes; n++) {
+      _tombstones[n] = tombstones[n];
+    }
+    for (node_id_t &node : _deleted_node_ids) {
+      node = P[node];
+    }
+    for (node_id_t &node : _free_node_ids) {
+      node = P[node];
+    }
+    for (node_id_t &node : _sample_nodes) {
+      node = P[node];
+    }
+    for (auto &[label, node] : _label_to_node) {
+      node = P[node];
+    }
+    size_t num_permuted = _node_permutation.size();
+    _node_permutation.resize(_cur_num_nodes);
+    std::iota(_node_permutation.begin() + num_permuted,
+              _node_permutation.end(), num_permuted);
+    for (node_id_t &node : _node_permutation) {
+      node = P[node];
+    }
+    if (!_rerank_vectors.empty()) {
+      _rerank_vectors.permute(P, _cur_num_nodes);
+    }
   }
 };
 
@@ -7,6 +7,7 @@
 
 #include <flatnav/distances/InnerProductDistance.h>
 #include <flatnav/distances/SquaredL2Distance.h>
+#include <quantization/ScalarQuantization.h>
 
 namespace flatnav::testing {
 
@@ -182,4 +183,53 @@ TEST_F(DistanceTest, TestSseInnerProductDistance) {
 #endif
 }
 
-} // namespace flatnav::testing
\ No newline at end of file
+// Scalar quantized distances must match the float distances between the
+// decoded vectors, including for dimensions that are not a multiple of 8.
+TEST(ScalarQuantizerTest, DistancesMatchDecodedVectors) {
+  using flatnav::distances::MetricType;
+  using flatnav::quantization::ScalarQuantizer;
+  using flatnav::util::DataType;
+
+  const uint32_t dim = 37, num_vectors = 100;
+  std::default_random_engine generator(1234);
+  std::normal_distribution<float> distribution(0.0f, 1.0f);
+  std::vector<float> vectors(num_vectors * dim);
+  for (auto &value : vectors) {
+    value = distribution(generator);
+  }
+
+  for (DataType code_type : {DataType::int8, DataType::float16}) {
+    for (MetricType metric_type : {MetricType::L2, MetricType::IP}) {
+      ScalarQuantizer quantizer(dim, metric_type, code_type);
+      quantizer.train(vectors.data(), num_vectors);
+      ASSERT_EQ(quantizer.dataSize(), dim * util::size(code_type));
+
+      std::vector<uint8_t> x_code(quantizer.dataSize());
+      std::vector<uint8_t> y_code(quantizer.dataSize());
+      std::vector<float> x_decoded(dim), y_decoded(dim);
+      for (uint32_t i = 0; i + 1 < num_vectors; i++) {
+        const float *x = vectors.data() + (i * dim);
+        const float *y = x + dim;
+        quantizer.transformData(x_code.data(), x);
+        quantizer.transformData(y_code.data(), y);
+        quantizer.decode(x_code.data(), x_decoded.data());
+        quantizer.decode(y_code.data(), y_decoded.data());
+
+        // Codes reconstruct the vectors up to the quantization step.
+        for (uint32_t d = 0; d < dim; d++) {
+          ASSERT_NEAR(x_decoded[d], x[d], 0.05f);
+        }
+        float expected_asymmetric =
+            quantizer.fullPrecisionDistance(x, y_decoded.data());
+        float expected_symmetric =
+            quantizer.fullPrecisionDistance(x_decoded.data(), y_decoded.data());
+        ASSERT_NEAR(quantizer.distance(x, y_code.data(), true),
+                    expected_asymmetric, 1e-3);
+        ASSERT_NEAR(quantizer.distance(x_code.data(), y_code.data()),
+                    expected_symmetric, 1e-3);
+      }
+    }
+  }
+}
+
+} // namespace flatnav::testing
@@ -0,0 +1,683 @@
+#include "gtest/gtest.h"
+#include <algorithm>
+#include <cstdio>
+#include <flatnav/distances/SquaredL2Distance.h>
+#include <flatnav/index/Index.h>
+#include <fstream>
+#include <numeric>
+#include <quantization/ProductQuantization.h>
+#include <random>
+#include <thread>
+
+using flatnav::Index;
+using flatnav::distances::MetricType;
+using flatnav::distances::SquaredL2Distance;
+using flatnav::quantization::ProductQuantizer;
+
+namespace flatnav::testing {
+
+static const uint32_t INDEXED_VECTORS = 2000;
+static const uint32_t VEC_DIM = 32;
+static const uint32_t M = 16;
+static const uint32_t EF_CONSTRUCTION = 100;
+static const uint32_t K = 10;
+static const uint32_t EF_SEARCH = 64;
+
+using IndexType = Index<SquaredL2Distance<util::DataType::float32>, int>;
+
+class IndexTest : public ::testing::Test {
+protected:
+  void SetUp() override {
+    std::default_random_engine generator(1234);
+    std::uniform_real_distribution<float> distribution(0.0f, 1.0f);
+    vectors.resize(INDEXED_VECTORS * VEC_DIM);
+    for (auto &value : vectors) {
+      value = distribution(generator);
+    }
+
+    index = std::make_unique<IndexType>(
+        /* dist = */ std::make_unique<SquaredL2Distance<>>(VEC_DIM),
+        /* dataset_size = */ INDEXED_VECTORS, /* max_edges = */ M,
+        /* collect_stats = */ true);
+    std::vector<int> labels(INDEXED_VECTORS);
+    std::iota(labels.begin(), labels.end(), 0);
+    index->addBatch<float>(vectors.data(), labels, EF_CONSTRUCTION);
+  }
+
+  float *vector(uint32_t label) { return vectors.data() + (label * VEC_DIM); }
+
+  std::vector<float> vectors;
+  std::unique_ptr<IndexType> index;
+};
+
+TEST_F(IndexTest, RemovedLabelsAreNeverReturned) {
+  for (int label = 0; label < 100; label++) {
+    index->remove(label);
+  }
+  EXPECT_THROW(index->remove(0), std::invalid_argument);
+
+  for (int label = 0; label < 200; label++) {
+    auto results = index->search(vector(label), K, EF_SEARCH);
+    ASSERT_EQ(results.size(), K);
+    for (const auto &[distance, result_label] : results) {
+      ASSERT_GE(result_label, 100);
+    }
+  }
+}
+
+TEST_F(IndexTest, RepairFreesSlotsForReuse) {
+  for (int label = 0; label < 100; label++) {
+    index->remove(label);
+  }
+  index->repairDeletedNodes();
+  ASSERT_EQ(index->numDeletedNodes(), 100);
+
+  // No live node should link to a repaired slot anymore.
+  auto outdegree_table = index->getGraphOutdegreeTable();
+  for (uint32_t node = 0; node < outdegree_table.size(); node++) {
+    if (node < 100) {
+      ASSERT_TRUE(outdegree_table[node].empty());
+      continue;
+    }
+    for (uint32_t neighbor : outdegree_table[node]) {
+      ASSERT_GE(neighbor, 100);
+    }
+  }
+
+  // Re-inserting reuses the freed slots instead of growing the index.
+  for (int label = 0; label < 100; label++) {
+    int new_label = INDEXED_VECTORS + label;
+    index->add(vector(label), new_label, EF_CONSTRUCTION, 100);
+  }
+  ASSERT_EQ(index->currentNumNodes(), INDEXED_VECTORS);
+  ASSERT_EQ(index->numDeletedNodes(), 0);
+
+  uint32_t found = 0;
+  for (int label = 0; label < 100; label++) {
+    auto results = index->search(vector(label), 1, EF_SEARCH);
+    found += results[0].second == INDEXED_VECTORS + label;
+  }
+  EXPECT_GE(found, 95);
+}
+
+TEST_F(IndexTest, RepairRunsConcurrentlyWithInsertionsAndRemovals) {
+  // Every inserted vector is removed as soon as its label is in the index,
+  // usually while it is still being linked to its neighbors, and the removed
+  // nodes are repaired meanwhile.
+  const int num_new_vectors = 500;
+  index->setAutoGrow(true);
+  std::atomic<bool> done = false;
+  std::thread inserter([&] {
+    for (int i = 0; i < num_new_vectors; i++) {
+      int label = INDEXED_VECTORS + i;
+      index->add(vector(i), label, EF_CONSTRUCTION, 100);
+    }
+  });
+  std::thread remover([&] {
+    for (int label = INDEXED_VECTORS;
+         label < INDEXED_VECTORS + num_new_vectors; label++) {
+      while (!index->contains(label)) {
+        std::this_thread::yield();
+      }
+      index->remove(label);
+    }
+    done = true;
+  });
+  while (!done) {
+    index->repairDeletedNodes();
+  }
+  inserter.join();
+  remover.join();
+
+  // Once nothing is inserted concurrently, every removed slot is freed and
+  // nothing links to a freed slot. Slots freed earlier were reused by the
+  // insertions that followed.
+  index->repairDeletedNodes();
+  ASSERT_EQ(index->numLiveNodes(), INDEXED_VECTORS);
+  ASSERT_LT(index->currentNumNodes(), INDEXED_VECTORS + num_new_vectors);
+  auto outdegree_table = index->getGraphOutdegreeTable();
+  size_t num_free_slots = 0;
+  for (const auto &links : outdegree_table) {
+    num_free_slots += links.empty();
+    for (uint32_t neighbor : links) {
+      ASSERT_FALSE(outdegree_table[neighbor].empty());
+    }
+  }
+  ASSERT_EQ(num_free_slots, index->numDeletedNodes());
+
+  uint32_t found = 0;
+  for (int label = 0; label < INDEXED_VECTORS; label++) {
+    auto results = index->search(vector(label), 1, EF_SEARCH);
+    found += results[0].second == label;
+  }
+  EXPECT_GE(found, 0.98 * INDEXED_VECTORS);
+}
+
+TEST_F(IndexTest, UpdateReplacesVector) {
+  int label = 7;
+  index->update(vector(42), label, EF_CONSTRUCTION);
+
+  auto results = index->search(vector(42), 2, EF_SEARCH);
+  std::vector<int> labels = {results[0].second, results[1].second};
+  std::sort(labels.begin(), labels.end());
+  EXPECT_EQ(labels, std::vector<int>({7, 42}));
+  EXPECT_FLOAT_EQ(results[0].first, 0.f);
+  EXPECT_FLOAT_EQ(results[1].first, 0.f);
+}
+
+TEST_F(IndexTest, SearchBatchMatchesSearch) {
+  const uint32_t num_queries = 103;
+  std::vector<float> distances(num_queries * K);
+  std::vector<int> labels(num_queries * K);
+  index->searchBatch<float>(vectors.data(), num_queries, K, EF_SEARCH,
+                            /* num_initializations = */ 100, distances.data(),
+                            labels.data());
+
+  for (uint32_t query = 0; query < num_queries; query++) {
+    auto results = index->search(vector(query), K, EF_SEARCH);
+    ASSERT_EQ(results.size(), K);
+    for (uint32_t i = 0; i < K; i++) {
+      EXPECT_FLOAT_EQ(distances[(query * K) + i], results[i].first);
+      EXPECT_EQ(labels[(query * K) + i], results[i].second);
+    }
+  }
+}
+
+TEST_F(IndexTest, RangeSearchGrowsTheBeamPastEfSearch) {
+  const uint32_t num_queries = 20, num_within_radius = 100;
+  size_t num_found = 0;
+  for (uint32_t query = 0; query < num_queries; query++) {
+    auto results = index->searchBruteForce(vector(query), num_within_radius);
+    float radius = results.back().first;
+
+    auto within_radius = index->rangeSearch(vector(query), radius,
+                                            /* ef_search = */ 16);
+    ASSERT_LE(within_radius.size(), num_within_radius);
+    ASSERT_TRUE(std::is_sorted(within_radius.begin(), within_radius.end()));
+    for (const auto &[distance, label] : within_radius) {
+      ASSERT_LE(distance, radius);
+    }
+    num_found += within_radius.size();
+
+    auto closest = index->rangeSearch(vector(query), radius,
+                                      /* ef_search = */ 16,
+                                      /* max_results = */ K);
+    ASSERT_EQ(closest.size(), K);
+    ASSERT_EQ(closest[0].second, query);
+  }
+  // Far more results than the initial beam of 16 are found.
+  EXPECT_GE(num_found, 0.9 * num_queries * num_within_radius);
+}
+
+TEST_F(IndexTest, RangeSearchOfRerankedIndexUsesExactDistances) {
+  using PQIndexType = Index<ProductQuantizer, int>;
+  auto quantizer = std::make_unique<ProductQuantizer>(
+      /* dim = */ VEC_DIM, /* M = */ 8, /* nbits = */ 8, MetricType::L2);
+  quantizer->train(/* vectors = */ vectors.data(), /* n = */ INDEXED_VECTORS);
+  PQIndexType pq_index(/* dist = */ std::move(quantizer),
+                       /* dataset_size = */ INDEXED_VECTORS,
+                       /* max_edges = */ M);
+  pq_index.enableReranking();
+  std::vector<int> labels(INDEXED_VECTORS);
+  std::iota(labels.begin(), labels.end(), 0);
+  pq_index.addBatch<float>(vectors.data(), labels, EF_CONSTRUCTION);
+
+  const uint32_t num_queries = 20, num_within_radius = 100;
+  size_t num_found = 0;
+  for (uint32_t query = 0; query < num_queries; query++) {
+    // Exact distances, since the brute-force scan is re-ranked too.
+    auto results =
+        pq_index.searchBruteForce(vector(query), INDEXED_VECTORS);
+    float radius = results[num_within_radius - 1].first;
+
+    auto within_radius = pq_index.rangeSearch(vector(query), radius,
+                                              /* ef_search = */ 16);
+    ASSERT_TRUE(std::is_sorted(within_radius.begin(), within_radius.end()));
+    for (const auto &[distance, label] : within_radius) {
+      ASSERT_LE(distance, radius);
+    }
+    num_found += within_radius.size();
+  }
+  EXPECT_GE(num_found, 0.9 * num_queries * num_within_radius);
+}
+
+TEST_F(IndexTest, KnnGraphMatchesSearch) {
+  index->remove(/* label = */ 3);
+  size_t num_rows = index->numLiveNodes();
+  ASSERT_EQ(num_rows, INDEXED_VECTORS - 1);
+  std::vector<float> distances(num_rows * K);
+  std::vector<int> labels(num_rows * K), row_labels(num_rows);
+  index->knnGraph(K, EF_SEARCH, distances.data(), labels.data(),
+                  row_labels.data());
+
+  size_t num_matches = 0;
+  for (size_t row = 0; row < num_rows; row++) {
+    int label = row_labels[row];
+    ASSERT_EQ(label, row < 3 ? row : row + 1);
+    // The node itself is the closest result of a search for its vector.
+    auto results = index->search(vector(label), K + 1, EF_SEARCH);
+    for (uint32_t i = 0; i < K; i++) {
+      ASSERT_NE(labels[(row * K) + i], label);
+      ASSERT_NE(labels[(row * K) + i], 3);
+      num_matches += std::count_if(
+          results.begin(), results.end(),
+          [&](const auto &result) {
+            return result.second == labels[(row * K) + i];
+          });
+    }
+  }
+  EXPECT_GE(num_matches, 0.95 * num_rows * K);
+}
+
+TEST_F(IndexTest, ReorderingPreservesTheGraph) {
+  auto graph = index->getGraph();
+  auto outdegree_table = index->getGraphOutdegreeTable();
+  ASSERT_EQ(graph.numNodes(), INDEXED_VECTORS);
+  for (uint32_t node = 0; node < INDEXED_VECTORS; node++) {
+    ASSERT_EQ(std::vector<node_id_t>(graph.begin(node), graph.end(node)),
+              outdegree_table[node]);
+  }
+  EXPECT_EQ(util::gOrder<node_id_t>(graph, 5),
+            util::gOrder<node_id_t>(outdegree_table, 5));
+
+  // Every partitioned ordering is a permutation.
+  ThreadPool thread_pool(/* num_threads = */ 4);
+  for (uint32_t num_partitions : {1, 3, 8}) {
+    auto P = util::partitionedGOrder<node_id_t>(graph, 5, num_partitions,
+                                                thread_pool);
+    std::sort(P.begin(), P.end());
+    std::vector<node_id_t> identity(INDEXED_VECTORS);
+    std::iota(identity.begin(), identity.end(), 0);
+    EXPECT_EQ(P, identity);
+  }
+
+  // Reordering is a relabeling: the same edges connect the same vectors.
+  size_t num_edges = graph.edges.size();
+  index->setNumThreads(std::max(1u, std::thread::hardware_concurrency()));
+  index->doGraphReordering({"gorder", "rcm"});
+  EXPECT_EQ(index->getGraph().edges.size(), num_edges);
+  for (int label = 0; label < 200; label++) {
+    auto results = index->search(vector(label), K, EF_SEARCH);
+    ASSERT_EQ(results.size(), K);
+    EXPECT_EQ(results[0].second, label);
+    EXPECT_FLOAT_EQ(results[0].first, 0.f);
+  }
+}
+
+TEST_F(IndexTest, ImportedGraphsReproduceTheIndex) {
+  auto graph = index->getGraph();
+  auto make_allocated_index = [&] {
+    auto allocated_index = std::make_unique<IndexType>(
+        /* dist = */ std::make_unique<SquaredL2Distance<>>(VEC_DIM),
+        /* dataset_size = */ INDEXED_VECTORS, /* max_edges = */ M);
+    allocated_index->setNumThreads(
+        std::max(1u, std::thread::hardware_concurrency()));
+    for (int label = 0; label < INDEXED_VECTORS; label++) {
+      node_id_t node;
+      allocated_index->allocateNode(vector(label), label, node);
+    }
+    return allocated_index;
+  };
+
+  auto csr_index = make_allocated_index();
+  csr_index->buildGraphLinks(graph.offsets.data(), graph.edges.data(),
+                             INDEXED_VECTORS, graph.edges.size());
+
+  // The same graph as a 1-based Matrix Market file.
+  std::string mtx_filename = "graph.mtx";
+  {
+    std::ofstream mtx_file(mtx_filename);
+    mtx_file << "%%MatrixMarket matrix coordinate pattern general\n"
+             << INDEXED_VECTORS << " " << INDEXED_VECTORS << " " << M << "\n";
+    for (uint32_t node = 0; node < INDEXED_VECTORS; node++) {
+      for (const node_id_t *edge = graph.begin(node); edge != graph.end(node);
+           edge++) {
+        mtx_file << node + 1 << " " << *edge + 1 << "\n";
+      }
+    }
+  }
+  auto mtx_index = make_allocated_index();
+  mtx_index->buildGraphLinks(mtx_filename);
+  std::remove(mtx_filename.c_str());
+
+  EXPECT_EQ(csr_index->getGraph().edges, graph.edges);
+  EXPECT_EQ(mtx_index->getGraph().edges, graph.edges);
+  for (int label = 0; label < 200; label++) {
+    auto results = index->search(vector(label), K, EF_SEARCH);
+    EXPECT_EQ(csr_index->search(vector(label), K, EF_SEARCH), results);
+    EXPECT_EQ(mtx_index->search(vector(label), K, EF_SEARCH), results);
+  }
+
+  // Invalid graphs are rejected before any links change.
+  std::vector<uint64_t> offsets(INDEXED_VECTORS + 1, M + 1);
+  offsets[0] = 0;
+  std::vector<node_id_t> edges(M + 1, 1);
+  EXPECT_THROW(csr_index->buildGraphLinks(offsets.data(), edges.data(),
+                                          INDEXED_VECTORS, edges.size()),
+               std::invalid_argument);
+  edges.assign(M, INDEXED_VECTORS);
+  offsets.assign(INDEXED_VECTORS + 1, M);
+  offsets[0] = 0;
+  EXPECT_THROW(csr_index->buildGraphLinks(offsets.data(), edges.data(),
+                                          INDEXED_VECTORS, edges.size()),
+               std::invalid_argument);
+  EXPECT_THROW(csr_index->buildGraphLinks(graph.offsets.data(),
+                                          graph.edges.data(),
+                                          INDEXED_VECTORS - 1,
+                                          graph.edges.size()),
+               std::invalid_argument);
+  EXPECT_EQ(csr_index->getGraph().edges, graph.edges);
+}
+
+TEST_F(IndexTest, RefinedGraphNeedsASmallerBeam) {
+  auto recall = [&](uint32_t ef_search) {
+    size_t num_found = 0;
+    for (int label = 0; label < 200; label++) {
+      auto expected = index->searchBruteForce(vector(label), K);
+      auto results = index->search(vector(label), K, ef_search);
+      for (const auto &result : results) {
+        num_found += std::count(expected.begin(), expected.end(), result);
+      }
+    }
+    return num_found / (200.0 * K);
+  };
+  double initial_recall = recall(/* ef_search = */ K);
+  size_t initial_num_edges = index->getGraph().edges.size();
+
+  EXPECT_THROW(index->setPruningAlpha(0.9f), std::invalid_argument);
+  index->setPruningAlpha(1.2f);
+  index->refineGraph(EF_CONSTRUCTION);
+  EXPECT_TRUE(index->isFrozen());
+  EXPECT_GT(index->getGraph().edges.size(), initial_num_edges);
+  EXPECT_GT(recall(/* ef_search = */ K), initial_recall);
+}
+
+TEST_F(IndexTest, LabelsStayAddressableAfterReordering) {
+  index->remove(3);
+  index->doGraphReordering({"gorder"});
+  auto permutation = index->nodePermutation();
+  ASSERT_EQ(permutation.size(), INDEXED_VECTORS);
+
+  std::string filename = "label_map_test.index";
+  index->saveIndex(filename);
+  auto loaded_index = IndexType::loadIndex(filename);
+  std::remove(filename.c_str());
+  EXPECT_EQ(loaded_index->nodePermutation(), permutation);
+
+  std::vector<float> stored(VEC_DIM);
+  for (auto *reordered_index : {index.get(), loaded_index.get()}) {
+    EXPECT_FALSE(reordered_index->contains(3));
+    EXPECT_FALSE(reordered_index->contains(INDEXED_VECTORS));
+    EXPECT_THROW(reordered_index->getVector(3, stored.data()),
+                 std::invalid_argument);
+    for (int label = 0; label < INDEXED_VECTORS; label += 7) {
+      if (label == 3) {
+        continue;
+      }
+      ASSERT_TRUE(reordered_index->contains(label));
+      reordered_index->getVector(label, stored.data());
+      EXPECT_TRUE(std::equal(stored.begin(), stored.end(), vector(label)));
+    }
+  }
+}
+
+TEST_F(IndexTest, SampleGraphEntryPointIsSerialized) {
+  auto distanceComputations = [&](uint32_t ef_search) {
+    index->resetStats();
+    uint32_t found = 0;
+    for (int label = 0; label < 200; label++) {
+      auto results = index->search(vector(label), 1, ef_search);
+      found += results[0].second == label;
+    }
+    EXPECT_GE(found, 198);
+    return index->distanceComputations();
+  };
+
+  uint64_t stride_distance_computations = distanceComputations(K);
+  index->setEntryPointStrategy(flatnav::EntryPointStrategy::SAMPLE_GRAPH);
+  uint64_t sample_graph_distance_computations = distanceComputations(K);
+  EXPECT_LT(sample_graph_distance_computations, stride_distance_computations);
+
+  std::string filename = "sample_graph_index.bin";
+  index->saveIndex(filename);
+  auto loaded_index = IndexType::loadIndex(filename);
+  std::remove(filename.c_str());
+  ASSERT_EQ(loaded_index->entryPointStrategy(),
+            flatnav::EntryPointStrategy::SAMPLE_GRAPH);
+  for (int label = 0; label < 20; label++) {
+    EXPECT_EQ(loaded_index->search(vector(label), K, EF_SEARCH),
+              index->search(vector(label), K, EF_SEARCH));
+  }
+}
+
+TEST_F(IndexTest, WritesThawFrozenIndex) {
+  // `addBatch` freezes the index but keeps the node versions around.
+  ASSERT_TRUE(index->isFrozen());
+  ASSERT_GT(index->nodeVersionsAllocatedMemory(), 0);
+
+  index->freeze();
+  ASSERT_EQ(index->nodeVersionsAllocatedMemory(), 0);
+  auto results = index->search(vector(3), K, EF_SEARCH);
+  ASSERT_EQ(results[0].second, 3);
+
+  index->remove(3);
+  ASSERT_FALSE(index->isFrozen());
+  ASSERT_GT(index->nodeVersionsAllocatedMemory(), 0);
+  results = index->search(vector(3), K, EF_SEARCH);
+  ASSERT_NE(results[0].second, 3);
+}
+
+TEST_F(IndexTest, SearchesRunConcurrentlyWithFreezingAndThawing) {
+  // Every update thaws the index while searches that started on the frozen
+  // index may still be running, and every freeze releases the node versions
+  // while searches that started on the thawed index may still use them.
+  std::thread writer([&] {
+    for (int label = 0; label < 200; label++) {
+      index->update(vector(label), label, EF_CONSTRUCTION);
+      index->freeze();
+    }
+  });
+  // Updated nodes are briefly unlinked, so only the searches that run once
+  // the writer is done are checked for recall.
+  uint32_t num_invalid_results = 0;
+  for (int label = 200; label < INDEXED_VECTORS; label++) {
+    for (const auto &[distance, result_label] :
+         index->search(vector(label), K, EF_SEARCH)) {
+      num_invalid_results +=
+          result_label < 0 || result_label >= INDEXED_VECTORS;
+    }
+  }
+  writer.join();
+  ASSERT_EQ(num_invalid_results, 0);
+  ASSERT_TRUE(index->isFrozen());
+  ASSERT_EQ(index->nodeVersionsAllocatedMemory(), 0);
+
+  // Searches never modify the graph, so it ends up as if nothing had run
+  // concurrently with the updates.
+  auto reference_index = std::make_unique<IndexType>(
+      /* dist = */ std::make_unique<SquaredL2Distance<>>(VEC_DIM),
+      /* dataset_size = */ INDEXED_VECTORS, /* max_edges = */ M);
+  std::vector<int> labels(INDEXED_VECTORS);
+  std::iota(labels.begin(), labels.end(), 0);
+  reference_index->addBatch<float>(vectors.data(), labels, EF_CONSTRUCTION);
+  for (int label = 0; label < 200; label++) {
+    reference_index->update(vector(label), label, EF_CONSTRUCTION);
+  }
+  for (int label = 0; label < INDEXED_VECTORS; label++) {
+    ASSERT_EQ(index->search(vector(label), K, EF_SEARCH),
+              reference_index->search(vector(label), K, EF_SEARCH));
+  }
+}
+
+TEST_F(IndexTest, SearchesRunConcurrentlyWithInsertions) {
+  auto concurrent_index = std::make_unique<IndexType>(
+      /* dist = */ std::make_unique<SquaredL2Distance<>>(VEC_DIM),
+      /* dataset_size = */ INDEXED_VECTORS, /* max_edges = */ M);
+  std::vector<int> labels(INDEXED_VECTORS / 2);
+  std::iota(labels.begin(), labels.end(), 0);
+  concurrent_index->addBatch<float>(vectors.data(), labels, EF_CONSTRUCTION);
+  concurrent_index->unfreeze();
+
+  std::thread writer([&] {
+    for (int label = INDEXED_VECTORS / 2; label < INDEXED_VECTORS; label++) {
+      concurrent_index->add(vector(label), label, EF_CONSTRUCTION, 100);
+    }
+  });
+  uint32_t found = 0;
+  for (int label = 0; label < INDEXED_VECTORS / 2; label++) {
+    auto results = concurrent_index->search(vector(label), 1, EF_SEARCH);
+    found += results[0].second == label;
+  }
+  writer.join();
+  EXPECT_GE(found, 0.98 * INDEXED_VECTORS / 2);
+
+  found = 0;
+  for (int label = 0; label < INDEXED_VECTORS; label++) {
+    auto results = concurrent_index->search(vector(label), 1, EF_SEARCH);
+    found += results[0].second == label;
+  }
+  EXPECT_GE(found, 0.98 * INDEXED_VECTORS);
+}
+
+TEST_F(IndexTest, ThreadsInsertIntoAnEmptyIndexConcurrently) {
+  const uint32_t num_threads = 4;
+  auto concurrent_index = std::make_unique<IndexType>(
+      /* dist = */ std::make_unique<SquaredL2Distance<>>(VEC_DIM),
+      /* dataset_size = */ INDEXED_VECTORS / 8, /* max_edges = */ M);
+  concurrent_index->setAutoGrow(true);
+
+  // Every thread inserts its own interleaved slice, growing the index on
+  // the way, starting with the first node.
+  std::vector<std::thread> writers;
+  for (uint32_t thread = 0; thread < num_threads; thread++) {
+    writers.emplace_back([&, thread] {
+      for (int label = thread; label < INDEXED_VECTORS; label += num_threads) {
+        concurrent_index->add(vector(label), label, EF_CONSTRUCTION, 100);
+      }
+    });
+  }
+  for (auto &writer : writers) {
+    writer.join();
+  }
+  ASSERT_EQ(concurrent_index->currentNumNodes(), INDEXED_VECTORS);
+  ASSERT_GE(concurrent_index->maxNodeCount(), INDEXED_VECTORS);
+
+  uint32_t found = 0;
+  for (int label = 0; label < INDEXED_VECTORS; label++) {
+    auto results = concurrent_index->search(vector(label), 1, EF_SEARCH);
+    found += results[0].second == label;
+  }
+  EXPECT_GE(found, 0.98 * INDEXED_VECTORS);
+}
+
+TEST_F(IndexTest, IndexGrowsWithoutRebuilding) {
+  uint32_t initial_capacity = INDEXED_VECTORS / 4;
+  auto growing_index = std::make_unique<IndexType>(
+      /* dist = */ std::make_unique<SquaredL2Distance<>>(VEC_DIM),
+      /* dataset_size = */ initial_capacity, /* max_edges = */ M);
+  std::vector<int> labels(initial_capacity);
+  std::iota(labels.begin(), labels.end(), 0);
+  growing_index->addBatch<float>(vectors.data(), labels, EF_CONSTRUCTION);
+  int label = initial_capacity;
+  EXPECT_THROW(growing_index->add(vector(label), label, EF_CONSTRUCTION, 100),
+               std::runtime_error);
+  EXPECT_THROW(growing_index->resize(initial_capacity - 1),
+               std::invalid_argument);
+
+  growing_index->resize(INDEXED_VECTORS / 2);
+  ASSERT_EQ(growing_index->maxNodeCount(), INDEXED_VECTORS / 2);
+  for (; label < INDEXED_VECTORS / 2; label++) {
+    growing_index->add(vector(label), label, EF_CONSTRUCTION, 100);
+  }
+
+  // With auto-grow, a writer keeps extending the full index while it is
+  // being searched.
+  growing_index->setAutoGrow(true);
+  std::thread writer([&] {
+    for (int label = INDEXED_VECTORS / 2; label < INDEXED_VECTORS; label++) {
+      growing_index->add(vector(label), label, EF_CONSTRUCTION, 100);
+    }
+  });
+  uint32_t found = 0;
+  for (int label = 0; label < INDEXED_VECTORS / 2; label++) {
+    auto results = growing_index->search(vector(label), 1, EF_SEARCH);
+    found += results[0].second == label;
+  }
+  writer.join();
+  EXPECT_GE(found, 0.98 * INDEXED_VECTORS / 2);
+  EXPECT_GE(growing_index->maxNodeCount(), INDEXED_VECTORS);
+  EXPECT_EQ(growing_index->currentNumNodes(), INDEXED_VECTORS);
+
+  std::string filename = "grown_index.bin";
+  growing_index->saveIndex(filename);
+  auto loaded_index = IndexType::loadIndex(filename);
+  ASSERT_EQ(loaded_index->maxNodeCount(), growing_index->maxNodeCount());
+  found = 0;
+  for (int label = 0; label < INDEXED_VECTORS; label++) {
+    auto results = loaded_index->search(vector(label), 1, EF_SEARCH);
+    EXPECT_EQ(results, growing_index->search(vector(label), 1, EF_SEARCH));
+    found += results[0].second == label;
+  }
+  EXPECT_GE(found, 0.98 * INDEXED_VECTORS);
+  std::remove(filename.c_str());
+}
+
+TEST_F(IndexTest, ProductQuantizedIndexIsReranked) {
+  using PQIndexType = Index<ProductQuantizer, int>;
+  auto quantizer = std::make_unique<ProductQuantizer>(
+      /* dim = */ VEC_DIM, /* M = */ 8, /* nbits = */ 8, MetricType::L2);
+  quantizer->train(/* vectors = */ vectors.data(), /* n = */ INDEXED_VECTORS);
+
+  PQIndexType pq_index(/* dist = */ std::move(quantizer),
+                       /* dataset_size = */ INDEXED_VECTORS,
+                       /* max_edges = */ M);
+  ASSERT_EQ(pq_index.dataSizeBytes(), 8);
+  ASSERT_EQ(pq_index.dataDimension(), VEC_DIM);
+  pq_index.enableReranking();
+  std::vector<int> labels(INDEXED_VECTORS);
+  std::iota(labels.begin(), labels.end(), 0);
+  pq_index.addBatch<float>(vectors.data(), labels, EF_CONSTRUCTION);
+  EXPECT_THROW(pq_index.enableReranking(), std::runtime_error);
+
+  // With re-ranking, distances are exact, so every vector finds itself.
+  for (int label = 0; label < 200; label++) {
+    auto results = pq_index.search(vector(label), K, EF_SEARCH);
+    ASSERT_EQ(results.size(), K);
+    EXPECT_EQ(results[0].second, label);
+    EXPECT_FLOAT_EQ(results[0].first, 0.f);
+    EXPECT_TRUE(std::is_sorted(results.begin(), results.end()));
+  }
+}
+
+TEST_F(IndexTest, RerankVectorsCanLiveOnDisk) {
+  using PQIndexType = Index<ProductQuantizer, int>;
+  auto quantizer = std::make_unique<ProductQuantizer>(
+      /* dim = */ VEC_DIM, /* M = */ 8, /* nbits = */ 8, MetricType::L2);
+  quantizer->train(/* vectors = */ vectors.data(), /* n = */ INDEXED_VECTORS);
+
+  std::string vectors_filename = "rerank_vectors.bin";
+  std::string index_filename = "pq_index.bin";
+  PQIndexType pq_index(/* dist = */ std::move(quantizer),
+                       /* dataset_size = */ INDEXED_VECTORS,
+                       /* max_edges = */ M);
+  pq_index.enableReranking(/* vectors_filename = */ vectors_filename);
+  ASSERT_EQ(pq_index.rerankVectorsAllocatedMemory(), 0);
+  std::vector<int> labels(INDEXED_VECTORS);
+  std::iota(labels.begin(), labels.end(), 0);
+  pq_index.addBatch<float>(vectors.data(), labels, EF_CONSTRUCTION);
+  pq_index.saveIndex(index_filename);
+
+  auto loaded_index = PQIndexType::loadIndex(index_filename);
+  ASSERT_TRUE(loaded_index->rerankingEnabled());
+  for (int label = 0; label < 100; label++) {
+    auto results = loaded_index->search(vector(label), K, EF_SEARCH);
+    EXPECT_EQ(results, pq_index.search(vector(label), K, EF_SEARCH));
+    EXPECT_EQ(results[0].second, label);
+    EXPECT_FLOAT_EQ(results[0].first, 0.f);
+  }
+  loaded_index.reset();
+  std::remove(index_filename.c_str());
+  std::remove(vectors_filename.c_str());
+}
+
+} // namespace flatnav::testing
@@ -0,0 +1,62 @@
+#include "gtest/gtest.h"
+#include <atomic>
+#include <flatnav/util/Multithreading.h>
+#include <stdexcept>
+#include <vector>
+
+namespace flatnav::testing {
+
+TEST(ThreadPoolTest, ParallelForVisitsEveryIndexOnce) {
+  ThreadPool pool(/* num_threads = */ 4);
+  for (uint32_t chunk_size : {0, 1, 7, 1000}) {
+    std::vector<std::atomic<uint32_t>> visits(10007);
+    pool.parallelFor(
+        /* start_index = */ 3, /* end_index = */ visits.size(),
+        /* function = */ [&](uint32_t index) { visits[index]++; },
+        /* chunk_size = */ chunk_size);
+    for (uint32_t index = 0; index < visits.size(); index++) {
+      ASSERT_EQ(visits[index], index < 3 ? 0 : 1);
+    }
+  }
+}
+
+TEST(ThreadPoolTest, RethrowsExceptionsOnCaller) {
+  ThreadPool pool(/* num_threads = */ 3);
+  EXPECT_THROW(pool.parallelFor(0, 100,
+                                [](uint32_t index) {
+                                  if (index == 42) {
+                                    throw std::runtime_error("boom");
+                                  }
+                                }),
+               std::runtime_error);
+
+  // The pool is still usable afterwards.
+  std::atomic<uint32_t> count(0);
+  pool.parallelFor(0, 100, [&](uint32_t) { count++; });
+  EXPECT_EQ(count, 100);
+}
+
+TEST(ThreadPoolTest, NestedJobsRunOnCallingThread) {
+  ThreadPool pool(/* num_threads = */ 2);
+  std::atomic<uint32_t> count(0);
+  pool.parallelFor(0, 8, [&](uint32_t) {
+    pool.parallelFor(0, 8, [&](uint32_t) { count++; });
+  });
+  EXPECT_EQ(count, 64);
+}
+
+TEST(ThreadPoolTest, ResizeReplacesWorkers) {
+  ThreadPool pool;
+  EXPECT_EQ(pool.numThreads(), 1);
+  pool.resize(/* num_threads = */ 5);
+  EXPECT_EQ(pool.numThreads(), 5);
+
+  std::vector<std::atomic<uint32_t>> calls(5);
+  pool.broadcast([&](uint32_t worker_id) { calls[worker_id]++; });
+  for (auto &call : calls) {
+    EXPECT_EQ(call, 1);
+  }
+  EXPECT_THROW(pool.resize(0), std::invalid_argument);
+}
+
+} // namespace flatnav::testing
@@ -1,11 +1,14 @@
 #include "gtest/gtest.h"
 #include <cassert>
 #include <cstdio> // for remove
+#include <cstring>
 #include <flatnav/distances/DistanceInterface.h>
 #include <flatnav/distances/InnerProductDistance.h>
 #include <flatnav/distances/SquaredL2Distance.h>
 #include <flatnav/index/Index.h>
+#include <fstream>
 #include <random>
+#include <thread>
 
 using flatnav::Index;
 using flatnav::distances::DistanceInterface;
@@ -51,8 +54,8 @@ void runTest(float *data, std::unique_ptr<DistanceInterface<dist_t>> &&distance,
 
   ASSERT_EQ(new_index->maxEdgesPerNode(), M);
   ASSERT_EQ(new_index->dataSizeBytes(), index->dataSizeBytes());
-  // 4 bytes for each node_id, 4 bytes for the label
-  ASSERT_EQ(new_index->nodeSizeBytes(), data_size + (4 * M) + 4);
+  ASSERT_EQ(new_index->nodeSizeBytes(),
+            data_size + (sizeof(node_id_t) * M) + sizeof(label_t));
   ASSERT_EQ(new_index->maxNodeCount(), N);
 
   uint64_t total_index_size =
@@ -109,4 +112,296 @@ TEST(FlatnavSerializationTest, TestInnerProductIndexSerialization) {
   EXPECT_EQ(std::remove(save_file.c_str()), 0);
 }
 
+TEST(FlatnavSerializationTest, TestMemoryMappedIndexLoading) {
+  uint32_t num_vectors = 2000, dim = 64, M = 16, ef_construction = 100;
+  auto vectors = generateRandomVectors(num_vectors, dim);
+  auto distance = std::make_unique<SquaredL2Distance<>>(dim);
+  std::string save_file = "mmap_index.bin";
+
+  using IndexType =
+      Index<SquaredL2Distance<flatnav::util::DataType::float32>, int>;
+  auto index = std::make_unique<IndexType>(
+      /* dist = */ std::move(distance), /* dataset_size = */ num_vectors,
+      /* max_edges = */ M);
+  std::vector<int> labels(num_vectors);
+  std::iota(labels.begin(), labels.end(), 0);
+  index->addBatch<float>(vectors.data(), labels, ef_construction);
+  index->saveIndex(/* filename = */ save_file);
+
+  auto mapped_index =
+      IndexType::loadIndex(/* filename = */ save_file, /* mmap = */ true);
+  ASSERT_TRUE(mapped_index->isMemoryMapped());
+  ASSERT_EQ(mapped_index->currentNumNodes(), num_vectors);
+
+  std::vector<float> queries = generateRandomVectors(QUERY_VECTORS, dim);
+  for (uint32_t i = 0; i < QUERY_VECTORS; i++) {
+    float *q = queries.data() + (dim * i);
+    auto expected = index->search(q, K, EF_SEARCH);
+    auto result = mapped_index->search(q, K, EF_SEARCH);
+    ASSERT_EQ(expected, result);
+  }
+
+  // The node block is mapped read-only, so inserting must fail loudly.
+  int label = num_vectors;
+  EXPECT_THROW(mapped_index->add(vectors.data(), label, ef_construction, 100),
+               std::runtime_error);
+
+  EXPECT_EQ(std::remove(save_file.c_str()), 0);
+}
+
+TEST(FlatnavSerializationTest, TestPartialLoadsAndChecksums) {
+  uint32_t num_vectors = 1000, capacity = 5000, dim = 32, M = 16;
+  auto vectors = generateRandomVectors(num_vectors, dim);
+  std::string save_file = "sectioned_index.bin";
+
+  using IndexType =
+      Index<SquaredL2Distance<flatnav::util::DataType::float32>, int>;
+  auto index = std::make_unique<IndexType>(
+      /* dist = */ std::make_unique<SquaredL2Distance<>>(dim),
+      /* dataset_size = */ capacity, /* max_edges = */ M);
+  std::vector<int> labels(num_vectors);
+  std::iota(labels.begin(), labels.end(), 0);
+  index->addBatch<float>(vectors.data(), labels, /* ef_construction = */ 100);
+  index->remove(/* label = */ 7);
+  index->saveIndex(/* filename = */ save_file);
+
+  // Only the nodes in use are written.
+  std::ifstream stream(save_file, std::ios::binary | std::ios::ate);
+  size_t file_size = stream.tellg();
+  stream.close();
+  ASSERT_LT(file_size, index->nodeSizeBytes() * capacity);
+  ASSERT_EQ(IndexType::loadIndex(save_file)->maxNodeCount(), capacity);
+
+  auto graph = IndexType::loadGraph(save_file);
+  auto expected_graph = index->getGraph();
+  ASSERT_EQ(graph.offsets, expected_graph.offsets);
+  ASSERT_EQ(graph.edges, expected_graph.edges);
+
+  std::vector<int> loaded_labels;
+  std::vector<char> loaded_vectors =
+      IndexType::loadVectors(save_file, loaded_labels);
+  ASSERT_EQ(loaded_labels.size(), num_vectors - 1);
+  ASSERT_EQ(loaded_vectors.size(), loaded_labels.size() * dim * sizeof(float));
+  for (size_t i = 0; i < loaded_labels.size(); i++) {
+    int label = loaded_labels[i];
+    ASSERT_NE(label, 7);
+    ASSERT_EQ(std::memcmp(loaded_vectors.data() + (i * dim * sizeof(float)),
+                          vectors.data() + (label * dim), dim * sizeof(float)),
+              0);
+  }
+
+  // Flipping a byte of the node block is caught on load.
+  std::fstream file(save_file, std::ios::binary | std::ios::in | std::ios::out);
+  file.seekg(file_size - 1);
+  char byte = file.get();
+  file.seekp(file_size - 1);
+  file.put(byte ^ 1);
+  file.close();
+  EXPECT_THROW(IndexType::loadIndex(save_file), std::runtime_error);
+  EXPECT_THROW(IndexType::loadGraph(save_file), std::runtime_error);
+
+  EXPECT_EQ(std::remove(save_file.c_str()), 0);
+}
+
+TEST(FlatnavSerializationTest, TestLegacyIndexFilesLoad) {
+  uint32_t num_vectors = 1000, capacity = 1500, dim = 32, M = 16;
+  auto vectors = generateRandomVectors(num_vectors, dim);
+  std::string save_file = "legacy_index.bin";
+
+  using IndexType =
+      Index<SquaredL2Distance<flatnav::util::DataType::float32>, int>;
+  auto index = std::make_unique<IndexType>(
+      /* dist = */ std::make_unique<SquaredL2Distance<>>(dim),
+      /* dataset_size = */ capacity, /* max_edges = */ M);
+  std::vector<int> labels(num_vectors);
+  std::iota(labels.begin(), labels.end(), 0);
+  index->addBatch<float>(vectors.data(), labels, /* ef_construction = */ 100);
+
+  // Before the sectioned format, an index was saved as one cereal archive
+  // holding its parameters, its distance and the node block of its whole
+  // capacity, with 32-bit node ids.
+  {
+    size_t data_size = dim * sizeof(float);
+    size_t node_size = data_size + (M * sizeof(uint32_t)) + sizeof(int);
+    std::vector<char> nodes(node_size * capacity, 0);
+    auto outdegree_table = index->getGraphOutdegreeTable();
+    for (uint32_t node = 0; node < num_vectors; node++) {
+      char *block = nodes.data() + (node * node_size);
+      std::memcpy(block, vectors.data() + (node * dim), data_size);
+      std::vector<uint32_t> links(M, node);
+      std::copy(outdegree_table[node].begin(), outdegree_table[node].end(),
+                links.begin());
+      std::memcpy(block + data_size, links.data(), M * sizeof(uint32_t));
+      std::memcpy(block + data_size + (M * sizeof(uint32_t)), &node,
+                  sizeof(int));
+    }
+    SquaredL2Distance<> distance(dim);
+    std::ofstream stream(save_file, std::ios::binary);
+    cereal::BinaryOutputArchive archive(stream);
+    archive(size_t(M), data_size, node_size, size_t(capacity),
+            size_t(num_vectors), distance);
+    archive(cereal::binary_data(nodes.data(), nodes.size()));
+  }
+
+  auto loaded_index = IndexType::loadIndex(save_file);
+  ASSERT_EQ(loaded_index->maxNodeCount(), capacity);
+  ASSERT_EQ(loaded_index->currentNumNodes(), num_vectors);
+  ASSERT_TRUE(loaded_index->contains(num_vectors - 1));
+  std::vector<float> queries = generateRandomVectors(QUERY_VECTORS, dim);
+  for (uint32_t i = 0; i < QUERY_VECTORS; i++) {
+    float *q = queries.data() + (dim * i);
+    ASSERT_EQ(loaded_index->search(q, K, EF_SEARCH),
+              index->search(q, K, EF_SEARCH));
+  }
+
+  auto graph = IndexType::loadGraph(save_file);
+  auto expected_graph = index->getGraph();
+  ASSERT_EQ(graph.offsets, expected_graph.offsets);
+  ASSERT_EQ(graph.edges, expected_graph.edges);
+  std::vector<int> loaded_labels;
+  IndexType::loadVectors(save_file, loaded_labels);
+  ASSERT_EQ(loaded_labels, labels);
+
+  // Saving the index again writes the current format.
+  loaded_index->saveIndex(save_file);
+  ASSERT_EQ(IndexType::loadIndex(save_file)->search(queries.data(), K,
+                                                    EF_SEARCH),
+            index->search(queries.data(), K, EF_SEARCH));
+
+  std::ofstream(save_file) << "not an index";
+  EXPECT_THROW(IndexType::loadIndex(save_file), std::runtime_error);
+
+  EXPECT_EQ(std::remove(save_file.c_str()), 0);
+}
+
+TEST(FlatnavSerializationTest, TestSixtyFourBitLabels) {
+  uint32_t num_vectors = 1000, dim = 32, M = 16;
+  auto vectors = generateRandomVectors(num_vectors, dim);
+  std::string save_file = "uint64_labels_index.bin";
+
+  using IndexType =
+      Index<SquaredL2Distance<flatnav::util::DataType::float32>, uint64_t>;
+  auto index = std::make_unique<IndexType>(
+      /* dist = */ std::make_unique<SquaredL2Distance<>>(dim),
+      /* dataset_size = */ num_vectors, /* max_edges = */ M);
+  ASSERT_EQ(index->nodeSizeBytes(),
+            index->dataSizeBytes() + (sizeof(node_id_t) * M) +
+                sizeof(uint64_t));
+
+  // Labels past 2^32 must not be truncated anywhere.
+  uint64_t first_label = uint64_t(1) << 40;
+  std::vector<uint64_t> labels(num_vectors);
+  std::iota(labels.begin(), labels.end(), first_label);
+  index->addBatch<float>(vectors.data(), labels, /* ef_construction = */ 100);
+  index->remove(/* label = */ first_label + 7);
+  ASSERT_FALSE(index->contains(first_label + 7));
+  ASSERT_TRUE(index->contains(first_label + 8));
+  index->saveIndex(/* filename = */ save_file);
+
+  auto new_index = IndexType::loadIndex(/* filename = */ save_file);
+  for (uint32_t i = 0; i < QUERY_VECTORS; i++) {
+    float *q = vectors.data() + (dim * i);
+    auto result = new_index->search(q, K, EF_SEARCH);
+    ASSERT_EQ(result, index->search(q, K, EF_SEARCH));
+    if (i != 7) {
+      ASSERT_EQ(result[0].second, first_label + i);
+    }
+  }
+
+  std::vector<uint64_t> loaded_labels;
+  IndexType::loadVectors(save_file, loaded_labels);
+  ASSERT_EQ(loaded_labels.size(), num_vectors - 1);
+  ASSERT_EQ(loaded_labels[0], first_label);
+
+  // The label is stored inline in every node, so the file cannot be read
+  // with another label type.
+  using IntLabelIndexType =
+      Index<SquaredL2Distance<flatnav::util::DataType::float32>, int>;
+  EXPECT_THROW(IntLabelIndexType::loadIndex(save_file), std::runtime_error);
+  EXPECT_THROW(IntLabelIndexType::loadGraph(save_file), std::runtime_error);
+
+  EXPECT_EQ(std::remove(save_file.c_str()), 0);
+}
+
+TEST(FlatnavSerializationTest, TestAsyncSaveWhileInserting) {
+  uint32_t num_vectors = 3000, dim = 32, M = 16, ef_construction = 64;
+  auto vectors = generateRandomVectors(num_vectors, dim);
+  std::string save_file = "snapshot_index.bin";
+
+  using IndexType =
+      Index<SquaredL2Distance<flatnav::util::DataType::float32>, int>;
+  auto index = std::make_unique<IndexType>(
+      /* dist = */ std::make_unique<SquaredL2Distance<>>(dim),
+      /* dataset_size = */ num_vectors, /* max_edges = */ M);
+  std::vector<int> labels(num_vectors / 2);
+  std::iota(labels.begin(), labels.end(), 0);
+  index->addBatch<float>(vectors.data(), labels, ef_construction);
+
+  std::thread writer([&] {
+    for (int label = num_vectors / 2; label < num_vectors; label++) {
+      index->add(vectors.data() + (label * dim), label, ef_construction, 100);
+    }
+  });
+  auto saved = index->saveIndexAsync(/* filename = */ save_file);
+  saved.get();
+  writer.join();
+
+  // The snapshot holds a prefix of the insertions, and its links only point
+  // to nodes within it.
+  auto snapshot = IndexType::loadIndex(/* filename = */ save_file);
+  size_t num_nodes = snapshot->currentNumNodes();
+  ASSERT_GE(num_nodes, num_vectors / 2);
+  ASSERT_LE(num_nodes, num_vectors);
+  auto graph = snapshot->getGraph();
+  for (uint32_t link : graph.edges) {
+    ASSERT_LT(link, num_nodes);
+  }
+  for (int label = 0; label < num_vectors; label++) {
+    ASSERT_EQ(snapshot->contains(label), label < num_nodes);
+  }
+  std::ifstream temporary_file(save_file + ".tmp");
+  ASSERT_FALSE(temporary_file.good());
+
+  EXPECT_EQ(std::remove(save_file.c_str()), 0);
+}
+
+TEST(FlatnavSerializationTest, TestAsyncSaveCopiesRerankVectorFile) {
+  uint32_t num_vectors = 1000, dim = 32, M = 16, ef_construction = 64;
+  auto vectors = generateRandomVectors(num_vectors, dim);
+  std::string save_file = "snapshot_rerank_index.bin";
+  std::string vectors_file = "snapshot_rerank_vectors.bin";
+
+  using IndexType =
+      Index<SquaredL2Distance<flatnav::util::DataType::float32>, int>;
+  auto index = std::make_unique<IndexType>(
+      /* dist = */ std::make_unique<SquaredL2Distance<>>(dim),
+      /* dataset_size = */ num_vectors, /* max_edges = */ M);
+  index->enableReranking(/* vectors_filename = */ vectors_file);
+  std::vector<int> labels(num_vectors);
+  std::iota(labels.begin(), labels.end(), 0);
+  index->addBatch<float>(vectors.data(), labels, ef_construction);
+
+  auto saved = index->saveIndexAsync(/* filename = */ save_file);
+  // Changes made after the snapshot is taken must not reach the saved index,
+  // even though they are written to the vector file.
+  auto replacement = generateRandomVectors(1, dim);
+  index->update(replacement.data(), /* label = */ 0, ef_construction);
+  saved.get();
+  index.reset();
+  EXPECT_EQ(std::remove(vectors_file.c_str()), 0);
+
+  auto snapshot = IndexType::loadIndex(/* filename = */ save_file);
+  ASSERT_TRUE(snapshot->rerankingEnabled());
+  ASSERT_EQ(snapshot->rerankVectorsAllocatedMemory(),
+            num_vectors * dim * sizeof(float));
+  for (int label = 0; label < 100; label++) {
+    auto results =
+        snapshot->search(vectors.data() + (label * dim), K, EF_SEARCH);
+    EXPECT_EQ(results[0].second, label);
+    EXPECT_FLOAT_EQ(results[0].first, 0.f);
+  }
+
+  EXPECT_EQ(std::remove(save_file.c_str()), 0);
+}
+
 } // namespace flatnav::testing
\ No newline at end of file
@@ -0,0 +1,226 @@
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstdio>
+#include <cstring>
+#include <flatnav/util/Datatype.h>
+#include <fstream>
+#include <stdexcept>
+#include <string>
+#include <type_traits>
+#include <vector>
+
+namespace flatnav::util {
+
+/**
+ * Reads the vectors of an on-disk dataset sequentially, a chunk at a time, so
+ * that an index can be built from a file that does not fit in memory. Each
+ * chunk is converted to the requested element type as it is read.
+ *
+ * Supported formats:
+ *   - "fbin", "u8bin", "i8bin": a header of two uint32 values (number of
+ *     vectors, dimension) followed by the vectors as float32, uint8 or int8.
+ *   - "fvecs", "bvecs": every vector is preceded by its int32 dimension and
+ *     stored as float32 or uint8.
+ *   - "npy": a 2-D, C-ordered NumPy array of float32, uint8 or int8.
+ */
+class DatasetReader {
+  std::ifstream _stream;
+  std::string _filename;
+  DataType _data_type = DataType::undefined;
+  size_t _num_vectors = 0;
+  size_t _dim = 0;
+  // Bytes preceding each vector (the dimension of fvecs and bvecs rows).
+  size_t _row_header_size = 0;
+  size_t _next_vector = 0;
+  std::vector<char> _buffer;
+
+public:
+  DatasetReader(const std::string &filename, const std::string &format)
+      : _stream(filename, std::ios::binary), _filename(filename) {
+    if (!_stream.is_open()) {
+      throw std::runtime_error("Unable to open file for reading: " + filename);
+    }
+    if (format == "fbin" || format == "u8bin" || format == "i8bin") {
+      _data_type = format == "fbin"    ? DataType::float32
+                   : format == "u8bin" ? DataType::uint8
+                                       : DataType::int8;
+      uint32_t header[2];
+      readBytes(reinterpret_cast<char *>(header), sizeof(header));
+      _num_vectors = header[0];
+      _dim = header[1];
+    } else if (format == "fvecs" || format == "bvecs") {
+      _data_type = format == "fvecs" ? DataType::float32 : DataType::uint8;
+      int32_t dim;
+      readBytes(reinterpret_cast<char *>(&dim), sizeof(dim));
+      _dim = dim;
+      _row_header_size = sizeof(int32_t);
+      size_t row_size = _row_header_size + (_dim * size(_data_type));
+      _stream.seekg(0, std::ios::end);
+      _num_vectors = static_cast<size_t>(_stream.tellg()) / row_size;
+      _stream.seekg(0);
+    } else if (format == "npy") {
+      readNpyHeader();
+    } else {
+      throw std::invalid_argument("`" + format +
+                                  "` is not a supported dataset format. "
+                                  "Supported formats: fbin, u8bin, i8bin, "
+                                  "fvecs, bvecs and npy.");
+    }
+    if (_dim == 0) {
+      throw std::runtime_error("Invalid dimension in dataset file: " +
+                               filename);
+    }
+  }
+
+  inline size_t numVectors() const { return _num_vectors; }
+  inline size_t dimension() const { return _dim; }
+  inline DataType dataType() const { return _data_type; }
+  inline size_t numRemaining() const { return _num_vectors - _next_vector; }
+
+  /**
+   * @brief Reads the next vectors of the file into `destination`, converted
+   * to T.
+   *
+   * @param destination Room for `max_vectors * dimension()` values.
+   * @param max_vectors The maximum number of vectors to read.
+   * @return The number of vectors read. 0 once the whole file has been read.
+   */
+  template <typename T> size_t read(T *destination, size_t max_vectors) {
+    size_t num_vectors = std::min(max_vectors, numRemaining());
+    if (num_vectors == 0) {
+      return 0;
+    }
+    size_t vector_size = _dim * size(_data_type);
+    size_t row_size = _row_header_size + vector_size;
+
+    // Rows without a header that are already in the requested type are read
+    // in place.
+    if (_row_header_size == 0 && matchesDataType<T>()) {
+      readBytes(reinterpret_cast<char *>(destination),
+                num_vectors * vector_size);
+      _next_vector += num_vectors;
+      return num_vectors;
+    }
+
+    _buffer.resize(num_vectors * row_size);
+    readBytes(_buffer.data(), _buffer.size());
+    for (size_t i = 0; i < num_vectors; i++) {
+      const char *row = _buffer.data() + (i * row_size) + _row_header_size;
+      T *vector = destination + (i * _dim);
+      switch (_data_type) {
+      case DataType::float32:
+        convert(reinterpret_cast<const float *>(row), vector);
+        break;
+      case DataType::uint8:
+        convert(reinterpret_cast<const uint8_t *>(row), vector);
+        break;
+      case DataType::int8:
+        convert(reinterpret_cast<const int8_t *>(row), vector);
+        break;
+      default:
+        throw std::runtime_error("Unsupported data type in dataset file.");
+      }
+    }
+    _next_vector += num_vectors;
+    return num_vectors;
+  }
+
+private:
+  template <typename T> bool matchesDataType() const {
+    switch (_data_type) {
+    case DataType::float32:
+      return std::is_same_v<T, float>;
+    case DataType::uint8:
+      return std::is_same_v<T, uint8_t>;
+    case DataType::int8:
+      return std::is_same_v<T, int8_t>;
+    default:
+      return false;
+    }
+  }
+
+  template <typename source_t, typename T>
+  void convert(const source_t *source, T *destination) const {
+    for (size_t j = 0; j < _dim; j++) {
+      source_t value;
+      std::memcpy(&value, source + j, sizeof(source_t));
+      destination[j] = static_cast<T>(value);
+    }
+  }
+
+  void readBytes(char *destination, size_t num_bytes) {
+    _stream.read(destination, num_bytes);
+    if (static_cast<size_t>(_stream.gcount()) != num_bytes) {
+      throw std::runtime_error("Unexpected end of file while reading: " +
+                               _filename);
+    }
+  }
+
+  // Parses the header of a version 1, 2 or 3 .npy file and leaves the stream
+  // at the start of the array data.
+  void readNpyHeader() {
+    char magic[8];
+    readBytes(magic, sizeof(magic));
+    if (std::memcmp(magic, "\x93NUMPY", 6) != 0) {
+      throw std::runtime_error("Not a .npy file: " + _filename);
+    }
+    size_t header_size = 0;
+    if (magic[6] == 1) {
+      uint16_t header_length;
+      readBytes(reinterpret_cast<char *>(&header_length),
+                sizeof(header_length));
+      header_size = header_length;
+    } else {
+      uint32_t header_length;
+      readBytes(reinterpret_cast<char *>(&header_length),
+                sizeof(header_length));
+      header_size = header_length;
+    }
+    std::string header(header_size, '\0');
+    readBytes(header.data(), header_size);
+
+    std::string descr = headerValue(header, "descr");
+    if (descr == "'<f4'") {
+      _data_type = DataType::float32;
+    } else if (descr == "'|u1'") {
+      _data_type = DataType::uint8;
+    } else if (descr == "'|i1'") {
+      _data_type = DataType::int8;
+    } else {
+      throw std::invalid_argument("Unsupported .npy data type " + descr +
+                                  ". Expected float32, uint8 or int8.");
+    }
+    if (headerValue(header, "fortran_order") != "False") {
+      throw std::invalid_argument("Fortran-ordered .npy files are not "
+                                  "supported.");
+    }
+    std::string shape = headerValue(header, "shape");
+    size_t num_vectors, dim;
+    if (std::sscanf(shape.c_str(), "(%zu, %zu)", &num_vectors, &dim) != 2) {
+      throw std::invalid_argument("Expected a 2-D array in .npy file, got "
+                                  "shape " +
+                                  shape + ".");
+    }
+    _num_vectors = num_vectors;
+    _dim = dim;
+  }
+
+  // Returns the value of `key` in the dictionary literal of a .npy header.
+  std::string headerValue(const std::string &header, const std::string &key) {
+    size_t key_position = header.find("'" + key + "'");
+    if (key_position == std::string::npos) {
+      throw std::runtime_error("Malformed .npy header in: " + _filename);
+    }
+    size_t start = header.find(':', key_position) + 1;
+    while (header[start] == ' ') {
+      start++;
+    }
+    size_t end = header[start] == '(' ? header.find(')', start) + 1
+                                      : header.find(',', start);
+    return header.substr(start, end - start);
+  }
+};
+
+} // namespace flatnav::util
@@ -2,9 +2,9 @@
 
 #include <algorithm>
 #include <climits>
+#include <cstdint>
 #include <cstdlib>
 #include <iostream>
-#include <unordered_map>
 #include <utility>
 #include <vector>
 
@@ -12,15 +12,18 @@ namespace flatnav::util {
 
 template <typename node_id_t> class GorderPriorityQueue {
 
-  typedef std::unordered_map<node_id_t, int> map_t;
-
   struct Node {
     node_id_t key;
     int priority;
   };
 
+  // Keys that are not (or no longer) in the queue.
+  static constexpr int64_t ABSENT = -1;
+
   std::vector<Node> _list;
-  map_t _index_table; // map: key -> index in _list
+  // key -> index in _list. Keys are dense node ids, so an array replaces a
+  // hash map.
+  std::vector<int64_t> _index_table;
 
   inline void swap(int i, int j) {
     Node tmp = _list[i];
@@ -32,15 +35,21 @@ template <typename node_id_t> class GorderPriorityQueue {
 
 public:
   GorderPriorityQueue(const std::vector<node_id_t> &nodes) {
-    for (int i = 0; i < nodes.size(); i++) {
+    node_id_t max_key = nodes.empty()
+                            ? 0
+                            : *std::max_element(nodes.begin(), nodes.end());
+    _list.reserve(nodes.size());
+    _index_table.assign(nodes.empty() ? 0 : max_key + 1, ABSENT);
+    for (size_t i = 0; i < nodes.size(); i++) {
       _list.push_back({nodes[i], 0});
       _index_table[nodes[i]] = i;
     }
   }
 
-  GorderPriorityQueue(size_t N) {
-    for (unsigned int i = 0; i < N; i++) {
-      _list.push_back({i, 0});
+  GorderPriorityQueue(size_t N) : _index_table(N) {
+    _list.reserve(N);
+    for (size_t i = 0; i < N; i++) {
+      _list.push_back({static_cast<node_id_t>(i), 0});
       _index_table[i] = i;
     }
   }
@@ -58,30 +67,30 @@ public:
   }
 
   void increment(node_id_t key) {
-    typename map_t::const_iterator i = _index_table.find(key);
-    if (i == _index_table.end()) {
+    if (key >= _index_table.size() || _index_table[key] == ABSENT) {
       return;
     }
+    size_t position = _index_table[key];
     // int new_index = _list.size()-1;
     // while((new_index > 0) && (_list[new_index].priority >
     // _list[i->second].priority)){ 	new_index--;
     // }
 
     auto it =
-        std::upper_bound(_list.begin(), _list.end(), _list[i->second], compare);
+        std::upper_bound(_list.begin(), _list.end(), _list[position], compare);
     size_t new_index = it - _list.begin() - 1; // possible bug
     // new_index points to the right-most element with same priority as key
-    // i.e. priority equal to "_list[i->second].priority" (i.e. the current
+    // i.e. priority equal to "_list[position].priority" (i.e. the current
     // priority)
-    swap(i->second, new_index);
+    swap(position, new_index);
     _list[new_index].priority++;
   }
 
   void decrement(node_id_t key) {
-    typename map_t::const_iterator i = _index_table.find(key);
-    if (i == _index_table.end()) {
+    if (key >= _index_table.size() || _index_table[key] == ABSENT) {
       return;
     }
+    size_t position = _index_table[key];
     // int new_index = _list.size()-1;
     // while((new_index > 0) && (_list[new_index].priority >=
     // _list[i->second].priority)){ 	new_index--;
@@ -89,7 +98,7 @@ public:
     // new_index++;
     // i shoudl do this better but am pressed for time now
     auto it =
-        std::lower_bound(_list.begin(), _list.end(), _list[i->second], compare);
+        std::lower_bound(_list.begin(), _list.end(), _list[position], compare);
     size_t new_index = it - _list.begin(); // POSSIBLE BUG
     // while((new_index > _list.size()) && (_list[new_index].priority ==
     // _list[i->second].priority)){ 	new_index++;
@@ -97,14 +106,14 @@ public:
     // new_index--;
     // new_index points to the right-most element with same priority as key
 
-    swap(i->second, new_index);
+    swap(position, new_index);
     _list[new_index].priority--;
   }
 
   node_id_t pop() {
     Node max = _list.back();
     _list.pop_back();
-    _index_table.erase(max.key);
+    _index_table[max.key] = ABSENT;
     return max.key;
   }
 
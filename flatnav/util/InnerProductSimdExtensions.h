@@ -234,4 +234,98 @@ const float computeIP_SseWithResidual_4(const void *x, const void *y,
 
 #endif // USE_SSE
 
+#if defined(USE_AVX2)
+
+/**
+ * Inner product distance (1 - <x, y>) between a float vector `x` and a vector
+ * `y` of 8-bit scalar quantization codes, where code c in dimension i decodes
+ * to `offset[i] + scale[i] * c`.
+ */
+static float computeIP_Avx2_Sq8(const float *x, const uint8_t *y,
+                                const float *offset, const float *scale,
+                                const size_t &dimension) {
+  size_t aligned_dimension = dimension & ~7;
+  simd8float32 v1, v2;
+  simd8float32 sum(0.0f);
+
+  for (size_t i = 0; i < aligned_dimension; i += 8) {
+    v1.loadu(x + i);
+    v2 = simd8float32(offset + i) + simd8float32(scale + i) * loadSq8Codes(y + i);
+    sum += v1 * v2;
+  }
+
+  float residual_sum = 0.0f;
+  for (size_t i = aligned_dimension; i < dimension; i++) {
+    residual_sum += x[i] * (offset[i] + scale[i] * y[i]);
+  }
+  return 1.0f - (sum.reduce_add() + residual_sum);
+}
+
+// Inner product distance between two vectors of 8-bit scalar quantization
+// codes that share the same per-dimension `offset` and `scale`.
+static float computeIP_Avx2_Sq8Codes(const uint8_t *x, const uint8_t *y,
+                                     const float *offset, const float *scale,
+                                     const size_t &dimension) {
+  size_t aligned_dimension = dimension & ~7;
+  simd8float32 v1, v2, offsets, scales;
+  simd8float32 sum(0.0f);
+
+  for (size_t i = 0; i < aligned_dimension; i += 8) {
+    offsets.loadu(offset + i);
+    scales.loadu(scale + i);
+    v1 = offsets + scales * loadSq8Codes(x + i);
+    v2 = offsets + scales * loadSq8Codes(y + i);
+    sum += v1 * v2;
+  }
+
+  float residual_sum = 0.0f;
+  for (size_t i = aligned_dimension; i < dimension; i++) {
+    residual_sum +=
+        (offset[i] + scale[i] * x[i]) * (offset[i] + scale[i] * y[i]);
+  }
+  return 1.0f - (sum.reduce_add() + residual_sum);
+}
+
+#endif // USE_AVX2
+
+#if defined(USE_F16C)
+
+// Inner product distance between a float vector and a half-precision vector.
+static float computeIP_Avx_Fp16(const float *x, const uint16_t *y,
+                                const size_t &dimension) {
+  size_t aligned_dimension = dimension & ~7;
+  simd8float32 v1;
+  simd8float32 sum(0.0f);
+
+  for (size_t i = 0; i < aligned_dimension; i += 8) {
+    v1.loadu(x + i);
+    sum += v1 * loadFp16(y + i);
+  }
+
+  float residual_sum = 0.0f;
+  for (size_t i = aligned_dimension; i < dimension; i++) {
+    residual_sum += x[i] * _cvtsh_ss(y[i]);
+  }
+  return 1.0f - (sum.reduce_add() + residual_sum);
+}
+
+// Inner product distance between two half-precision vectors.
+static float computeIP_Avx_Fp16Codes(const uint16_t *x, const uint16_t *y,
+                                     const size_t &dimension) {
+  size_t aligned_dimension = dimension & ~7;
+  simd8float32 sum(0.0f);
+
+  for (size_t i = 0; i < aligned_dimension; i += 8) {
+    sum += loadFp16(x + i) * loadFp16(y + i);
+  }
+
+  float residual_sum = 0.0f;
+  for (size_t i = aligned_dimension; i < dimension; i++) {
+    residual_sum += _cvtsh_ss(x[i]) * _cvtsh_ss(y[i]);
+  }
+  return 1.0f - (sum.reduce_add() + residual_sum);
+}
+
+#endif // USE_F16C
+
 } // namespace flatnav::util
@@ -17,9 +17,23 @@
 #define USE_SSE4_1
 #endif // __SSE4_1__
 
+// Hardware CRC-32C, used to checksum index files.
+#ifdef __SSE4_2__
+#define USE_SSE4_2
+#endif // __SSE4_2__
+
 #ifdef __AVX__
 #define USE_AVX
 
+#ifdef __AVX2__
+#define USE_AVX2
+#endif // __AVX2__
+
+// Conversions between half and single precision floats.
+#ifdef __F16C__
+#define USE_F16C
+#endif // __F16C__
+
 #ifdef __AVX512F__
 
 #ifdef __AVX512BW__
@@ -1,11 +1,22 @@
 #pragma once
 
+#include <algorithm>
 #include <atomic>
+#include <condition_variable>
 #include <cstdint>
+#include <exception>
+#include <functional>
 #include <mutex>
+#include <stdexcept>
 #include <thread>
 #include <tuple>
 #include <utility>
+#include <vector>
+
+#ifdef __linux__
+#include <pthread.h>
+#include <sched.h>
+#endif
 
 namespace flatnav {
 
@@ -16,7 +27,7 @@ namespace flatnav {
  * installing the Python library.
  */
 template <typename Function, typename... Args>
-void executeInParallel(uint32_t start_index, uint32_t end_index,
+void executeInParallel(uint64_t start_index, uint64_t end_index,
                        uint32_t num_threads, Function function,
                        Args... additional_args) {
   if (num_threads == 0) {
@@ -24,13 +35,14 @@ void executeInParallel(uint32_t start_index, uint32_t end_index,
   }
 
   // This needs to be an atomic because mutliple threads will be
-  // modifying it concurrently.
-  std::atomic<uint32_t> current(start_index);
+  // modifying it concurrently. It is 64 bits wide so that the increments past
+  // `end_index` made by finishing threads cannot wrap around.
+  std::atomic<uint64_t> current(start_index);
   std::thread thread_objects[num_threads];
 
   auto parallel_executor = [&] {
     while (true) {
-      uint32_t current_vector_idx = current.fetch_add(1);
+      uint64_t current_vector_idx = current.fetch_add(1);
       if (current_vector_idx >= end_index) {
         break;
       }
@@ -48,4 +60,349 @@ void executeInParallel(uint32_t start_index, uint32_t end_index,
   }
 }
 
-} // namespace flatnav
\ No newline at end of file
+/**
+ * @brief A fixed set of long-lived worker threads that run parallel loops.
+ *
+ * `executeInParallel` creates and joins fresh threads on every call, which
+ * dominates the cost of small batches. The pool keeps `num_threads - 1`
+ * threads parked on a condition variable between calls; the calling thread
+ * acts as worker 0, so a pool of size 1 has no threads at all.
+ *
+ * `parallelFor` splits the index range into one contiguous range per worker.
+ * Workers claim chunks of their own range and, once it is drained, steal
+ * chunks from the ranges of the other workers. Exceptions thrown by the loop
+ * body are rethrown on the calling thread.
+ *
+ * A pool runs one job at a time. If a job is submitted while another one is
+ * running (from another thread, or from inside a loop body), it runs on the
+ * calling thread alone instead of waiting.
+ */
+class ThreadPool {
+public:
+  /**
+   * @param num_threads Total number of workers, including the calling thread.
+   * @param pin_threads If true, worker i is pinned to core i (Linux only).
+   * The calling thread is never pinned.
+   */
+  explicit ThreadPool(uint32_t num_threads = 1, bool pin_threads = false) {
+    resize(num_threads, pin_threads);
+  }
+
+  ~ThreadPool() { stopWorkers(); }
+
+  ThreadPool(const ThreadPool &) = delete;
+  ThreadPool &operator=(const ThreadPool &) = delete;
+
+  /**
+   * @brief Replaces the workers with `num_threads` new ones. Blocks until the
+   * running job, if any, has finished, so it must not be called from inside
+   * a job.
+   */
+  void resize(uint32_t num_threads, bool pin_threads = false) {
+    if (num_threads == 0) {
+      throw std::invalid_argument("Invalid number of threads");
+    }
+    while (_running.exchange(true)) {
+      std::this_thread::yield();
+    }
+    JobGuard job_guard(_running);
+    stopWorkers();
+
+    _stop = false;
+    _pin_threads = pin_threads;
+    for (uint32_t worker_id = 1; worker_id < num_threads; worker_id++) {
+      _workers.emplace_back(&ThreadPool::workerLoop, this, worker_id,
+                            _generation);
+    }
+  }
+
+  inline uint32_t numThreads() const { return _workers.size() + 1; }
+  inline bool pinsThreads() const { return _pin_threads; }
+
+  /**
+   * @brief Runs `function(worker_id)` once on every worker and blocks until
+   * all of them return.
+   */
+  template <typename Function> void broadcast(Function &&function) {
+    if (_workers.empty() || _running.exchange(true)) {
+      function(0);
+      return;
+    }
+    JobGuard job_guard(_running);
+
+    std::exception_ptr error;
+    std::mutex error_guard;
+    std::function<void(uint32_t)> job = [&](uint32_t worker_id) {
+      try {
+        function(worker_id);
+      } catch (...) {
+        std::lock_guard<std::mutex> lock(error_guard);
+        if (!error) {
+          error = std::current_exception();
+        }
+      }
+    };
+
+    {
+      std::lock_guard<std::mutex> lock(_state_guard);
+      _job = &job;
+      _num_pending_workers = _workers.size();
+      _generation++;
+    }
+    _job_available.notify_all();
+
+    job(0);
+
+    {
+      std::unique_lock<std::mutex> lock(_state_guard);
+      _job_done.wait(lock, [this] { return _num_pending_workers == 0; });
+      _job = nullptr;
+    }
+
+    if (error) {
+      std::rethrow_exception(error);
+    }
+  }
+
+  /**
+   * @brief Runs `function(index)` for every index in [start_index, end_index).
+   *
+   * @param chunk_size Number of consecutive indices claimed at a time. With
+   * the default of 0, each worker's range is split into about
+   * CHUNKS_PER_WORKER chunks.
+   */
+  template <typename Function>
+  void parallelFor(uint64_t start_index, uint64_t end_index,
+                   Function function, uint32_t chunk_size = 0) {
+    if (start_index >= end_index) {
+      return;
+    }
+    uint32_t num_threads = numThreads();
+    uint64_t num_indices = end_index - start_index;
+    if (chunk_size == 0) {
+      chunk_size = std::max<uint64_t>(
+          1, num_indices / (num_threads * CHUNKS_PER_WORKER));
+    }
+
+    std::vector<WorkRange> ranges(num_threads);
+    for (uint32_t worker_id = 0; worker_id < num_threads; worker_id++) {
+      ranges[worker_id].next =
+          start_index + (num_indices * worker_id / num_threads);
+      ranges[worker_id].end =
+          start_index + (num_indices * (worker_id + 1) / num_threads);
+    }
+
+    broadcast([&](uint32_t worker_id) {
+      // Drain our own range first, then steal from the others.
+      for (uint32_t i = 0; i < num_threads; i++) {
+        WorkRange &range = ranges[(worker_id + i) % num_threads];
+        while (true) {
+          uint64_t first = range.next.fetch_add(chunk_size);
+          if (first >= range.end) {
+            break;
+          }
+          uint64_t last = std::min<uint64_t>(first + chunk_size, range.end);
+          for (uint64_t index = first; index < last; index++) {
+            function(index);
+          }
+        }
+      }
+    });
+  }
+
+private:
+  static constexpr uint32_t CHUNKS_PER_WORKER = 16;
+
+  // Padded to a cache line so that workers claiming chunks of neighboring
+  // ranges do not contend on the same line.
+  struct alignas(64) WorkRange {
+    std::atomic<uint64_t> next{0};
+    uint64_t end = 0;
+  };
+
+  // Clears the running flag when the job (or a resize) is over.
+  struct JobGuard {
+    std::atomic<bool> &running;
+    explicit JobGuard(std::atomic<bool> &running) : running(running) {}
+    ~JobGuard() { running = false; }
+  };
+
+  void workerLoop(uint32_t worker_id, uint64_t generation) {
+#ifdef __linux__
+    if (_pin_threads) {
+      cpu_set_t cpu_set;
+      CPU_ZERO(&cpu_set);
+      CPU_SET(worker_id % std::max(1u, std::thread::hardware_concurrency()),
+              &cpu_set);
+      pthread_setaffinity_np(pthread_self(), sizeof(cpu_set_t), &cpu_set);
+    }
+#endif
+    while (true) {
+      const std::function<void(uint32_t)> *job;
+      {
+        std::unique_lock<std::mutex> lock(_state_guard);
+        _job_available.wait(
+            lock, [&] { return _stop || _generation != generation; });
+        if (_stop) {
+          return;
+        }
+        generation = _generation;
+        job = _job;
+      }
+
+      (*job)(worker_id);
+
+      std::lock_guard<std::mutex> lock(_state_guard);
+      if (--_num_pending_workers == 0) {
+        _job_done.notify_one();
+      }
+    }
+  }
+
+  // Must be called with `_running` set or from the destructor.
+  void stopWorkers() {
+    {
+      std::lock_guard<std::mutex> lock(_state_guard);
+      _stop = true;
+    }
+    _job_available.notify_all();
+    for (auto &worker : _workers) {
+      worker.join();
+    }
+    _workers.clear();
+  }
+
+  std::vector<std::thread> _workers;
+  bool _pin_threads = false;
+
+  // Set for the duration of a job, so that only one job runs at a time.
+  // This is a flag rather than a mutex because nested jobs check it from a
+  // thread that may already be running the outer job.
+  std::atomic<bool> _running{false};
+
+  // Guards the fields below, which hand a job over to the workers.
+  std::mutex _state_guard;
+  std::condition_variable _job_available;
+  std::condition_variable _job_done;
+  const std::function<void(uint32_t)> *_job = nullptr;
+  uint64_t _generation = 0;
+  uint32_t _num_pending_workers = 0;
+  bool _stop = false;
+};
+
+/**
+ * @brief Lets any number of writers run at once, but not while the gate is
+ * paused. `pause` waits for the writers in progress and holds new ones off
+ * until the returned lock is released, which is how a consistent snapshot of
+ * a structure is taken while other threads keep modifying it.
+ *
+ * A thread that is already writing can enter the gate again without waiting
+ * (a write operation may call another one), so pausing cannot deadlock on
+ * nested writes.
+ */
+class WriterGate {
+  std::mutex _mutex;
+  std::condition_variable _condition;
+  size_t _num_writers = 0;
+  bool _paused = false;
+
+  // Gates the calling thread is writing through, with their nesting depth.
+  static std::vector<std::pair<const WriterGate *, uint32_t>> &enteredGates() {
+    static thread_local std::vector<std::pair<const WriterGate *, uint32_t>>
+        gates;
+    return gates;
+  }
+
+public:
+  class Writer {
+    WriterGate *_gate;
+
+  public:
+    explicit Writer(WriterGate &gate) : _gate(&gate) { _gate->enter(); }
+    Writer(Writer &&other) noexcept : _gate(other._gate) {
+      other._gate = nullptr;
+    }
+    ~Writer() {
+      if (_gate) {
+        _gate->leave();
+      }
+    }
+    Writer(const Writer &) = delete;
+    Writer &operator=(const Writer &) = delete;
+  };
+
+  // Held for as long as the gate is paused.
+  class Pause {
+    WriterGate *_gate;
+
+  public:
+    explicit Pause(WriterGate &gate) : _gate(&gate) {
+      std::unique_lock<std::mutex> lock(_gate->_mutex);
+      // Only one pause at a time.
+      _gate->_condition.wait(lock, [&] { return !_gate->_paused; });
+      _gate->_paused = true;
+      _gate->_condition.wait(lock, [&] { return _gate->_num_writers == 0; });
+    }
+    ~Pause() {
+      {
+        std::unique_lock<std::mutex> lock(_gate->_mutex);
+        _gate->_paused = false;
+      }
+      _gate->_condition.notify_all();
+    }
+    Pause(const Pause &) = delete;
+    Pause &operator=(const Pause &) = delete;
+  };
+
+  Writer write() { return Writer(*this); }
+  Pause pause() { return Pause(*this); }
+
+  /**
+   * @brief Runs `function` if the calling thread, which must hold a writer,
+   * is the only writer. Other threads cannot enter the gate while it runs.
+   * Returns whether `function` ran.
+   */
+  template <typename Function> bool runIfSoleWriter(Function &&function) {
+    std::unique_lock<std::mutex> lock(_mutex);
+    if (_num_writers != 1) {
+      return false;
+    }
+    function();
+    return true;
+  }
+
+private:
+  void enter() {
+    auto &gates = enteredGates();
+    for (auto &[gate, depth] : gates) {
+      if (gate == this) {
+        depth++;
+        return;
+      }
+    }
+    std::unique_lock<std::mutex> lock(_mutex);
+    _condition.wait(lock, [&] { return !_paused; });
+    _num_writers++;
+    gates.emplace_back(this, 1);
+  }
+
+  void leave() {
+    auto &gates = enteredGates();
+    auto entry = std::find_if(gates.begin(), gates.end(),
+                              [&](const auto &gate) { return gate.first == this; });
+    if (--entry->second > 0) {
+      return;
+    }
+    gates.erase(entry);
+    bool last_writer;
+    {
+      std::unique_lock<std::mutex> lock(_mutex);
+      last_writer = --_num_writers == 0;
+    }
+    if (last_writer) {
+      _condition.notify_all();
+    }
+  }
+};
+
+} // namespace flatnav
@@ -1,10 +1,15 @@
 #pragma once
 
 #include <flatnav/util/GorderPriorityQueue.h>
+#include <flatnav/util/Multithreading.h>
 #include <flatnav/util/VisitedSetPool.h>
 
 #include <algorithm>
+#include <cstdint>
+#include <numeric>
 #include <queue>
+#include <stdexcept>
+#include <string>
 #include <utility>
 #include <vector>
 
@@ -16,6 +21,10 @@
 // 0 to N-1 (where N is the number of nodes in the graph) with no
 // non-existent nodes.
 //
+// The outdegree table is convenient but costs one heap allocation per node.
+// Large graphs are reordered from a CSRGraph instead, which every algorithm
+// also accepts.
+//
 // All functions must accept outdegree_table and return a permutation
 // P. P is a length-N vector where P[i] is the new node ID of the
 // node currently labeled "i". That is, to find the new label of
@@ -23,9 +32,138 @@
 
 namespace flatnav::util {
 
+/**
+ * Graph in compressed sparse row form: the out-edges of `node` are
+ * `edges[offsets[node]]` up to `edges[offsets[node + 1]]`.
+ */
+template <typename node_id_t> struct CSRGraph {
+  std::vector<uint64_t> offsets{0};
+  std::vector<node_id_t> edges;
+
+  inline node_id_t numNodes() const { return offsets.size() - 1; }
+  inline const node_id_t *begin(node_id_t node) const {
+    return edges.data() + offsets[node];
+  }
+  inline const node_id_t *end(node_id_t node) const {
+    return edges.data() + offsets[node + 1];
+  }
+  inline uint64_t degree(node_id_t node) const {
+    return offsets[node + 1] - offsets[node];
+  }
+
+  /**
+   * @brief Builds the graph from fixed-size link arrays, such as the ones in
+   * the node block of an index. Links of a node to itself mark empty slots
+   * and are skipped.
+   *
+   * @param num_nodes The number of nodes.
+   * @param max_degree The size of each link array.
+   * @param links Returns the link array of a node.
+   * @param thread_pool If given, the link arrays are scanned in parallel.
+   */
+  template <typename LinksFunction>
+  static CSRGraph fromLinks(node_id_t num_nodes, size_t max_degree,
+                            LinksFunction links,
+                            ThreadPool *thread_pool = nullptr) {
+    CSRGraph graph;
+    graph.offsets.assign(num_nodes + 1, 0);
+    forEachNode(num_nodes, thread_pool, [&](node_id_t node) {
+      const node_id_t *node_links = links(node);
+      graph.offsets[node + 1] =
+          max_degree - std::count(node_links, node_links + max_degree, node);
+    });
+    for (node_id_t node = 0; node < num_nodes; node++) {
+      graph.offsets[node + 1] += graph.offsets[node];
+    }
+    graph.edges.resize(graph.offsets[num_nodes]);
+    forEachNode(num_nodes, thread_pool, [&](node_id_t node) {
+      const node_id_t *node_links = links(node);
+      std::copy_if(node_links, node_links + max_degree,
+                   graph.edges.begin() + graph.offsets[node],
+                   [node](node_id_t link) { return link != node; });
+    });
+    return graph;
+  }
+
+  static CSRGraph
+  fromOutdegreeTable(const std::vector<std::vector<node_id_t>> &table) {
+    CSRGraph graph;
+    for (const auto &edges : table) {
+      graph.edges.insert(graph.edges.end(), edges.begin(), edges.end());
+      graph.offsets.push_back(graph.edges.size());
+    }
+    return graph;
+  }
+
+  /**
+   * @brief Builds the graph from a list of `num_edges` edges, stored as
+   * (source, target) pairs back to back in `edges`. The edges of each node
+   * keep the order they have in the list.
+   *
+   * @exception std::invalid_argument Thrown if an edge starts at a node that
+   * is not in the graph.
+   */
+  static CSRGraph fromEdgeList(node_id_t num_nodes, const node_id_t *edges,
+                               uint64_t num_edges) {
+    CSRGraph graph;
+    graph.offsets.assign(num_nodes + 1, 0);
+    for (uint64_t edge = 0; edge < num_edges; edge++) {
+      node_id_t source = edges[2 * edge];
+      if (source >= num_nodes) {
+        throw std::invalid_argument("Edge " + std::to_string(edge) +
+                                    " starts at node " +
+                                    std::to_string(source) +
+                                    ", which is not in the graph.");
+      }
+      graph.offsets[source + 1]++;
+    }
+    for (node_id_t node = 0; node < num_nodes; node++) {
+      graph.offsets[node + 1] += graph.offsets[node];
+    }
+    graph.edges.resize(num_edges);
+    std::vector<uint64_t> cursor(graph.offsets.begin(), graph.offsets.end() - 1);
+    for (uint64_t edge = 0; edge < num_edges; edge++) {
+      graph.edges[cursor[edges[2 * edge]]++] = edges[2 * edge + 1];
+    }
+    return graph;
+  }
+
+  // The graph with every edge reversed, i.e. the in-edges of every node.
+  CSRGraph transpose() const {
+    CSRGraph graph;
+    graph.offsets.assign(numNodes() + 1, 0);
+    for (node_id_t edge : edges) {
+      graph.offsets[edge + 1]++;
+    }
+    for (node_id_t node = 0; node < numNodes(); node++) {
+      graph.offsets[node + 1] += graph.offsets[node];
+    }
+    graph.edges.resize(edges.size());
+    std::vector<uint64_t> cursor(graph.offsets.begin(), graph.offsets.end() - 1);
+    for (node_id_t node = 0; node < numNodes(); node++) {
+      for (const node_id_t *edge = begin(node); edge != end(node); edge++) {
+        graph.edges[cursor[*edge]++] = node;
+      }
+    }
+    return graph;
+  }
+
+  // Runs `function(node)` for every node, on the pool if there is one.
+  template <typename Function>
+  static void forEachNode(node_id_t num_nodes, ThreadPool *thread_pool,
+                          Function function) {
+    if (thread_pool) {
+      thread_pool->parallelFor(0, num_nodes, function);
+      return;
+    }
+    for (node_id_t node = 0; node < num_nodes; node++) {
+      function(node);
+    }
+  }
+};
+
 template <typename node_id_t>
-std::vector<node_id_t>
-gOrder(std::vector<std::vector<node_id_t>> &outdegree_table, const int w) {
+std::vector<node_id_t> gOrder(const CSRGraph<node_id_t> &graph, const int w) {
   /* Simple explanation of the Gorder Algorithm:
   insert all v into Q each with priority 0
   select a start node into P
@@ -51,14 +189,12 @@ gOrder(std::vector<std::vector<node_id_t>> &outdegree_table, const int w) {
       i++
   */
 
-  int cur_num_nodes = outdegree_table.size();
-  // create table of in-degrees
-  std::vector<std::vector<node_id_t>> indegree_table(cur_num_nodes);
-  for (node_id_t node = 0; node < cur_num_nodes; node++) {
-    for (node_id_t &edge : outdegree_table[node]) {
-      indegree_table[edge].push_back(node);
-    }
+  node_id_t cur_num_nodes = graph.numNodes();
+  if (cur_num_nodes == 0) {
+    return {};
   }
+  // create table of in-degrees
+  CSRGraph<node_id_t> indegree_graph = graph.transpose();
 
   GorderPriorityQueue<node_id_t> Q(cur_num_nodes);
   std::vector<node_id_t> P(cur_num_nodes, 0);
@@ -68,41 +204,43 @@ gOrder(std::vector<std::vector<node_id_t>> &outdegree_table, const int w) {
   P[0] = Q.pop();
 
   // for i = 1 to N:
-  for (int i = 1; i < cur_num_nodes; i++) {
+  for (node_id_t i = 1; i < cur_num_nodes; i++) {
     node_id_t v_e = P[i - 1];
     // ve = newest node in window
     // for each node u in out-edges of ve:
-    for (node_id_t &u : outdegree_table[v_e]) {
-      Q.increment(u);
+    for (const node_id_t *u = graph.begin(v_e); u != graph.end(v_e); u++) {
+      Q.increment(*u);
     }
     // for each node u in in-edges of v_e:
-    for (node_id_t &u : indegree_table[v_e]) {
+    for (const node_id_t *u = indegree_graph.begin(v_e);
+         u != indegree_graph.end(v_e); u++) {
       // if u in Q, increment priority of u
-      Q.increment(u);
+      Q.increment(*u);
       // for each node v in out-edges of u:
-      for (node_id_t &v : outdegree_table[u]) {
-        Q.increment(v);
+      for (const node_id_t *v = graph.begin(*u); v != graph.end(*u); v++) {
+        Q.increment(*v);
       }
     }
 
     if (i > w + 1) {
       node_id_t v_b = P[i - w - 1];
       // for each node u in out-edges of vb:
-      for (node_id_t &u : outdegree_table[v_b]) {
-        Q.decrement(u);
+      for (const node_id_t *u = graph.begin(v_b); u != graph.end(v_b); u++) {
+        Q.decrement(*u);
       }
 
       // for each node u in in-edges of v_b
-      for (node_id_t &u : indegree_table[v_b]) {
+      for (const node_id_t *u = indegree_graph.begin(v_b);
+           u != indegree_graph.end(v_b); u++) {
         // if u in Q, increment priority of u
         // Note: it doesn't seem to matter whether this particular
         // operation is an increment or a decrement. In a previous
         // version of this code, it was "increment" (which is
         // technically wrong) but the performance was nearly the same.
-        Q.decrement(u);
+        Q.decrement(*u);
         // for each node v in out-edges of u:
-        for (node_id_t &v : outdegree_table[u]) {
-          Q.decrement(v);
+        for (const node_id_t *v = graph.begin(*u); v != graph.end(*u); v++) {
+          Q.decrement(*v);
         }
       }
     }
@@ -110,7 +248,7 @@ gOrder(std::vector<std::vector<node_id_t>> &outdegree_table, const int w) {
   }
 
   std::vector<node_id_t> Pinv(cur_num_nodes, 0);
-  for (int n = 0; n < cur_num_nodes; n++) {
+  for (node_id_t n = 0; n < cur_num_nodes; n++) {
     Pinv[P[n]] = n;
   }
   // now we have a mapping Pinv[i] -> new label of node i
@@ -119,77 +257,57 @@ gOrder(std::vector<std::vector<node_id_t>> &outdegree_table, const int w) {
 
 template <typename node_id_t>
 std::vector<node_id_t>
-rcmOrder(std::vector<std::vector<node_id_t>> &outdegree_table) {
+gOrder(std::vector<std::vector<node_id_t>> &outdegree_table, const int w) {
+  return gOrder(CSRGraph<node_id_t>::fromOutdegreeTable(outdegree_table), w);
+}
 
-  int cur_num_nodes = outdegree_table.size();
-  std::vector<std::pair<node_id_t, int>> sorted_nodes;
-  std::vector<int> degrees;
+template <typename node_id_t>
+std::vector<node_id_t> rcmOrder(const CSRGraph<node_id_t> &graph,
+                                ThreadPool *thread_pool = nullptr) {
 
-  for (node_id_t node = 0; node < cur_num_nodes; node++) {
-    int deg = outdegree_table[node].size();
-    sorted_nodes.push_back({node, deg});
-    degrees.push_back(deg);
-  }
+  node_id_t cur_num_nodes = graph.numNodes();
+  std::vector<node_id_t> sorted_nodes(cur_num_nodes);
+  std::iota(sorted_nodes.begin(), sorted_nodes.end(), 0);
+  std::sort(sorted_nodes.begin(), sorted_nodes.end(),
+            [&](node_id_t a, node_id_t b) {
+              return graph.degree(a) < graph.degree(b);
+            });
 
-  std::sort(
-      sorted_nodes.begin(), sorted_nodes.end(),
-      [](const std::pair<node_id_t, int> &a,
-         const std::pair<node_id_t, int> &b) { return a.second < b.second; });
+  // Sort every neighbor list by degree (min degree first) once, up front,
+  // instead of every time a node is dequeued.
+  CSRGraph<node_id_t> sorted_graph = graph;
+  CSRGraph<node_id_t>::forEachNode(
+      cur_num_nodes, thread_pool, [&](node_id_t node) {
+        std::sort(sorted_graph.edges.begin() + sorted_graph.offsets[node],
+                  sorted_graph.edges.begin() + sorted_graph.offsets[node + 1],
+                  [&](node_id_t a, node_id_t b) {
+                    return graph.degree(a) < graph.degree(b);
+                  });
+      });
 
+  // P doubles as the BFS queue: the nodes in [head, P.size()) have been
+  // visited but not expanded yet.
   std::vector<node_id_t> P;
+  P.reserve(cur_num_nodes);
   auto visited_set = VisitedSet(cur_num_nodes);
   visited_set.clear();
 
-  for (int i = 0; i < sorted_nodes.size(); i++) {
-    node_id_t node = sorted_nodes[i].first;
-    std::queue<node_id_t> Q;
-
-    if (!visited_set.isVisited(node)) {
-      // add node to permutation
-      P.push_back(node);
-      visited_set.insert(node);
-
-      // get list of neighbors
-      std::vector<std::pair<node_id_t, int>> neighbors;
-      for (auto &edge : outdegree_table[node]) {
-        neighbors.push_back({edge, degrees[edge]});
-      }
-
-      // sort neighbors by degree (min degree first)
-      std::sort(neighbors.begin(), neighbors.end(),
-                [](const std::pair<node_id_t, int> &a,
-                   const std::pair<node_id_t, int> &b) {
-                  return a.second < b.second;
-                });
-
-      // add neighbors to queue
-      for (int j = 0; j < neighbors.size(); j++) {
-        Q.push(neighbors[j].first);
-      }
+  for (node_id_t node : sorted_nodes) {
+    if (visited_set.isVisited(node)) {
+      continue;
+    }
+    size_t head = P.size();
+    P.push_back(node);
+    visited_set.insert(node);
 
-      while (Q.size() > 0) {
-        // exhause all the neighbors
-        node_id_t candidate = Q.front();
-        Q.pop();
-        if (!visited_set.isVisited(candidate)) {
-          P.push_back(candidate);
-          visited_set.insert(candidate);
-
-          // get list of neighbors of candidate
-          std::vector<std::pair<node_id_t, int>> candidate_neighbors;
-          for (auto &edge : outdegree_table[candidate]) {
-            candidate_neighbors.push_back({edge, degrees[edge]});
-          }
-          // sort neighbors by degree (min degree first)
-          std::sort(candidate_neighbors.begin(), candidate_neighbors.end(),
-                    [](const std::pair<node_id_t, int> &a,
-                       const std::pair<node_id_t, int> &b) {
-                      return a.second < b.second;
-                    });
-          // add neighbors to queue
-          for (int j = 0; j < candidate_neighbors.size(); j++) {
-            Q.push(candidate_neighbors[j].first);
-          }
+    // exhaust all the neighbors
+    while (head < P.size()) {
+      node_id_t candidate = P[head++];
+      for (const node_id_t *edge = sorted_graph.begin(candidate);
+           edge != sorted_graph.end(candidate); edge++) {
+        if (!visited_set.isVisited(*edge)) {
+          P.push_back(*edge);
+          visited_set.insert(*edge);
         }
       }
     }
@@ -197,10 +315,73 @@ rcmOrder(std::vector<std::vector<node_id_t>> &outdegree_table) {
 
   std::reverse(P.begin(), P.end());
   std::vector<node_id_t> Pinv(cur_num_nodes, 0);
-  for (int n = 0; n < cur_num_nodes; n++) {
+  for (node_id_t n = 0; n < cur_num_nodes; n++) {
     Pinv[P[n]] = n;
   }
   return Pinv;
 }
 
+template <typename node_id_t>
+std::vector<node_id_t>
+rcmOrder(std::vector<std::vector<node_id_t>> &outdegree_table) {
+  return rcmOrder(CSRGraph<node_id_t>::fromOutdegreeTable(outdegree_table));
+}
+
+/**
+ * @brief Parallel approximation of Gorder for graphs too large to reorder on
+ * one thread.
+ *
+ * The nodes are first laid out in RCM order, which keeps neighborhoods close
+ * together, and cut into `num_partitions` consecutive ranges. Each range is
+ * then reordered with Gorder on its own, restricted to the edges between its
+ * nodes, and the ranges are processed concurrently. Only the edges that cross
+ * a partition boundary are ignored, so with partitions of a few hundred
+ * thousand nodes the result is close to that of Gorder.
+ */
+template <typename node_id_t>
+std::vector<node_id_t> partitionedGOrder(const CSRGraph<node_id_t> &graph,
+                                         const int w,
+                                         uint32_t num_partitions,
+                                         ThreadPool &thread_pool) {
+  node_id_t cur_num_nodes = graph.numNodes();
+  num_partitions = std::max<uint32_t>(
+      1, std::min<uint64_t>(num_partitions, cur_num_nodes));
+  std::vector<node_id_t> rcm = rcmOrder(graph, &thread_pool);
+  std::vector<node_id_t> order(cur_num_nodes);
+  for (node_id_t n = 0; n < cur_num_nodes; n++) {
+    order[rcm[n]] = n;
+  }
+
+  std::vector<node_id_t> Pinv(cur_num_nodes, 0);
+  thread_pool.parallelFor(
+      0, num_partitions,
+      [&](uint32_t partition) {
+        node_id_t first = uint64_t(cur_num_nodes) * partition / num_partitions;
+        node_id_t last =
+            uint64_t(cur_num_nodes) * (partition + 1) / num_partitions;
+
+        // The subgraph induced by the partition, with nodes renumbered by
+        // their RCM position within it.
+        CSRGraph<node_id_t> subgraph;
+        subgraph.offsets.reserve(last - first + 1);
+        for (node_id_t position = first; position < last; position++) {
+          node_id_t node = order[position];
+          for (const node_id_t *edge = graph.begin(node);
+               edge != graph.end(node); edge++) {
+            if (rcm[*edge] >= first && rcm[*edge] < last) {
+              subgraph.edges.push_back(rcm[*edge] - first);
+            }
+          }
+          subgraph.offsets.push_back(subgraph.edges.size());
+        }
+
+        std::vector<node_id_t> local = gOrder(subgraph, w);
+        for (node_id_t position = first; position < last; position++) {
+          Pinv[order[position]] = first + local[position - first];
+        }
+      },
+      /* chunk_size = */ 1);
+  return Pinv;
+}
+
 } // namespace flatnav::util
\ No newline at end of file
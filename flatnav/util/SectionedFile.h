@@ -0,0 +1,427 @@
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <fcntl.h>
+#include <flatnav/util/Macros.h>
+#include <istream>
+#include <ostream>
+#include <stdexcept>
+#include <streambuf>
+#include <string>
+#include <unistd.h>
+#include <vector>
+
+namespace flatnav::util {
+
+namespace detail {
+
+// Lookup tables for a software CRC-32C that processes 8 bytes at a time.
+struct Crc32cTables {
+  uint32_t table[8][256];
+
+  Crc32cTables() {
+    for (uint32_t byte = 0; byte < 256; byte++) {
+      uint32_t crc = byte;
+      for (int bit = 0; bit < 8; bit++) {
+        crc = (crc >> 1) ^ (0x82F63B78 & (0 - (crc & 1)));
+      }
+      table[0][byte] = crc;
+    }
+    for (uint32_t byte = 0; byte < 256; byte++) {
+      for (int k = 1; k < 8; k++) {
+        table[k][byte] = (table[k - 1][byte] >> 8) ^
+                         table[0][table[k - 1][byte] & 0xFF];
+      }
+    }
+  }
+};
+
+} // namespace detail
+
+/**
+ * @brief CRC-32C (Castagnoli) of `size` bytes. Checksums of consecutive
+ * pieces are chained by passing the checksum of the previous piece as `crc`.
+ * Uses the SSE4.2 crc32 instruction when available.
+ */
+inline uint32_t crc32c(const void *data, size_t size, uint32_t crc = 0) {
+  const uint8_t *bytes = static_cast<const uint8_t *>(data);
+  crc = ~crc;
+#ifdef USE_SSE4_2
+  uint64_t crc64 = crc;
+  for (; size >= 8; size -= 8, bytes += 8) {
+    uint64_t word;
+    std::memcpy(&word, bytes, sizeof(word));
+    crc64 = _mm_crc32_u64(crc64, word);
+  }
+  crc = static_cast<uint32_t>(crc64);
+  for (; size > 0; size--, bytes++) {
+    crc = _mm_crc32_u8(crc, *bytes);
+  }
+#else
+  static const detail::Crc32cTables tables;
+  const auto &table = tables.table;
+  for (; size >= 8; size -= 8, bytes += 8) {
+    uint64_t word;
+    std::memcpy(&word, bytes, sizeof(word));
+    word ^= crc;
+    crc = table[7][word & 0xFF] ^ table[6][(word >> 8) & 0xFF] ^
+          table[5][(word >> 16) & 0xFF] ^ table[4][(word >> 24) & 0xFF] ^
+          table[3][(word >> 32) & 0xFF] ^ table[2][(word >> 40) & 0xFF] ^
+          table[1][(word >> 48) & 0xFF] ^ table[0][word >> 56];
+  }
+  for (; size > 0; size--, bytes++) {
+    crc = (crc >> 8) ^ table[0][(crc ^ *bytes) & 0xFF];
+  }
+#endif
+  return ~crc;
+}
+
+/**
+ * On-disk layout shared by SectionedFileWriter and SectionedFileReader:
+ *
+ *   [header][section table]  padding  [section 0]  padding  [section 1] ...
+ *
+ * The header holds a magic string, the format version chosen by the caller
+ * and the number of sections. Each section table entry records the id,
+ * offset, size and CRC-32C of a section. Sections start at multiples of the
+ * alignment given to the writer, so that they can be memory-mapped, and can
+ * be read independently of one another.
+ */
+struct SectionedFileHeader {
+  char magic[8];
+  uint32_t version;
+  uint32_t num_sections;
+};
+
+struct SectionEntry {
+  uint32_t id;
+  uint32_t checksum;
+  uint64_t offset;
+  uint64_t size;
+};
+
+static constexpr char SECTIONED_FILE_MAGIC[8] = {'F', 'L', 'A', 'T',
+                                                 'N', 'A', 'V', '\0'};
+
+// Whether `filename` starts with the magic string of a sectioned file. Files
+// written before the sectioned format do not.
+inline bool isSectionedFile(const std::string &filename) {
+  int fd = ::open(filename.c_str(), O_RDONLY);
+  if (fd == -1) {
+    throw std::runtime_error("Unable to open file for reading: " + filename);
+  }
+  char magic[sizeof(SECTIONED_FILE_MAGIC)];
+  bool is_sectioned =
+      ::pread(fd, magic, sizeof(magic), 0) == sizeof(magic) &&
+      std::memcmp(magic, SECTIONED_FILE_MAGIC, sizeof(magic)) == 0;
+  ::close(fd);
+  return is_sectioned;
+}
+
+/**
+ * @brief Writes a sectioned file. Writes are buffered and flushed in large
+ * blocks with write(2); blocks larger than the buffer bypass it.
+ *
+ * Usage:
+ * @code
+ * SectionedFileWriter file(filename, version, alignment);
+ * file.beginSection(id);
+ * file.write(data, size);   // or write through file.stream()
+ * file.endSection();
+ * file.close();
+ * @endcode
+ */
+class SectionedFileWriter {
+  // Forwards what is written to `stream()` into the current section.
+  class StreamBuffer : public std::streambuf {
+    SectionedFileWriter *_file;
+
+  public:
+    explicit StreamBuffer(SectionedFileWriter *file) : _file(file) {}
+
+  protected:
+    int_type overflow(int_type character) override {
+      if (character != traits_type::eof()) {
+        char byte = traits_type::to_char_type(character);
+        _file->write(&byte, 1);
+      }
+      return traits_type::not_eof(character);
+    }
+    std::streamsize xsputn(const char *data, std::streamsize size) override {
+      _file->write(data, size);
+      return size;
+    }
+  };
+
+  static constexpr size_t BUFFER_SIZE = 8 << 20;
+
+  std::string _filename;
+  int _fd = -1;
+  uint32_t _version;
+  size_t _alignment;
+  // Offset in the file of the first byte in `_buffer`.
+  uint64_t _offset;
+  std::vector<char> _buffer;
+  std::vector<SectionEntry> _sections;
+  bool _in_section = false;
+  StreamBuffer _stream_buffer;
+  std::ostream _stream;
+
+public:
+  /**
+   * @param filename The file to (over)write.
+   * @param version Format version stored in the header.
+   * @param alignment Sections start at multiples of this many bytes. The
+   * header and section table must fit in the first `alignment` bytes.
+   */
+  SectionedFileWriter(const std::string &filename, uint32_t version,
+                      size_t alignment)
+      : _filename(filename), _version(version), _alignment(alignment),
+        _offset(alignment), _stream_buffer(this), _stream(&_stream_buffer) {
+    _fd = ::open(filename.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0644);
+    if (_fd == -1) {
+      throw std::runtime_error("Unable to open file for writing: " + filename);
+    }
+    _buffer.reserve(BUFFER_SIZE);
+  }
+
+  SectionedFileWriter(const SectionedFileWriter &) = delete;
+  SectionedFileWriter &operator=(const SectionedFileWriter &) = delete;
+
+  ~SectionedFileWriter() {
+    if (_fd != -1) {
+      ::close(_fd);
+    }
+  }
+
+  void beginSection(uint32_t id) {
+    if (_in_section) {
+      throw std::logic_error("Sections cannot be nested.");
+    }
+    // Pad up to the next aligned offset.
+    uint64_t position = _offset + _buffer.size();
+    uint64_t aligned = (position + _alignment - 1) / _alignment * _alignment;
+    _buffer.resize(_buffer.size() + (aligned - position), 0);
+    _sections.push_back({/* id = */ id, /* checksum = */ 0,
+                         /* offset = */ aligned, /* size = */ 0});
+    _in_section = true;
+  }
+
+  void write(const void *data, size_t size) {
+    if (!_in_section) {
+      throw std::logic_error("Data must be written inside a section.");
+    }
+    SectionEntry &section = _sections.back();
+    section.checksum = crc32c(data, size, section.checksum);
+    section.size += size;
+
+    if (_buffer.size() + size <= BUFFER_SIZE) {
+      const char *bytes = static_cast<const char *>(data);
+      _buffer.insert(_buffer.end(), bytes, bytes + size);
+      return;
+    }
+    flush();
+    writeFully(data, size);
+  }
+
+  // Adaptor for serializers that write to a std::ostream (e.g. cereal).
+  std::ostream &stream() { return _stream; }
+
+  void endSection() {
+    _stream.flush();
+    _in_section = false;
+  }
+
+  // Writes the header and section table and closes the file.
+  void close() {
+    flush();
+    size_t table_size = sizeof(SectionedFileHeader) +
+                        (_sections.size() * sizeof(SectionEntry));
+    if (table_size > _alignment) {
+      throw std::runtime_error("Too many sections in: " + _filename);
+    }
+    SectionedFileHeader header;
+    std::memcpy(header.magic, SECTIONED_FILE_MAGIC, sizeof(header.magic));
+    header.version = _version;
+    header.num_sections = _sections.size();
+
+    std::vector<char> table(_alignment, 0);
+    std::memcpy(table.data(), &header, sizeof(header));
+    std::memcpy(table.data() + sizeof(header), _sections.data(),
+                _sections.size() * sizeof(SectionEntry));
+    if (::lseek(_fd, 0, SEEK_SET) == -1) {
+      throw std::runtime_error("Failed to write index to: " + _filename);
+    }
+    writeFully(table.data(), table.size());
+    if (::close(_fd) != 0) {
+      _fd = -1;
+      throw std::runtime_error("Failed to write index to: " + _filename);
+    }
+    _fd = -1;
+  }
+
+private:
+  void flush() {
+    if (::lseek(_fd, _offset, SEEK_SET) == -1) {
+      throw std::runtime_error("Failed to write index to: " + _filename);
+    }
+    writeFully(_buffer.data(), _buffer.size());
+    _buffer.clear();
+  }
+
+  // Writes at the current file position and advances `_offset`.
+  void writeFully(const void *data, size_t size) {
+    const char *bytes = static_cast<const char *>(data);
+    while (size > 0) {
+      ssize_t written = ::write(_fd, bytes, size);
+      if (written <= 0) {
+        throw std::runtime_error("Failed to write index to: " + _filename);
+      }
+      bytes += written;
+      size -= written;
+      _offset += written;
+    }
+  }
+};
+
+/**
+ * @brief Reads the sections of a file written by SectionedFileWriter. A
+ * section is read sequentially between `beginSection` and `endSection`,
+ * either with `read` or through `stream()` (but not both, since the stream
+ * reads ahead), and `endSection` verifies its checksum.
+ */
+class SectionedFileReader {
+  // Serves the current section to `stream()`.
+  class StreamBuffer : public std::streambuf {
+    SectionedFileReader *_file;
+    std::vector<char> _buffer;
+
+  public:
+    explicit StreamBuffer(SectionedFileReader *file)
+        : _file(file), _buffer(1 << 20) {}
+
+    void reset() { setg(nullptr, nullptr, nullptr); }
+
+  protected:
+    int_type underflow() override {
+      size_t size = std::min<uint64_t>(_buffer.size(), _file->remaining());
+      if (size == 0) {
+        return traits_type::eof();
+      }
+      _file->read(_buffer.data(), size);
+      setg(_buffer.data(), _buffer.data(), _buffer.data() + size);
+      return traits_type::to_int_type(_buffer[0]);
+    }
+  };
+
+  std::string _filename;
+  int _fd = -1;
+  uint32_t _version = 0;
+  std::vector<SectionEntry> _sections;
+  const SectionEntry *_current = nullptr;
+  uint64_t _position = 0;
+  uint32_t _checksum = 0;
+  StreamBuffer _stream_buffer;
+  std::istream _stream;
+
+public:
+  explicit SectionedFileReader(const std::string &filename)
+      : _filename(filename), _stream_buffer(this), _stream(&_stream_buffer) {
+    _fd = ::open(filename.c_str(), O_RDONLY);
+    if (_fd == -1) {
+      throw std::runtime_error("Unable to open file for reading: " + filename);
+    }
+    SectionedFileHeader header;
+    if (::pread(_fd, &header, sizeof(header), 0) != sizeof(header) ||
+        std::memcmp(header.magic, SECTIONED_FILE_MAGIC,
+                    sizeof(header.magic)) != 0) {
+      ::close(_fd);
+      throw std::runtime_error("Not a FlatNav index file, or one written by "
+                               "an older version of FlatNav: " +
+                               filename);
+    }
+    _version = header.version;
+    _sections.resize(header.num_sections);
+    size_t table_size = _sections.size() * sizeof(SectionEntry);
+    if (::pread(_fd, _sections.data(), table_size, sizeof(header)) !=
+        static_cast<ssize_t>(table_size)) {
+      ::close(_fd);
+      throw std::runtime_error("Truncated index file: " + filename);
+    }
+  }
+
+  SectionedFileReader(const SectionedFileReader &) = delete;
+  SectionedFileReader &operator=(const SectionedFileReader &) = delete;
+
+  ~SectionedFileReader() { ::close(_fd); }
+
+  inline uint32_t version() const { return _version; }
+
+  bool hasSection(uint32_t id) const {
+    return std::any_of(_sections.begin(), _sections.end(),
+                       [id](const SectionEntry &s) { return s.id == id; });
+  }
+
+  const SectionEntry &section(uint32_t id) const {
+    for (const SectionEntry &section : _sections) {
+      if (section.id == id) {
+        return section;
+      }
+    }
+    throw std::runtime_error("Missing section " + std::to_string(id) +
+                             " in index file: " + _filename);
+  }
+
+  void beginSection(uint32_t id) {
+    _current = &section(id);
+    _position = 0;
+    _checksum = 0;
+    _stream_buffer.reset();
+    _stream.clear();
+  }
+
+  inline uint64_t remaining() const { return _current->size - _position; }
+
+  void read(void *destination, size_t size) {
+    if (size > remaining()) {
+      throw std::runtime_error("Read past the end of section " +
+                               std::to_string(_current->id) +
+                               " in index file: " + _filename);
+    }
+    char *bytes = static_cast<char *>(destination);
+    size_t total = size;
+    while (size > 0) {
+      ssize_t num_read = ::pread(_fd, bytes, size,
+                                 _current->offset + _position);
+      if (num_read <= 0) {
+        throw std::runtime_error("Unexpected end of file while reading: " +
+                                 _filename);
+      }
+      bytes += num_read;
+      size -= num_read;
+      _position += num_read;
+    }
+    _checksum = crc32c(destination, total, _checksum);
+  }
+
+  // Adaptor for deserializers that read from a std::istream (e.g. cereal).
+  std::istream &stream() { return _stream; }
+
+  // Reads whatever is left of the section and verifies its checksum.
+  void endSection() {
+    std::vector<char> rest(std::min<uint64_t>(remaining(), 1 << 20));
+    while (remaining() > 0) {
+      read(rest.data(), std::min<uint64_t>(rest.size(), remaining()));
+    }
+    if (_checksum != _current->checksum) {
+      throw std::runtime_error("Checksum mismatch in section " +
+                               std::to_string(_current->id) +
+                               " of index file: " + _filename);
+    }
+    _current = nullptr;
+  }
+};
+
+} // namespace flatnav::util
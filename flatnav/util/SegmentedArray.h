@@ -0,0 +1,150 @@
+#pragma once
+
+#include <algorithm>
+#include <atomic>
+#include <cstddef>
+#include <memory>
+#include <vector>
+
+namespace flatnav::util {
+
+/**
+ * Array of fixed-size elements stored in equally sized segments that never
+ * move once allocated. Each element is `stride` consecutive values of type T,
+ * and each segment holds a power of two number of elements, so looking up an
+ * element costs one extra load compared to a flat array.
+ *
+ * The array can grow while other threads read it: the segment directory is
+ * published atomically and directories that have been outgrown are kept
+ * alive until the array is cleared. Growing must be serialized by the caller.
+ *
+ * Segments are either allocated by the array itself or attached from memory
+ * owned by someone else (e.g. a memory-mapped file).
+ */
+template <typename T> class SegmentedArray {
+  // Elements per segment, as a power of two.
+  size_t _segment_shift = 0;
+  size_t _stride = 1;
+  bool _zero_initialize = true;
+
+  std::atomic<T **> _directory = nullptr;
+  size_t _num_segments = 0;
+  size_t _directory_capacity = 0;
+  // Every directory ever allocated, the current one last.
+  std::vector<std::unique_ptr<T *[]>> _directories;
+  std::vector<std::unique_ptr<T[]>> _owned_segments;
+
+public:
+  // Segments hold between 2^10 and 2^16 elements.
+  static constexpr size_t MIN_SEGMENT_SHIFT = 10;
+  static constexpr size_t MAX_SEGMENT_SHIFT = 16;
+
+  // Picks a segment size for an array expected to hold about `num_elements`
+  // elements: the smallest power of two that fits them, within the bounds
+  // above.
+  static size_t segmentShiftFor(size_t num_elements) {
+    size_t shift = MIN_SEGMENT_SHIFT;
+    while (shift < MAX_SEGMENT_SHIFT && (size_t(1) << shift) < num_elements) {
+      shift++;
+    }
+    return shift;
+  }
+
+  SegmentedArray() = default;
+
+  /**
+   * @param segment_shift Each segment holds 2^segment_shift elements.
+   * @param stride Number of values of type T per element.
+   * @param zero_initialize Whether allocated segments are zero-filled. Leaving
+   * them uninitialized lets the OS commit their pages lazily.
+   */
+  SegmentedArray(size_t segment_shift, size_t stride = 1,
+                 bool zero_initialize = true)
+      : _segment_shift(segment_shift), _stride(stride),
+        _zero_initialize(zero_initialize) {}
+
+  SegmentedArray(const SegmentedArray &) = delete;
+  SegmentedArray &operator=(const SegmentedArray &) = delete;
+
+  SegmentedArray(SegmentedArray &&other) noexcept { *this = std::move(other); }
+
+  SegmentedArray &operator=(SegmentedArray &&other) noexcept {
+    if (this != &other) {
+      _segment_shift = other._segment_shift;
+      _stride = other._stride;
+      _zero_initialize = other._zero_initialize;
+      _directory = other._directory.load();
+      _num_segments = other._num_segments;
+      _directory_capacity = other._directory_capacity;
+      _directories = std::move(other._directories);
+      _owned_segments = std::move(other._owned_segments);
+
+      other._directory = nullptr;
+      other._num_segments = 0;
+      other._directory_capacity = 0;
+    }
+    return *this;
+  }
+
+  // Pointer to the first value of element `index`.
+  inline T *at(size_t index) const {
+    T **directory = _directory.load(std::memory_order_acquire);
+    return directory[index >> _segment_shift] +
+           ((index & (segmentSize() - 1)) * _stride);
+  }
+
+  inline T &operator[](size_t index) const { return *at(index); }
+
+  inline size_t segmentSize() const { return size_t(1) << _segment_shift; }
+  inline size_t numSegments() const { return _num_segments; }
+  inline size_t capacity() const { return _num_segments << _segment_shift; }
+  inline bool empty() const { return _num_segments == 0; }
+
+  // Size in bytes of the segments allocated by the array.
+  inline size_t allocatedBytes() const {
+    return _owned_segments.size() * segmentSize() * _stride * sizeof(T);
+  }
+
+  // Allocates segments until the array can hold `num_elements` elements.
+  void grow(size_t num_elements) {
+    while (capacity() < num_elements) {
+      size_t segment_length = segmentSize() * _stride;
+      _owned_segments.emplace_back(_zero_initialize ? new T[segment_length]()
+                                                    : new T[segment_length]);
+      appendSegment(_owned_segments.back().get());
+    }
+  }
+
+  // Appends a segment of `segmentSize() * stride` values that the array does
+  // not own.
+  void attach(T *segment) { appendSegment(segment); }
+
+  // Releases all segments. The segment size and stride are kept.
+  void clear() {
+    _directory = nullptr;
+    _num_segments = 0;
+    _directory_capacity = 0;
+    _directories.clear();
+    _owned_segments.clear();
+  }
+
+private:
+  void appendSegment(T *segment) {
+    if (_num_segments == _directory_capacity) {
+      size_t capacity = std::max<size_t>(8, 2 * _directory_capacity);
+      std::unique_ptr<T *[]> directory(new T *[capacity]);
+      std::copy_n(_directory.load(std::memory_order_relaxed), _num_segments,
+                  directory.get());
+      directory[_num_segments] = segment;
+      // Readers may still hold the old directory, so it is not freed.
+      _directory.store(directory.get(), std::memory_order_release);
+      _directories.push_back(std::move(directory));
+      _directory_capacity = capacity;
+    } else {
+      _directories.back()[_num_segments] = segment;
+    }
+    _num_segments++;
+  }
+};
+
+} // namespace flatnav::util
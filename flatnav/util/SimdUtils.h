@@ -366,4 +366,20 @@ struct simd16float32 : public simd512bit {
 
 #endif // USE_AVX512
 
+#if defined(USE_AVX2)
+// Loads 8 consecutive 8-bit scalar quantization codes as floats.
+inline simd8float32 loadSq8Codes(const uint8_t *codes) {
+  __m128i bytes = _mm_loadl_epi64(reinterpret_cast<const __m128i *>(codes));
+  return simd8float32(_mm256_cvtepi32_ps(_mm256_cvtepu8_epi32(bytes)));
+}
+#endif // USE_AVX2
+
+#if defined(USE_F16C)
+// Loads 8 consecutive half-precision floats as single-precision floats.
+inline simd8float32 loadFp16(const uint16_t *values) {
+  return simd8float32(_mm256_cvtph_ps(
+      _mm_loadu_si128(reinterpret_cast<const __m128i *>(values))));
+}
+#endif // USE_F16C
+
 } // namespace flatnav::util
@@ -288,4 +288,105 @@ static float computeL2_SseWithResidual_4(const void *x, const void *y,
 
 #endif // USE_SSE
 
-} // namespace flatnav::util
\ No newline at end of file
+#if defined(USE_AVX2)
+
+/**
+ * Squared L2 distance between a float vector `x` and a vector `y` of 8-bit
+ * scalar quantization codes, where code c in dimension i decodes to
+ * `offset[i] + scale[i] * c`.
+ */
+static float computeL2_Avx2_Sq8(const float *x, const uint8_t *y,
+                                const float *offset, const float *scale,
+                                const size_t &dimension) {
+  size_t aligned_dimension = dimension & ~7;
+  simd8float32 difference, v1, v2;
+  simd8float32 sum(0.0f);
+
+  for (size_t i = 0; i < aligned_dimension; i += 8) {
+    v1.loadu(x + i);
+    v2 = simd8float32(offset + i) + simd8float32(scale + i) * loadSq8Codes(y + i);
+    difference = v1 - v2;
+    sum += difference * difference;
+  }
+
+  float residual_sum = 0.0f;
+  for (size_t i = aligned_dimension; i < dimension; i++) {
+    float difference = x[i] - (offset[i] + scale[i] * y[i]);
+    residual_sum += difference * difference;
+  }
+  return sum.reduce_add() + residual_sum;
+}
+
+/**
+ * Squared L2 distance between two vectors of 8-bit scalar quantization codes
+ * that share the same per-dimension `scale`. The offsets cancel out.
+ */
+static float computeL2_Avx2_Sq8Codes(const uint8_t *x, const uint8_t *y,
+                                     const float *scale,
+                                     const size_t &dimension) {
+  size_t aligned_dimension = dimension & ~7;
+  simd8float32 difference;
+  simd8float32 sum(0.0f);
+
+  for (size_t i = 0; i < aligned_dimension; i += 8) {
+    difference =
+        simd8float32(scale + i) * (loadSq8Codes(x + i) - loadSq8Codes(y + i));
+    sum += difference * difference;
+  }
+
+  float residual_sum = 0.0f;
+  for (size_t i = aligned_dimension; i < dimension; i++) {
+    float difference = scale[i] * (static_cast<float>(x[i]) - y[i]);
+    residual_sum += difference * difference;
+  }
+  return sum.reduce_add() + residual_sum;
+}
+
+#endif // USE_AVX2
+
+#if defined(USE_F16C)
+
+// Squared L2 distance between a float vector and a half-precision vector.
+static float computeL2_Avx_Fp16(const float *x, const uint16_t *y,
+                                const size_t &dimension) {
+  size_t aligned_dimension = dimension & ~7;
+  simd8float32 difference, v1;
+  simd8float32 sum(0.0f);
+
+  for (size_t i = 0; i < aligned_dimension; i += 8) {
+    v1.loadu(x + i);
+    difference = v1 - loadFp16(y + i);
+    sum += difference * difference;
+  }
+
+  float residual_sum = 0.0f;
+  for (size_t i = aligned_dimension; i < dimension; i++) {
+    float difference = x[i] - _cvtsh_ss(y[i]);
+    residual_sum += difference * difference;
+  }
+  return sum.reduce_add() + residual_sum;
+}
+
+// Squared L2 distance between two half-precision vectors.
+static float computeL2_Avx_Fp16Codes(const uint16_t *x, const uint16_t *y,
+                                     const size_t &dimension) {
+  size_t aligned_dimension = dimension & ~7;
+  simd8float32 difference;
+  simd8float32 sum(0.0f);
+
+  for (size_t i = 0; i < aligned_dimension; i += 8) {
+    difference = loadFp16(x + i) - loadFp16(y + i);
+    sum += difference * difference;
+  }
+
+  float residual_sum = 0.0f;
+  for (size_t i = aligned_dimension; i < dimension; i++) {
+    float difference = _cvtsh_ss(x[i]) - _cvtsh_ss(y[i]);
+    residual_sum += difference * difference;
+  }
+  return sum.reduce_add() + residual_sum;
+}
+
+#endif // USE_F16C
+
+} // namespace flatnav::util
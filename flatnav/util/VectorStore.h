@@ -0,0 +1,307 @@
+#pragma once
+
+#include <algorithm>
+#include <cereal/access.hpp>
+#include <cereal/cereal.hpp>
+#include <cereal/types/string.hpp>
+#include <cstdint>
+#include <cstring>
+#include <fcntl.h>
+#include <flatnav/util/SegmentedArray.h>
+#include <stdexcept>
+#include <string>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <utility>
+#include <vector>
+
+namespace flatnav::util {
+
+/**
+ * Fixed-size array of float vectors indexed by node id. The vectors either
+ * live on the heap or in a separate file that is memory-mapped, so that an
+ * index can keep only compressed codes in RAM and page full-precision vectors
+ * in from disk when they are actually read.
+ *
+ * A heap-backed store is saved with the index. A file-backed store only
+ * records the file name; the file itself is the storage and has to be kept
+ * next to the saved index.
+ *
+ * Vectors are kept in segments (one mapping per segment for file-backed
+ * stores), so the store can grow without moving the vectors already in it.
+ */
+class VectorStore {
+  SegmentedArray<float> _vectors;
+  size_t _num_vectors = 0;
+  size_t _dim = 0;
+  // Empty for a heap-backed store.
+  std::string _filename;
+  // Regions mapped for a file-backed store, as (address, length) pairs.
+  std::vector<std::pair<void *, size_t>> _mappings;
+  bool _writable = true;
+
+public:
+  VectorStore() = default;
+
+  VectorStore(const VectorStore &) = delete;
+  VectorStore &operator=(const VectorStore &) = delete;
+
+  VectorStore(VectorStore &&other) noexcept { *this = std::move(other); }
+
+  VectorStore &operator=(VectorStore &&other) noexcept {
+    if (this != &other) {
+      release();
+      _vectors = std::move(other._vectors);
+      _num_vectors = other._num_vectors;
+      _dim = other._dim;
+      _filename = std::move(other._filename);
+      _mappings = std::move(other._mappings);
+      _writable = other._writable;
+
+      other._num_vectors = 0;
+      other._mappings.clear();
+    }
+    return *this;
+  }
+
+  ~VectorStore() { release(); }
+
+  /**
+   * @brief Allocates room for `num_vectors` vectors of dimension `dim`. If
+   * `filename` is empty, the vectors are kept on the heap. Otherwise the file
+   * is created (or truncated) to hold them and mapped read-write.
+   */
+  void allocate(size_t num_vectors, size_t dim,
+                const std::string &filename = "") {
+    release();
+    _num_vectors = 0;
+    _dim = dim;
+    _filename = filename;
+    _writable = true;
+    _vectors = SegmentedArray<float>(
+        /* segment_shift = */ SegmentedArray<float>::segmentShiftFor(
+            num_vectors),
+        /* stride = */ _dim);
+
+    if (!_filename.empty()) {
+      int fd = ::open(_filename.c_str(), O_RDWR | O_CREAT | O_TRUNC, 0644);
+      if (fd == -1) {
+        throw std::runtime_error("Unable to create vector file: " + _filename);
+      }
+      ::close(fd);
+    }
+    resize(num_vectors);
+  }
+
+  /**
+   * @brief Grows the store to `num_vectors` vectors. Vectors already in the
+   * store keep their address, so this can run while other threads read them.
+   * A file-backed store extends its file and maps the new part.
+   */
+  void resize(size_t num_vectors) {
+    if (num_vectors <= _num_vectors) {
+      return;
+    }
+    if (_filename.empty()) {
+      _vectors.grow(num_vectors);
+      _num_vectors = num_vectors;
+      return;
+    }
+    int fd = ::open(_filename.c_str(), O_RDWR);
+    if (fd == -1) {
+      throw std::runtime_error("Unable to open vector file: " + _filename);
+    }
+    if (::ftruncate(fd, num_vectors * _dim * sizeof(float)) == -1) {
+      ::close(fd);
+      throw std::runtime_error("Unable to resize vector file: " + _filename);
+    }
+    _num_vectors = num_vectors;
+    mapSegments(/* fd = */ fd, /* writable = */ true);
+  }
+
+  /**
+   * @brief Maps the file of a file-backed store whose metadata was just
+   * deserialized. Does nothing for heap-backed stores.
+   *
+   * @param writable If false, the file is mapped read-only and `set` throws.
+   */
+  void open(bool writable) {
+    if (_filename.empty() || _num_vectors == 0) {
+      return;
+    }
+    int fd = ::open(_filename.c_str(), writable ? O_RDWR : O_RDONLY);
+    if (fd == -1) {
+      throw std::runtime_error("Unable to open vector file: " + _filename);
+    }
+    struct stat file_stat;
+    if (::fstat(fd, &file_stat) == -1 ||
+        static_cast<size_t>(file_stat.st_size) < sizeInBytes()) {
+      ::close(fd);
+      throw std::runtime_error("Vector file is smaller than expected: " +
+                               _filename);
+    }
+    mapSegments(/* fd = */ fd, /* writable = */ writable);
+  }
+
+  inline bool empty() const { return _num_vectors == 0; }
+  inline bool isFileBacked() const { return !_filename.empty(); }
+  inline const std::string &filename() const { return _filename; }
+  inline size_t dimension() const { return _dim; }
+  inline size_t sizeInBytes() const {
+    return _num_vectors * _dim * sizeof(float);
+  }
+
+  inline const float *get(size_t index) const { return _vectors.at(index); }
+
+  void set(size_t index, const void *vector) {
+    if (!_writable) {
+      throw std::runtime_error("Cannot modify vector file `" + _filename +
+                               "` since it is mapped read-only.");
+    }
+    std::memcpy(_vectors.at(index), vector, _dim * sizeof(float));
+  }
+
+  // Moves the vector at index i to index P[i], for i < count. The cycles of
+  // P are followed in place, so only two vectors are buffered.
+  template <typename node_id_t>
+  void permute(const std::vector<node_id_t> &P, size_t count) {
+    std::vector<float> carried(_dim), displaced(_dim);
+    std::vector<bool> moved(count, false);
+    for (size_t i = 0; i < count; i++) {
+      if (moved[i] || P[i] == i) {
+        continue;
+      }
+      std::memcpy(carried.data(), get(i), _dim * sizeof(float));
+      for (size_t dest = P[i]; !moved[dest]; dest = P[dest]) {
+        moved[dest] = true;
+        std::memcpy(displaced.data(), get(dest), _dim * sizeof(float));
+        set(dest, carried.data());
+        std::swap(carried, displaced);
+      }
+    }
+  }
+
+  /**
+   * @brief Returns a copy of the first `count` vectors, to be saved with
+   * `save(archive, count)` later while this store keeps changing. The copy is
+   * always heap-backed: the file of a file-backed store keeps changing after
+   * the snapshot, so the copy is saved with the vectors rather than the file
+   * name.
+   */
+  VectorStore snapshot(size_t count) {
+    VectorStore copy;
+    copy._num_vectors = _num_vectors;
+    copy._dim = _dim;
+    copy._vectors = SegmentedArray<float>(
+        /* segment_shift = */ SegmentedArray<float>::segmentShiftFor(
+            _num_vectors),
+        /* stride = */ _dim);
+    count = std::min(count, _num_vectors);
+    copy._vectors.grow(count);
+    for (size_t first = 0; first < count; first += _vectors.segmentSize()) {
+      size_t num_vectors = std::min(_vectors.segmentSize(), count - first);
+      std::memcpy(copy._vectors.at(first), _vectors.at(first),
+                  num_vectors * _dim * sizeof(float));
+    }
+    return copy;
+  }
+
+  // Writes dirty pages of a file-backed store back to disk.
+  void flush() {
+    if (!_writable) {
+      return;
+    }
+    for (auto &[address, length] : _mappings) {
+      ::msync(address, length, MS_SYNC);
+    }
+  }
+
+  void release() {
+    for (auto &[address, length] : _mappings) {
+      ::munmap(address, length);
+    }
+    _mappings.clear();
+    _vectors.clear();
+  }
+
+  /**
+   * @brief Writes the store to `archive`. A heap-backed store writes its
+   * first `count` vectors; the rest are zero when it is loaded. A file-backed
+   * store only writes the file name.
+   */
+  template <typename Archive> void save(Archive &archive, size_t count) {
+    archive(_num_vectors, _dim, _filename);
+    if (isFileBacked()) {
+      return;
+    }
+    uint64_t num_saved = std::min(count, _num_vectors);
+    archive(num_saved);
+    // The vectors are written back to back, one segment at a time.
+    for (size_t first = 0; first < num_saved;
+         first += _vectors.segmentSize()) {
+      size_t num_vectors = std::min(_vectors.segmentSize(), num_saved - first);
+      archive(cereal::binary_data(_vectors.at(first),
+                                  num_vectors * _dim * sizeof(float)));
+    }
+  }
+
+  // Reads a store written by `save`. File-backed stores must then be opened.
+  template <typename Archive> void load(Archive &archive) {
+    release();
+    archive(_num_vectors, _dim, _filename);
+    _vectors = SegmentedArray<float>(
+        /* segment_shift = */ SegmentedArray<float>::segmentShiftFor(
+            _num_vectors),
+        /* stride = */ _dim);
+    if (isFileBacked()) {
+      return;
+    }
+    _vectors.grow(_num_vectors);
+    uint64_t num_saved;
+    archive(num_saved);
+    for (size_t first = 0; first < num_saved;
+         first += _vectors.segmentSize()) {
+      size_t num_vectors = std::min(_vectors.segmentSize(), num_saved - first);
+      archive(cereal::binary_data(_vectors.at(first),
+                                  num_vectors * _dim * sizeof(float)));
+    }
+  }
+
+private:
+  // Maps the segments of the file that are not mapped yet, each in its own
+  // region so that earlier segments never move. Takes ownership of `fd`.
+  void mapSegments(int fd, bool writable) {
+    int protection = writable ? PROT_READ | PROT_WRITE : PROT_READ;
+    size_t segment_bytes = _vectors.segmentSize() * _dim * sizeof(float);
+    size_t page_size = ::sysconf(_SC_PAGESIZE);
+
+    while (_vectors.capacity() < _num_vectors) {
+      // Segments start at page boundaries unless the segment size is not a
+      // multiple of the page size, in which case the mapping starts a little
+      // earlier.
+      size_t offset = _vectors.numSegments() * segment_bytes;
+      size_t mapping_offset = offset / page_size * page_size;
+      size_t length = segment_bytes + (offset - mapping_offset);
+      void *region =
+          ::mmap(/* addr = */ nullptr, /* length = */ length,
+                 /* prot = */ protection, /* flags = */ MAP_SHARED,
+                 /* fd = */ fd, /* offset = */ mapping_offset);
+      if (region == MAP_FAILED) {
+        ::close(fd);
+        throw std::runtime_error("Unable to memory-map vector file: " +
+                                 _filename);
+      }
+      // Only the few vectors of each query's final candidates are read.
+      ::madvise(region, length, MADV_RANDOM);
+      _mappings.emplace_back(region, length);
+      _vectors.attach(reinterpret_cast<float *>(static_cast<char *>(region) +
+                                                (offset - mapping_offset)));
+    }
+    // The mappings keep their own reference to the file.
+    ::close(fd);
+    _writable = writable;
+  }
+};
+
+} // namespace flatnav::util
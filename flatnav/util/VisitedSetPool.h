@@ -2,6 +2,8 @@
 
 // #include <flatnav/util/SIMDDistanceSpecializations.h>
 
+#include <algorithm>
+#include <atomic>
 #include <cstring>
 #include <flatnav/util/Macros.h>
 #include <iostream>
@@ -17,15 +19,15 @@ class VisitedSet {
 private:
   uint8_t _mark;
   uint8_t *_table;
-  uint32_t _table_size;
+  size_t _table_size;
 
 public:
-  VisitedSet(const uint32_t size) : _mark(1), _table_size(size) {
+  VisitedSet(const size_t size) : _mark(1), _table_size(size) {
     // initialize values to 0
     _table = new uint8_t[_table_size]();
   }
 
-  inline void prefetch(const uint32_t num) const {
+  inline void prefetch(const size_t num) const {
 #ifdef USE_SSE
     _mm_prefetch(reinterpret_cast<const char *>(&_table[num]), _MM_HINT_T0);
 #endif
@@ -33,9 +35,19 @@ public:
 
   inline uint8_t getMark() const { return _mark; }
 
-  inline void insert(const uint32_t num) { _table[num] = _mark; }
+  inline void insert(const size_t num) { _table[num] = _mark; }
 
-  inline uint32_t size() const { return _table_size; }
+  inline size_t size() const { return _table_size; }
+
+  // Grows the table to `size` entries. Nothing is marked visited afterwards.
+  inline void resize(const size_t size) {
+    if (size <= _table_size) {
+      return;
+    }
+    delete[] _table;
+    _table_size = size;
+    _table = new uint8_t[_table_size]();
+  }
 
   inline void clear() {
     _mark++;
@@ -45,7 +57,7 @@ public:
     }
   }
 
-  inline bool isVisited(const uint32_t num) const {
+  inline bool isVisited(const size_t num) const {
     return _table[num] == _mark;
   }
 
@@ -137,11 +149,12 @@ public:
 class VisitedSetPool {
   std::vector<VisitedSet *> _visisted_set_pool;
   std::mutex _pool_guard;
-  uint32_t _num_elements;
+  // Grows with the index. Sets smaller than this are resized when polled.
+  std::atomic<size_t> _num_elements;
   uint32_t _max_pool_size;
 
 public:
-  VisitedSetPool(uint32_t initial_pool_size, uint32_t num_elements,
+  VisitedSetPool(uint32_t initial_pool_size, size_t num_elements,
                  uint32_t max_pool_size = std::thread::hardware_concurrency())
       : _visisted_set_pool(initial_pool_size), _num_elements(num_elements),
         _max_pool_size(max_pool_size) {
@@ -165,6 +178,7 @@ public:
     if (!_visisted_set_pool.empty()) {
       auto *visited_set = _visisted_set_pool.back();
       _visisted_set_pool.pop_back();
+      visited_set->resize(/* size = */ _num_elements);
       return visited_set;
     } else {
       return new VisitedSet(/* size = */ _num_elements);
@@ -173,6 +187,14 @@ public:
 
   size_t poolSize() const { return _visisted_set_pool.size(); }
 
+  inline size_t numElements() const { return _num_elements.load(); }
+
+  // Sets polled from now on have at least `num_elements` entries. Sets that
+  // are currently in use keep their size until they are polled again.
+  void setNumElements(size_t num_elements) {
+    _num_elements = std::max(_num_elements.load(), num_elements);
+  }
+
   void pushVisitedSet(VisitedSet *visited_set) {
     std::unique_lock<std::mutex> lock(_pool_guard);
 
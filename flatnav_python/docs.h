@@ -8,6 +8,8 @@ static const char *ADD_DOCSTRING = R"pbdoc(
 Add vectors(data) to the index with the given `ef_construction` parameter and optional labels. 
 `ef_construction` determines how many vertices are visited while inserting every vector in 
 the underlying graph structure.
+The GIL is released while vectors are inserted. Several Python threads may add to the same 
+index at once, and other threads may search it meanwhile.
 Args:
     data (np.ndarray): The data to add to the index.
     ef_construction (int): The number of vertices to visit while inserting every vector in the graph.
@@ -17,6 +19,40 @@ Returns:
     None
 )pbdoc";
 
+static const char *ADD_FROM_FILE_DOCSTRING = R"pbdoc(
+Add the vectors of an on-disk dataset to the index, reading `chunk_size` vectors at a time
+and converting each chunk to the data type of the index. Only the index and two chunks are
+held in memory, and the next chunk is read while the current one is added. Vectors are
+labeled consecutively from `first_label` in file order. With `auto_grow`, the index is
+grown once to fit the whole file.
+Args:
+    path (str): The dataset file.
+    ef_construction (int): The number of vertices to visit while inserting every vector in the graph.
+    format (str, optional): One of "fbin", "u8bin", "i8bin", "fvecs", "bvecs" or "npy".
+        Defaults to the extension of `path`.
+    chunk_size (int, optional): The number of vectors read and added at a time. Defaults to 100000.
+    num_initializations (int, optional): The number of initializations to perform. Defaults to 100.
+    first_label (int, optional): The label of the first vector. Defaults to one more than the
+        largest label in the index, or 0 if it is empty, so that no label is used twice.
+Returns:
+    None
+)pbdoc";
+
+static const char *ADD_STREAM_DOCSTRING = R"pbdoc(
+Add vectors to the index from an iterable of 2-D arrays, one chunk at a time, so that the
+whole dataset never has to be in memory. Each chunk is converted to the data type of the
+index separately. Items may also be `(data, labels)` pairs. Otherwise vectors are labeled
+consecutively from `first_label` in stream order.
+Args:
+    chunks (Iterable[np.ndarray]): The chunks of vectors to add.
+    ef_construction (int): The number of vertices to visit while inserting every vector in the graph.
+    num_initializations (int, optional): The number of initializations to perform. Defaults to 100.
+    first_label (int, optional): The label of the first vector. Defaults to one more than the
+        largest label in the index, or 0 if it is empty, so that no label is used twice.
+Returns:
+    None
+)pbdoc";
+
 static const char *ALLOCATE_NODES_DOCSTRING = R"pbdoc(
 Allocate nodes in the underlying graph structure for the given data. Unlike the add method, 
 this method does not construct the edge connectivity. It only allocates memory for each node 
@@ -32,14 +68,20 @@ static const char *SEARCH_SINGLE_DOCSTRING = R"pbdoc(
 Return top `K` closest data points for the given `query`. The results are returned as a Tuple of 
 distances and label ID's. The `ef_search` parameter determines how many neighbors are visited 
 while finding the closest neighbors for the query.
+The search runs without the GIL, so a thread pool of Python workers can serve queries from the 
+same index in parallel, including while other threads add vectors or save the index.
 
 Args:
     query (np.ndarray): The query vector.
     K (int): The number of neighbors to return.
     ef_search (int): The number of neighbors to visit while finding the closest neighbors for the query.
     num_initializations (int, optional): The number of initializations to perform. Defaults to 100.
+    allowed_labels (Optional[np.ndarray], optional): Restricts the results to an allow-list, given either 
+        as a boolean mask indexed by label or as an array of allowed labels. Very selective 
+        allow-lists are answered with an exhaustive scan. Defaults to None.
 Returns:
-    Tuple[np.ndarray, np.ndarray]: The distances and label ID's of the closest neighbors.
+    Tuple[np.ndarray, np.ndarray]: The distances and label ID's of the closest neighbors. If fewer than `K` 
+        neighbors are found, the remaining entries have label -1 and an infinite distance.
 )pbdoc";
 
 static const char *SEARCH_DOCSTRING = R"pbdoc(
@@ -47,14 +89,150 @@ This is a batched version of the `search_single` method.
 Return top `K` closest data points for every query in the provided `queries`. The results are returned as a Tuple of
 distances and label ID's. The `ef_search` parameter determines how many neighbors are visited while finding the closest neighbors
 for every query.
+Queries are processed in chunks, so `queries` can be a `np.memmap` of a query set larger than memory. 
+With `out_distances` and `out_labels`, results are written into existing arrays (for instance 
+memory-mapped ones) instead of newly allocated ones.
+Like `search_single`, this releases the GIL while searching and is safe to call from several 
+Python threads at once.
 
 Args:
     queries (np.ndarray): The query vectors.
     K (int): The number of neighbors to return.
     ef_search (int): The number of neighbors to visit while finding the closest neighbors for every query.
     num_initializations (int, optional): The number of initializations to perform. Defaults to 100.
+    allowed_labels (Optional[np.ndarray], optional): Restricts the results to an allow-list, given either 
+        as a boolean mask indexed by label or as an array of allowed labels. The same allow-list applies 
+        to every query. Defaults to None.
+    out_distances (Optional[np.ndarray], optional): A writeable, C-contiguous float32 array of shape 
+        (num_queries, K) to write the distances to. Defaults to None, to allocate a new array.
+    out_labels (Optional[np.ndarray], optional): A writeable, C-contiguous label array of shape 
+        (num_queries, K) to write the labels to. Defaults to None, to allocate a new array.
+Returns:
+    Tuple[np.ndarray, np.ndarray]: The distances and label ID's of the closest neighbors. If fewer than `K` 
+        neighbors are found, the remaining entries have label -1 and an infinite distance. These are 
+        `out_distances` and `out_labels` when given.
+)pbdoc";
+
+static const char *RANGE_SEARCH_DOCSTRING = R"pbdoc(
+Return every data point within `radius` of each query, closest first. The search starts with a 
+beam of `ef_search` neighbors. The beam grows whenever it fills up with points within the radius, 
+and the search then keeps expanding the closest points for as long as they are within the radius, 
+so the number of results is not bounded by `ef_search`. With re-ranking, a point whose approximate 
+distance is beyond the radius is checked with its exact distance before the search stops on it. 
+Queries are searched in parallel.
+
+Args:
+    queries (np.ndarray): The query vectors.
+    radius (float): The largest distance of a result, in the units returned by `search`.
+    max_results (Optional[int], optional): Return at most this many results (the closest) per query. 
+        Defaults to None, for no limit.
+    ef_search (int, optional): The initial search beam width. Defaults to 100.
+    num_initializations (int, optional): The number of initializations to perform. Defaults to 100.
+    allowed_labels (Optional[np.ndarray], optional): Restricts the results to an allow-list, given either 
+        as a boolean mask indexed by label or as an array of allowed labels. Defaults to None.
+Returns:
+    Tuple[np.ndarray, np.ndarray, np.ndarray]: `lims`, `distances` and `labels`. The results of query `i` 
+        are `distances[lims[i]:lims[i + 1]]` and `labels[lims[i]:lims[i + 1]]`.
+)pbdoc";
+
+static const char *KNN_GRAPH_DOCSTRING = R"pbdoc(
+Compute the approximate `K` nearest neighbors of every vector in the index, entirely in C++. Each 
+vector is searched for starting from its own node, and the vector itself is left out of its neighbors. 
+Removed vectors are skipped. Rows are computed in parallel and ordered by label, so with labels 
+`0..N-1` row `i` holds the neighbors of label `i`.
+Quantized indices need re-ranking, since the vectors are otherwise not stored.
+
+Args:
+    K (int): The number of neighbors per vector.
+    ef_search (int): The search beam width.
+    distances (Optional[np.ndarray], optional): A float32 array of shape (num_vectors, K) to write the 
+        distances to, such as a `np.memmap`. Defaults to None, to allocate a new array.
+    labels (Optional[np.ndarray], optional): A label array of shape (num_vectors, K) to write the 
+        neighbor labels to. Defaults to None, to allocate a new array.
+Returns:
+    Tuple[np.ndarray, np.ndarray, np.ndarray]: The distances and labels of the neighbors of every row, 
+        sorted by distance, and the label of every row. Rows with fewer than `K` neighbors are padded 
+        with label -1 and an infinite distance.
+)pbdoc";
+
+static const char *REMOVE_DOCSTRING = R"pbdoc(
+Soft-delete the vector with the given label. The underlying node keeps routing searches 
+but is never returned as a result. Call `repair_deleted_nodes` to re-link its neighbors and 
+make its slot available to subsequent `add` calls.
+Args:
+    label (int): The label of the vector to remove.
+Returns:
+    None
+)pbdoc";
+
+static const char *CONTAINS_DOCSTRING = R"pbdoc(
+Check which of the given labels belong to vectors in the index. Removed vectors are not
+contained. A single label can be checked with `label in index`.
+Args:
+    labels (np.ndarray): A 1-D array of labels.
 Returns:
-    Tuple[np.ndarray, np.ndarray]: The distances and label ID's of the closest neighbors.
+    np.ndarray: A boolean array with the same length as `labels`.
+)pbdoc";
+
+static const char *GET_VECTOR_DOCSTRING = R"pbdoc(
+Return the vector stored under the given label. Labels are looked up in a hash map that the
+index keeps up to date, including across re-ordering, so this takes constant time. Quantized
+indices return their full-precision re-rank vectors, so re-ranking must be enabled for them.
+Args:
+    label (int): The label of the vector.
+Returns:
+    np.ndarray: The vector, with the data type of the index.
+)pbdoc";
+
+static const char *GET_VECTORS_DOCSTRING = R"pbdoc(
+Return the vectors stored under the given labels. See `get_vector`.
+Args:
+    labels (np.ndarray): A 1-D array of labels.
+Returns:
+    np.ndarray: An array of shape (len(labels), dim) with the data type of the index.
+)pbdoc";
+
+static const char *UPDATE_DOCSTRING = R"pbdoc(
+Replace the vector stored under the given label and re-link it in the graph.
+Args:
+    data (np.ndarray): The new vector.
+    label (int): The label of the vector to update.
+    ef_construction (int): The number of vertices to visit while searching for the new neighbors.
+    num_initializations (int, optional): The number of initializations to perform. Defaults to 100.
+Returns:
+    None
+)pbdoc";
+
+static const char *REPAIR_DELETED_NODES_DOCSTRING = R"pbdoc(
+Re-link the neighbors of all vectors removed since the last repair and free their slots for reuse. 
+This releases the GIL, so it can run on a background thread while the index keeps serving queries
+and inserting vectors. Insertions are only paused while the slots are freed. A slot that a vector
+inserted meanwhile links to is freed by the next repair instead.
+Returns:
+    None
+)pbdoc";
+
+static const char *REFINE_GRAPH_DOCSTRING = R"pbdoc(
+Re-link every node, as the second pass of Vamana's two-pass construction does. Each node searches
+the graph for its own vector, and the nodes found together with its current neighbors are pruned
+with `pruning_alpha`. Its new neighbors then link back to it. Nodes added early, to a small graph,
+get better neighborhoods, and with `pruning_alpha` above 1 the graph reaches the same recall with
+a smaller `ef_search`. Nodes are refined in parallel on the index's threads, without the GIL.
+A quantized index needs re-ranking enabled, since it otherwise has no vectors to search with.
+Example:
+    index.add(data=data, ef_construction=100)
+    index.pruning_alpha = 1.2
+    index.refine_graph(ef_construction=100)
+Args:
+    ef_construction (int): The beam width of the search for new neighbors.
+Returns:
+    None
+)pbdoc";
+
+static const char *NUM_DELETED_NODES_DOCSTRING = R"pbdoc(
+Returns the number of soft-deleted nodes, whether or not they have been repaired yet.
+Returns:
+    int: The number of deleted nodes.
 )pbdoc";
 
 static const char *GET_GRAPH_OUTDEGREE_TABLE_DOCSTRING = R"pbdoc(
@@ -65,9 +243,22 @@ Returns:
 
 static const char *BUILD_GRAPH_LINKS_DOCSTRING = R"pbdoc(
 Construct the edge connectivity of the underlying graph. This method should be invoked after 
-allocating nodes using the `allocate_nodes` method.
+allocating nodes using the `allocate_nodes` method, and the graph must have one node per 
+allocated node, in allocation order. Pass exactly one of a Matrix Market file, a graph in 
+compressed sparse row form (`indptr` and `indices`, as in `scipy.sparse.csr_matrix`), or an 
+edge list. An edge list stored in a binary file can be read with 
+`np.fromfile(path, dtype=np.uint32).reshape(-1, 2)` (or `np.memmap`).
+Arrays are validated as a whole before any links change, then copied into the links in 
+parallel on the index's threads, without the GIL. The text file is parsed on a single thread.
 Args:
-    mtx_filename (str): The filename of the matrix file.
+    mtx_filename (str, optional): The filename of the matrix file.
+    indptr (np.ndarray, optional): The out-edges of node `i` are `indices[indptr[i]:indptr[i + 1]]`.
+    indices (np.ndarray, optional): The edge targets, to be given with `indptr`.
+    edges (np.ndarray, optional): An array of shape (num_edges, 2) of (source, target) node ids.
+
+Raises:
+    ValueError: If a node has more than `max_edges_per_node` out-edges, an edge leaves the
+        graph, or the graph does not have one node per allocated node.
 
 Returns:
     None
@@ -75,7 +266,9 @@ Returns:
 
 static const char *REORDER_DOCSTRING = R"pbdoc(
 Perform graph re-ordering based on the given sequence of re-ordering strategies.
-Supported re-ordering strategies include `gorder` and `rcm`.
+Supported re-ordering strategies include `gorder` and `rcm`. When the index uses several
+threads, `gorder` splits graphs of more than 262144 nodes into partitions of consecutive
+nodes in RCM order and re-orders them in parallel, ignoring the edges between partitions.
 Reference: 
   1. Graph Reordering for Cache-Efficient Near Neighbor Search: https://arxiv.org/pdf/2104.03221
 Args:
@@ -84,14 +277,102 @@ Returns:
     None
 )pbdoc";
 
+static const char *NODE_PERMUTATION_DOCSTRING = R"pbdoc(
+The node ids assigned by re-ordering: the node that had id `i` before the index was first
+re-ordered now has id `node_permutation[i]`. It covers every node, is saved with the index
+and is the identity if the index was never re-ordered.
+)pbdoc";
+
 static const char *SET_NUM_THREADS_DOCSTRING = R"pbdoc(
 Set the number of threads to use for constructing the graph and/or performing KNN search.
+The index keeps a pool of worker threads alive between calls; the calling thread is one of them.
 Args:
     num_threads (int): The number of threads to use.
+    pin_threads (bool, optional): Pin each worker thread to its own core (Linux only). Defaults to False.
+    chunk_size (int, optional): Number of consecutive vectors a worker claims at a time when adding
+        vectors. Workers that run out of work steal chunks from the others. Defaults to 0, which picks
+        a chunk size from the batch size.
+Returns:
+    None
+)pbdoc";
+
+static const char *FREEZE_DOCSTRING = R"pbdoc(
+Put the index in read-only mode. Searches then read the graph without any synchronization and
+the per-node version counters used to coordinate with concurrent writers are released.
+Loaded indices start out frozen and `add` freezes the index when it returns. Freezing waits
+for writes in progress and for the searches that started before it. The next `add`, `update`,
+`remove` or `repair_deleted_nodes` call unfreezes the index automatically.
 Returns:
     None
 )pbdoc";
 
+static const char *UNFREEZE_DOCSTRING = R"pbdoc(
+Leave read-only mode so that searches can safely run concurrently with writes again. This
+waits for the searches that started while the index was frozen.
+Returns:
+    None
+)pbdoc";
+
+static const char *IS_FROZEN_DOCSTRING = R"pbdoc(
+Whether the index is in read-only mode. See `freeze`.
+Returns:
+    bool: True if the index is frozen.
+)pbdoc";
+
+static const char *RESIZE_DOCSTRING = R"pbdoc(
+Grow the index so that it can hold `new_capacity` vectors, without rebuilding it. Existing
+nodes are never moved, so searches can keep running while the index grows.
+Args:
+    new_capacity (int): The new maximum number of vectors. Must be at least `capacity`.
+Returns:
+    None
+)pbdoc";
+
+static const char *CAPACITY_DOCSTRING = R"pbdoc(
+The maximum number of vectors the index can hold before it has to grow.
+Returns:
+    int: The capacity of the index.
+)pbdoc";
+
+static const char *AUTO_GROW_DOCSTRING = R"pbdoc(
+Whether `add` grows a full index instead of raising an error. The capacity grows by half at
+a time, or at once by as much as a batch requires. Disabled by default.
+Returns:
+    bool: True if auto-grow is enabled.
+)pbdoc";
+
+static const char *PRUNING_ALPHA_DOCSTRING = R"pbdoc(
+The alpha of the rule that prunes the neighbors of every node (Vamana's RobustPrune). A candidate
+is dropped if an already selected neighbor is more than alpha times closer to it than the node is.
+With 1, the default, this is the HNSW heuristic. Larger values, such as 1.2, keep more long edges.
+It applies to every write that follows, including `refine_graph`, and is not saved with the index.
+Raises:
+    ValueError: If set to a value smaller than 1.
+Returns:
+    float: The pruning alpha.
+)pbdoc";
+
+static const char *SET_ENTRY_POINT_STRATEGY_DOCSTRING = R"pbdoc(
+Select how searches and insertions pick the node the beam search starts from.
+Supported strategies:
+  - `stride`: compare the query against `num_initializations` nodes taken at a fixed
+    stride over the index (default).
+  - `sample_graph`: greedily descend a small k-NN graph over ~sqrt(N) sampled nodes.
+    This usually needs far fewer distance computations than `stride` and ignores
+    `num_initializations`. The sample graph is built immediately, rebuilt after every
+    call to `add` and saved with the index.
+Args:
+    strategy (str): The entry point strategy.
+Returns:
+    None
+)pbdoc";
+
+static const char *ENTRY_POINT_STRATEGY_DOCSTRING = R"pbdoc(
+Returns the entry point strategy used by the index, either `stride` or `sample_graph`.
+Returns:
+    str: The entry point strategy.
+)pbdoc";
+
 static const char *NUM_THREADS_DOCSTRING = R"pbdoc(
 Returns the number of threads used for constructing the graph and/or performing KNN search.
 Returns:
@@ -106,20 +387,68 @@ Returns:
 
 static const char *SAVE_DOCSTRING = R"pbdoc(
 Save a FlatNav index at the given file location.
+Only the nodes in use are written, whatever the capacity of the index. The file is split into 
+sections (parameters, distance, labels, entry points, re-rank vectors and nodes), each with a 
+checksum that is verified when it is read back. The GIL is released while saving. Writes to 
+the index from other threads wait until the index is saved; searches do not.
 Args:
     filename (str): The file location to save the index.
 Returns:
     None
 )pbdoc";
 
+static const char *SAVE_ASYNC_DOCSTRING = R"pbdoc(
+Save a snapshot of the index on a background thread. Writes to the index are paused only while 
+the snapshot is copied into memory, which takes a copy of the nodes in use and of the re-rank 
+vectors. The index can then be searched and modified while the snapshot is written. The copy 
+stays in memory until then, so memory use can briefly double. Re-rank vectors kept in a file 
+are written into the saved index, since the file keeps changing after the snapshot. The file 
+is written under `filename + ".tmp"` and renamed once complete, so that other processes (such 
+as a snapshot uploader) never see a partial index.
+Args:
+    filename (str): The file location to save the index.
+Returns:
+    concurrent.futures.Future: Resolves to None once the file is in place. Use 
+    `asyncio.wrap_future` to await it from a coroutine.
+)pbdoc";
+
 static const char *LOAD_INDEX_DOCSTRING = R"pbdoc(
 Load a FlatNav index from a given file location.
+With `mmap=True` the graph is memory-mapped read-only from the file instead of being copied 
+into memory. Loading returns almost immediately, memory usage only grows with the pages that 
+queries actually touch and processes that map the same file share it through the page cache. 
+A memory-mapped index cannot be modified.
+A `RuntimeError` is raised if a checksum does not match, except for the nodes of a memory-mapped 
+index, which are not read on load.
+Files saved by versions of FlatNav that predate the current format are read as well. They are
+always copied into memory, and `save` writes them in the current format.
 Args:
     filename (str): The file location to load the index from.
+    mmap (bool, optional): Memory-map the index file instead of reading it. Defaults to False.
 Returns:
     Union[L2Inde, IndexIPFloat]: The loaded index.
 )pbdoc";
 
+static const char *LOAD_GRAPH_DOCSTRING = R"pbdoc(
+Read only the graph of a saved index, without loading the index. The node blocks are streamed 
+from the file a few megabytes at a time.
+Args:
+    filename (str): The index file.
+Returns:
+    Tuple[np.ndarray, np.ndarray]: The graph in compressed sparse row form. The neighbors of 
+    node `i` are `edges[offsets[i]:offsets[i + 1]]`. `offsets` has `num_nodes + 1` entries.
+)pbdoc";
+
+static const char *LOAD_VECTORS_DOCSTRING = R"pbdoc(
+Read only the vectors of a saved index and their labels, without loading the index. Removed 
+vectors are skipped. Not supported for quantized indices, which do not store their vectors.
+Args:
+    filename (str): The index file.
+Returns:
+    Tuple[np.ndarray, np.ndarray]: The vectors, of shape (num_vectors, dim) and the data type of 
+    the index, and their labels.
+)pbdoc";
+
 static const char *GET_QUERY_DISTANCE_COMPUTATIONS_DOCSTRING = R"pbdoc(
 Returns the number of distance computations performed during the last search operation. 
 This method also resets the distance computations counter.
@@ -127,6 +456,26 @@ Returns:
     int: The number of distance computations.
 )pbdoc";
 
+static const char *TRAIN_DOCSTRING = R"pbdoc(
+Trains the quantizer of the index. This must be done before any vector is added ('fp16' indices need no training).
+Args:
+    data (np.ndarray): The training vectors, of shape (num_vectors, dim). A sample of the dataset is usually enough.
+Returns:
+    None
+)pbdoc";
+
+static const char *IS_TRAINED_DOCSTRING = R"pbdoc(
+Whether the quantizer of the index has been trained.
+Returns:
+    bool: True if the index can accept vectors.
+)pbdoc";
+
+static const char *RERANK_DOCSTRING = R"pbdoc(
+Whether search results are re-ranked with full-precision distances.
+Returns:
+    bool: True if the index keeps full-precision vectors for re-ranking.
+)pbdoc";
+
 static const char *CONSTRUCTOR_DOCSTRING = R"pbdoc(
 Constructs a an in-memory index with the parameters.
 Args:
@@ -136,7 +485,49 @@ Args:
     max_edges_per_node (int): The maximum number of edges per node in the graph.
     verbose (bool, optional): Enables verbose output. Defaults to False.
     collect_stats (bool, optional): Collects performance statistics. Defaults to False.
+    quantization (str, optional): Stores compressed codes instead of the float32 vectors. 'pq' uses product quantization, 'sq8' one byte per dimension scaled by the per-dimension range of the training data, and 'fp16' half-precision floats. 'pq' and 'sq8' indices must be trained with `train` before vectors are added. Defaults to None.
+    pq_subquantizers (int, optional): Number of subquantizers (bytes per code) for 'pq'. Must divide `dim`.
+    pq_nbits (int, optional): Number of bits per subquantizer index. Only 8 is supported. Defaults to 8.
+    rerank (bool, optional): For quantized indices, keeps the full-precision vectors and re-computes exact distances for the `ef_search` candidates of each query. Defaults to False.
+    rerank_vectors_path (str, optional): With `rerank`, stores the full-precision vectors in this file and memory-maps it instead of holding them in RAM. Only the final candidates of each query are read from it. The file is not copied into indices saved with `save` and must be kept at the same path. Defaults to None.
+    label_dtype (numpy.dtype, optional): The type of the labels, one of np.int32, np.int64 or np.uint64. Labels are stored inline in every node, so 64-bit labels add 4 bytes per node; use them when labels do not fit in 32 bits. Indices with 64-bit labels are named after the label type (e.g. `IndexL2FloatUint64`), and missing search results are padded with the label -1 cast to that type, i.e. 2**64 - 1 for np.uint64. Defaults to np.int32.
+
+Node ids are 32 bits wide, which limits an index to ~4.29B nodes. Building the library with FLATNAV_64BIT_NODE_IDS defined lifts the limit at the cost of 4 more bytes per link. Indices can only be loaded by a build with the same node id width and label type as the one that saved them.
 
 Returns:
-    Union[IndexL2Float, IndexIPFloat]: The constructed index.
+    Union[IndexL2Float, IndexIPFloat, IndexPQ, IndexSQ]: The constructed index.
+)pbdoc";
+
+static const char *ASYNC_INDEX_DOCSTRING = R"pbdoc(
+Serves single queries from asyncio code by coalescing them into batched `search` calls. Each 
+batch runs on the thread pool of the index without the GIL, so the event loop keeps running 
+while it is searched. A batch is dispatched once it holds `max_batch_size` queries or its 
+oldest query has waited `max_wait` seconds; raising `max_wait` trades latency for throughput. 
+Only queries with the same `K`, `ef_search` and `num_initializations` share a batch.
+Call `close` (or use the AsyncIndex as a context manager) once done, to dispatch the pending 
+queries and stop the dispatcher thread.
+Args:
+    index: The index to search, e.g. an IndexL2Float.
+    max_batch_size (int, optional): The largest number of queries searched at once. Defaults to 64.
+    max_wait (float, optional): How long, in seconds, a query waits for others to fill its batch. 
+        Defaults to 0.001.
+)pbdoc";
+
+static const char *SEARCH_ONE_DOCSTRING = R"pbdoc(
+Queue a query for the next batched search. Must be called from a running event loop.
+Args:
+    query (np.ndarray): The query vector.
+    K (int): The number of neighbors to return.
+    ef_search (int): The number of neighbors to visit while finding the closest neighbors for the query.
+    num_initializations (int, optional): The number of initializations to perform. Defaults to 100.
+Returns:
+    asyncio.Future: Resolves to the distances and label ID's of the closest neighbors, as for 
+    `search_single`. If the batched search fails, every query in the batch raises its error.
+)pbdoc";
+
+static const char *ASYNC_INDEX_CLOSE_DOCSTRING = R"pbdoc(
+Dispatch the queries that are still waiting and stop the dispatcher thread. Queries cannot be 
+submitted afterwards.
+Returns:
+    None
 )pbdoc";
@@ -1,27 +1,46 @@
 #include "docs.h"
 #include <algorithm>
+#include <chrono>
+#include <condition_variable>
 #include <cstdint>
+#include <cstring>
 #include <flatnav/distances/DistanceInterface.h>
 #include <flatnav/distances/InnerProductDistance.h>
 #include <flatnav/distances/SquaredL2Distance.h>
 #include <flatnav/index/Index.h>
+#include <flatnav/util/DatasetReader.h>
 #include <flatnav/util/Datatype.h>
 #include <flatnav/util/Multithreading.h>
+#include <future>
 #include <iostream>
+#include <limits>
+#include <list>
 #include <memory>
+#include <mutex>
+#include <optional>
 #include <ostream>
 #include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <quantization/ProductQuantization.h>
+#include <quantization/ScalarQuantization.h>
 #include <string>
 #include <thread>
+#include <tuple>
 #include <utility>
 #include <vector>
 
+using flatnav::EntryPointStrategy;
 using flatnav::Index;
+using flatnav::node_id_t;
 using flatnav::distances::DistanceInterface;
 using flatnav::distances::InnerProductDistance;
+using flatnav::distances::MetricType;
 using flatnav::distances::SquaredL2Distance;
+using flatnav::quantization::ProductQuantizer;
+using flatnav::quantization::ScalarQuantizer;
+using flatnav::util::CSRGraph;
+using flatnav::util::DatasetReader;
 using flatnav::util::DataType;
 using flatnav::util::for_each_data_type;
 
@@ -51,6 +70,29 @@ auto cast_and_call(DataType data_type, const py::array &array, Func &&function,
   }
 }
 
+// Recovers the DataType an index was created with from its distance type. This
+// is needed when an index is constructed from a file rather than from the
+// `create` factory.
+template <typename dist_t> struct DistanceDataType;
+
+template <DataType distance_data_type>
+struct DistanceDataType<SquaredL2Distance<distance_data_type>> {
+  static constexpr DataType data_type = distance_data_type;
+};
+
+template <DataType distance_data_type>
+struct DistanceDataType<InnerProductDistance<distance_data_type>> {
+  static constexpr DataType data_type = distance_data_type;
+};
+
+template <> struct DistanceDataType<ProductQuantizer> {
+  static constexpr DataType data_type = DataType::float32;
+};
+
+template <> struct DistanceDataType<ScalarQuantizer> {
+  static constexpr DataType data_type = DataType::float32;
+};
+
 template <typename dist_t, typename label_t>
 class PyIndex : public std::enable_shared_from_this<PyIndex<dist_t, label_t>> {
 
@@ -62,13 +104,84 @@ class PyIndex : public std::enable_shared_from_this<PyIndex<dist_t, label_t>> {
 
   typedef std::pair<py::array_t<float>, py::array_t<label_t>>
       DistancesLabelsPair;
+  typedef typename Index<dist_t, label_t>::LabelFilter LabelFilter;
+
+  // Filters admitting less than this fraction of the index are answered with
+  // an exhaustive scan over the admitted nodes instead of a graph search,
+  // which would otherwise expand most of the graph to fill its result heap.
+  static constexpr float BRUTE_FORCE_FILTER_SELECTIVITY = 0.02f;
+
+  // Number of queries `search` converts and searches at a time.
+  static constexpr size_t SEARCH_CHUNK_SIZE = 1 << 16;
+
+  /**
+   * Allow-list passed to the search methods. It is either a boolean mask
+   * indexed by label or an array of allowed labels. The NumPy array is held
+   * for the lifetime of this object so that the filter can read it without
+   * the GIL.
+   */
+  class AllowList {
+    py::array_t<bool, py::array::c_style | py::array::forcecast> _mask;
+    std::vector<label_t> _sorted_labels;
+    bool _is_set = false;
+    bool _is_mask = false;
+    size_t _num_allowed = 0;
+
+  public:
+    explicit AllowList(const py::object &allowed_labels) {
+      if (allowed_labels.is_none()) {
+        return;
+      }
+      _is_set = true;
+      auto array = py::array::ensure(allowed_labels);
+      if (!array || array.ndim() != 1) {
+        throw std::invalid_argument(
+            "allowed_labels must be a 1-D boolean mask or array of labels.");
+      }
+      if (array.dtype().is(py::dtype::of<bool>())) {
+        _is_mask = true;
+        _mask = array.cast<decltype(_mask)>();
+        const bool *mask = _mask.data();
+        _num_allowed = std::count(mask, mask + _mask.size(), true);
+        return;
+      }
+      auto labels = array.cast<
+          py::array_t<label_t, py::array::c_style | py::array::forcecast>>();
+      _sorted_labels.assign(labels.data(), labels.data() + labels.size());
+      if (!std::is_sorted(_sorted_labels.begin(), _sorted_labels.end())) {
+        std::sort(_sorted_labels.begin(), _sorted_labels.end());
+      }
+      _num_allowed = _sorted_labels.size();
+    }
 
-  // Internal add method that handles templated dispatch
+    LabelFilter filter() const {
+      if (!_is_set) {
+        return nullptr;
+      }
+      if (_is_mask) {
+        const bool *mask = _mask.data();
+        size_t mask_size = _mask.size();
+        return [mask, mask_size](const label_t &label) {
+          return static_cast<size_t>(label) < mask_size && mask[label];
+        };
+      }
+      const std::vector<label_t> *sorted_labels = &_sorted_labels;
+      return [sorted_labels](const label_t &label) {
+        return std::binary_search(sorted_labels->begin(), sorted_labels->end(),
+                                  label);
+      };
+    }
+
+    size_t size() const { return _num_allowed; }
+  };
+
+  // Internal add method that handles templated dispatch. Without labels, the
+  // vectors are labeled consecutively from `first_label`.
   template <typename data_type>
   void addImpl(const py::array_t<data_type, py::array::c_style |
                                                 py::array::forcecast> &data,
                int ef_construction, int num_initializations = 100,
-               py::object labels = py::none()) {
+               py::object labels = py::none(), label_t first_label = 0) {
     // py::array_t<float, py::array::c_style | py::array::forcecast> means that
     // the functions expects either a Numpy array of floats or a castable type
     // to that type. If the given type can't be casted, pybind11 will throw an
@@ -91,7 +204,7 @@ class PyIndex : public std::enable_shared_from_this<PyIndex<dist_t, label_t>> {
 
     if (labels.is_none()) {
       std::vector<label_t> vec_labels(num_vectors);
-      std::iota(vec_labels.begin(), vec_labels.end(), 0);
+      std::iota(vec_labels.begin(), vec_labels.end(), first_label);
 
       {
         // Release python GIL while threads are running
@@ -124,32 +237,108 @@ class PyIndex : public std::enable_shared_from_this<PyIndex<dist_t, label_t>> {
     }
   }
 
+  // Adds the vectors of a dataset file `chunk_size` at a time, labeled
+  // consecutively from `first_label` in file order. The next chunk is read
+  // while the current one is being added, so at most two chunks are held in
+  // memory.
+  template <typename data_type>
+  void addFromFileImpl(DatasetReader &reader, uint64_t chunk_size,
+                       int ef_construction, int num_initializations,
+                       label_t first_label) {
+    std::vector<data_type> chunk(chunk_size * _dim);
+    std::vector<data_type> next_chunk(chunk_size * _dim);
+    std::vector<label_t> labels;
+
+    size_t num_read = reader.read(chunk.data(), chunk_size);
+    while (num_read > 0) {
+      auto next_read = std::async(std::launch::async, [&] {
+        return reader.read(next_chunk.data(), chunk_size);
+      });
+      labels.resize(num_read);
+      std::iota(labels.begin(), labels.end(), first_label);
+      first_label += num_read;
+      _index->template addBatch<data_type>(
+          /* data = */ (void *)chunk.data(), /* labels = */ labels,
+          /* ef_construction = */ ef_construction,
+          /* num_initializations = */ num_initializations);
+
+      num_read = next_read.get();
+      std::swap(chunk, next_chunk);
+    }
+  }
+
+  template <typename data_type>
+  void updateImpl(const py::array_t<data_type, py::array::c_style |
+                                                   py::array::forcecast> &data,
+                  label_t label, int ef_construction,
+                  int num_initializations = 100) {
+    if (data.ndim() != 1 || data.shape(0) != _dim) {
+      throw std::invalid_argument("Data has incorrect dimensions.");
+    }
+    py::gil_scoped_release gil;
+    this->_index->update(/* data = */ (void *)data.data(0), /* label = */ label,
+                         /* ef_construction = */ ef_construction,
+                         /* num_initializations = */ num_initializations);
+  }
+
+  // An exhaustive scan is used when the filter admits too few labels for the
+  // graph search to be worth it.
+  bool useBruteForce(const LabelFilter &filter, size_t num_allowed) const {
+    return filter && num_allowed < BRUTE_FORCE_FILTER_SELECTIVITY *
+                                       _index->currentNumNodes();
+  }
+
+  std::vector<std::pair<float, label_t>>
+  searchOne(const void *query, int K, int ef_search, int num_initializations,
+            const LabelFilter &filter, size_t num_allowed) {
+    if (useBruteForce(filter, num_allowed)) {
+      return _index->searchBruteForce(/* query = */ query, /* K = */ K,
+                                      /* filter = */ filter);
+    }
+    return _index->search(/* query = */ query, /* K = */ K,
+                          /* ef_search = */ ef_search,
+                          /* num_initializations = */ num_initializations,
+                          /* filter = */ filter);
+  }
+
+  // Filtered searches (and searches over an index with deleted nodes) may find
+  // fewer than K results. The remaining slots are padded with a label of -1
+  // and an infinite distance.
+  static void copyResults(const std::vector<std::pair<float, label_t>> &top_k,
+                          int K, float *distances, label_t *labels) {
+    for (size_t i = 0; i < K; i++) {
+      if (i < top_k.size()) {
+        distances[i] = top_k[i].first;
+        labels[i] = top_k[i].second;
+      } else {
+        distances[i] = std::numeric_limits<float>::infinity();
+        labels[i] = static_cast<label_t>(-1);
+      }
+    }
+  }
+
   template <typename data_type>
   DistancesLabelsPair searchSingleImpl(
       const py::array_t<data_type, py::array::c_style | py::array::forcecast>
           &query,
-      int K, int ef_search, int num_initializations = 100) {
+      int K, int ef_search, int num_initializations,
+      const LabelFilter &filter, size_t num_allowed) {
     if (query.ndim() != 1 || query.shape(0) != _dim) {
       throw std::invalid_argument("Query has incorrect dimensions.");
     }
 
-    std::vector<std::pair<float, label_t>> top_k = this->_index->search(
-        /* query = */ (const void *)query.data(0), /* K = */ K,
-        /* ef_search = */ ef_search,
-        /* num_initializations = */ num_initializations);
-
-    if (top_k.size() != K) {
-      throw std::runtime_error(
-          "Search did not return the expected number of results. Expected " +
-          std::to_string(K) + " but got " + std::to_string(top_k.size()) + ".");
-    }
-
     label_t *labels = new label_t[K];
     float *distances = new float[K];
-
-    for (size_t i = 0; i < K; i++) {
-      distances[i] = top_k[i].first;
-      labels[i] = top_k[i].second;
+    {
+      // Release python GIL so that other Python threads can search (or add)
+      // at the same time.
+      py::gil_scoped_release gil;
+      std::vector<std::pair<float, label_t>> top_k = searchOne(
+          /* query = */ (const void *)query.data(0), /* K = */ K,
+          /* ef_search = */ ef_search,
+          /* num_initializations = */ num_initializations,
+          /* filter = */ filter, /* num_allowed = */ num_allowed);
+      copyResults(top_k, K, distances, labels);
     }
 
     // Allows to transfer ownership to Python
@@ -168,84 +357,146 @@ class PyIndex : public std::enable_shared_from_this<PyIndex<dist_t, label_t>> {
     return {distances_array, labels_array};
   }
 
+  // Searches a batch of queries, writing `num_queries * K` results to
+  // `distances` and `labels`.
   template <typename data_type>
-  DistancesLabelsPair
-  searchImpl(const py::array_t<data_type, py::array::c_style |
-                                              py::array::forcecast> &queries,
-             int K, int ef_search, int num_initializations = 100) {
+  void searchImpl(const py::array_t<data_type, py::array::c_style |
+                                                   py::array::forcecast>
+                      &queries,
+                  int K, int ef_search, int num_initializations,
+                  const LabelFilter &filter, size_t num_allowed,
+                  float *distances, label_t *labels) {
     size_t num_queries = queries.shape(0);
-    size_t queries_dim = queries.shape(1);
-
-    if (queries.ndim() != 2 || queries_dim != _dim) {
-      throw std::invalid_argument("Queries have incorrect dimensions.");
+    // Release python GIL while threads are running
+    py::gil_scoped_release gil;
+
+    if (!useBruteForce(filter, num_allowed)) {
+      _index->template searchBatch<data_type>(
+          /* queries = */ (const void *)queries.data(0),
+          /* num_queries = */ num_queries, /* K = */ K,
+          /* ef_search = */ ef_search,
+          /* num_initializations = */ num_initializations,
+          /* distances = */ distances, /* labels = */ labels,
+          /* filter = */ filter);
+      return;
     }
 
-    auto num_threads = _index->getNumThreads();
-    label_t *results = new label_t[num_queries * K];
-    float *distances = new float[num_queries * K];
-
-    // No need to spawn any threads if we are in a single-threaded environment
-    if (num_threads == 1) {
-      for (size_t query_index = 0; query_index < num_queries; query_index++) {
-        std::vector<std::pair<float, label_t>> top_k = this->_index->search(
-            /* query = */ (const void *)queries.data(query_index), /* K = */ K,
-            /* ef_search = */ ef_search,
-            /* num_initializations = */ num_initializations);
+    auto search_query = [&](size_t row_index) {
+      std::vector<std::pair<float, label_t>> top_k = searchOne(
+          /* query = */ (const void *)queries.data(row_index), /* K = */ K,
+          /* ef_search = */ ef_search,
+          /* num_initializations = */ num_initializations,
+          /* filter = */ filter, /* num_allowed = */ num_allowed);
+      copyResults(top_k, K, distances + (row_index * K),
+                  labels + (row_index * K));
+    };
+
+    _index->threadPool().parallelFor(/* start_index = */ 0,
+                                     /* end_index = */ num_queries,
+                                     /* function = */ search_query);
+  }
 
-        if (top_k.size() != K) {
-          throw std::runtime_error("Search did not return the expected number "
-                                   "of results. Expected " +
-                                   std::to_string(K) + " but got " +
-                                   std::to_string(top_k.size()) + ".");
-        }
+  template <typename data_type>
+  std::tuple<py::array_t<uint64_t>, py::array_t<float>, py::array_t<label_t>>
+  rangeSearchImpl(const py::array_t<data_type, py::array::c_style |
+                                                   py::array::forcecast>
+                      &queries,
+                  float radius, size_t max_results, int ef_search,
+                  int num_initializations, const LabelFilter &filter) {
+    if (queries.ndim() != 2 || queries.shape(1) != _dim) {
+      throw std::invalid_argument("Queries have incorrect dimensions.");
+    }
+    size_t num_queries = queries.shape(0);
 
-        for (size_t i = 0; i < top_k.size(); i++) {
-          distances[query_index * K + i] = top_k[i].first;
-          results[query_index * K + i] = top_k[i].second;
-        }
-      }
-    } else {
-      // Parallelize the search
-      flatnav::executeInParallel(
+    std::vector<std::vector<std::pair<float, label_t>>> results(num_queries);
+    {
+      // Release python GIL while threads are running
+      py::gil_scoped_release gil;
+      _index->threadPool().parallelFor(
           /* start_index = */ 0, /* end_index = */ num_queries,
-          /* num_threads = */ num_threads,
-          /* function = */ [&](uint32_t row_index) {
-            auto *query = (const void *)queries.data(row_index);
-            std::vector<std::pair<float, label_t>> top_k = this->_index->search(
-                /* query = */ query, /* K = */ K, /* ef_search = */ ef_search,
-                /* num_initializations = */ num_initializations);
-
-            for (uint32_t result_id = 0; result_id < K; result_id++) {
-              distances[(row_index * K) + result_id] = top_k[result_id].first;
-              results[(row_index * K) + result_id] = top_k[result_id].second;
-            }
+          /* function = */ [&](size_t row_index) {
+            results[row_index] = _index->rangeSearch(
+                /* query = */ (const void *)queries.data(row_index),
+                /* radius = */ radius, /* ef_search = */ ef_search,
+                /* max_results = */ max_results,
+                /* num_initializations = */ num_initializations,
+                /* filter = */ filter);
           });
     }
 
-    // Allows to transfer ownership to Python
-    py::capsule free_results_when_done(
-        results, [](void *ptr) { delete (label_t *)ptr; });
-    py::capsule free_distances_when_done(
-        distances, [](void *ptr) { delete (float *)ptr; });
-
-    py::array_t<label_t> labels =
-        py::array_t<label_t>({num_queries, (size_t)K}, // shape of the array
-                             {K * sizeof(label_t), sizeof(label_t)}, // strides
-                             results,               // data pointer
-                             free_results_when_done // capsule
-        );
+    // Query i's results are at positions lims[i] to lims[i + 1].
+    py::array_t<uint64_t> lims(num_queries + 1);
+    uint64_t *lims_data = lims.mutable_data();
+    lims_data[0] = 0;
+    for (size_t i = 0; i < num_queries; i++) {
+      lims_data[i + 1] = lims_data[i] + results[i].size();
+    }
+    py::array_t<float> distances(lims_data[num_queries]);
+    py::array_t<label_t> labels(lims_data[num_queries]);
+    float *distances_data = distances.mutable_data();
+    label_t *labels_data = labels.mutable_data();
+    for (size_t i = 0; i < num_queries; i++) {
+      for (size_t j = 0; j < results[i].size(); j++) {
+        distances_data[lims_data[i] + j] = results[i][j].first;
+        labels_data[lims_data[i] + j] = results[i][j].second;
+      }
+    }
+    return {lims, distances, labels};
+  }
 
-    py::array_t<float> dists = py::array_t<float>(
-        {num_queries, (size_t)K}, {K * sizeof(float), sizeof(float)}, distances,
-        free_distances_when_done);
+  // Returns `output` if it is given, after checking that it can hold the
+  // results, or a new array otherwise.
+  template <typename T>
+  static py::array_t<T> outputArray(const py::object &output, size_t rows,
+                                    size_t columns, const std::string &name) {
+    if (output.is_none()) {
+      return py::array_t<T>(std::vector<size_t>{rows, columns});
+    }
+    if (!py::isinstance<py::array_t<T>>(output)) {
+      throw std::invalid_argument("`" + name + "` must be an array of " +
+                                  std::string(py::str(py::dtype::of<T>())) +
+                                  ".");
+    }
+    auto array = output.cast<py::array_t<T>>();
+    if (array.ndim() != 2 || array.shape(0) != rows ||
+        array.shape(1) != columns || !array.writeable() ||
+        !(array.flags() & py::array::c_style)) {
+      throw std::invalid_argument(
+          "`" + name + "` must be a writeable, C-contiguous array of shape (" +
+          std::to_string(rows) + ", " + std::to_string(columns) + ").");
+    }
+    return array;
+  }
 
-    return {dists, labels};
+  // Element type of the vectors returned by `getVector`. Quantized indices
+  // only store codes, so they return their full-precision re-rank vectors.
+  py::dtype vectorDtype() {
+    if constexpr (std::is_same_v<dist_t, ProductQuantizer> ||
+                  std::is_same_v<dist_t, ScalarQuantizer>) {
+      if (!_index->rerankingEnabled()) {
+        throw std::runtime_error(
+            "A quantized index only stores the codes of its vectors. Enable "
+            "re-ranking to keep full-precision copies that can be retrieved.");
+      }
+    }
+    switch (_data_type) {
+    case DataType::float32:
+      return py::dtype::of<float>();
+    case DataType::int8:
+      return py::dtype::of<int8_t>();
+    case DataType::uint8:
+      return py::dtype::of<uint8_t>();
+    default:
+      throw std::invalid_argument("Unsupported data type.");
+    }
   }
 
+  // Hands ownership of the result buffers over to numpy arrays.
 public:
   explicit PyIndex(std::unique_ptr<Index<dist_t, label_t>> index)
       : _dim(index->dataDimension()), _label_id(0), _verbose(false),
-        _index(index.release()) {
+        _index(index.release()),
+        _data_type(DistanceDataType<dist_t>::data_type) {
 
     if (_verbose) {
       _index->getIndexSummary();
@@ -268,10 +519,14 @@ public:
       uint64_t total_index_memory = _index->getTotalIndexMemory();
       uint64_t visited_set_allocated_memory =
           _index->visitedSetPoolAllocatedMemory();
-      uint64_t mutexes_allocated_memory = _index->mutexesAllocatedMemory();
+      uint64_t node_versions_allocated_memory =
+          _index->nodeVersionsAllocatedMemory();
+      uint64_t rerank_vectors_allocated_memory =
+          _index->rerankVectorsAllocatedMemory();
 
       auto total_memory = total_index_memory + visited_set_allocated_memory +
-                          mutexes_allocated_memory;
+                          node_versions_allocated_memory +
+                          rerank_vectors_allocated_memory;
 
       std::cout << "Total allocated index memory: "
                 << (float)(total_memory / 1e9) << " GB \n"
@@ -285,6 +540,29 @@ public:
 
   Index<dist_t, label_t> *getIndex() { return _index; }
 
+  // Only bound for quantized distances (ProductQuantizer, ScalarQuantizer).
+  void train(const py::array_t<float, py::array::c_style |
+                                          py::array::forcecast> &data) {
+    if (data.ndim() != 2 || data.shape(1) != _dim) {
+      throw std::invalid_argument("Data has incorrect dimensions.");
+    }
+    if (_index->currentNumNodes() > 0) {
+      throw std::runtime_error(
+          "The index must be trained before vectors are added to it.");
+    }
+    py::gil_scoped_release gil;
+    _index->distance().train(/* vectors = */ data.data(0),
+                             /* n = */ data.shape(0));
+  }
+
+  bool isTrained() { return _index->distance().isTrained(); }
+
+  void enableReranking(const std::string &vectors_filename = "") {
+    _index->enableReranking(/* vectors_filename = */ vectors_filename);
+  }
+
+  bool rerankingEnabled() { return _index->rerankingEnabled(); }
+
   ~PyIndex() { delete _index; }
 
   uint64_t getQueryDistanceComputations() const {
@@ -293,11 +571,70 @@ public:
     return distance_computations;
   }
 
-  void buildGraphLinks(const std::string &mtx_filename) {
-    _index->buildGraphLinks(/* mtx_filename = */ mtx_filename);
+  void buildGraphLinks(const py::object &mtx_filename,
+                       const py::object &indptr, const py::object &indices,
+                       const py::object &edges) {
+    int num_sources = !mtx_filename.is_none() + !edges.is_none() +
+                      (!indptr.is_none() || !indices.is_none());
+    if (num_sources != 1) {
+      throw std::invalid_argument(
+          "Exactly one of `mtx_filename`, `indptr` and `indices`, or `edges` "
+          "must be given.");
+    }
+    if (!mtx_filename.is_none()) {
+      auto filename = mtx_filename.cast<std::string>();
+      py::gil_scoped_release gil;
+      _index->buildGraphLinks(/* mtx_filename = */ filename);
+      return;
+    }
+
+    using NodeIdArray =
+        py::array_t<node_id_t, py::array::c_style | py::array::forcecast>;
+    size_t num_nodes = _index->currentNumNodes();
+    if (!edges.is_none()) {
+      auto edge_list = NodeIdArray::ensure(edges);
+      if (!edge_list || edge_list.ndim() != 2 || edge_list.shape(1) != 2) {
+        throw std::invalid_argument(
+            "`edges` must be an array of (source, target) pairs.");
+      }
+      const node_id_t *edge_data = edge_list.data();
+      uint64_t num_edges = edge_list.shape(0);
+      py::gil_scoped_release gil;
+      auto graph = CSRGraph<node_id_t>::fromEdgeList(
+          /* num_nodes = */ num_nodes, /* edges = */ edge_data,
+          /* num_edges = */ num_edges);
+      _index->buildGraphLinks(/* offsets = */ graph.offsets.data(),
+                              /* edges = */ graph.edges.data(),
+                              /* num_nodes = */ num_nodes,
+                              /* num_edges = */ graph.edges.size());
+      return;
+    }
+
+    if (indptr.is_none() || indices.is_none()) {
+      throw std::invalid_argument(
+          "`indptr` and `indices` must be given together.");
+    }
+    auto offsets = py::array_t<uint64_t, py::array::c_style |
+                                             py::array::forcecast>::ensure(
+        indptr);
+    auto targets = NodeIdArray::ensure(indices);
+    if (!offsets || !targets || offsets.ndim() != 1 || targets.ndim() != 1 ||
+        static_cast<size_t>(offsets.shape(0)) != num_nodes + 1) {
+      throw std::invalid_argument(
+          "`indptr` must be a 1D array with one entry per node plus one, and "
+          "`indices` a 1D array of edge targets.");
+    }
+    const uint64_t *offset_data = offsets.data();
+    const node_id_t *target_data = targets.data();
+    uint64_t num_edges = targets.shape(0);
+    py::gil_scoped_release gil;
+    _index->buildGraphLinks(/* offsets = */ offset_data,
+                            /* edges = */ target_data,
+                            /* num_nodes = */ num_nodes,
+                            /* num_edges = */ num_edges);
   }
 
-  std::vector<std::vector<uint32_t>> getGraphOutdegreeTable() {
+  std::vector<std::vector<node_id_t>> getGraphOutdegreeTable() {
     return _index->getGraphOutdegreeTable();
   }
 
@@ -315,25 +652,143 @@ public:
             "` is not a supported graph re-ordering strategy.");
       }
     }
+    py::gil_scoped_release gil;
     _index->doGraphReordering(strategies);
   }
 
-  void setNumThreads(uint32_t num_threads) {
-    _index->setNumThreads(num_threads);
+  void setEntryPointStrategy(const std::string &strategy) {
+    auto name = strategy;
+    std::transform(name.begin(), name.end(), name.begin(),
+                   [](unsigned char c) { return std::tolower(c); });
+    if (name == "stride") {
+      _index->setEntryPointStrategy(EntryPointStrategy::STRIDE);
+    } else if (name == "sample_graph") {
+      _index->setEntryPointStrategy(EntryPointStrategy::SAMPLE_GRAPH);
+    } else {
+      throw std::invalid_argument("`" + strategy +
+                                  "` is not a supported entry point strategy.");
+    }
+  }
+
+  std::string getEntryPointStrategy() {
+    switch (_index->entryPointStrategy()) {
+    case EntryPointStrategy::SAMPLE_GRAPH:
+      return "sample_graph";
+    default:
+      return "stride";
+    }
+  }
+
+  void setNumThreads(uint32_t num_threads, bool pin_threads = false,
+                    uint32_t chunk_size = 0) {
+    _index->setNumThreads(/* num_threads = */ num_threads,
+                          /* pin_threads = */ pin_threads,
+                          /* chunk_size = */ chunk_size);
   }
 
   uint32_t getNumThreads() { return _index->getNumThreads(); }
 
+  void freeze() {
+    // Release python GIL while waiting for the writes and searches in flight.
+    py::gil_scoped_release gil;
+    _index->freeze();
+  }
+
+  void unfreeze() {
+    py::gil_scoped_release gil;
+    _index->unfreeze();
+  }
+
+  bool isFrozen() { return _index->isFrozen(); }
+
   void save(const std::string &filename) {
+    py::gil_scoped_release gil;
     _index->saveIndex(/* filename = */ filename);
   }
 
+  // Returns a `concurrent.futures.Future`. A non-daemon Python thread waits
+  // for the background write and resolves it, so the interpreter does not
+  // exit before the snapshot is written.
+  py::object saveAsync(const std::string &filename) {
+    std::shared_ptr<std::future<void>> saved;
+    {
+      py::gil_scoped_release gil;
+      saved = std::make_shared<std::future<void>>(
+          _index->saveIndexAsync(/* filename = */ filename));
+    }
+    py::object future =
+        py::module_::import("concurrent.futures").attr("Future")();
+    future.attr("set_running_or_notify_cancel")();
+
+    py::cpp_function resolve([saved, future]() {
+      try {
+        {
+          py::gil_scoped_release gil;
+          saved->get();
+        }
+        future.attr("set_result")(py::none());
+      } catch (const std::exception &error) {
+        future.attr("set_exception")(
+            py::module_::import("builtins").attr("RuntimeError")(error.what()));
+      }
+    });
+    py::module_::import("threading")
+        .attr("Thread")(py::arg("target") = resolve,
+                        py::arg("name") = "flatnav-save")
+        .attr("start")();
+    return future;
+  }
+
   static std::shared_ptr<PyIndex<dist_t, label_t>>
-  loadIndex(const std::string &filename) {
-    auto index = Index<dist_t, label_t>::loadIndex(/* filename = */ filename);
+  loadIndex(const std::string &filename, bool mmap = false) {
+    auto index = Index<dist_t, label_t>::loadIndex(/* filename = */ filename,
+                                                   /* mmap = */ mmap);
     return std::make_shared<PyIndex<dist_t, label_t>>(std::move(index));
   }
 
+  static std::pair<py::array_t<uint64_t>, py::array_t<node_id_t>>
+  loadGraph(const std::string &filename) {
+    auto graph = Index<dist_t, label_t>::loadGraph(/* filename = */ filename);
+    return {py::array_t<uint64_t>(graph.offsets.size(), graph.offsets.data()),
+            py::array_t<node_id_t>(graph.edges.size(), graph.edges.data())};
+  }
+
+  static std::pair<py::array, py::array_t<label_t>>
+  loadVectors(const std::string &filename) {
+    if constexpr (std::is_same_v<dist_t, ProductQuantizer> ||
+                  std::is_same_v<dist_t, ScalarQuantizer>) {
+      throw std::runtime_error(
+          "A quantized index only stores the codes of its vectors. Load the "
+          "index and use `get_vectors` to read its re-rank vectors instead.");
+    }
+    std::vector<label_t> labels;
+    std::vector<char> vectors = Index<dist_t, label_t>::loadVectors(
+        /* filename = */ filename, /* labels = */ labels);
+
+    py::dtype dtype;
+    switch (DistanceDataType<dist_t>::data_type) {
+    case DataType::float32:
+      dtype = py::dtype::of<float>();
+      break;
+    case DataType::int8:
+      dtype = py::dtype::of<int8_t>();
+      break;
+    case DataType::uint8:
+      dtype = py::dtype::of<uint8_t>();
+      break;
+    default:
+      throw std::invalid_argument("Unsupported data type.");
+    }
+    size_t num_vectors = labels.size();
+    size_t dim = num_vectors == 0
+                     ? 0
+                     : vectors.size() / num_vectors / dtype.itemsize();
+    py::array vectors_array(dtype, std::vector<size_t>{num_vectors, dim});
+    std::memcpy(vectors_array.mutable_data(), vectors.data(), vectors.size());
+    return {vectors_array,
+            py::array_t<label_t>(labels.size(), labels.data())};
+  }
+
   std::shared_ptr<PyIndex<dist_t, label_t>> allocateNodes(
       const py::array_t<float, py::array::c_style | py::array::forcecast>
           &data) {
@@ -343,7 +798,7 @@ public:
       throw std::invalid_argument("Data has incorrect dimensions.");
     }
     for (size_t vec_index = 0; vec_index < num_vectors; vec_index++) {
-      uint32_t new_node_id;
+      node_id_t new_node_id;
 
       this->_index->allocateNode(/* data = */ (void *)data.data(vec_index),
                                  /* label = */ _label_id,
@@ -354,72 +809,324 @@ public:
   }
 
   void add(const py::array &data, int ef_construction, int num_initializations,
-           py::object labels = py::none()) {
+           py::object labels = py::none(), label_t first_label = 0) {
     cast_and_call(
         _data_type, data,
-        [this](auto &&casted_data, int ef, int num_init, py::object lbls) {
+        [this](auto &&casted_data, int ef, int num_init, py::object lbls,
+               label_t first) {
           this->addImpl(std::forward<decltype(casted_data)>(casted_data), ef,
-                        num_init, lbls);
+                        num_init, lbls, first);
+        },
+        ef_construction, num_initializations, labels, first_label);
+  }
+
+  void addFromFile(const std::string &path, int ef_construction,
+                   std::string format = "", uint64_t chunk_size = 100000,
+                   int num_initializations = 100,
+                   std::optional<label_t> first_label = std::nullopt) {
+    if (chunk_size == 0) {
+      throw std::invalid_argument("chunk_size must be greater than 0.");
+    }
+    if (format.empty()) {
+      format = path.substr(path.find_last_of('.') + 1);
+    }
+    DatasetReader reader(/* filename = */ path, /* format = */ format);
+    if (reader.dimension() != _dim) {
+      throw std::invalid_argument(
+          "Dataset has dimension " + std::to_string(reader.dimension()) +
+          " but the index expects " + std::to_string(_dim) + ".");
+    }
+    chunk_size = std::min<uint64_t>(chunk_size, reader.numVectors());
+    if (_index->autoGrow()) {
+      _index->resize(/* new_capacity = */ std::max(
+          _index->maxNodeCount(),
+          _index->currentNumNodes() + reader.numVectors()));
+    }
+
+    py::gil_scoped_release gil;
+    label_t label = first_label ? *first_label : _index->nextUnusedLabel();
+    switch (_data_type) {
+    case DataType::float32:
+      addFromFileImpl<float>(reader, chunk_size, ef_construction,
+                             num_initializations, label);
+      break;
+    case DataType::int8:
+      addFromFileImpl<int8_t>(reader, chunk_size, ef_construction,
+                              num_initializations, label);
+      break;
+    case DataType::uint8:
+      addFromFileImpl<uint8_t>(reader, chunk_size, ef_construction,
+                               num_initializations, label);
+      break;
+    default:
+      throw std::invalid_argument("Unsupported data type.");
+    }
+  }
+
+  // Adds every array yielded by `chunks`. Items may also be (data, labels)
+  // pairs; otherwise vectors are labeled consecutively from `first_label` in
+  // stream order.
+  void addStream(const py::iterable &chunks, int ef_construction,
+                 int num_initializations = 100,
+                 std::optional<label_t> first_label = std::nullopt) {
+    label_t label = first_label ? *first_label : _index->nextUnusedLabel();
+    for (py::handle chunk : chunks) {
+      py::object data = py::reinterpret_borrow<py::object>(chunk);
+      py::object labels = py::none();
+      if (py::isinstance<py::tuple>(chunk)) {
+        auto pair = chunk.cast<py::tuple>();
+        if (pair.size() != 2) {
+          throw std::invalid_argument(
+              "Stream items must be arrays or (data, labels) pairs.");
+        }
+        data = pair[0];
+        labels = pair[1];
+      }
+      auto array = py::array::ensure(data);
+      if (!array || array.ndim() != 2) {
+        throw std::invalid_argument(
+            "Stream items must be 2-D arrays of shape (num_vectors, dim).");
+      }
+      add(/* data = */ array, /* ef_construction = */ ef_construction,
+          /* num_initializations = */ num_initializations,
+          /* labels = */ labels, /* first_label = */ label);
+      label += array.shape(0);
+    }
+  }
+
+  void remove(label_t label) {
+    py::gil_scoped_release gil;
+    _index->remove(/* label = */ label);
+  }
+
+  bool containsLabel(label_t label) { return _index->contains(label); }
+
+  py::array_t<bool> contains(
+      const py::array_t<label_t, py::array::c_style | py::array::forcecast>
+          &labels) {
+    py::array_t<bool> found(labels.size());
+    bool *found_data = found.mutable_data();
+    const label_t *labels_data = labels.data();
+    py::gil_scoped_release gil;
+    for (size_t i = 0; i < labels.size(); i++) {
+      found_data[i] = _index->contains(labels_data[i]);
+    }
+    return found;
+  }
+
+  py::array getVector(label_t label) {
+    py::array vector(vectorDtype(), std::vector<size_t>{(size_t)_dim});
+    py::gil_scoped_release gil;
+    _index->getVector(/* label = */ label,
+                      /* destination = */ vector.mutable_data());
+    return vector;
+  }
+
+  py::array getVectors(
+      const py::array_t<label_t, py::array::c_style | py::array::forcecast>
+          &labels) {
+    if (labels.ndim() != 1) {
+      throw std::invalid_argument("labels must be a 1-D array.");
+    }
+    size_t num_labels = labels.shape(0);
+    py::array vectors(vectorDtype(),
+                      std::vector<size_t>{num_labels, (size_t)_dim});
+    char *vectors_data = static_cast<char *>(vectors.mutable_data());
+    size_t row_size = vectors.strides(0);
+    const label_t *labels_data = labels.data();
+    py::gil_scoped_release gil;
+    for (size_t i = 0; i < num_labels; i++) {
+      _index->getVector(/* label = */ labels_data[i],
+                        /* destination = */ vectors_data + (i * row_size));
+    }
+    return vectors;
+  }
+
+  py::array_t<node_id_t> getNodePermutation() {
+    std::vector<node_id_t> permutation = _index->nodePermutation();
+    return py::array_t<node_id_t>(permutation.size(), permutation.data());
+  }
+
+  void update(const py::array &data, label_t label, int ef_construction,
+              int num_initializations) {
+    cast_and_call(
+        _data_type, data,
+        [this](auto &&casted_data, label_t lbl, int ef, int num_init) {
+          this->updateImpl(std::forward<decltype(casted_data)>(casted_data),
+                           lbl, ef, num_init);
         },
-        ef_construction, num_initializations, labels);
+        label, ef_construction, num_initializations);
+  }
+
+  void repairDeletedNodes() {
+    // Release python GIL so that the repair can run on a background thread.
+    py::gil_scoped_release gil;
+    _index->repairDeletedNodes();
+  }
+
+  void refineGraph(int ef_construction) {
+    py::gil_scoped_release gil;
+    _index->refineGraph(/* ef_construction = */ ef_construction);
+  }
+
+  uint64_t getNumDeletedNodes() { return _index->numDeletedNodes(); }
+
+  void resize(uint64_t new_capacity) {
+    _index->resize(/* new_capacity = */ new_capacity);
+  }
+
+  uint64_t getCapacity() { return _index->maxNodeCount(); }
+
+  bool getAutoGrow() { return _index->autoGrow(); }
+
+  void setAutoGrow(bool auto_grow) {
+    _index->setAutoGrow(/* auto_grow = */ auto_grow);
+  }
+
+  float getPruningAlpha() { return _index->pruningAlpha(); }
+
+  void setPruningAlpha(float alpha) {
+    _index->setPruningAlpha(/* alpha = */ alpha);
   }
 
   DistancesLabelsPair search(const py::array &queries, int K, int ef_search,
-                             int num_initializations) {
+                             int num_initializations,
+                             py::object allowed_labels = py::none(),
+                             py::object out_distances = py::none(),
+                             py::object out_labels = py::none()) {
+    if (queries.ndim() != 2 || queries.shape(1) != _dim) {
+      throw std::invalid_argument("Queries have incorrect dimensions.");
+    }
+    size_t num_queries = queries.shape(0);
+    AllowList allow_list(allowed_labels);
+    auto distances = outputArray<float>(out_distances, num_queries, K,
+                                        "out_distances");
+    auto labels = outputArray<label_t>(out_labels, num_queries, K,
+                                       "out_labels");
+    float *distances_data = distances.mutable_data();
+    label_t *labels_data = labels.mutable_data();
+
+    // Queries are converted and searched a chunk at a time, so that a query
+    // set on disk (e.g. a `np.memmap`) is never copied into memory at once.
+    for (size_t first = 0; first < num_queries;
+         first += SEARCH_CHUNK_SIZE) {
+      size_t last = std::min(first + SEARCH_CHUNK_SIZE, num_queries);
+      py::array chunk = queries[py::slice(first, last, 1)];
+      cast_and_call(
+          _data_type, chunk,
+          [&](auto &&casted_queries) {
+            this->searchImpl(
+                std::forward<decltype(casted_queries)>(casted_queries), K,
+                ef_search, num_initializations, allow_list.filter(),
+                allow_list.size(), distances_data + (first * K),
+                labels_data + (first * K));
+          });
+    }
+    return {distances, labels};
+  }
+
+  std::tuple<py::array_t<uint64_t>, py::array_t<float>, py::array_t<label_t>>
+  rangeSearch(const py::array &queries, float radius,
+              std::optional<size_t> max_results, int ef_search,
+              int num_initializations, py::object allowed_labels = py::none()) {
+    AllowList allow_list(allowed_labels);
     return cast_and_call(
         _data_type, queries,
-        [this](auto &&casted_queries, int k, int ef, int num_init) {
-          return this->searchImpl(
-              std::forward<decltype(casted_queries)>(casted_queries), k, ef,
-              num_init);
+        [this, &allow_list](auto &&casted_queries, float r, size_t max_k,
+                            int ef, int num_init) {
+          return this->rangeSearchImpl(
+              std::forward<decltype(casted_queries)>(casted_queries), r,
+              max_k, ef, num_init, allow_list.filter());
         },
-        K, ef_search, num_initializations);
+        radius, max_results.value_or(0), ef_search, num_initializations);
+  }
+
+  std::tuple<py::array_t<float>, py::array_t<label_t>, py::array_t<label_t>>
+  knnGraph(int K, int ef_search, py::object distances, py::object labels) {
+    size_t num_rows = _index->numLiveNodes();
+    auto distances_array =
+        outputArray<float>(distances, num_rows, K, "distances");
+    auto labels_array = outputArray<label_t>(labels, num_rows, K, "labels");
+    py::array_t<label_t> row_labels(num_rows);
+
+    float *distances_data = distances_array.mutable_data();
+    label_t *labels_data = labels_array.mutable_data();
+    label_t *row_labels_data = row_labels.mutable_data();
+    {
+      py::gil_scoped_release gil;
+      _index->knnGraph(/* K = */ K, /* ef_search = */ ef_search,
+                       /* distances = */ distances_data,
+                       /* labels = */ labels_data,
+                       /* row_labels = */ row_labels_data);
+    }
+    return {distances_array, labels_array, row_labels};
   }
 
   DistancesLabelsPair searchSingle(const py::array &query, int K, int ef_search,
-                                   int num_initializations) {
+                                   int num_initializations,
+                                   py::object allowed_labels = py::none()) {
+    AllowList allow_list(allowed_labels);
     return cast_and_call(
         _data_type, query,
-        [this](auto &&casted_query, int k, int ef, int num_init) {
+        [this, &allow_list](auto &&casted_query, int k, int ef, int num_init) {
           return this->searchSingleImpl(
               std::forward<decltype(casted_query)>(casted_query), k, ef,
-              num_init);
+              num_init, allow_list.filter(), allow_list.size());
         },
         K, ef_search, num_initializations);
   }
 };
 
+// The Python class of PyIndex<dist_t, label_t> is named after the distance,
+// followed by the label type unless labels are 32-bit ints (e.g.
+// `IndexL2Float` and `IndexL2FloatUint64`).
 template <typename dist_t> struct IndexSpecialization;
 
 template <> struct IndexSpecialization<SquaredL2Distance<DataType::float32>> {
-  using type = PyIndex<SquaredL2Distance<DataType::float32>, int>;
-  static constexpr char *name = "IndexL2Float";
+  static constexpr const char *name = "IndexL2Float";
 };
 
 template <> struct IndexSpecialization<SquaredL2Distance<DataType::uint8>> {
-  using type = PyIndex<SquaredL2Distance<DataType::uint8>, int>;
-  static constexpr char *name = "IndexL2Uint8";
+  static constexpr const char *name = "IndexL2Uint8";
 };
 
 template <> struct IndexSpecialization<SquaredL2Distance<DataType::int8>> {
-  using type = PyIndex<SquaredL2Distance<DataType::int8>, int>;
-  static constexpr char *name = "IndexL2Int8";
+  static constexpr const char *name = "IndexL2Int8";
 };
 
 template <>
 struct IndexSpecialization<InnerProductDistance<DataType::float32>> {
-  using type = PyIndex<InnerProductDistance<DataType::float32>, int>;
-  static constexpr char *name = "IndexIPFloat";
+  static constexpr const char *name = "IndexIPFloat";
 };
 
 template <> struct IndexSpecialization<InnerProductDistance<DataType::uint8>> {
-  using type = PyIndex<InnerProductDistance<DataType::uint8>, int>;
-  static constexpr char *name = "IndexIPUint8";
+  static constexpr const char *name = "IndexIPUint8";
 };
 
 template <> struct IndexSpecialization<InnerProductDistance<DataType::int8>> {
-  using type = PyIndex<InnerProductDistance<DataType::int8>, int>;
-  static constexpr char *name = "IndexIPInt8";
+  static constexpr const char *name = "IndexIPInt8";
+};
+
+template <> struct IndexSpecialization<ProductQuantizer> {
+  static constexpr const char *name = "IndexPQ";
+};
+
+template <> struct IndexSpecialization<ScalarQuantizer> {
+  static constexpr const char *name = "IndexSQ";
+};
+
+template <typename label_t> struct LabelSpecialization;
+
+template <> struct LabelSpecialization<int> {
+  static constexpr const char *suffix = "";
+};
+
+template <> struct LabelSpecialization<int64_t> {
+  static constexpr const char *suffix = "Int64";
+};
+
+template <> struct LabelSpecialization<uint64_t> {
+  static constexpr const char *suffix = "Uint64";
 };
 
 void validateDistanceType(const std::string &distance_type) {
@@ -434,29 +1141,101 @@ void validateDistanceType(const std::string &distance_type) {
   }
 }
 
-template <DataType data_type, typename... Args>
+template <DataType data_type, typename label_t, typename... Args>
 py::object createIndex(const std::string &distance_type, int dim,
                        Args &&... args) {
   validateDistanceType(distance_type);
 
   if (distance_type == "l2") {
     auto distance = SquaredL2Distance<data_type>::create(dim);
-    auto index = std::make_shared<PyIndex<SquaredL2Distance<data_type>, int>>(
-        std::move(distance), data_type, std::forward<Args>(args)...);
+    auto index =
+        std::make_shared<PyIndex<SquaredL2Distance<data_type>, label_t>>(
+            std::move(distance), data_type, std::forward<Args>(args)...);
     return py::cast(index);
   }
 
   auto distance = InnerProductDistance<data_type>::create(dim);
-  auto index = std::make_shared<PyIndex<InnerProductDistance<data_type>, int>>(
-      std::move(distance), data_type, std::forward<Args>(args)...);
+  auto index =
+      std::make_shared<PyIndex<InnerProductDistance<data_type>, label_t>>(
+          std::move(distance), data_type, std::forward<Args>(args)...);
   return py::cast(index);
 }
 
+// Builds the quantizer named by `quantization` (`pq`, `sq8` or `fp16`) and an
+// index over it. Quantized indices take float32 vectors.
+template <typename label_t>
+py::object createQuantizedIndex(const std::string &quantization,
+                                const std::string &distance_type, int dim,
+                                int dataset_size, int max_edges_per_node,
+                                DataType index_data_type, bool verbose,
+                                bool collect_stats, int pq_subquantizers,
+                                int pq_nbits, bool rerank,
+                                const std::string &rerank_vectors_path) {
+  validateDistanceType(distance_type);
+  if (index_data_type != DataType::float32) {
+    throw std::invalid_argument("Quantized indices only support float32 data.");
+  }
+  MetricType metric_type =
+      distance_type == "l2" ? MetricType::L2 : MetricType::IP;
+
+  auto make_index = [&](auto distance) {
+    using dist_t = typename decltype(distance)::element_type;
+    auto index = std::make_shared<PyIndex<dist_t, label_t>>(
+        std::move(distance), index_data_type, dataset_size, max_edges_per_node,
+        verbose, collect_stats);
+    if (rerank) {
+      index->enableReranking(/* vectors_filename = */ rerank_vectors_path);
+    }
+    return py::cast(index);
+  };
+
+  if (quantization == "pq") {
+    if (pq_subquantizers <= 0) {
+      throw std::invalid_argument("pq_subquantizers must be set to a positive "
+                                  "number of subquantizers.");
+    }
+    return make_index(std::make_unique<ProductQuantizer>(
+        /* dim = */ dim, /* M = */ pq_subquantizers, /* nbits = */ pq_nbits,
+        /* metric_type = */ metric_type));
+  }
+  if (quantization == "sq8" || quantization == "fp16") {
+    return make_index(std::make_unique<ScalarQuantizer>(
+        /* dim = */ dim, /* metric_type = */ metric_type,
+        /* code_type = */ quantization == "sq8" ? DataType::int8
+                                                : DataType::float16));
+  }
+  throw std::invalid_argument("`" + quantization +
+                              "` is not a supported quantization. Valid "
+                              "options include `pq`, `sq8` and `fp16`.");
+}
+
+// Calls `function` with a value of the label type named by `label_dtype`,
+// which must be one of int32, int64 or uint64.
+template <typename Function>
+py::object dispatchLabelType(const py::object &label_dtype,
+                             Function function) {
+  py::dtype dtype = py::dtype::from_args(label_dtype);
+  if (dtype.equal(py::dtype::of<int>())) {
+    return function(int{});
+  }
+  if (dtype.equal(py::dtype::of<int64_t>())) {
+    return function(int64_t{});
+  }
+  if (dtype.equal(py::dtype::of<uint64_t>())) {
+    return function(uint64_t{});
+  }
+  throw std::invalid_argument(
+      "Unsupported label_dtype `" + py::str(dtype).cast<std::string>() +
+      "`. Valid options include int32, int64 and uint64.");
+}
+
 template <typename dist_t, typename label_t>
-void bindSpecialization(py::module_ &index_submodule) {
-  using IndexType = typename IndexSpecialization<dist_t>::type;
+auto bindSpecialization(py::module_ &index_submodule) {
+  using IndexType = PyIndex<dist_t, label_t>;
+  std::string name = std::string(IndexSpecialization<dist_t>::name) +
+                     LabelSpecialization<label_t>::suffix;
   auto index_class = py::class_<IndexType, std::shared_ptr<IndexType>>(
-      index_submodule, IndexSpecialization<dist_t>::name);
+      index_submodule, name.c_str());
 
   index_class
       .def(
@@ -468,6 +1247,13 @@ void bindSpecialization(py::module_ &index_submodule) {
           py::arg("data"), py::arg("ef_construction"),
           py::arg("num_initializations") = 100, py::arg("labels") = py::none(),
           ADD_DOCSTRING)
+      .def("add_from_file", &IndexType::addFromFile, py::arg("path"),
+           py::arg("ef_construction"), py::arg("format") = "",
+           py::arg("chunk_size") = 100000, py::arg("num_initializations") = 100,
+           py::arg("first_label") = std::nullopt, ADD_FROM_FILE_DOCSTRING)
+      .def("add_stream", &IndexType::addStream, py::arg("chunks"),
+           py::arg("ef_construction"), py::arg("num_initializations") = 100,
+           py::arg("first_label") = std::nullopt, ADD_STREAM_DOCSTRING)
       .def(
           "allocate_nodes",
           [](IndexType &index,
@@ -477,78 +1263,411 @@ void bindSpecialization(py::module_ &index_submodule) {
       .def(
           "search_single",
           [](IndexType &index, const py::array &query, int K, int ef_search,
-             int num_initializations = 100) {
-            return index.searchSingle(query, K, ef_search, num_initializations);
+             int num_initializations = 100,
+             py::object allowed_labels = py::none()) {
+            return index.searchSingle(query, K, ef_search, num_initializations,
+                                      allowed_labels);
           },
           py::arg("query"), py::arg("K"), py::arg("ef_search"),
-          py::arg("num_initializations") = 100, SEARCH_SINGLE_DOCSTRING)
+          py::arg("num_initializations") = 100,
+          py::arg("allowed_labels") = py::none(), SEARCH_SINGLE_DOCSTRING)
       .def(
           "search",
           [](IndexType &index, const py::array &queries, int K, int ef_search,
-             int num_initializations = 100) {
-            return index.search(queries, K, ef_search, num_initializations);
+             int num_initializations = 100,
+             py::object allowed_labels = py::none(),
+             py::object out_distances = py::none(),
+             py::object out_labels = py::none()) {
+            return index.search(queries, K, ef_search, num_initializations,
+                                allowed_labels, out_distances, out_labels);
           },
           py::arg("queries"), py::arg("K"), py::arg("ef_search"),
-          py::arg("num_initializations") = 100, SEARCH_DOCSTRING)
+          py::arg("num_initializations") = 100,
+          py::arg("allowed_labels") = py::none(),
+          py::arg("out_distances") = py::none(),
+          py::arg("out_labels") = py::none(), SEARCH_DOCSTRING)
+      .def("range_search", &IndexType::rangeSearch, py::arg("queries"),
+           py::arg("radius"), py::arg("max_results") = py::none(),
+           py::arg("ef_search") = 100, py::arg("num_initializations") = 100,
+           py::arg("allowed_labels") = py::none(), RANGE_SEARCH_DOCSTRING)
+      .def("knn_graph", &IndexType::knnGraph, py::arg("K"),
+           py::arg("ef_search"), py::arg("distances") = py::none(),
+           py::arg("labels") = py::none(), KNN_GRAPH_DOCSTRING)
+      .def("remove", &IndexType::remove, py::arg("label"), REMOVE_DOCSTRING)
+      .def("contains", &IndexType::contains, py::arg("labels"),
+           CONTAINS_DOCSTRING)
+      .def("__contains__", &IndexType::containsLabel, py::arg("label"))
+      .def("get_vector", &IndexType::getVector, py::arg("label"),
+           GET_VECTOR_DOCSTRING)
+      .def("get_vectors", &IndexType::getVectors, py::arg("labels"),
+           GET_VECTORS_DOCSTRING)
+      .def(
+          "update",
+          [](IndexType &index, const py::array &data, label_t label,
+             int ef_construction, int num_initializations = 100) {
+            index.update(data, label, ef_construction, num_initializations);
+          },
+          py::arg("data"), py::arg("label"), py::arg("ef_construction"),
+          py::arg("num_initializations") = 100, UPDATE_DOCSTRING)
+      .def("repair_deleted_nodes", &IndexType::repairDeletedNodes,
+           REPAIR_DELETED_NODES_DOCSTRING)
+      .def("refine_graph", &IndexType::refineGraph,
+           py::arg("ef_construction"), REFINE_GRAPH_DOCSTRING)
       .def("get_query_distance_computations",
            &IndexType::getQueryDistanceComputations,
            GET_QUERY_DISTANCE_COMPUTATIONS_DOCSTRING)
       .def("save", &IndexType::save, py::arg("filename"), SAVE_DOCSTRING)
+      .def("save_async", &IndexType::saveAsync, py::arg("filename"),
+           SAVE_ASYNC_DOCSTRING)
       .def("build_graph_links", &IndexType::buildGraphLinks,
-           py::arg("mtx_filename"), BUILD_GRAPH_LINKS_DOCSTRING)
+           py::arg("mtx_filename") = py::none(), py::arg("indptr") = py::none(),
+           py::arg("indices") = py::none(), py::arg("edges") = py::none(),
+           BUILD_GRAPH_LINKS_DOCSTRING)
       .def("get_graph_outdegree_table", &IndexType::getGraphOutdegreeTable,
            GET_GRAPH_OUTDEGREE_TABLE_DOCSTRING)
       .def("reorder", &IndexType::reorder, py::arg("strategies"),
            REORDER_DOCSTRING)
       .def("set_num_threads", &IndexType::setNumThreads, py::arg("num_threads"),
+           py::arg("pin_threads") = false, py::arg("chunk_size") = 0,
            SET_NUM_THREADS_DOCSTRING)
+      .def("resize", &IndexType::resize, py::arg("new_capacity"),
+           RESIZE_DOCSTRING)
+      .def("freeze", &IndexType::freeze, FREEZE_DOCSTRING)
+      .def("unfreeze", &IndexType::unfreeze, UNFREEZE_DOCSTRING)
+      .def("set_entry_point_strategy", &IndexType::setEntryPointStrategy,
+           py::arg("strategy"), SET_ENTRY_POINT_STRATEGY_DOCSTRING)
       .def_static("load_index", &IndexType::loadIndex, py::arg("filename"),
-                  LOAD_INDEX_DOCSTRING)
+                  py::arg("mmap") = false, LOAD_INDEX_DOCSTRING)
+      .def_static("load_graph", &IndexType::loadGraph, py::arg("filename"),
+                  LOAD_GRAPH_DOCSTRING)
+      .def_static("load_vectors", &IndexType::loadVectors, py::arg("filename"),
+                  LOAD_VECTORS_DOCSTRING)
       .def_property_readonly("max_edges_per_node",
                              &IndexType::getMaxEdgesPerNode)
+      .def_property_readonly("num_deleted_nodes",
+                             &IndexType::getNumDeletedNodes,
+                             NUM_DELETED_NODES_DOCSTRING)
       .def_property_readonly("num_threads", &IndexType::getNumThreads,
-                             NUM_THREADS_DOCSTRING);
+                             NUM_THREADS_DOCSTRING)
+      .def_property_readonly("is_frozen", &IndexType::isFrozen,
+                             IS_FROZEN_DOCSTRING)
+      .def_property_readonly("capacity", &IndexType::getCapacity,
+                             CAPACITY_DOCSTRING)
+      .def_property("auto_grow", &IndexType::getAutoGrow,
+                    &IndexType::setAutoGrow, AUTO_GROW_DOCSTRING)
+      .def_property("pruning_alpha", &IndexType::getPruningAlpha,
+                    &IndexType::setPruningAlpha, PRUNING_ALPHA_DOCSTRING)
+      .def_property_readonly("entry_point_strategy",
+                             &IndexType::getEntryPointStrategy,
+                             ENTRY_POINT_STRATEGY_DOCSTRING)
+      .def_property_readonly("rerank", &IndexType::rerankingEnabled,
+                             RERANK_DOCSTRING)
+      .def_property_readonly("node_permutation",
+                             &IndexType::getNodePermutation,
+                             NODE_PERMUTATION_DOCSTRING);
+
+  return index_class;
 }
 
-void defineIndexSubmodule(py::module_ &index_submodule) {
-  bindSpecialization<SquaredL2Distance<DataType::float32>, int>(
+/**
+ * Serves single queries submitted from asyncio code. Queries are coalesced
+ * into batches, each searched with one `search` call of the wrapped index,
+ * which runs on the thread pool of the index without the GIL. A batch is
+ * dispatched once it holds `max_batch_size` queries or its oldest query has
+ * waited `max_wait` seconds. Only queries with the same search parameters
+ * share a batch.
+ *
+ * Batches are dispatched by a Python thread started with the first query. It
+ * waits for batches without holding the GIL.
+ */
+class AsyncIndex : public std::enable_shared_from_this<AsyncIndex> {
+  struct Batch {
+    int K;
+    int ef_search;
+    int num_initializations;
+    std::chrono::steady_clock::time_point deadline;
+    std::vector<py::object> queries;
+    // A `concurrent.futures.Future` per query, resolved with its results.
+    std::vector<py::object> futures;
+  };
+
+  py::object _index;
+  size_t _max_batch_size;
+  std::chrono::nanoseconds _max_wait;
+
+  // Guards the batches and `_closed`. It is never held while acquiring the
+  // GIL, so Python threads may take it while holding the GIL.
+  std::mutex _guard;
+  std::condition_variable _batch_ready;
+  // Batches that are not dispatched yet, oldest (and so first due) first.
+  std::list<Batch> _batches;
+  bool _closed = false;
+  py::object _dispatcher;
+
+public:
+  AsyncIndex(py::object index, size_t max_batch_size, double max_wait)
+      : _index(std::move(index)), _max_batch_size(max_batch_size),
+        _max_wait(std::chrono::duration_cast<std::chrono::nanoseconds>(
+            std::chrono::duration<double>(max_wait))) {
+    if (max_batch_size == 0) {
+      throw std::invalid_argument("max_batch_size must be greater than 0.");
+    }
+    if (max_wait < 0) {
+      throw std::invalid_argument("max_wait cannot be negative.");
+    }
+  }
+
+  py::object searchOne(const py::array &query, int K, int ef_search,
+                       int num_initializations) {
+    if (query.ndim() != 1) {
+      throw std::invalid_argument("Query must be a 1-D array.");
+    }
+    py::object future = py::module_::import("concurrent.futures").attr(
+        "Future")();
+    bool notify;
+    {
+      std::lock_guard<std::mutex> lock(_guard);
+      if (_closed) {
+        throw std::runtime_error("Cannot search a closed AsyncIndex.");
+      }
+      auto batch = std::find_if(
+          _batches.begin(), _batches.end(), [&](const Batch &batch) {
+            return batch.K == K && batch.ef_search == ef_search &&
+                   batch.num_initializations == num_initializations &&
+                   batch.queries.size() < _max_batch_size;
+          });
+      // The dispatcher is woken up for new batches, whose deadline it does
+      // not know yet, and for full ones.
+      notify = batch == _batches.end();
+      if (notify) {
+        batch = _batches.insert(
+            _batches.end(),
+            Batch{K, ef_search, num_initializations,
+                  std::chrono::steady_clock::now() + _max_wait});
+      }
+      batch->queries.push_back(query);
+      batch->futures.push_back(future);
+      notify = notify || batch->queries.size() == _max_batch_size;
+    }
+    if (notify) {
+      _batch_ready.notify_one();
+    }
+    if (!_dispatcher) {
+      startDispatcher();
+    }
+    return py::module_::import("asyncio").attr("wrap_future")(future);
+  }
+
+  // Dispatches the pending queries and waits for the dispatcher to exit.
+  void close() {
+    {
+      std::lock_guard<std::mutex> lock(_guard);
+      if (_closed) {
+        return;
+      }
+      _closed = true;
+    }
+    _batch_ready.notify_all();
+    if (_dispatcher) {
+      _dispatcher.attr("join")();
+    }
+  }
+
+  py::object index() const { return _index; }
+  size_t maxBatchSize() const { return _max_batch_size; }
+  double maxWait() const {
+    return std::chrono::duration<double>(_max_wait).count();
+  }
+
+private:
+  void startDispatcher() {
+    auto self = shared_from_this();
+    _dispatcher = py::module_::import("threading")
+                      .attr("Thread")(
+                          py::arg("target") = py::cpp_function(
+                              [self] { self->dispatchBatches(); }),
+                          py::arg("name") = "flatnav-aio-dispatcher",
+                          py::arg("daemon") = true);
+    _dispatcher.attr("start")();
+  }
+
+  void dispatchBatches() {
+    while (true) {
+      Batch batch;
+      {
+        py::gil_scoped_release gil;
+        std::unique_lock<std::mutex> lock(_guard);
+        auto ready = _batches.end();
+        while (true) {
+          auto now = std::chrono::steady_clock::now();
+          ready = std::find_if(
+              _batches.begin(), _batches.end(), [&](const Batch &batch) {
+                return _closed || batch.deadline <= now ||
+                       batch.queries.size() == _max_batch_size;
+              });
+          if (ready != _batches.end() || _closed) {
+            break;
+          }
+          if (_batches.empty()) {
+            _batch_ready.wait(lock);
+          } else {
+            _batch_ready.wait_until(lock, _batches.front().deadline);
+          }
+        }
+        if (ready == _batches.end()) {
+          return;
+        }
+        batch = std::move(*ready);
+        _batches.erase(ready);
+      }
+      dispatch(batch);
+    }
+  }
+
+  // Searches the queries of `batch` and resolves their futures. Errors are
+  // raised from every query in the batch.
+  void dispatch(Batch &batch) {
+    std::vector<py::object> futures;
+    std::vector<size_t> rows;
+    for (size_t i = 0; i < batch.futures.size(); i++) {
+      // Skips the queries that were cancelled while they waited.
+      if (batch.futures[i]
+              .attr("set_running_or_notify_cancel")()
+              .cast<bool>()) {
+        futures.push_back(batch.futures[i]);
+        rows.push_back(i);
+      }
+    }
+    if (futures.empty()) {
+      return;
+    }
+    try {
+      py::list queries;
+      for (size_t row : rows) {
+        queries.append(batch.queries[row]);
+      }
+      py::tuple results = _index.attr("search")(
+          py::module_::import("numpy").attr("stack")(queries),
+          py::arg("K") = batch.K, py::arg("ef_search") = batch.ef_search,
+          py::arg("num_initializations") = batch.num_initializations);
+      py::object distances = results[0], labels = results[1];
+      for (size_t i = 0; i < futures.size(); i++) {
+        futures[i].attr("set_result")(
+            py::make_tuple(py::object(distances[py::int_(i)]),
+                           py::object(labels[py::int_(i)])));
+      }
+    } catch (py::error_already_set &error) {
+      for (auto &future : futures) {
+        future.attr("set_exception")(error.value());
+      }
+    }
+  }
+};
+
+void defineAioSubmodule(py::module_ &aio_submodule) {
+  py::class_<AsyncIndex, std::shared_ptr<AsyncIndex>>(
+      aio_submodule, "AsyncIndex", ASYNC_INDEX_DOCSTRING)
+      .def(py::init<py::object, size_t, double>(), py::arg("index"),
+           py::arg("max_batch_size") = 64, py::arg("max_wait") = 0.001)
+      .def("search_one", &AsyncIndex::searchOne, py::arg("query"),
+           py::arg("K"), py::arg("ef_search"),
+           py::arg("num_initializations") = 100, SEARCH_ONE_DOCSTRING)
+      .def("close", &AsyncIndex::close, ASYNC_INDEX_CLOSE_DOCSTRING)
+      .def("__enter__", [](std::shared_ptr<AsyncIndex> self) { return self; })
+      .def("__exit__", [](AsyncIndex &self, py::args) { self.close(); })
+      .def_property_readonly("index", &AsyncIndex::index)
+      .def_property_readonly("max_batch_size", &AsyncIndex::maxBatchSize)
+      .def_property_readonly("max_wait", &AsyncIndex::maxWait);
+}
+
+template <typename label_t>
+void bindLabelSpecializations(py::module_ &index_submodule) {
+  bindSpecialization<SquaredL2Distance<DataType::float32>, label_t>(
+      index_submodule);
+  bindSpecialization<SquaredL2Distance<DataType::int8>, label_t>(
       index_submodule);
-  bindSpecialization<SquaredL2Distance<DataType::int8>, int>(index_submodule);
-  bindSpecialization<SquaredL2Distance<DataType::uint8>, int>(index_submodule);
-  bindSpecialization<InnerProductDistance<DataType::float32>, int>(
+  bindSpecialization<SquaredL2Distance<DataType::uint8>, label_t>(
       index_submodule);
-  bindSpecialization<InnerProductDistance<DataType::int8>, int>(
+  bindSpecialization<InnerProductDistance<DataType::float32>, label_t>(
       index_submodule);
-  bindSpecialization<InnerProductDistance<DataType::uint8>, int>(
+  bindSpecialization<InnerProductDistance<DataType::int8>, label_t>(
       index_submodule);
+  bindSpecialization<InnerProductDistance<DataType::uint8>, label_t>(
+      index_submodule);
+  bindSpecialization<ProductQuantizer, label_t>(index_submodule)
+      .def("train", &PyIndex<ProductQuantizer, label_t>::train,
+           py::arg("data"), TRAIN_DOCSTRING)
+      .def_property_readonly("is_trained",
+                             &PyIndex<ProductQuantizer, label_t>::isTrained,
+                             IS_TRAINED_DOCSTRING);
+  bindSpecialization<ScalarQuantizer, label_t>(index_submodule)
+      .def("train", &PyIndex<ScalarQuantizer, label_t>::train, py::arg("data"),
+           TRAIN_DOCSTRING)
+      .def_property_readonly("is_trained",
+                             &PyIndex<ScalarQuantizer, label_t>::isTrained,
+                             IS_TRAINED_DOCSTRING);
+}
+
+void defineIndexSubmodule(py::module_ &index_submodule) {
+  bindLabelSpecializations<int>(index_submodule);
+  bindLabelSpecializations<int64_t>(index_submodule);
+  bindLabelSpecializations<uint64_t>(index_submodule);
 
   index_submodule.def(
       "create",
       [](const std::string &distance_type, int dim, int dataset_size,
          int max_edges_per_node, DataType index_data_type, bool verbose = false,
-         bool collect_stats = false) {
-        switch (index_data_type) {
-        case DataType::float32:
-          return createIndex<DataType::float32>(
-              distance_type, dim, dataset_size, max_edges_per_node, verbose,
-              collect_stats);
-        case DataType::int8:
-          return createIndex<DataType::int8>(distance_type, dim, dataset_size,
-                                             max_edges_per_node, verbose,
-                                             collect_stats);
-        case DataType::uint8:
-          return createIndex<DataType::uint8>(distance_type, dim, dataset_size,
-                                              max_edges_per_node, verbose,
-                                              collect_stats);
-        default:
-          throw std::runtime_error("Unsupported data type");
+         bool collect_stats = false,
+         std::optional<std::string> quantization = std::nullopt,
+         int pq_subquantizers = 0, int pq_nbits = 8, bool rerank = false,
+         std::optional<std::string> rerank_vectors_path = std::nullopt,
+         const py::object &label_dtype = py::none()) {
+        if (rerank_vectors_path && !rerank) {
+          throw std::invalid_argument(
+              "rerank_vectors_path requires rerank=True.");
         }
+        if (!quantization && rerank) {
+          throw std::invalid_argument(
+              "Re-ranking is only supported for quantized indices.");
+        }
+        py::object dtype = label_dtype.is_none()
+                               ? py::object(py::dtype::of<int>())
+                               : label_dtype;
+        return dispatchLabelType(dtype, [&](auto label) -> py::object {
+          using label_t = decltype(label);
+          if (quantization) {
+            return createQuantizedIndex<label_t>(
+                *quantization, distance_type, dim, dataset_size,
+                max_edges_per_node, index_data_type, verbose, collect_stats,
+                pq_subquantizers, pq_nbits, rerank,
+                rerank_vectors_path.value_or(""));
+          }
+          switch (index_data_type) {
+          case DataType::float32:
+            return createIndex<DataType::float32, label_t>(
+                distance_type, dim, dataset_size, max_edges_per_node, verbose,
+                collect_stats);
+          case DataType::int8:
+            return createIndex<DataType::int8, label_t>(
+                distance_type, dim, dataset_size, max_edges_per_node, verbose,
+                collect_stats);
+          case DataType::uint8:
+            return createIndex<DataType::uint8, label_t>(
+                distance_type, dim, dataset_size, max_edges_per_node, verbose,
+                collect_stats);
+          default:
+            throw std::runtime_error("Unsupported data type");
+          }
+        });
       },
       py::arg("distance_type"), py::arg("dim"), py::arg("dataset_size"),
       py::arg("max_edges_per_node"),
       py::arg("index_data_type") = DataType::float32,
       py::arg("verbose") = false, py::arg("collect_stats") = false,
-      CONSTRUCTOR_DOCSTRING);
+      py::arg("quantization") = py::none(), py::arg("pq_subquantizers") = 0,
+      py::arg("pq_nbits") = 8, py::arg("rerank") = false,
+      py::arg("rerank_vectors_path") = py::none(),
+      py::arg("label_dtype") = py::none(), CONSTRUCTOR_DOCSTRING);
 }
 
 void defineDatatypeEnums(py::module_ &module) {
@@ -575,4 +1694,7 @@ PYBIND11_MODULE(flatnav, module) {
   auto index_submodule = module.def_submodule("index");
   defineIndexSubmodule(index_submodule);
   defineDistanceEnums(module);
+
+  auto aio_submodule = module.def_submodule("aio");
+  defineAioSubmodule(aio_submodule);
 }
\ No newline at end of file
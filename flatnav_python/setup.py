@@ -77,12 +77,19 @@ if not no_simd_vectorization:
         # Reference: https://llvm.org/docs/Vectorizers.html
         EXTRA_COMPILE_ARGS.append("-ftree-vectorize")
 
+DEFINE_MACROS = [("VERSION_INFO", __version__)]
+
+# Node ids are 32 bits wide unless FLATNAV_64BIT_NODE_IDS is set to 1, which
+# lifts the limit of ~4.29B nodes per index at the cost of 4 more bytes per link.
+if int(os.environ.get("FLATNAV_64BIT_NODE_IDS", "0")):
+    DEFINE_MACROS.append(("FLATNAV_64BIT_NODE_IDS", None))
+
 
 ext_modules = [
     Pybind11Extension(
         "flatnav",
         [SOURCE_PATH],
-        define_macros=[("VERSION_INFO", __version__)],
+        define_macros=DEFINE_MACROS,
         cxx_std=17,
         include_dirs=INCLUDE_DIRS,
         extra_compile_args=EXTRA_COMPILE_ARGS,
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from flatnav.aio import AsyncIndex
+from .test_utils import generate_random_data, create_index
+import numpy as np
+import pytest
+
+
+def build_index(num_vectors: int = 2_000, dim: int = 32):
+    training_set = generate_random_data(dataset_length=num_vectors, dim=dim)
+    index = create_index(
+        distance_type="l2",
+        dim=dim,
+        dataset_size=num_vectors,
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=64)
+    return index
+
+
+def test_async_index_matches_search_single():
+    index = build_index()
+    queries = generate_random_data(dataset_length=100, dim=32)
+
+    async def search_all(async_index):
+        return await asyncio.gather(
+            *[async_index.search_one(query, K=10, ef_search=64) for query in queries]
+        )
+
+    # A long `max_wait` only returns quickly if full batches are dispatched
+    # right away.
+    with AsyncIndex(index, max_batch_size=10, max_wait=60.0) as async_index:
+        start = time.time()
+        results = asyncio.run(search_all(async_index))
+        assert time.time() - start < 30
+
+    for query, (distances, labels) in zip(queries, results):
+        expected_distances, expected_labels = index.search_single(
+            query=query, K=10, ef_search=64
+        )
+        assert np.array_equal(labels, expected_labels)
+        assert np.allclose(distances, expected_distances)
+
+
+def test_async_index_dispatches_partial_batches():
+    index = build_index()
+    queries = generate_random_data(dataset_length=3, dim=32)
+
+    async def search_all(async_index):
+        # Queries with different search parameters go to different batches.
+        return await asyncio.gather(
+            async_index.search_one(queries[0], K=5, ef_search=32),
+            async_index.search_one(queries[1], K=10, ef_search=64),
+            async_index.search_one(queries[2], K=5, ef_search=32),
+        )
+
+    async_index = AsyncIndex(index, max_batch_size=1_000, max_wait=0.01)
+    results = asyncio.run(search_all(async_index))
+    assert [len(labels) for _, labels in results] == [5, 10, 5]
+    async_index.close()
+
+    async def search_after_close():
+        return await async_index.search_one(queries[0], K=5, ef_search=32)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(search_after_close())
+    with pytest.raises(ValueError):
+        AsyncIndex(index, max_batch_size=0)
@@ -1,4 +1,6 @@
+import asyncio
 import flatnav
+import os
 from flatnav.index import IndexL2Float, IndexIPFloat
 from typing import Union, Optional
 import numpy as np
@@ -151,3 +153,558 @@ def run_test(
         if not recall_threshold:
             raise RuntimeError("Recall threshold must be provided.")
         assert recall >= recall_threshold
+
+
+def test_search_with_allowed_labels():
+    training_set = generate_random_data(dataset_length=5_000, dim=32)
+    queries = generate_random_data(dataset_length=100, dim=32)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=64)
+
+    # A broad filter goes through the graph search, a narrow one through the
+    # exhaustive scan. Both must only return allowed labels.
+    even_labels = np.arange(0, len(training_set), 2)
+    mask = np.zeros(len(training_set), dtype=bool)
+    mask[even_labels] = True
+    for allowed_labels in [even_labels, mask, np.array([3, 17, 42])]:
+        _, labels = index.search(
+            queries=queries, K=10, ef_search=64, allowed_labels=allowed_labels
+        )
+        if allowed_labels.dtype == bool:
+            allowed = set(np.flatnonzero(allowed_labels))
+        else:
+            allowed = set(allowed_labels)
+        assert all(label in allowed or label == -1 for label in labels.flatten())
+
+    distances, labels = index.search_single(
+        query=queries[0], K=10, ef_search=64, allowed_labels=np.array([3, 17, 42])
+    )
+    assert sorted(labels[:3]) == [3, 17, 42]
+    assert np.all(labels[3:] == -1)
+    assert np.all(np.isinf(distances[3:]))
+
+
+def test_sample_graph_entry_point_strategy():
+    training_set = generate_random_data(dataset_length=5_000, dim=32)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+    )
+    assert index.entry_point_strategy == "stride"
+    index.set_entry_point_strategy("sample_graph")
+    assert index.entry_point_strategy == "sample_graph"
+    index.add(data=training_set, ef_construction=64)
+
+    _, labels = index.search(queries=training_set[:100], K=1, ef_search=32)
+    assert np.mean(labels[:, 0] == np.arange(100)) >= 0.95
+
+    with pytest.raises(ValueError):
+        index.set_entry_point_strategy("kmeans")
+
+
+def test_index_grows_without_rebuilding():
+    training_set = generate_random_data(dataset_length=4_000, dim=32)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=1_000,
+        max_edges_per_node=16,
+    )
+    assert index.capacity == 1_000
+    assert not index.auto_grow
+    labels = np.arange(len(training_set))
+    index.add(data=training_set[:1_000], ef_construction=64, labels=labels[:1_000])
+    with pytest.raises(RuntimeError):
+        index.add(
+            data=training_set[1_000:1_001],
+            ef_construction=64,
+            labels=labels[1_000:1_001],
+        )
+
+    index.resize(2_000)
+    assert index.capacity == 2_000
+    index.add(
+        data=training_set[1_000:2_000],
+        ef_construction=64,
+        labels=labels[1_000:2_000],
+    )
+
+    index.auto_grow = True
+    index.add(data=training_set[2_000:], ef_construction=64, labels=labels[2_000:])
+    assert index.capacity >= len(training_set)
+
+    _, labels = index.search(queries=training_set[::40], K=1, ef_search=32)
+    assert np.mean(labels[:, 0] == np.arange(0, len(training_set), 40)) >= 0.95
+
+
+def test_label_lookups_survive_reordering(tmp_path):
+    training_set = generate_random_data(dataset_length=2_000, dim=32)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=64)
+    index.remove(5)
+    assert np.array_equal(index.node_permutation, np.arange(len(training_set)))
+
+    index.reorder(strategies=["gorder"])
+    permutation = index.node_permutation
+    assert np.array_equal(np.sort(permutation), np.arange(len(training_set)))
+
+    path = str(tmp_path / "reordered.index")
+    index.save(path)
+    loaded_index = IndexL2Float.load_index(path)
+    assert np.array_equal(loaded_index.node_permutation, permutation)
+
+    labels = np.arange(0, len(training_set), 3)
+    for reordered_index in [index, loaded_index]:
+        assert np.array_equal(reordered_index.contains(labels), labels != 5)
+        assert 4 in reordered_index and 5 not in reordered_index
+        assert reordered_index.contains(np.array([len(training_set)]))[0] == False
+        kept = labels[labels != 5]
+        assert np.array_equal(
+            reordered_index.get_vectors(kept),
+            training_set[kept].astype(np.float32),
+        )
+        assert np.array_equal(
+            reordered_index.get_vector(4), training_set[4].astype(np.float32)
+        )
+        with pytest.raises(ValueError):
+            reordered_index.get_vector(5)
+
+
+def test_sixty_four_bit_labels(tmp_path):
+    training_set = generate_random_data(dataset_length=1_000, dim=16)
+    index = flatnav.index.create(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+        label_dtype=np.uint64,
+    )
+    assert isinstance(index, flatnav.index.IndexL2FloatUint64)
+
+    labels = np.arange(len(training_set), dtype=np.uint64) + np.uint64(2**40)
+    index.add(data=training_set, ef_construction=64, labels=labels)
+    distances, found = index.search(queries=training_set[:10], K=5, ef_search=64)
+    assert found.dtype == np.uint64
+    assert np.array_equal(found[:, 0], labels[:10])
+
+    # Missing results are padded with -1 cast to the label type.
+    _, found = index.search_single(
+        query=training_set[0], K=5, ef_search=64, allowed_labels=labels[:2]
+    )
+    assert np.all(found[2:] == np.iinfo(np.uint64).max)
+
+    path = str(tmp_path / "uint64_labels.index")
+    index.save(path)
+    loaded_index = flatnav.index.IndexL2FloatUint64.load_index(path)
+    assert labels[7] in loaded_index
+    assert np.array_equal(
+        loaded_index.get_vector(labels[7]), training_set[7].astype(np.float32)
+    )
+    with pytest.raises(RuntimeError):
+        IndexL2Float.load_index(path)
+
+    with pytest.raises(ValueError):
+        flatnav.index.create(
+            distance_type="l2",
+            dim=16,
+            dataset_size=10,
+            max_edges_per_node=16,
+            label_dtype=np.float32,
+        )
+
+
+def test_partial_index_loads(tmp_path):
+    training_set = generate_random_data(dataset_length=1_000, dim=16)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=4 * len(training_set),
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=64)
+    index.remove(3)
+    path = str(tmp_path / "partial.index")
+    index.save(path)
+
+    offsets, edges = IndexL2Float.load_graph(path)
+    outdegree_table = index.get_graph_outdegree_table()
+    assert len(offsets) == len(training_set) + 1
+    for node in range(len(training_set)):
+        neighbors = edges[offsets[node] : offsets[node + 1]].tolist()
+        assert neighbors == outdegree_table[node]
+
+    vectors, labels = IndexL2Float.load_vectors(path)
+    assert 3 not in labels and len(labels) == len(training_set) - 1
+    assert np.array_equal(vectors, training_set[labels].astype(np.float32))
+
+
+def test_save_async_while_inserting(tmp_path):
+    training_set = generate_random_data(dataset_length=2_000, dim=16)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set[:1_000], ef_construction=64)
+
+    path = str(tmp_path / "snapshot.index")
+    future = index.save_async(path)
+    index.add(data=training_set[1_000:], ef_construction=64)
+
+    async def wait_for_snapshot():
+        await asyncio.wrap_future(future)
+
+    asyncio.run(wait_for_snapshot())
+    snapshot = IndexL2Float.load_index(path)
+    assert 1_000 <= len(snapshot.get_graph_outdegree_table()) <= 2_000
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_range_search():
+    training_set = generate_random_data(dataset_length=2_000, dim=16)
+    queries = training_set[:20]
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=64)
+
+    radius = 1.4
+    lims, distances, labels = index.range_search(
+        queries=queries, radius=radius, ef_search=16
+    )
+    assert len(lims) == len(queries) + 1 and lims[-1] == len(labels)
+    assert np.all(distances <= radius)
+
+    true_distances = ((queries[:, None, :] - training_set[None, :, :]) ** 2).sum(-1)
+    expected = (true_distances <= radius).sum()
+    assert lims[-1] >= 0.9 * expected
+    for i in range(len(queries)):
+        assert labels[lims[i]] == i
+        assert np.all(np.diff(distances[lims[i] : lims[i + 1]]) >= 0)
+
+    lims, _, labels = index.range_search(queries=queries, radius=radius, max_results=3)
+    assert np.all(np.diff(lims) <= 3)
+
+
+def test_knn_graph(tmp_path):
+    training_set = generate_random_data(dataset_length=1_000, dim=16)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=64)
+    index.remove(7)
+
+    distances = np.memmap(
+        tmp_path / "distances.bin", dtype=np.float32, mode="w+", shape=(999, 10)
+    )
+    _, labels, row_labels = index.knn_graph(K=10, ef_search=64, distances=distances)
+    assert np.array_equal(row_labels, np.delete(np.arange(1_000), 7))
+    assert not np.any(labels == row_labels[:, None]) and not np.any(labels == 7)
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+    _, search_labels = index.search(
+        queries=training_set[row_labels], K=11, ef_search=64
+    )
+    recall = np.mean(
+        [np.isin(labels[i], search_labels[i]).mean() for i in range(len(labels))]
+    )
+    assert recall >= 0.95
+
+    with pytest.raises(ValueError):
+        index.knn_graph(K=10, ef_search=64, labels=np.zeros((999, 5), dtype=np.int32))
+
+
+def test_graph_import(tmp_path):
+    training_set = generate_random_data(dataset_length=1_000, dim=16)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=64)
+    outdegree_table = index.get_graph_outdegree_table()
+    indptr = np.cumsum([0] + [len(edges) for edges in outdegree_table])
+    indices = np.concatenate(outdegree_table)
+    edges = np.stack([np.repeat(np.arange(1_000), np.diff(indptr)), indices], axis=1)
+    edges.astype(np.uint32).tofile(tmp_path / "edges.bin")
+    _, expected_labels = index.search(queries=training_set, K=10, ef_search=64)
+
+    for graph in [
+        dict(indptr=indptr, indices=indices),
+        dict(edges=np.fromfile(tmp_path / "edges.bin", dtype=np.uint32).reshape(-1, 2)),
+    ]:
+        imported_index = create_index(
+            distance_type="l2",
+            dim=training_set.shape[1],
+            dataset_size=len(training_set),
+            max_edges_per_node=16,
+        )
+        imported_index.allocate_nodes(data=training_set).build_graph_links(**graph)
+        assert imported_index.get_graph_outdegree_table() == outdegree_table
+        _, labels = imported_index.search(queries=training_set, K=10, ef_search=64)
+        assert np.array_equal(labels, expected_labels)
+
+    with pytest.raises(ValueError):
+        # Every edge leaves node 0, which has more than 16 of them.
+        imported_index.build_graph_links(edges=edges * [0, 1])
+    with pytest.raises(ValueError):
+        imported_index.build_graph_links(indptr=indptr[:-1], indices=indices)
+    with pytest.raises(ValueError):
+        imported_index.build_graph_links()
+
+
+def test_refine_graph():
+    training_set = generate_random_data(dataset_length=2_000, dim=32)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=100)
+    queries = training_set[:200]
+    distances = ((queries[:, None, :] - training_set[None, :, :]) ** 2).sum(axis=-1)
+    ground_truth = np.argsort(distances, axis=1)[:, :10]
+
+    def recall() -> float:
+        _, labels = index.search(queries=queries, K=10, ef_search=10)
+        return np.mean([np.isin(labels[i], ground_truth[i]).mean() for i in range(200)])
+
+    initial_recall = recall()
+
+    with pytest.raises(ValueError):
+        index.pruning_alpha = 0.5
+    assert index.pruning_alpha == 1.0
+    index.pruning_alpha = 1.2
+    index.refine_graph(ef_construction=100)
+    assert index.is_frozen
+
+    assert recall() > initial_recall
+
+
+def test_search_into_memory_mapped_arrays(tmp_path):
+    training_set = generate_random_data(dataset_length=1_000, dim=16)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=64)
+
+    queries = np.memmap(
+        tmp_path / "queries.bin", dtype=np.float64, mode="w+", shape=(200, 16)
+    )
+    queries[:] = training_set[:200]
+    out_distances = np.memmap(
+        tmp_path / "distances.bin", dtype=np.float32, mode="w+", shape=(200, 5)
+    )
+    out_labels = np.empty((200, 5), dtype=np.int32)
+    distances, labels = index.search(
+        queries=queries,
+        K=5,
+        ef_search=32,
+        out_distances=out_distances,
+        out_labels=out_labels,
+    )
+    assert np.shares_memory(distances, out_distances)
+    assert np.shares_memory(labels, out_labels)
+
+    expected_distances, expected_labels = index.search(
+        queries=training_set[:200], K=5, ef_search=32
+    )
+    assert np.array_equal(out_labels, expected_labels)
+    assert np.array_equal(out_distances, expected_distances)
+
+    with pytest.raises(ValueError):
+        index.search(
+            queries=queries,
+            K=5,
+            ef_search=32,
+            out_labels=np.empty((200, 5), dtype=np.int64),
+        )
+
+
+def test_product_quantized_index():
+    # Every query must find itself, so fix the data: with any beam width, some
+    # datasets have a vector that the search passes by.
+    np.random.seed(0)
+    training_set = generate_random_data(dataset_length=5_000, dim=32)
+    queries = training_set[:100]
+
+    recalls = {}
+    for rerank in [False, True]:
+        index = flatnav.index.create(
+            distance_type="l2",
+            dim=training_set.shape[1],
+            dataset_size=len(training_set),
+            max_edges_per_node=16,
+            quantization="pq",
+            pq_subquantizers=8,
+            rerank=rerank,
+        )
+        assert isinstance(index, flatnav.index.IndexPQ)
+        assert index.rerank == rerank
+        assert not index.is_trained
+
+        with pytest.raises(RuntimeError):
+            index.add(data=training_set, ef_construction=64)
+
+        index.train(training_set)
+        assert index.is_trained
+        index.add(data=training_set, ef_construction=64)
+
+        distances, labels = index.search(queries=queries, K=1, ef_search=64)
+        recalls[rerank] = np.mean(labels[:, 0] == np.arange(len(queries)))
+        if rerank:
+            assert np.allclose(distances[:, 0], 0.0)
+
+    assert recalls[True] >= 0.95
+    assert recalls[True] >= recalls[False]
+
+    with pytest.raises(ValueError):
+        flatnav.index.create(
+            distance_type="l2",
+            dim=32,
+            dataset_size=10,
+            max_edges_per_node=16,
+            rerank=True,
+        )
+
+
+def test_product_quantized_index_with_rerank_vectors_on_disk(tmp_path):
+    training_set = generate_random_data(dataset_length=2_000, dim=32)
+    vectors_path = str(tmp_path / "rerank_vectors.bin")
+    index_path = str(tmp_path / "pq_index.bin")
+
+    index = flatnav.index.create(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+        quantization="pq",
+        pq_subquantizers=8,
+        rerank=True,
+        rerank_vectors_path=vectors_path,
+    )
+    index.train(training_set)
+    index.add(data=training_set, ef_construction=64)
+    index.save(index_path)
+
+    loaded_index = flatnav.index.IndexPQ.load_index(index_path)
+    assert loaded_index.rerank
+    distances, labels = loaded_index.search(
+        queries=training_set[:100], K=1, ef_search=64
+    )
+    assert np.mean(labels[:, 0] == np.arange(100)) >= 0.95
+    assert np.allclose(distances[labels[:, 0] == np.arange(100), 0], 0.0)
+
+
+@pytest.mark.parametrize("quantization", ["sq8", "fp16"])
+@pytest.mark.parametrize("distance_type", ["l2", "angular"])
+def test_scalar_quantized_index(quantization, distance_type):
+    training_set = generate_random_data(dataset_length=5_000, dim=32)
+    if distance_type == "angular":
+        training_set /= np.linalg.norm(training_set, axis=1, keepdims=True)
+    index = flatnav.index.create(
+        distance_type=distance_type,
+        dim=training_set.shape[1],
+        dataset_size=len(training_set),
+        max_edges_per_node=16,
+        quantization=quantization,
+    )
+    assert isinstance(index, flatnav.index.IndexSQ)
+    assert index.is_trained == (quantization == "fp16")
+
+    index.train(training_set)
+    index.add(data=training_set, ef_construction=64)
+    _, labels = index.search(queries=training_set[:100], K=10, ef_search=64)
+    # Every vector should be among the nearest neighbors of itself.
+    assert np.mean(np.any(labels == np.arange(100)[:, None], axis=1)) >= 0.95
+
+
+def write_dataset(path, data: np.ndarray, file_format: str):
+    if file_format == "npy":
+        np.save(path, data)
+    elif file_format in ("fbin", "u8bin"):
+        with open(path, "wb") as f:
+            np.array(data.shape, dtype=np.uint32).tofile(f)
+            data.tofile(f)
+    else:
+        rows = np.empty((len(data), 4 + data.shape[1]), dtype=np.uint8)
+        rows[:, :4] = np.array([data.shape[1]], dtype=np.int32).view(np.uint8)
+        rows[:, 4:] = data
+        rows.tofile(path)
+
+
+@pytest.mark.parametrize("file_format", ["fbin", "u8bin", "bvecs", "npy"])
+def test_add_from_file_and_stream(tmp_path, file_format):
+    dtype = np.float32 if file_format == "fbin" else np.uint8
+    training_set = np.random.randint(0, 256, size=(3_000, 32)).astype(dtype)
+    path = tmp_path / f"dataset.{file_format}"
+    write_dataset(path, training_set, file_format)
+
+    index_data_type = (
+        flatnav.data_type.DataType.float32
+        if dtype == np.float32
+        else flatnav.data_type.DataType.uint8
+    )
+    indices = []
+    for build in ["add", "add_from_file", "add_stream"]:
+        index = flatnav.index.create(
+            distance_type="l2",
+            dim=training_set.shape[1],
+            dataset_size=len(training_set),
+            max_edges_per_node=16,
+            index_data_type=index_data_type,
+        )
+        if build == "add":
+            index.add(data=training_set, ef_construction=64)
+        elif build == "add_from_file":
+            index.add_from_file(str(path), ef_construction=64, chunk_size=700)
+        else:
+            index.add_stream(
+                (training_set[i : i + 700] for i in range(0, len(training_set), 700)),
+                ef_construction=64,
+            )
+        indices.append(index)
+
+    results = [
+        index.search(queries=training_set[:100], K=10, ef_search=64)[1]
+        for index in indices
+    ]
+    assert np.array_equal(results[0], results[1])
+    assert np.array_equal(results[0], results[2])
+
+    # Vectors added to a non-empty index are labeled after the ones in it.
+    index = indices[0]
+    index.auto_grow = True
+    index.add_from_file(str(path), ef_construction=64, chunk_size=700)
+    index.add_stream([training_set[:10]], ef_construction=64)
+    index.add_stream([training_set[:10]], ef_construction=64, first_label=10_000)
+    assert np.all(index.contains(np.arange(2 * len(training_set) + 10)))
+    assert np.all(index.contains(np.arange(10_000, 10_010)))
+    assert np.array_equal(
+        index.get_vectors(np.arange(3_000, 6_010)),
+        np.concatenate([training_set, training_set[:10]]),
+    )
@@ -1,6 +1,8 @@
 import math
 import time
+from concurrent.futures import ThreadPoolExecutor
 from .test_utils import generate_random_data, compute_recall, create_index
+from flatnav.index import IndexL2Float
 import os
 import numpy as np
 
@@ -67,3 +69,85 @@ def test_parallel_insertions_yield_similar_recall():
 
     # Construction time should be significantly lower for parallel insertions
     assert parallel_construction_time < single_threaded_index_construction_time
+
+
+def test_parallel_python_threads_search_and_insert(tmp_path):
+    training_set = generate_random_data(dataset_length=20_000, dim=128)
+    queries = generate_random_data(dataset_length=4_000, dim=128)
+    index = create_index(
+        distance_type="l2",
+        dim=training_set.shape[1],
+        dataset_size=2 * training_set.shape[0],
+        max_edges_per_node=16,
+    )
+    index.add(data=training_set, ef_construction=100)
+    # Each call searches on its calling thread, so any speedup comes from the
+    # Python threads running at once.
+    index.set_num_threads(1)
+    num_threads = min(os.cpu_count(), 8)
+
+    def search(query):
+        return index.search_single(query=query, K=10, ef_search=64)
+
+    start = time.time()
+    serial_results = [search(query) for query in queries]
+    serial_time = time.time() - start
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        start = time.time()
+        threaded_results = list(executor.map(search, queries))
+        threaded_time = time.time() - start
+
+    speedup = serial_time / threaded_time
+    print(
+        f"\nsearch_single throughput: {len(queries) / serial_time:.0f} QPS on one "
+        f"thread, {len(queries) / threaded_time:.0f} QPS on {num_threads} threads "
+        f"(speedup = {speedup:.2f})"
+    )
+    for (distances, labels), (expected_distances, expected_labels) in zip(
+        threaded_results, serial_results
+    ):
+        assert np.array_equal(labels, expected_labels)
+        assert np.array_equal(distances, expected_distances)
+
+    # Searches, insertions and saves from many threads at once. `add` left the
+    # index frozen, so the first insertion thaws it while searches that
+    # started on the frozen index may still be running.
+    assert index.is_frozen
+    path = str(tmp_path / "concurrent.index")
+    new_vectors = generate_random_data(dataset_length=4_000, dim=128)
+    new_labels = np.arange(len(training_set), len(training_set) + len(new_vectors))
+    with ThreadPoolExecutor(max_workers=num_threads + 2) as executor:
+        insertions = [
+            executor.submit(
+                index.add,
+                data=new_vectors[i::2],
+                ef_construction=100,
+                labels=new_labels[i::2],
+            )
+            for i in range(2)
+        ]
+        saved = executor.submit(index.save, path)
+        searched = list(executor.map(search, queries))
+        for future in insertions + [saved]:
+            future.result()
+
+    # A search that starts from a node that is still being linked can find
+    # fewer than K results, padded with -1.
+    assert len(searched) == len(queries)
+    for distances, labels in searched:
+        assert np.all((labels == -1) | ((labels >= 0) & (labels <= new_labels[-1])))
+    assert np.all(index.contains(new_labels))
+    assert len(IndexL2Float.load_index(path).get_graph_outdegree_table()) >= len(
+        training_set
+    )
+
+    # Once the writes are done, threads see the same index as a serial search.
+    serial_results = [search(query) for query in new_vectors]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        threaded_results = list(executor.map(search, new_vectors))
+    for (distances, labels), (expected_distances, expected_labels) in zip(
+        threaded_results, serial_results
+    ):
+        assert np.array_equal(labels, expected_labels)
+        assert np.array_equal(distances, expected_distances)
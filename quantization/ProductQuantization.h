@@ -117,21 +117,17 @@ public:
       throw std::invalid_argument("The dataset dimension must be a multiple of "
                                   "the desired number of sub-quantizers.");
     }
-    _code_size = (_num_bits * 8 + 7) / 8;
+    if (_num_bits != 8) {
+      throw std::invalid_argument(
+          "Only 8 bits per subvector index are currently supported.");
+    }
+    _code_size = (_num_bits * _num_subquantizers + 7) / 8;
     _subvector_dim = dim / _num_subquantizers;
 
-    if (_metric_type == MetricType::L2) {
-      _distance = SquaredL2Distance<>(_subvector_dim);
-    } else if (_metric_type == MetricType::IP) {
-      _distance = InnerProductDistance<>(_subvector_dim);
-    } else {
-      throw std::invalid_argument("Invalid metric type");
-    }
+    setDistances();
 
     _subq_centroids_count = 1 << _num_bits;
     _centroids.resize(_subq_centroids_count * dim);
-
-    _dist_func = getDistFuncFromVariant();
   }
 
   // Return a pointer to the centroids associated with a given subvector
@@ -291,7 +287,7 @@ public:
 
     for (uint32_t m = 0; m < _num_subquantizers; m++) {
       uint64_t code_ = code_manager.decode();
-      std::memcpy(vector + (m * _subvector_dim), getCentroids(m, 0),
+      std::memcpy(vector + (m * _subvector_dim), getCentroids(m, code_),
                   sizeof(float) * _subvector_dim);
     }
   }
@@ -348,45 +344,64 @@ public:
   //                     Implementation of DistanceInterface Methods //
   //                                                                                    //
   ////////////////////////////////////////////////////////////////////////////////////////
-  inline size_t getDimension() const { return getCodeSize(); }
+  inline size_t getDimension() const {
+    return _subvector_dim * _num_subquantizers;
+  }
 
   inline size_t dataSizeImpl() { return getCodeSize(); }
 
   void transformDataImpl(void *destination, const void *src) {
-    uint8_t *code = new uint8_t[_code_size]();
-    computePQCode(static_cast<const float *>(src), code);
+    if (!_is_trained) {
+      throw std::runtime_error(
+          "The product quantizer must be trained before it is used.");
+    }
+    computePQCode(static_cast<const float *>(src),
+                  static_cast<uint8_t *>(destination));
+  }
+
+  // A query is represented by its distance table, so that the table is
+  // computed once per query rather than on every distance computation.
+  inline size_t querySizeImpl() {
+    return _num_subquantizers * _subq_centroids_count * sizeof(float);
+  }
+
+  void transformQueryImpl(void *destination, const void *src) {
+    if (!_is_trained) {
+      throw std::runtime_error(
+          "The product quantizer must be trained before it is used.");
+    }
+    computeDistanceTable(/* vector = */ static_cast<const float *>(src),
+                         /* dist_table = */ static_cast<float *>(destination),
+                         /* dist_func = */ _dist_func);
+  }
 
-    std::memcpy(destination, code, _code_size);
+  bool storesVectorsImpl() { return false; }
 
-    delete[] code;
+  float fullPrecisionDistanceImpl(const void *x, const void *y) {
+    return std::visit(
+        [x, y](auto &distance) { return distance.distanceImpl(x, y); },
+        _full_precision_distance);
   }
 
   /**
-   * @brief Computes the distance between a query vector and a database vector.
-   * NOTE: The first vector is expected to the query vector and the second one
-   * a database vector.
+   * @brief Computes the distance between a query and a database vector.
+   * NOTE: The first argument is expected to be the distance table of the
+   * query (see `transformQuery`) and the second one a database vector code.
    *
-   * @param x         query vector
-   * @param y         database vector
+   * @param x         query distance table
+   * @param y         database vector code
    * @return
    */
   float asymmetricDistanceImpl(const void *x, const void *y) const {
     assert(_is_trained);
 
-    float *x_ptr = (float *)(x);
-    uint8_t *y_ptr = (uint8_t *)(y);
-
-    float *dist_table = new float[_subq_centroids_count * _num_subquantizers];
-
-    computeDistanceTable(/* vector = */ x_ptr,
-                         /* dist_table = */ dist_table,
-                         /* dist_func = */ _dist_func);
+    const float *dist_table = static_cast<const float *>(x);
+    const uint8_t *y_ptr = static_cast<const uint8_t *>(y);
 
     float distance = 0.0;
     for (uint32_t m = 0; m < _num_subquantizers; m++) {
       distance += dist_table[(m * _subq_centroids_count) + y_ptr[m]];
     }
-    delete[] dist_table;
     return distance;
   }
 
@@ -451,6 +466,22 @@ public:
   inline bool isTrained() const { return _is_trained; }
 
 private:
+  // Sets the sub-vector distance used for training and distance tables, and
+  // the full-dimension distance used for re-ranking.
+  void setDistances() {
+    auto dim = _subvector_dim * _num_subquantizers;
+    if (_metric_type == MetricType::L2) {
+      _distance = SquaredL2Distance<>(_subvector_dim);
+      _full_precision_distance = SquaredL2Distance<>(dim);
+    } else if (_metric_type == MetricType::IP) {
+      _distance = InnerProductDistance<>(_subvector_dim);
+      _full_precision_distance = InnerProductDistance<>(dim);
+    } else {
+      throw std::invalid_argument("Invalid metric type");
+    }
+    _dist_func = getDistFuncFromVariant();
+  }
+
   // NOTE: This is a hack to get around the fact that the PQ class needs to know
   // which distance function to use. So, this function allows us to just extract
   // the distance function pointer since that's the only thing we care about.
@@ -567,6 +598,10 @@ private:
                InnerProductDistance<DataType::float32>>
       _distance;
 
+  std::variant<SquaredL2Distance<DataType::float32>,
+               InnerProductDistance<DataType::float32>>
+      _full_precision_distance;
+
   std::function<float(const float *, const float *)> _dist_func;
 
   friend class ::cereal::access;
@@ -579,14 +614,7 @@ private:
 
     if constexpr (Archive::is_loading::value) {
       // loading PQ
-      if (_metric_type == MetricType::L2) {
-        _distance = SquaredL2Distance<>(_subvector_dim);
-      } else if (_metric_type == MetricType::IP) {
-        _distance = InnerProductDistance<>(_subvector_dim);
-      } else {
-        throw std::invalid_argument("Invalid metric type");
-      }
-      _dist_func = getDistFuncFromVariant();
+      setDistances();
     }
   }
 };
@@ -0,0 +1,364 @@
+#pragma once
+
+#include <algorithm>
+#include <cereal/access.hpp>
+#include <cereal/archives/binary.hpp>
+#include <cereal/cereal.hpp>
+#include <cereal/types/vector.hpp>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <flatnav/distances/DistanceInterface.h>
+#include <flatnav/distances/IPDistanceDispatcher.h>
+#include <flatnav/distances/L2DistanceDispatcher.h>
+#include <flatnav/util/Datatype.h>
+#include <flatnav/util/InnerProductSimdExtensions.h>
+#include <flatnav/util/Macros.h>
+#include <flatnav/util/SquaredL2SimdExtensions.h>
+#include <iostream>
+#include <limits>
+#include <stdexcept>
+#include <vector>
+
+namespace flatnav::quantization {
+
+using flatnav::distances::MetricType;
+using flatnav::util::DataType;
+
+// Converts a single-precision float to half precision, rounding to the nearest
+// representable value.
+inline uint16_t floatToHalf(float value) {
+#if defined(USE_F16C)
+  return _cvtss_sh(value, _MM_FROUND_TO_NEAREST_INT);
+#else
+  uint32_t bits;
+  std::memcpy(&bits, &value, sizeof(float));
+  uint32_t sign = (bits >> 16) & 0x8000;
+  uint32_t float_exponent = (bits >> 23) & 0xff;
+  int32_t exponent = static_cast<int32_t>(float_exponent) - 127 + 15;
+  uint32_t mantissa = bits & 0x7fffff;
+
+  if (float_exponent == 0xff) {
+    // Infinity or NaN
+    return sign | 0x7c00 | (mantissa ? 0x200 : 0);
+  }
+  if (exponent >= 31) {
+    return sign | 0x7c00;
+  }
+  if (exponent <= 0) {
+    // Subnormal half, or zero.
+    if (exponent < -10) {
+      return sign;
+    }
+    mantissa |= 0x800000;
+    uint32_t shift = 14 - exponent;
+    uint32_t half_mantissa = mantissa >> shift;
+    uint32_t remainder = mantissa & ((1u << shift) - 1);
+    uint32_t halfway = 1u << (shift - 1);
+    if (remainder > halfway || (remainder == halfway && (half_mantissa & 1))) {
+      half_mantissa++;
+    }
+    return sign | half_mantissa;
+  }
+  uint32_t half = sign | (exponent << 10) | (mantissa >> 13);
+  uint32_t remainder = mantissa & 0x1fff;
+  // A carry into the exponent is the correct rounding.
+  if (remainder > 0x1000 || (remainder == 0x1000 && (half & 1))) {
+    half++;
+  }
+  return half;
+#endif
+}
+
+inline float halfToFloat(uint16_t value) {
+#if defined(USE_F16C)
+  return _cvtsh_ss(value);
+#else
+  uint32_t sign = static_cast<uint32_t>(value & 0x8000) << 16;
+  uint32_t exponent = (value >> 10) & 0x1f;
+  uint32_t mantissa = value & 0x3ff;
+  uint32_t bits;
+  if (exponent == 0x1f) {
+    bits = sign | 0x7f800000 | (mantissa << 13);
+  } else if (exponent == 0) {
+    // Zero or subnormal: mantissa * 2^-24
+    float magnitude = std::ldexp(static_cast<float>(mantissa), -24);
+    return sign ? -magnitude : magnitude;
+  } else {
+    bits = sign | ((exponent + 112) << 23) | (mantissa << 13);
+  }
+  float result;
+  std::memcpy(&result, &bits, sizeof(float));
+  return result;
+#endif
+}
+
+/**
+ * Scalar quantizer that takes float32 vectors and stores one small code per
+ * dimension, which cuts the memory traffic of every hop of the graph search
+ * by 2x (float16) or 4x (int8).
+ *
+ * - DataType::int8 stores an 8-bit code per dimension. Dimension i is scaled
+ *   with the minimum and maximum of that dimension over the training vectors,
+ *   and code c decodes to `offset[i] + scale[i] * c`. Requires `train`.
+ * - DataType::float16 stores each value in half precision. There is nothing
+ *   to train.
+ *
+ * Queries stay in float32: search distances are computed between the float
+ * query and the decoded codes, while construction compares two codes.
+ */
+class ScalarQuantizer
+    : public flatnav::distances::DistanceInterface<ScalarQuantizer> {
+  friend class flatnav::distances::DistanceInterface<ScalarQuantizer>;
+
+public:
+  // Constructor for serialization
+  ScalarQuantizer() = default;
+
+  /**
+   * @param dim           dimensionality of the input vectors
+   * @param metric_type   L2 or IP (inner product)
+   * @param code_type     DataType::int8 or DataType::float16
+   */
+  ScalarQuantizer(uint32_t dim, MetricType metric_type,
+                  DataType code_type = DataType::int8)
+      : _dimension(dim), _metric_type(metric_type), _code_type(code_type),
+        _is_trained(code_type == DataType::float16) {
+    if (_code_type != DataType::int8 && _code_type != DataType::float16) {
+      throw std::invalid_argument(
+          "Scalar quantization only supports int8 and float16 codes.");
+    }
+    if (_metric_type != MetricType::L2 && _metric_type != MetricType::IP) {
+      throw std::invalid_argument("Invalid metric type");
+    }
+  }
+
+  /**
+   * @brief Computes the per-dimension ranges used by int8 codes. Values
+   * outside the training range are clamped when encoded. This is a no-op for
+   * float16 codes.
+   *
+   * @param vectors          Vectors to use for training
+   * @param n                Number of vectors
+   */
+  void train(const float *vectors, uint64_t n) {
+    if (_code_type == DataType::float16) {
+      return;
+    }
+    if (n == 0) {
+      throw std::invalid_argument(
+          "At least one vector is required to train the scalar quantizer.");
+    }
+    std::vector<float> minimums(vectors, vectors + _dimension);
+    std::vector<float> maximums(vectors, vectors + _dimension);
+    for (uint64_t vec_index = 1; vec_index < n; vec_index++) {
+      const float *vector = vectors + (vec_index * _dimension);
+      for (uint32_t i = 0; i < _dimension; i++) {
+        minimums[i] = std::min(minimums[i], vector[i]);
+        maximums[i] = std::max(maximums[i], vector[i]);
+      }
+    }
+
+    _offset.swap(minimums);
+    _scale.resize(_dimension);
+    for (uint32_t i = 0; i < _dimension; i++) {
+      _scale[i] = (maximums[i] - _offset[i]) / MAX_CODE;
+    }
+    _is_trained = true;
+  }
+
+  /**
+   * @brief Decode a single vector from its codes.
+   */
+  void decode(const void *code, float *vector) const {
+    if (_code_type == DataType::float16) {
+      const uint16_t *values = static_cast<const uint16_t *>(code);
+      for (uint32_t i = 0; i < _dimension; i++) {
+        vector[i] = halfToFloat(values[i]);
+      }
+      return;
+    }
+    const uint8_t *codes = static_cast<const uint8_t *>(code);
+    for (uint32_t i = 0; i < _dimension; i++) {
+      vector[i] = _offset[i] + (_scale[i] * codes[i]);
+    }
+  }
+
+  ////////////////////////////////////////////////////////////////////////////
+  //                Implementation of DistanceInterface Methods             //
+  ////////////////////////////////////////////////////////////////////////////
+  inline size_t getDimension() const { return _dimension; }
+
+  inline size_t dataSizeImpl() {
+    return _dimension * flatnav::util::size(_code_type);
+  }
+
+  void transformDataImpl(void *destination, const void *src) {
+    if (!_is_trained) {
+      throw std::runtime_error(
+          "The scalar quantizer must be trained before it is used.");
+    }
+    const float *vector = static_cast<const float *>(src);
+    if (_code_type == DataType::float16) {
+      uint16_t *values = static_cast<uint16_t *>(destination);
+      for (uint32_t i = 0; i < _dimension; i++) {
+        values[i] = floatToHalf(vector[i]);
+      }
+      return;
+    }
+    uint8_t *codes = static_cast<uint8_t *>(destination);
+    for (uint32_t i = 0; i < _dimension; i++) {
+      float code = _scale[i] > 0 ? (vector[i] - _offset[i]) / _scale[i] : 0.f;
+      codes[i] = static_cast<uint8_t>(
+          std::clamp(std::round(code), 0.f, static_cast<float>(MAX_CODE)));
+    }
+  }
+
+  bool storesVectorsImpl() { return false; }
+
+  float fullPrecisionDistanceImpl(const void *x, const void *y) {
+    const float *x_ptr = static_cast<const float *>(x);
+    const float *y_ptr = static_cast<const float *>(y);
+    if (_metric_type == MetricType::L2) {
+      return flatnav::distances::L2DistanceDispatcher::dispatch(x_ptr, y_ptr,
+                                                                _dimension);
+    }
+    return flatnav::distances::IPDistanceDispatcher::dispatch(x_ptr, y_ptr,
+                                                              _dimension);
+  }
+
+  /**
+   * @brief With `asymmetric` set, `x` is a float32 query and `y` a database
+   * vector code. Otherwise both are database vector codes.
+   */
+  float distanceImpl(const void *x, const void *y, bool asymmetric) const {
+    if (_code_type == DataType::float16) {
+      return asymmetric
+                 ? fp16Distance(static_cast<const float *>(x),
+                                static_cast<const uint16_t *>(y))
+                 : fp16CodesDistance(static_cast<const uint16_t *>(x),
+                                     static_cast<const uint16_t *>(y));
+    }
+    return asymmetric ? sq8Distance(static_cast<const float *>(x),
+                                    static_cast<const uint8_t *>(y))
+                      : sq8CodesDistance(static_cast<const uint8_t *>(x),
+                                         static_cast<const uint8_t *>(y));
+  }
+
+  void getSummaryImpl() const {
+    std::cout << "\nScalar Quantizer Parameters" << std::flush;
+    std::cout << "\n-----------------------------"
+              << "\n"
+              << std::flush;
+    std::cout << "Dimension: " << _dimension << "\n" << std::flush;
+    std::cout << "Code type: " << flatnav::util::name(_code_type) << "\n"
+              << std::flush;
+    std::cout << "Is trained: " << _is_trained << "\n" << std::flush;
+  }
+
+  inline DataType getCodeType() const { return _code_type; }
+
+  inline MetricType getMetricType() const { return _metric_type; }
+
+  inline bool isTrained() const { return _is_trained; }
+
+private:
+  static constexpr uint32_t MAX_CODE = 255;
+
+  float sq8Distance(const float *x, const uint8_t *y) const {
+    const float *offset = _offset.data();
+    const float *scale = _scale.data();
+#if defined(USE_AVX2)
+    if (_metric_type == MetricType::L2) {
+      return util::computeL2_Avx2_Sq8(x, y, offset, scale, _dimension);
+    }
+    return util::computeIP_Avx2_Sq8(x, y, offset, scale, _dimension);
+#else
+    float result = 0.f;
+    for (uint32_t i = 0; i < _dimension; i++) {
+      float decoded = offset[i] + (scale[i] * y[i]);
+      result += _metric_type == MetricType::L2
+                    ? (x[i] - decoded) * (x[i] - decoded)
+                    : x[i] * decoded;
+    }
+    return _metric_type == MetricType::L2 ? result : 1.0f - result;
+#endif
+  }
+
+  float sq8CodesDistance(const uint8_t *x, const uint8_t *y) const {
+    const float *offset = _offset.data();
+    const float *scale = _scale.data();
+#if defined(USE_AVX2)
+    if (_metric_type == MetricType::L2) {
+      return util::computeL2_Avx2_Sq8Codes(x, y, scale, _dimension);
+    }
+    return util::computeIP_Avx2_Sq8Codes(x, y, offset, scale, _dimension);
+#else
+    float result = 0.f;
+    for (uint32_t i = 0; i < _dimension; i++) {
+      float decoded_x = offset[i] + (scale[i] * x[i]);
+      float decoded_y = offset[i] + (scale[i] * y[i]);
+      result += _metric_type == MetricType::L2
+                    ? (decoded_x - decoded_y) * (decoded_x - decoded_y)
+                    : decoded_x * decoded_y;
+    }
+    return _metric_type == MetricType::L2 ? result : 1.0f - result;
+#endif
+  }
+
+  float fp16Distance(const float *x, const uint16_t *y) const {
+#if defined(USE_F16C)
+    if (_metric_type == MetricType::L2) {
+      return util::computeL2_Avx_Fp16(x, y, _dimension);
+    }
+    return util::computeIP_Avx_Fp16(x, y, _dimension);
+#else
+    float result = 0.f;
+    for (uint32_t i = 0; i < _dimension; i++) {
+      float decoded = halfToFloat(y[i]);
+      result += _metric_type == MetricType::L2
+                    ? (x[i] - decoded) * (x[i] - decoded)
+                    : x[i] * decoded;
+    }
+    return _metric_type == MetricType::L2 ? result : 1.0f - result;
+#endif
+  }
+
+  float fp16CodesDistance(const uint16_t *x, const uint16_t *y) const {
+#if defined(USE_F16C)
+    if (_metric_type == MetricType::L2) {
+      return util::computeL2_Avx_Fp16Codes(x, y, _dimension);
+    }
+    return util::computeIP_Avx_Fp16Codes(x, y, _dimension);
+#else
+    float result = 0.f;
+    for (uint32_t i = 0; i < _dimension; i++) {
+      float decoded_x = halfToFloat(x[i]);
+      float decoded_y = halfToFloat(y[i]);
+      result += _metric_type == MetricType::L2
+                    ? (decoded_x - decoded_y) * (decoded_x - decoded_y)
+                    : decoded_x * decoded_y;
+    }
+    return _metric_type == MetricType::L2 ? result : 1.0f - result;
+#endif
+  }
+
+  uint32_t _dimension;
+  MetricType _metric_type;
+  DataType _code_type;
+  bool _is_trained;
+
+  // Per-dimension minimum and (max - min) / MAX_CODE of the training vectors.
+  // Only used by int8 codes.
+  std::vector<float> _offset;
+  std::vector<float> _scale;
+
+  friend class ::cereal::access;
+
+  template <typename Archive> void serialize(Archive &archive) {
+    archive(_dimension, _metric_type, _code_type, _is_trained, _offset,
+            _scale);
+  }
+};
+
+} // namespace flatnav::quantization
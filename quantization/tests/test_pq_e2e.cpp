@@ -6,6 +6,7 @@
 #include <quantization/ProductQuantization.h>
 #include <random>
 
+using flatnav::distances::MetricType;
 using flatnav::quantization::ProductQuantizer;
 
 namespace flatnav::quantization {
@@ -32,8 +33,8 @@ TEST(ProductQuantizationTest, TestComputeCodes) {
   // Number of testing vectors
   const uint32_t num_vectors = 1000;
 
-  ProductQuantizer<SquaredL2Distance> pq(/* dim = */ dim, /* M = */ M,
-                                         /* nbits = */ nbits);
+  ProductQuantizer pq(/* dim = */ dim, /* M = */ M, /* nbits = */ nbits,
+                      /* metric_type = */ MetricType::L2);
 
   // Generate random vectors
   std::vector<float> testing_vectors =